@@ -22,7 +22,6 @@ def check_dependencies():
     print("\n📦 Verificando dependencias...")
     
     required_packages = [
-        'pandas',
         'sqlalchemy', 
         'psycopg2',
         'pymysql'
@@ -38,6 +37,12 @@ def check_dependencies():
             print(f"❌ {package} - No encontrado")
             missing_packages.append(package)
     
+    for package in ['pandas', 'pyarrow']:
+        if importlib.util.find_spec(package):
+            print(f"✅ {package} - Instalado (opcional)")
+        else:
+            print(f"➖ {package} - Opcional, no instalado")
+    
     if missing_packages:
         print(f"\n⚠️  Paquetes faltantes: {', '.join(missing_packages)}")
         print("Ejecuta: pip install -r requirements.txt")
@@ -60,9 +65,32 @@ def check_project_structure():
         'database_repair/backup_manager.py',
         'database_repair/table_compressor.py',
         'database_repair/stats_collector.py',
+        'database_repair/index_advisor.py',
+        'database_repair/constraint_installer.py',
+        'database_repair/watermark_store.py',
+        'database_repair/duplicate_watcher.py',
+        'database_repair/schema_reflector.py',
+        'database_repair/lazy_import.py',
+        'database_repair/duplicate_groups.py',
+        'database_repair/key_profiler.py',
+        'database_repair/cross_shard_detector.py',
+        'database_repair/throttle_controller.py',
+        'database_repair/cancellation.py',
+        'database_repair/query_builder.py',
+        'database_repair/job_runner.py',
+        'database_repair/progress.py',
+        'database_repair/deletion_plan.py',
+        'database_repair/id_set.py',
+        'database_repair/dedup_loader.py',
+        'database_repair/key_filter.py',
+        'database_repair/key_normalizer.py',
+        'database_repair/foreign_key_remapper.py',
+        'database_repair/survivor_order.py',
         'database_repair/logger_setup.py',
         'database_repair/main.py',
         'support_utilities/cli.py',
+        'support_utilities/watch_cli.py',
+        'support_utilities/startup_benchmark.py',
         'support_utilities/example_usage.py',
         'support_utilities/setup.py',
         'support_utilities/test_duplicate_repair.py',
@@ -176,8 +204,9 @@ def main():
         print("\nPuedes usar el sistema de las siguientes formas:")
         print("1. Script principal: python run.py")
         print("2. CLI: python run_cli.py --help")
-        print("3. Tests completos: cd support_utilities && python test_duplicate_repair.py")
-        print("4. Ejemplos: cd support_utilities && python example_usage.py")
+        print("3. Vigilancia continua: python run_watch.py --help")
+        print("4. Tests completos: cd support_utilities && python test_duplicate_repair.py")
+        print("5. Ejemplos: cd support_utilities && python example_usage.py")
     else:
         print("⚠️  HAY PROBLEMAS EN LA INSTALACIÓN")
         print("\nRevisa los errores arriba y:")
@@ -1,12 +1,64 @@
 """
 Database Duplicate Repair Package
 """
-from .database_connector import DatabaseConnector
-from .duplicate_analyzer import DuplicateAnalyzer
-from .duplicate_remover import DuplicateRemover
-from .table_compressor import TableCompressor
-from .backup_manager import BackupManager
-from .stats_collector import StatsCollector
+from importlib import import_module
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .database_connector import DatabaseConnector
+    from .duplicate_analyzer import DuplicateAnalyzer
+    from .duplicate_remover import DuplicateRemover
+    from .table_compressor import TableCompressor
+    from .backup_manager import BackupManager
+    from .stats_collector import StatsCollector
+    from .index_advisor import IndexAdvisor
+    from .constraint_installer import UniqueConstraintInstaller
+    from .watermark_store import WatermarkStore
+    from .duplicate_watcher import DuplicateWatcher
+    from .schema_reflector import SchemaReflector
+    from .duplicate_groups import DuplicateGroups
+    from .key_profiler import KeyProfiler
+    from .cross_shard_detector import CrossShardDetector
+    from .throttle_controller import ThrottleController
+    from .cancellation import CancellationToken, OperationCancelled
+    from .query_builder import QueryBuilder
+    from .job_runner import JobRunner
+    from .progress import ProgressTracker, TerminalProgressBar
+    from .deletion_plan import DeletionPlan, DeletionPlanner
+    from .id_set import IdSet
+    from .dedup_loader import DedupLoader
+    from .key_filter import KeyFilter
+
+# Las clases se importan en su primer uso: `import database_repair` no carga
+# SQLAlchemy ni pandas (arranque rápido de la CLI)
+_LAZY_IMPORTS = {
+    'DatabaseConnector': '.database_connector',
+    'DuplicateAnalyzer': '.duplicate_analyzer',
+    'DuplicateRemover': '.duplicate_remover',
+    'TableCompressor': '.table_compressor',
+    'BackupManager': '.backup_manager',
+    'StatsCollector': '.stats_collector',
+    'IndexAdvisor': '.index_advisor',
+    'UniqueConstraintInstaller': '.constraint_installer',
+    'WatermarkStore': '.watermark_store',
+    'DuplicateWatcher': '.duplicate_watcher',
+    'SchemaReflector': '.schema_reflector',
+    'DuplicateGroups': '.duplicate_groups',
+    'KeyProfiler': '.key_profiler',
+    'CrossShardDetector': '.cross_shard_detector',
+    'ThrottleController': '.throttle_controller',
+    'CancellationToken': '.cancellation',
+    'OperationCancelled': '.cancellation',
+    'QueryBuilder': '.query_builder',
+    'JobRunner': '.job_runner',
+    'ProgressTracker': '.progress',
+    'TerminalProgressBar': '.progress',
+    'DeletionPlan': '.deletion_plan',
+    'DeletionPlanner': '.deletion_plan',
+    'IdSet': '.id_set',
+    'DedupLoader': '.dedup_loader',
+    'KeyFilter': '.key_filter'
+}
 
 __version__ = "1.0.0"
 __all__ = [
@@ -15,5 +67,37 @@ __all__ = [
     'DuplicateRemover',
     'TableCompressor',
     'BackupManager',
-    'StatsCollector'
-]
\ No newline at end of file
+    'StatsCollector',
+    'IndexAdvisor',
+    'UniqueConstraintInstaller',
+    'WatermarkStore',
+    'DuplicateWatcher',
+    'SchemaReflector',
+    'DuplicateGroups',
+    'KeyProfiler',
+    'CrossShardDetector',
+    'ThrottleController',
+    'CancellationToken',
+    'OperationCancelled',
+    'QueryBuilder',
+    'JobRunner',
+    'ProgressTracker',
+    'TerminalProgressBar',
+    'DeletionPlan',
+    'DeletionPlanner',
+    'IdSet',
+    'DedupLoader',
+    'KeyFilter'
+]
+
+def __getattr__(name):
+    """Importa la clase pública al primer acceso y la deja en el módulo"""
+    if name in _LAZY_IMPORTS:
+        value = getattr(import_module(_LAZY_IMPORTS[name], __name__), name)
+        globals()[name] = value
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def __dir__():
+    """Incluye las clases diferidas en dir() y el autocompletado"""
+    return sorted(list(globals()) + list(_LAZY_IMPORTS))
@@ -0,0 +1,65 @@
+"""
+Escritura atómica de archivos compartidos entre procesos (cachés, marcas de agua, estado)
+"""
+import os
+import tempfile
+from contextlib import contextmanager
+from typing import IO, Iterator
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+@contextmanager
+def atomic_write(path: str, binary: bool = False) -> Iterator[IO]:
+    """
+    Abre un temporal propio junto a path y lo renombra sobre path al cerrar
+    
+    El temporal tiene nombre único (NamedTemporaryFile en el mismo
+    directorio), así dos procesos que escriben a la vez no comparten
+    `path.tmp`; os.replace deja siempre uno de los dos archivos completos.
+    Si el bloque falla, el temporal se borra y path no cambia.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    handle = tempfile.NamedTemporaryFile('wb' if binary else 'w',
+                                         encoding=None if binary else 'utf-8',
+                                         dir=directory, prefix=f".{os.path.basename(path)}.",
+                                         suffix='.tmp', delete=False)
+    try:
+        with handle:
+            yield handle
+        os.replace(handle.name, path)
+    except BaseException:
+        try:
+            os.unlink(handle.name)
+        except OSError:
+            pass
+        raise
+
+@contextmanager
+def file_lock(path: str) -> Iterator[None]:
+    """
+    Bloqueo exclusivo entre procesos sobre `path.lock` mientras dura el bloque
+    
+    Para leer, combinar y reemplazar un archivo compartido sin perder lo que
+    otro proceso escribió entre la lectura y el os.replace (atomic_write
+    solo evita archivos a medio escribir). Un threading.Lock no basta:
+    cada proceso tiene el suyo. fcntl.flock en POSIX, msvcrt.locking en
+    Windows; se libera al cerrar aunque el proceso muera.
+    """
+    with open(f"{path}.lock", 'a+b') as handle:
+        if fcntl is not None:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+        else:
+            handle.seek(0)
+            msvcrt.locking(handle.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_UNLCK, 1)
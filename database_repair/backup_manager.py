@@ -1,31 +1,55 @@
 """
 Gestión de copias de seguridad
 """
-from sqlalchemy import text
+from sqlalchemy import ColumnElement, false, text
 from datetime import datetime
-from typing import Optional
+from typing import TYPE_CHECKING, Any, Dict, Optional, Union
 from .database_connector import DatabaseConnector
+from .schema_reflector import SchemaReflector
+from .query_builder import QueryBuilder
+from .index_advisor import IndexAdvisor
+from .progress import ProgressCallback, ProgressTracker
+from .cancellation import OperationCancelled
 from .logger_setup import LoggerSetup
 from .config import DatabaseConfig
 
+if TYPE_CHECKING:
+    from .cancellation import CancellationToken
+    from .throttle_controller import ThrottleController
+
 class BackupManager:
     """Maneja las copias de seguridad de tablas"""
     
     def __init__(self, db_connector: DatabaseConnector):
         self.db_connector = db_connector
         self.engine = db_connector.get_engine()
+        self.query_builder = QueryBuilder(db_connector)
         
         # Setup logger
         logger_setup = LoggerSetup()
         self.logger = logger_setup.setup_logger(self.__class__.__name__)
     
-    def create_backup(self, table_name: str, backup_suffix: Optional[str] = None) -> str:
+    def create_backup(self, table_name: str, backup_suffix: Optional[str] = None,
+                      where: Optional[Union[str, ColumnElement]] = None,
+                      params: Optional[Dict[str, Any]] = None,
+                      throttle: Optional['ThrottleController'] = None,
+                      cancel_token: Optional['CancellationToken'] = None,
+                      progress: Optional[ProgressCallback] = None) -> str:
         """
         Crea una copia de seguridad de la tabla
         
         Args:
             table_name: Nombre de la tabla original
             backup_suffix: Sufijo personalizado para el backup
+            where: Condición opcional para respaldar solo las filas afectadas
+                (SQL textual o expresión de SQLAlchemy Core)
+            params: Parámetros de la condición
+            throttle: Si se indica, copia por lotes en orden de la PK al ritmo
+                que marque el controlador en lugar de un único CREATE TABLE AS
+            cancel_token: En la copia por lotes, detiene la copia entre lotes;
+                el backup incompleto se descarta y se propaga OperationCancelled
+            progress: Callback de avance (ver ProgressTracker); en la copia por
+                lotes el total es la estimación de filas de la tabla
             
         Returns:
             Nombre de la tabla de backup creada
@@ -36,19 +60,113 @@ class BackupManager:
         backup_name = f"{table_name}_{DatabaseConfig.BACKUP_PREFIX}_{backup_suffix}"
         
         try:
-            with self.engine.connect() as conn:
-                # Crear tabla de backup
-                backup_query = f"CREATE TABLE {backup_name} AS SELECT * FROM {table_name}"
-                conn.execute(text(backup_query))
-                conn.commit()
+            if throttle is not None:
+                total = None
+                if progress is not None and where is None:
+                    total = IndexAdvisor(self.db_connector).estimate_row_count(table_name)
+                try:
+                    with ProgressTracker('backup', progress, total, table_name) as tracker:
+                        copied = self._copy_in_batches(table_name, backup_name, where,
+                                                       params or {}, throttle, cancel_token,
+                                                       tracker)
+                except OperationCancelled:
+                    self._drop_table(backup_name)
+                    self.logger.warning(f"Backup cancelado; se descartó {backup_name}")
+                    raise
+                self.logger.info(f"Backup creado por lotes: {backup_name} ({copied} registros)")
+                return backup_name
+            
+            with ProgressTracker('backup', progress, table=table_name) as tracker:
+                with self.engine.connect() as conn:
+                    # Crear tabla de backup
+                    backup_query = self.query_builder.copy_rows(table_name, backup_name, where)
+                    copied = conn.execute(backup_query, params or {}).rowcount
+                    conn.commit()
+                # Algunos drivers no informan filas en CREATE TABLE AS (-1)
+                tracker.advance(max(copied, 0))
                 
             self.logger.info(f"Backup creado exitosamente: {backup_name}")
             return backup_name
+        
+        except OperationCancelled:
+            raise
             
         except Exception as e:
             self.logger.error(f"Error creando backup: {str(e)}")
             raise
     
+    def _copy_in_batches(self, table_name: str, backup_name: str,
+                         where: Optional[Union[str, ColumnElement]],
+                         params: Dict[str, Any], throttle: 'ThrottleController',
+                         cancel_token: Optional['CancellationToken'] = None,
+                         progress: Optional[ProgressTracker] = None) -> int:
+        """
+        Crea la tabla vacía y la llena por rangos de la clave de orden (keyset)
+        
+        Las sentencias de cada variante de rango se construyen una vez y se
+        reutilizan en todos los lotes. Un lote que agota el timeout de
+        bloqueo se reintenta; el rango solo avanza cuando el lote se confirma.
+        """
+        builder = self.query_builder
+        order_by = SchemaReflector(self.db_connector).get_row_locator(table_name)['order_by']
+        bound_queries = {after: builder.range_bound(table_name, order_by, where, after)
+                         for after in (False, True)}
+        copy_queries = {
+            (after, bounded): builder.copy_rows(
+                table_name, backup_name,
+                builder.range_condition(table_name, order_by, where, after, bounded),
+                create=False
+            )
+            for after in (False, True) for bounded in (False, True)
+        }
+        
+        with self.engine.connect() as conn:
+            conn.execute(builder.copy_rows(table_name, backup_name, false()))
+            conn.commit()
+        
+        state = {"after": None, "done": False}
+        
+        def copy_batch(batch_size: int) -> Optional[int]:
+            if state['done']:
+                return None
+            return self.db_connector.run_with_retry(
+                lambda: copy_range(batch_size), cancel_token, f"lote de backup de {table_name}"
+            )
+        
+        def copy_range(batch_size: int) -> Optional[int]:
+            after = state['after'] is not None
+            batch_params = dict(params)
+            if after:
+                batch_params.update({f"after_{position}": value
+                                     for position, value in enumerate(state['after'])})
+            
+            with self.engine.connect() as conn:
+                # Último valor de la clave dentro de este lote
+                bound = conn.execute(bound_queries[after],
+                                     {**batch_params, "offset": int(batch_size) - 1}).fetchone()
+                if bound is not None:
+                    batch_params.update({f"bound_{position}": value
+                                         for position, value in enumerate(bound)})
+                
+                copied = conn.execute(copy_queries[(after, bound is not None)],
+                                      batch_params).rowcount
+                conn.commit()
+            
+            if bound is None:
+                state['done'] = True
+            else:
+                state['after'] = tuple(bound)
+            # Último tramo vacío: no cuenta como lote
+            return None if state['done'] and not copied else copied
+        
+        return throttle.run_batches(copy_batch, cancel_token, progress)
+    
+    def _drop_table(self, table_name: str):
+        """Elimina una tabla de backup incompleta"""
+        with self.engine.connect() as conn:
+            conn.execute(text(f"DROP TABLE IF EXISTS {self.query_builder.quote_table(table_name)}"))
+            conn.commit()
+    
     def verify_backup(self, original_table: str, backup_table: str) -> bool:
         """
         Verifica que el backup sea válido comparando conteos
@@ -64,12 +182,12 @@ class BackupManager:
             with self.engine.connect() as conn:
                 # Contar registros en tabla original
                 original_count = conn.execute(
-                    text(f"SELECT COUNT(*) FROM {original_table}")
+                    self.query_builder.count_rows(original_table)
                 ).fetchone()[0]
                 
                 # Contar registros en backup
                 backup_count = conn.execute(
-                    text(f"SELECT COUNT(*) FROM {backup_table}")
+                    self.query_builder.count_rows(backup_table)
                 ).fetchone()[0]
                 
             if original_count == backup_count:
@@ -99,12 +217,12 @@ class BackupManager:
         try:
             with self.engine.connect() as conn:
                 # Elimina la tabla original
-                conn.execute(text(f"DROP TABLE IF EXISTS {original_table}"))
+                conn.execute(text(
+                    f"DROP TABLE IF EXISTS {self.query_builder.quote_table(original_table)}"
+                ))
                 
                 # recrear desde el backup
-                conn.execute(
-                    text(f"CREATE TABLE {original_table} AS SELECT * FROM {backup_table}")
-                )
+                conn.execute(self.query_builder.copy_rows(backup_table, original_table))
                 conn.commit()
                 
             self.logger.info(f"Tabla {original_table} restaurada desde {backup_table}")
@@ -0,0 +1,62 @@
+"""
+Cancelación cooperativa de operaciones por lotes
+"""
+import signal
+import threading
+from typing import Iterable, Optional
+from .logger_setup import LoggerSetup
+
+class OperationCancelled(Exception):
+    """Se lanza entre lotes cuando se solicitó la cancelación; processed son las filas ya confirmadas"""
+    
+    def __init__(self, reason: Optional[str] = None, processed: int = 0):
+        super().__init__(reason or "Operación cancelada")
+        self.reason = reason
+        self.processed = processed
+
+class CancellationToken:
+    """
+    Bandera compartida para detener un trabajo en curso
+    
+    Las operaciones por lotes la consultan entre lotes (cada lote es su
+    propia transacción), así que al cancelar la tabla queda en un estado
+    consistente: los lotes confirmados se conservan y el resto no empieza.
+    """
+    
+    def __init__(self):
+        self._event = threading.Event()
+        self.reason: Optional[str] = None
+        
+        # Setup logger
+        logger_setup = LoggerSetup()
+        self.logger = logger_setup.setup_logger(self.__class__.__name__)
+    
+    def cancel(self, reason: Optional[str] = None):
+        """Solicita la cancelación; el trabajo se detiene al terminar el lote en curso"""
+        if not self._event.is_set():
+            self.reason = reason or "cancelación solicitada"
+            self.logger.warning(f"Cancelación solicitada: {self.reason}")
+            self._event.set()
+    
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+    
+    def raise_if_cancelled(self, processed: int = 0):
+        """Lanza OperationCancelled si se solicitó la cancelación"""
+        if self._event.is_set():
+            raise OperationCancelled(self.reason, processed)
+    
+    def wait(self, timeout: float) -> bool:
+        """Espera hasta timeout segundos; retorna True si se canceló antes"""
+        return self._event.wait(timeout)
+    
+    def install_signal_handlers(self, signals: Optional[Iterable[int]] = None):
+        """SIGINT/SIGTERM cancelan al terminar el lote; un segundo SIGINT interrumpe en seco"""
+        def handler(signum, frame):
+            if self.cancelled and signum == signal.SIGINT:
+                raise KeyboardInterrupt
+            self.cancel(f"señal {signal.Signals(signum).name}")
+        
+        for signum in signals or (signal.SIGINT, signal.SIGTERM):
+            signal.signal(signum, handler)
@@ -20,6 +20,128 @@ class DatabaseConfig:
     
     # Config de backup
     BACKUP_PREFIX = 'backup'
+
+    # Config de compactación SQLite
+    SQLITE_COMPACTION_MODES = ['full', 'incremental', 'into']
+    SQLITE_INCREMENTAL_VACUUM_PAGES = 1000
+
+    # Config de reconstrucción online (PostgreSQL)
+    ONLINE_REBUILD_BATCH_SIZE = 50000
+    ONLINE_REBUILD_LOCK_TIMEOUT = '2s'
+    ONLINE_REBUILD_MAX_LOCK_ATTEMPTS = 5
+    ONLINE_REBUILD_REPLAY_THRESHOLD = 1000
+
+    # Config de índices temporales de soporte
+    TEMP_INDEX_PREFIX = 'tmp_dedup'
+    TEMP_INDEX_MIN_ROWS = 100000
+    
+    # Config de restricción única post-reparación
+    UNIQUE_INDEX_PREFIX = 'uq_dedup'
+    UNIQUE_INDEX_MAX_ATTEMPTS = 3
+    
+    # Config de ejecución incremental
+    WATERMARK_FILE = '.dedup_watermarks.json'
+    
+    # Config de reflexión de esquema y localizador de filas
+    SCHEMA_CACHE_FILE = '.dedup_schema_cache.json'
+    SCHEMA_CACHE_TTL = 86400
+    ROW_LOCATOR_MODES = ['auto', 'primary_key', 'physical']
+    ROW_LOCATOR_MODE = 'auto'
+    
+    # Config de modo vigilancia
+    WATCH_MIN_INTERVAL = 5.0
+    WATCH_MAX_INTERVAL = 300.0
+    WATCH_BUSY_LATENCY = 0.5
+    WATCH_MAX_DELTA_ROWS = 50000
+    
+    # Config de paginación de ids en el análisis
+    ID_PAGE_SIZE = 10000
+    MYSQL_GROUP_CONCAT_MAX_LEN = 16777216
+    
+    # Config de perfilado de claves candidatas
+    PROFILE_METHODS = ['auto', 'grouping_sets', 'stream']
+    PROFILE_EXACT_MAX_KEYS = 5000000
+    PROFILE_HLL_PRECISION = 14
+    PROFILE_SIZE_BUCKETS = [1, 2, 3, 6, 11, 101, 1001]
+    
+    # Config de detección entre shards
+    SHARD_PARTITIONS = 64
+    SHARD_SPILL_DIR = None
+    SHARD_SAMPLE_GROUPS = 20
+    SHARD_DELETE_BATCH_SIZE = 1000
+    
+    # Config de control adaptativo de escritura
+    THROTTLE_TARGET_LATENCY = 0.5
+    THROTTLE_MAX_REPLICA_LAG = 5.0
+    THROTTLE_MAX_LOCK_WAITS = 5
+    THROTTLE_INITIAL_BATCH_SIZE = 1000
+    THROTTLE_MIN_BATCH_SIZE = 100
+    THROTTLE_MAX_BATCH_SIZE = 50000
+    THROTTLE_MIN_SLEEP = 0.05
+    THROTTLE_MAX_SLEEP = 10.0
+    THROTTLE_PROBE_INTERVAL = 1.0
+    THROTTLE_HISTORY = 100
+    
+    # Config de timeouts por fase (segundos; None = sin límite) y reintentos
+    PHASE_TIMEOUTS = {
+        'analysis': {'statement_timeout': None, 'lock_timeout': None},
+        'backup': {'statement_timeout': None, 'lock_timeout': 30},
+        'deletion': {'statement_timeout': None, 'lock_timeout': 10},
+        'index': {'statement_timeout': None, 'lock_timeout': 10},
+        'load': {'statement_timeout': None, 'lock_timeout': 10}
+    }
+    LOCK_RETRY_ATTEMPTS = 5
+    LOCK_RETRY_BASE_DELAY = 0.5
+    LOCK_RETRY_MAX_DELAY = 30.0
+    SQLITE_PROGRESS_HANDLER_STEPS = 10000
+    
+    # Config del constructor de consultas (sentencias en caché por dialecto/tabla/columnas)
+    QUERY_CACHE_SIZE = 512
+    
+    # Config de archivos de trabajos (varias tablas en un solo proceso)
+    JOB_PARALLELISM = 4
+    JOB_COUNT_ROWS = True
+    JOB_FILE_FORMATS = ['.json', '.yaml', '.yml']
+    
+    # Config del reporte de avance (segundos entre eventos y filas entre lecturas del reloj)
+    PROGRESS_MIN_INTERVAL = 1.0
+    PROGRESS_CHECK_ROWS = 1000
+    PROGRESS_BAR_WIDTH = 30
+    
+    # Config de conjuntos de ids (nivel zlib al serializar e ids por bloque al serializar/iterar)
+    ID_SET_COMPRESSION_LEVEL = 6
+    ID_SET_CHUNK_SIZE = 1_000_000
+    
+    # Config del flujo plan/apply (víctimas por lote al aplicar y extensión del archivo)
+    PLAN_APPLY_BATCH_SIZE = 5000
+    PLAN_FILE_SUFFIX = '.dedupplan'
+    
+    # Config de la carga sin duplicados (filas por lote, modos y prefijo de la tabla temporal)
+    LOAD_BATCH_SIZE = 5000
+    LOAD_MODES = ['auto', 'conflict', 'staging']
+    LOAD_STAGING_PREFIX = 'dedup_stage'
+    
+    # Config del filtro de Bloom de claves (tasa de falsos positivos, holgura, filas por bloque, archivo
+    # y segundos tras los que refresh() reconstruye desde cero; None: nunca)
+    KEY_FILTER_FP_RATE = 0.01
+    KEY_FILTER_GROWTH = 2.0
+    KEY_FILTER_MIN_CAPACITY = 1024
+    KEY_FILTER_CHUNK_ROWS = 50000
+    KEY_FILTER_LOOKUP_BATCH = 1000
+    KEY_FILTER_FILE = '.dedup_keyfilter_{table}.bloom'
+    KEY_FILTER_MAX_AGE = 86400
+    
+    # Config de columnas clave normalizadas (funciones admitidas y prefijo de sus índices de expresión)
+    KEY_NORMALIZERS = ['lower', 'trim', 'collapse', 'unaccent']
+    KEY_INDEX_PREFIX = 'dedup_key'
+    
+    # Config de la reasignación de claves foráneas (desactivada por defecto y prefijo de las tablas de mapeo)
+    REMAP_FOREIGN_KEYS = False
+    FK_MAPPING_PREFIX = 'dedup_fkmap'
+    
+    # Config de réplicas de lectura (retraso máximo para recibir lecturas y segundos entre mediciones)
+    REPLICA_MAX_LAG = 30.0
+    REPLICA_LAG_CHECK_INTERVAL = 5.0
     
     @classmethod
     def get_connection_string(cls, db_type: str, **kwargs) -> str:
@@ -32,5 +154,5 @@ class DatabaseConfig:
         # Reemplaza aqui los parámetros 
         for key, value in kwargs.items():
             base_string = base_string.replace(key, str(value))
-            
+        
         return base_string
\ No newline at end of file
@@ -0,0 +1,163 @@
+"""
+Instalación de restricciones únicas tras la reparación
+"""
+import hashlib
+from typing import Any, Callable, Dict, List, Optional
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+from .database_connector import DatabaseConnector
+from .schema_reflector import SchemaReflector
+from .query_builder import QueryBuilder
+from .key_normalizer import is_normalized
+from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
+
+class UniqueConstraintInstaller:
+    """Crea un índice único sobre las columnas clave para impedir nuevos duplicados"""
+    
+    def __init__(self, db_connector: DatabaseConnector):
+        self.db_connector = db_connector
+        self.engine = db_connector.get_engine()
+        self.db_type = db_connector.db_type
+        self.schema_reflector = SchemaReflector(db_connector)
+        self.query_builder = QueryBuilder(db_connector)
+        
+        # Setup logger
+        logger_setup = LoggerSetup()
+        self.logger = logger_setup.setup_logger(self.__class__.__name__)
+    
+    def find_unique_index(self, table_name: str, columns_to_check: List[str]) -> Optional[str]:
+        """Retorna el nombre de un índice/restricción única sobre exactamente esas columnas"""
+        if is_normalized(columns_to_check):
+            # Índice único de expresión: el inspector no lo describe, se busca por nombre
+            index_name = self._unique_index_name(table_name, columns_to_check)
+            return index_name if self.schema_reflector.index_exists(table_name, index_name) else None
+        
+        inspector = inspect(self.engine)
+        wanted = set(columns_to_check)
+        
+        for index in inspector.get_indexes(table_name):
+            if index.get('unique') and set(index['column_names']) == wanted:
+                return index['name']
+        
+        for constraint in inspector.get_unique_constraints(table_name):
+            if set(constraint['column_names']) == wanted:
+                return constraint['name']
+        
+        return None
+    
+    def install(self, table_name: str, columns_to_check: List[str],
+                resolve_conflicts: Callable[[int], int],
+                max_attempts: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Instala el índice único reintentando si llegan duplicados durante la construcción
+        
+        Args:
+            table_name: Nombre de la tabla
+            columns_to_check: Columnas que definen un duplicado
+            resolve_conflicts: Callback que elimina los duplicados nuevos; recibe
+                el número de intento y retorna las filas eliminadas
+            max_attempts: Intentos de creación antes de rendirse
+        
+        Returns:
+            Diccionario indicando si la restricción quedó instalada
+        """
+        max_attempts = max_attempts or DatabaseConfig.UNIQUE_INDEX_MAX_ATTEMPTS
+        
+        existing = self.find_unique_index(table_name, columns_to_check)
+        if existing:
+            self.logger.info(f"Restricción única ya presente: {existing}")
+            return {
+                "installed": True,
+                "already_present": True,
+                "index_name": existing,
+                "attempts": 0,
+                "delta_deleted": 0
+            }
+        
+        index_name = self._unique_index_name(table_name, columns_to_check)
+        delta_deleted = 0
+        
+        for attempt in range(1, max_attempts + 1):
+            try:
+                self._create_unique_index(table_name, columns_to_check, index_name)
+                installed = self._is_index_valid(index_name)
+                self.logger.info(
+                    f"Índice único {index_name} {'instalado' if installed else 'inválido'} "
+                    f"(intento {attempt})"
+                )
+                return {
+                    "installed": installed,
+                    "already_present": False,
+                    "index_name": index_name,
+                    "attempts": attempt,
+                    "delta_deleted": delta_deleted
+                }
+            
+            except IntegrityError as e:
+                self.logger.warning(
+                    f"Duplicados nuevos durante la creación del índice (intento {attempt}): {str(e)}"
+                )
+                self._drop_failed_index(table_name, index_name)
+                if attempt < max_attempts:
+                    delta_deleted += resolve_conflicts(attempt)
+        
+        return {
+            "installed": False,
+            "already_present": False,
+            "index_name": None,
+            "attempts": max_attempts,
+            "delta_deleted": delta_deleted,
+            "message": "Siguen apareciendo duplicados; restricción no instalada"
+        }
+    
+    def _create_unique_index(self, table_name: str, columns_to_check: List[str], index_name: str):
+        """Crea el índice único (de expresión si hay columnas normalizadas) con DDL online"""
+        columns_str = ', '.join(self.query_builder.index_elements(columns_to_check))
+        
+        if self.db_type == 'postgresql':
+            autocommit_engine = self.engine.execution_options(isolation_level="AUTOCOMMIT")
+            with autocommit_engine.connect() as conn:
+                conn.exec_driver_sql(
+                    f"CREATE UNIQUE INDEX CONCURRENTLY {index_name} ON {table_name} ({columns_str})"
+                )
+            return
+        
+        if self.db_type == 'mysql':
+            create_query = (
+                f"ALTER TABLE {table_name} ADD UNIQUE INDEX {index_name} ({columns_str}), "
+                "ALGORITHM=INPLACE, LOCK=NONE"
+            )
+        else:
+            create_query = f"CREATE UNIQUE INDEX {index_name} ON {table_name} ({columns_str})"
+        
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql(create_query)
+            conn.commit()
+    
+    def _drop_failed_index(self, table_name: str, index_name: str):
+        """Elimina el índice inválido que deja un CREATE INDEX CONCURRENTLY fallido"""
+        if self.db_type != 'postgresql':
+            return
+        
+        autocommit_engine = self.engine.execution_options(isolation_level="AUTOCOMMIT")
+        with autocommit_engine.connect() as conn:
+            conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+    
+    def _is_index_valid(self, index_name: str) -> bool:
+        """Verifica que el índice sea utilizable (PostgreSQL puede dejarlo inválido)"""
+        if self.db_type != 'postgresql':
+            return True
+        
+        with self.engine.connect() as conn:
+            return bool(conn.execute(
+                text("SELECT indisvalid FROM pg_index WHERE indexrelid = CAST(:name AS regclass)"),
+                {"name": index_name}
+            ).scalar())
+    
+    def _unique_index_name(self, table_name: str, columns_to_check: List[str]) -> str:
+        """Nombre determinista y corto para el índice único"""
+        digest = hashlib.md5(
+            f"{table_name}:{','.join(columns_to_check)}".encode('utf-8')
+        ).hexdigest()[:10]
+        return f"{DatabaseConfig.UNIQUE_INDEX_PREFIX}_{table_name[:40]}_{digest}"
@@ -0,0 +1,378 @@
+"""
+Detección de duplicados entre tablas y shards
+"""
+import hashlib
+import json
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import text
+from .backup_manager import BackupManager
+from .cancellation import CancellationToken, OperationCancelled
+from .database_connector import database_phase
+from .schema_reflector import SchemaReflector
+from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
+
+class CrossShardDetector:
+    """
+    Encuentra claves repetidas en varias tablas con el mismo esquema, aunque
+    estén en bases de datos distintas
+    
+    Cada shard se lee en paralelo y sus huellas de clave se reparten en
+    particiones hash en disco; después cada partición se une por separado
+    (hash join particionado), así la memoria depende del tamaño de una
+    partición y no del total de filas.
+    """
+    
+    def __init__(self, shards: List[Dict[str, Any]], partitions: Optional[int] = None,
+                 workdir: Optional[str] = None):
+        """
+        Args:
+            shards: Lista de {'name': str, 'connector': DatabaseConnector, 'table': str};
+                el orden es la precedencia por defecto (el primero conserva sus filas)
+            partitions: Número de particiones hash en disco
+            workdir: Directorio para los archivos temporales de las particiones
+        """
+        if len(shards) < 2:
+            raise ValueError("Se requieren al menos dos shards")
+        
+        self.shards = [
+            {"name": shard.get('name') or f"shard{index}", "connector": shard['connector'],
+             "table": shard['table']}
+            for index, shard in enumerate(shards)
+        ]
+        names = [shard['name'] for shard in self.shards]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Nombres de shard repetidos: {names}")
+        
+        self.partitions = partitions or DatabaseConfig.SHARD_PARTITIONS
+        self.workdir = workdir or DatabaseConfig.SHARD_SPILL_DIR
+        
+        # Setup logger
+        logger_setup = LoggerSetup()
+        self.logger = logger_setup.setup_logger(self.__class__.__name__)
+    
+    def find_duplicates(self, columns_to_check: List[str],
+                        precedence: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Reporta los duplicados entre shards sin modificar nada
+        
+        Returns:
+            Diccionario con cross_shard_groups, rows_to_delete por shard
+            (filas de los shards que pierden según la precedencia) y una
+            muestra de grupos
+        """
+        return self.remove_duplicates(columns_to_check, precedence, dry_run=True)
+    
+    def remove_duplicates(self, columns_to_check: List[str], precedence: Optional[List[str]] = None,
+                          dry_run: bool = True, backup: bool = True,
+                          cancel_token: Optional[CancellationToken] = None) -> Dict[str, Any]:
+        """
+        Elimina los duplicados entre shards según la precedencia
+        
+        Para cada clave presente en más de un shard se conservan las filas
+        del shard de mayor precedencia y se eliminan las de los demás. Los
+        duplicados dentro de un mismo shard no se tocan (eso lo hace
+        DuplicateRemover).
+        
+        Args:
+            columns_to_check: Columnas que definen un duplicado
+            precedence: Nombres de shard de mayor a menor precedencia; los no
+                listados van después, en el orden de self.shards
+            dry_run: Si True, solo reporta
+            backup: Si True, respalda cada tabla afectada antes de borrar
+            cancel_token: Detiene el borrado entre lotes; el resultado queda
+                con status 'cancelled' y los lotes ya confirmados en deleted
+        """
+        ranks = self._precedence_ranks(precedence)
+        start = time.perf_counter()
+        
+        try:
+            self.logger.info(
+                f"Buscando duplicados entre {len(self.shards)} shards por {columns_to_check} "
+                f"({self.partitions} particiones)"
+            )
+            
+            with tempfile.TemporaryDirectory(prefix='dedup_shards_', dir=self.workdir) as spill_dir:
+                # Fase 1: lectura en paralelo hacia particiones en disco
+                with ThreadPoolExecutor(max_workers=len(self.shards)) as executor:
+                    rows_scanned = list(executor.map(
+                        lambda index: self._scan_shard(index, columns_to_check, spill_dir),
+                        range(len(self.shards))
+                    ))
+                
+                # Fase 2: unión partición a partición
+                summary = self._join_partitions(columns_to_check, ranks, spill_dir)
+                
+                result = {
+                    "status": "success",
+                    "columns": columns_to_check,
+                    "dry_run": dry_run,
+                    "shards": [
+                        {"name": shard['name'], "table": shard['table'], "rows_scanned": scanned}
+                        for shard, scanned in zip(self.shards, rows_scanned)
+                    ],
+                    "cross_shard_groups": summary['groups'],
+                    "rows_to_delete": summary['victims'],
+                    "sample": summary['sample'],
+                    "deleted": {},
+                    "backup_tables": {},
+                    "deleted_count": 0
+                }
+                
+                if dry_run:
+                    self.logger.info(
+                        f"DRY RUN: {summary['groups']} claves repetidas entre shards; se eliminarían "
+                        f"{sum(summary['victims'].values())} filas"
+                    )
+                else:
+                    for index, shard in enumerate(self.shards):
+                        if not summary['victims'][shard['name']]:
+                            continue
+                        if cancel_token is not None and cancel_token.cancelled:
+                            result['status'] = "cancelled"
+                            result['message'] = str(cancel_token.reason)
+                            break
+                        if backup:
+                            result['backup_tables'][shard['name']] = BackupManager(
+                                shard['connector']
+                            ).create_backup(
+                                shard['table'],
+                                backup_suffix=f"cross_shard_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                            )
+                        try:
+                            with database_phase('deletion'):
+                                result['deleted'][shard['name']] = self._delete_victims(
+                                    index, columns_to_check, spill_dir, cancel_token
+                                )
+                        except OperationCancelled as e:
+                            result['deleted'][shard['name']] = e.processed
+                            result['status'] = "cancelled"
+                            result['message'] = str(e)
+                            self.logger.warning(f"Eliminación entre shards cancelada: {e}")
+                            break
+                    result['deleted_count'] = sum(result['deleted'].values())
+                    self.logger.info(f"Eliminadas {result['deleted_count']} filas duplicadas entre shards")
+            
+            result['elapsed_seconds'] = round(time.perf_counter() - start, 3)
+            return result
+        
+        except Exception as e:
+            self.logger.error(f"Error detectando duplicados entre shards: {str(e)}")
+            raise
+    
+    def _scan_shard(self, index: int, columns_to_check: List[str], spill_dir: str) -> int:
+        """Lee claves e ids de un shard y las escribe en su archivo de cada partición"""
+        shard = self.shards[index]
+        locator = self._locator_columns(index)
+        query = f"SELECT {', '.join(columns_to_check)}, {', '.join(locator)} FROM {shard['table']}"
+        key_size = len(columns_to_check)
+        
+        files = [open(self._partition_path(spill_dir, index, partition), 'w', encoding='utf-8')
+                 for partition in range(self.partitions)]
+        rows = 0
+        try:
+            with shard['connector'].get_engine().connect() as conn:
+                result = conn.execution_options(stream_results=True).execute(text(query))
+                for row in result:
+                    key = json.dumps(list(row[:key_size]), default=str)
+                    row_id = row[key_size] if len(locator) == 1 else list(row[key_size:])
+                    files[self._partition_of(key)].write(
+                        json.dumps([key, row_id], default=str) + '\n'
+                    )
+                    rows += 1
+        finally:
+            for partition_file in files:
+                partition_file.close()
+        
+        self.logger.info(f"Shard {shard['name']}: {rows} filas leídas")
+        return rows
+    
+    def _join_partitions(self, columns_to_check: List[str], ranks: List[int],
+                         spill_dir: str) -> Dict[str, Any]:
+        """Agrupa cada partición en memoria y escribe las víctimas de cada shard"""
+        victims = {shard['name']: 0 for shard in self.shards}
+        sample = []
+        groups = 0
+        
+        victim_files = [open(self._victims_path(spill_dir, index), 'w', encoding='utf-8')
+                        for index in range(len(self.shards))]
+        try:
+            for partition in range(self.partitions):
+                members: Dict[str, Dict[int, List[Any]]] = {}
+                for index in range(len(self.shards)):
+                    for key, row_id in self._read_partition(spill_dir, index, partition):
+                        members.setdefault(key, {}).setdefault(index, []).append(row_id)
+                
+                for key, by_shard in members.items():
+                    if len(by_shard) < 2:
+                        continue
+                    groups += 1
+                    winner = min(by_shard, key=lambda index: ranks[index])
+                    for index, row_ids in by_shard.items():
+                        if index == winner:
+                            continue
+                        victims[self.shards[index]['name']] += len(row_ids)
+                        # La clave y el shard ganador viajan con cada víctima: al
+                        # borrar se comprueba que siguen siendo ciertos
+                        for row_id in row_ids:
+                            victim_files[index].write(json.dumps([key, row_id, winner]) + '\n')
+                    
+                    if len(sample) < DatabaseConfig.SHARD_SAMPLE_GROUPS:
+                        sample.append({
+                            "key": dict(zip(columns_to_check, json.loads(key))),
+                            "keep": self.shards[winner]['name'],
+                            "rows": {self.shards[index]['name']: row_ids
+                                     for index, row_ids in by_shard.items()}
+                        })
+        finally:
+            for victim_file in victim_files:
+                victim_file.close()
+        
+        return {"groups": groups, "victims": victims, "sample": sample}
+    
+    def _delete_victims(self, index: int, columns_to_check: List[str], spill_dir: str,
+                        cancel_token: Optional[CancellationToken] = None) -> int:
+        """
+        Borra por lotes las filas perdedoras de un shard, leyéndolas del disco
+        
+        Entre la lectura y el borrado pasa tiempo (y un backup completo), así
+        que cada lote se revalida: se descartan las víctimas cuya clave ya no
+        está en el shard ganador, y el DELETE exige localizador y clave, de
+        modo que una fila que cambió de clave (o un ctid reutilizado) no se
+        borra. Entre la comprobación en el ganador y el DELETE en este shard
+        no hay transacción común.
+        """
+        shard = self.shards[index]
+        locator = self._locator_columns(index)
+        batch_size = DatabaseConfig.SHARD_DELETE_BATCH_SIZE
+        deleted = 0
+        
+        with open(self._victims_path(spill_dir, index), 'r', encoding='utf-8') as victims_file:
+            batch = []
+            for line in victims_file:
+                batch.append(json.loads(line))
+                if len(batch) >= batch_size:
+                    deleted += self._delete_batch_with_retry(shard, locator, columns_to_check, batch,
+                                                             cancel_token, deleted)
+                    batch = []
+            if batch:
+                deleted += self._delete_batch_with_retry(shard, locator, columns_to_check, batch,
+                                                         cancel_token, deleted)
+        
+        self.logger.info(f"Shard {shard['name']}: {deleted} filas eliminadas")
+        return deleted
+    
+    def _delete_batch_with_retry(self, shard: Dict[str, Any], locator: List[str],
+                                 columns_to_check: List[str], batch: List[Any],
+                                 cancel_token: Optional[CancellationToken], deleted: int) -> int:
+        """Punto de cancelación entre lotes; reintenta el lote si agota el timeout de bloqueo"""
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled(deleted)
+        try:
+            return shard['connector'].run_with_retry(
+                lambda: self._delete_batch(shard, locator, columns_to_check, batch),
+                cancel_token, f"lote de eliminación de {shard['name']}"
+            )
+        except OperationCancelled as e:
+            raise OperationCancelled(e.reason, deleted) from None
+    
+    def _delete_batch(self, shard: Dict[str, Any], locator: List[str], columns_to_check: List[str],
+                      batch: List[Any]) -> int:
+        """DELETE de las víctimas del lote (localizador y clave) cuya clave sigue en su ganador"""
+        batch = self._still_won(columns_to_check, batch)
+        if not batch:
+            return 0
+        
+        conditions = []
+        params = {}
+        for row, (key, row_id, _) in enumerate(batch):
+            values = [row_id] if len(locator) == 1 else row_id
+            located = [f"{column} = :r{row}_{position}" for position, column in enumerate(locator)]
+            params.update({f"r{row}_{position}": value for position, value in enumerate(values)})
+            key_condition, key_params = self._key_condition(columns_to_check, json.loads(key),
+                                                            f"r{row}_k")
+            conditions.append('(' + ' AND '.join(located + [key_condition]) + ')')
+            params.update(key_params)
+        query = text(f"DELETE FROM {shard['table']} WHERE {' OR '.join(conditions)}")
+        
+        with shard['connector'].get_engine().connect() as conn:
+            deleted = conn.execute(query, params).rowcount
+            conn.commit()
+        return deleted
+    
+    def _still_won(self, columns_to_check: List[str], batch: List[Any]) -> List[Any]:
+        """Víctimas del lote cuya clave sigue en el shard ganador (si no, serían la última copia)"""
+        keys_by_winner: Dict[int, set] = {}
+        for key, _, winner in batch:
+            keys_by_winner.setdefault(winner, set()).add(key)
+        
+        present = set()
+        for winner, keys in keys_by_winner.items():
+            conditions = []
+            params = {}
+            for position, key in enumerate(sorted(keys)):
+                condition, key_params = self._key_condition(columns_to_check, json.loads(key),
+                                                            f"w{position}_k")
+                conditions.append(f"({condition})")
+                params.update(key_params)
+            shard = self.shards[winner]
+            query = text(f"SELECT DISTINCT {', '.join(columns_to_check)} FROM {shard['table']} "
+                         f"WHERE {' OR '.join(conditions)}")
+            with shard['connector'].get_engine().connect() as conn:
+                present.update((winner, json.dumps(list(row), default=str))
+                               for row in conn.execute(query, params))
+        
+        kept = [victim for victim in batch if (victim[2], victim[0]) in present]
+        if len(kept) < len(batch):
+            self.logger.warning(f"{len(batch) - len(kept)} víctimas descartadas: su clave ya no "
+                                f"está en el shard ganador")
+        return kept
+    
+    def _key_condition(self, columns_to_check: List[str], values: List[Any],
+                       prefix: str) -> Tuple[str, Dict[str, Any]]:
+        """Igualdad por cada columna clave (IS NULL si el valor leído era NULL)"""
+        conditions = []
+        params = {}
+        for position, (column, value) in enumerate(zip(columns_to_check, values)):
+            if value is None:
+                conditions.append(f"{column} IS NULL")
+            else:
+                conditions.append(f"{column} = :{prefix}{position}")
+                params[f"{prefix}{position}"] = value
+        return ' AND '.join(conditions), params
+    
+    def _locator_columns(self, index: int) -> List[str]:
+        """Columnas que localizan una fila del shard: la PK, o ctid/rowid solo si no tiene PK"""
+        shard = self.shards[index]
+        return SchemaReflector(shard['connector']).get_row_locator(shard['table'],
+                                                                   mode='primary_key')['columns']
+    
+    def _precedence_ranks(self, precedence: Optional[List[str]]) -> List[int]:
+        """Rango de cada shard (menor = mayor precedencia)"""
+        names = [shard['name'] for shard in self.shards]
+        precedence = list(precedence or [])
+        unknown = [name for name in precedence if name not in names]
+        if unknown:
+            raise ValueError(f"Shards desconocidos en la precedencia: {unknown}")
+        order = precedence + [name for name in names if name not in precedence]
+        return [order.index(name) for name in names]
+    
+    def _partition_of(self, key: str) -> int:
+        digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+        return int.from_bytes(digest, 'big') % self.partitions
+    
+    def _read_partition(self, spill_dir: str, index: int, partition: int) -> Iterator[List[Any]]:
+        with open(self._partition_path(spill_dir, index, partition), 'r', encoding='utf-8') as f:
+            for line in f:
+                yield json.loads(line)
+    
+    def _partition_path(self, spill_dir: str, index: int, partition: int) -> str:
+        return os.path.join(spill_dir, f"shard{index}_part{partition}.jsonl")
+    
+    def _victims_path(self, spill_dir: str, index: int) -> str:
+        return os.path.join(spill_dir, f"shard{index}_victims.jsonl")
@@ -1,19 +1,76 @@
 """
 Manejo de conexiones a base de datos
 """
-from sqlalchemy import create_engine, Engine
-from sqlalchemy.exc import SQLAlchemyError
-from typing import Optional
+import copy
+import itertools
+import math
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import create_engine, event, text, Engine
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from typing import (Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple, Union,
+                    TYPE_CHECKING)
 from .logger_setup import LoggerSetup
 from .config import DatabaseConfig
 
+if TYPE_CHECKING:
+    from .cancellation import CancellationToken
+
+# Fase en curso del hilo/tarea actual (ver database_phase)
+_current_phase: ContextVar[Optional[str]] = ContextVar('database_repair_phase', default=None)
+
+@contextmanager
+def database_phase(phase: str) -> Iterator[None]:
+    """
+    Marca la fase en curso ('analysis', 'backup', 'deletion', 'index', 'load')
+    
+    Las conexiones que se abran dentro aplican los timeouts configurados
+    para esa fase en su DatabaseConnector.
+    """
+    if phase not in DatabaseConfig.PHASE_TIMEOUTS:
+        raise ValueError(f"Fase no soportada: {phase}")
+    
+    token = _current_phase.set(phase)
+    try:
+        yield
+    finally:
+        _current_phase.reset(token)
+
 class DatabaseConnector:
     """Maneja las conexiones a diferentes tipos de base de datos"""
     
-    def __init__(self, connection_string: str, db_type: str):
+    def __init__(self, connection_string: str, db_type: str,
+                 timeouts: Optional[Dict[str, Dict[str, Optional[float]]]] = None,
+                 engine_options: Optional[Dict[str, Any]] = None,
+                 replicas: Optional[Union[str, Sequence[str]]] = None):
+        """
+        Args:
+            connection_string: URL de SQLAlchemy
+            db_type: 'postgresql', 'mysql' o 'sqlite'
+            timeouts: Por fase, {'statement_timeout': s, 'lock_timeout': s}
+                (segundos; None = sin límite); se combina con PHASE_TIMEOUTS
+            engine_options: Argumentos extra de create_engine (p. ej. pool_size)
+            replicas: URL (o lista de URLs) de réplicas de solo lectura; las
+                lecturas puras (análisis, conteos del simulacro, estadísticas y
+                planes) van a ellas mientras su retraso no supere REPLICA_MAX_LAG
+        """
         self.connection_string = connection_string
         self.db_type = db_type
+        self.engine_options = engine_options or {}
         self.engine: Optional[Engine] = None
+        self.replica_strings = [replicas] if isinstance(replicas, str) else list(replicas or [])
+        self.replica_engines: List[Engine] = []
+        self._replica_turn = itertools.count()
+        # Por réplica: (momento de la medición, retraso)
+        self._replica_lags: Dict[int, Tuple[float, Optional[float]]] = {}
+        
+        self.timeouts = copy.deepcopy(DatabaseConfig.PHASE_TIMEOUTS)
+        for phase, settings in (timeouts or {}).items():
+            if phase not in self.timeouts:
+                raise ValueError(f"Fase no soportada: {phase}")
+            self.timeouts[phase].update(settings)
         
         # Setup logger
         logger_setup = LoggerSetup()
@@ -21,6 +78,7 @@ class DatabaseConnector:
         
         self._validate_db_type()
         self._create_engine()
+        self._install_timeout_hooks()
     
     def _validate_db_type(self):
         """Valida que el tipo de BD sea soportado"""
@@ -30,8 +88,12 @@ class DatabaseConnector:
     def _create_engine(self):
         """Crea el engine de SQLAlchemy"""
         try:
-            self.engine = create_engine(self.connection_string)
-            self.logger.info(f"Engine creado para {self.db_type}")
+            self.engine = create_engine(self.connection_string, **self.engine_options)
+            self.replica_engines = [create_engine(replica, **self.engine_options)
+                                    for replica in self.replica_strings]
+            self.logger.info(f"Engine creado para {self.db_type}"
+                             + (f" con {len(self.replica_engines)} réplicas de lectura"
+                                if self.replica_engines else ""))
         except SQLAlchemyError as e:
             self.logger.error(f"Error creando engine: {str(e)}")
             raise
@@ -42,13 +104,205 @@ class DatabaseConnector:
             raise RuntimeError("Engine no inicializado")
         return self.engine
     
+    def get_read_engine(self) -> Engine:
+        """
+        Engine para lecturas que toleran unos segundos de retraso
+        
+        Rota entre las réplicas y salta las que superan REPLICA_MAX_LAG o no
+        permiten medir su retraso; sin réplicas utilizables, el primario.
+        """
+        for _ in range(len(self.replica_engines)):
+            index = next(self._replica_turn) % len(self.replica_engines)
+            lag = self._checked_replica_lag(index)
+            if lag is not None and lag <= DatabaseConfig.REPLICA_MAX_LAG:
+                return self.replica_engines[index]
+        if self.replica_engines:
+            self.logger.warning("Ninguna réplica al día; la lectura va al primario")
+        return self.get_engine()
+    
+    def is_replica(self, engine: Engine) -> bool:
+        """True si el engine es una de las réplicas de lectura"""
+        return any(engine is replica for replica in self.replica_engines)
+    
+    def replica_lag(self, engine: Optional[Engine] = None) -> Optional[float]:
+        """
+        Segundos de retraso de una réplica (por defecto, este engine); None si no se puede medir
+        
+        PostgreSQL: cero si ya aplicó todo el WAL recibido (un primario sin
+        escrituras no cuenta como retraso). MySQL: Seconds_Behind_Source.
+        """
+        engine = engine or self.get_engine()
+        try:
+            with engine.connect() as conn:
+                if self.db_type == 'postgresql':
+                    return float(conn.execute(text(
+                        "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+                        "ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0) END"
+                    )).scalar())
+                if self.db_type == 'mysql':
+                    row = conn.execute(text("SHOW REPLICA STATUS")).mappings().first()
+                    lag = row.get('Seconds_Behind_Source') if row is not None else None
+                    return None if lag is None else float(lag)
+        except Exception as e:
+            self.logger.debug(f"No se pudo medir el retraso de réplica: {str(e)}")
+        return None
+    
+    def max_replica_lag(self) -> Optional[float]:
+        """Retraso de la réplica más atrasada entre las que se pueden medir (None si ninguna)"""
+        lags = [lag for lag in map(self.replica_lag, self.replica_engines) if lag is not None]
+        return max(lags) if lags else None
+    
+    def _checked_replica_lag(self, index: int) -> Optional[float]:
+        """Retraso de la réplica, medido como mucho una vez cada REPLICA_LAG_CHECK_INTERVAL"""
+        now = time.monotonic()
+        measured = self._replica_lags.get(index)
+        if measured is None or now - measured[0] >= DatabaseConfig.REPLICA_LAG_CHECK_INTERVAL:
+            measured = (now, self.replica_lag(self.replica_engines[index]))
+            self._replica_lags[index] = measured
+            if measured[1] is None or measured[1] > DatabaseConfig.REPLICA_MAX_LAG:
+                self.logger.warning(f"Réplica {index} sin lecturas: retraso {measured[1]}")
+        return measured[1]
+    
     def test_connection(self) -> bool:
         """Prueba la conexión a la base de datos"""
         try:
             with self.engine.connect() as conn:
-                conn.execute("SELECT 1")
+                conn.execute(text("SELECT 1"))
             self.logger.info("Conexión exitosa")
             return True
         except Exception as e:
             self.logger.error(f"Error de conexión: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+    
+    def run_with_retry(self, operation: Callable[[], Any],
+                       cancel_token: Optional['CancellationToken'] = None,
+                       description: str = "operación") -> Any:
+        """
+        Ejecuta una operación (un lote en su propia transacción) reintentando
+        con espera exponencial si falla por timeout de bloqueo o deadlock
+        
+        Otros errores, incluido el statement_timeout, se propagan sin reintentar.
+        """
+        attempt = 0
+        while True:
+            try:
+                return operation()
+            except DBAPIError as e:
+                attempt += 1
+                if not self.is_lock_timeout(e) or attempt >= DatabaseConfig.LOCK_RETRY_ATTEMPTS:
+                    raise
+                
+                delay = min(DatabaseConfig.LOCK_RETRY_MAX_DELAY,
+                            DatabaseConfig.LOCK_RETRY_BASE_DELAY * 2 ** (attempt - 1))
+                delay *= random.uniform(0.5, 1.0)
+                self.logger.warning(
+                    f"Timeout de bloqueo en {description} (intento {attempt}); "
+                    f"reintento en {delay:.2f}s"
+                )
+                if cancel_token is not None:
+                    cancel_token.wait(delay)
+                    cancel_token.raise_if_cancelled()
+                else:
+                    time.sleep(delay)
+    
+    @staticmethod
+    def is_lock_timeout(error: Exception) -> bool:
+        """True para lock_timeout/deadlock (PostgreSQL), 1205/1213 (MySQL) o BD bloqueada (SQLite)"""
+        original = getattr(error, 'orig', None) or error
+        if getattr(original, 'pgcode', None) in ('55P03', '40P01'):
+            return True
+        args = getattr(original, 'args', ())
+        if args and args[0] in (1205, 1213):
+            return True
+        message = str(original).lower()
+        return 'database is locked' in message or 'database table is locked' in message
+    
+    def _install_timeout_hooks(self):
+        """Aplica los timeouts de la fase al tomar una conexión del pool y los deshace al devolverla"""
+        for engine in [self.engine, *self.replica_engines]:
+            if not isinstance(engine, Engine):
+                # Engine sustituido (p. ej. un doble de pruebas): no admite eventos
+                continue
+            event.listen(engine.pool, 'checkout', self._apply_phase_timeouts)
+            event.listen(engine.pool, 'checkin', self._reset_phase_timeouts)
+            if self.db_type == 'sqlite':
+                event.listen(engine, 'before_cursor_execute', self._start_sqlite_deadline)
+    
+    def _apply_phase_timeouts(self, dbapi_connection, connection_record, connection_proxy):
+        phase = _current_phase.get()
+        settings = self.timeouts.get(phase) if phase else None
+        if not settings or all(value is None for value in settings.values()):
+            return
+        
+        statement_timeout = settings.get('statement_timeout')
+        lock_timeout = settings.get('lock_timeout')
+        cursor = dbapi_connection.cursor()
+        try:
+            if self.db_type == 'postgresql':
+                if statement_timeout is not None:
+                    cursor.execute(f"SET statement_timeout = {int(statement_timeout * 1000)}")
+                if lock_timeout is not None:
+                    cursor.execute(f"SET lock_timeout = {int(lock_timeout * 1000)}")
+                dbapi_connection.commit()
+            elif self.db_type == 'mysql':
+                if statement_timeout is not None:
+                    # Solo limita SELECT; las escrituras quedan acotadas por el lock wait
+                    cursor.execute(f"SET SESSION max_execution_time = {int(statement_timeout * 1000)}")
+                if lock_timeout is not None:
+                    cursor.execute(
+                        f"SET SESSION innodb_lock_wait_timeout = {max(1, math.ceil(lock_timeout))}"
+                    )
+            else:
+                cursor.execute("PRAGMA busy_timeout")
+                connection_record.info['previous_busy_timeout'] = cursor.fetchone()[0]
+                if lock_timeout is not None:
+                    cursor.execute(f"PRAGMA busy_timeout = {int(lock_timeout * 1000)}")
+                if statement_timeout is not None:
+                    self._install_sqlite_statement_timeout(dbapi_connection, connection_record,
+                                                           statement_timeout)
+        finally:
+            cursor.close()
+        
+        connection_record.info['phase_timeouts'] = phase
+    
+    def _install_sqlite_statement_timeout(self, dbapi_connection, connection_record,
+                                          statement_timeout: float):
+        """SQLite no tiene statement_timeout: un progress handler interrumpe la sentencia"""
+        info = connection_record.info
+        info['statement_timeout'] = statement_timeout
+        info['statement_deadline'] = None
+        
+        def interrupt_after_deadline() -> int:
+            deadline = info.get('statement_deadline')
+            return 1 if deadline is not None and time.monotonic() > deadline else 0
+        
+        dbapi_connection.set_progress_handler(interrupt_after_deadline,
+                                              DatabaseConfig.SQLITE_PROGRESS_HANDLER_STEPS)
+    
+    def _start_sqlite_deadline(self, conn, cursor, statement, parameters, context, executemany):
+        if 'statement_timeout' in conn.info:
+            conn.info['statement_deadline'] = time.monotonic() + conn.info['statement_timeout']
+    
+    def _reset_phase_timeouts(self, dbapi_connection, connection_record):
+        if dbapi_connection is None or connection_record.info.pop('phase_timeouts', None) is None:
+            return
+        
+        try:
+            cursor = dbapi_connection.cursor()
+            if self.db_type == 'postgresql':
+                cursor.execute("RESET statement_timeout")
+                cursor.execute("RESET lock_timeout")
+                dbapi_connection.commit()
+            elif self.db_type == 'mysql':
+                cursor.execute("SET SESSION max_execution_time = DEFAULT")
+                cursor.execute("SET SESSION innodb_lock_wait_timeout = DEFAULT")
+            else:
+                dbapi_connection.set_progress_handler(None, 0)
+                cursor.execute(
+                    f"PRAGMA busy_timeout = {int(connection_record.info.pop('previous_busy_timeout', 5000))}"
+                )
+                connection_record.info.pop('statement_timeout', None)
+                connection_record.info.pop('statement_deadline', None)
+            cursor.close()
+        except Exception as e:
+            self.logger.warning(f"No se pudieron restablecer los timeouts de la conexión: {str(e)}")
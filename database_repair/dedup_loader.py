@@ -0,0 +1,315 @@
+"""
+Carga masiva que omite las filas cuya clave ya existe (deduplicación al ingerir)
+"""
+import csv
+import io
+import itertools
+import os
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+from sqlalchemy import delete, text
+from .database_connector import DatabaseConnector, database_phase
+from .schema_reflector import SchemaReflector
+from .query_builder import QueryBuilder
+from .cancellation import CancellationToken, OperationCancelled
+from .progress import ProgressCallback, ProgressTracker
+from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
+
+Row = Tuple[Any, ...]
+
+# Escapes del formato de texto de COPY
+_COPY_ESCAPES = str.maketrans({'\\': '\\\\', '\t': '\\t', '\n': '\\n', '\r': '\\r'})
+
+def _copy_value(value: Any) -> str:
+    """Valor en el formato de texto de COPY (\\N es NULL; tab, saltos y \\ escapados)"""
+    if value is None:
+        return '\\N'
+    if type(value) is str:
+        return value.translate(_COPY_ESCAPES)
+    if type(value) is int:
+        return str(value)
+    if isinstance(value, bool):
+        return 't' if value else 'f'
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return '\\\\x' + bytes(value).hex()
+    if isinstance(value, float) and value.is_integer():
+        # pandas pasa a float las columnas enteras con NaN; COPY no acepta '1.0' en un integer
+        return str(int(value))
+    return str(value).translate(_COPY_ESCAPES)
+
+class DedupLoader:
+    """
+    Carga lotes de filas en una tabla omitiendo las que repiten una clave existente
+    
+    Con un índice único (o PK) exactamente sobre las columnas clave el
+    conflicto lo resuelve la BD: INSERT ... ON CONFLICT DO NOTHING en
+    PostgreSQL/SQLite e INSERT IGNORE en MySQL. Sin índice único cada lote
+    pasa por una tabla temporal y se inserta con un anti-join NOT EXISTS;
+    eso no protege contra otra carga simultánea de la misma clave (para
+    eso hace falta el índice, ver UniqueConstraintInstaller).
+    
+    En PostgreSQL (psycopg2) cada lote llega a la tabla temporal con COPY;
+    en el resto se envía con executemany. Las claves repetidas dentro de un
+    lote se descartan antes de enviarlo, y las filas con alguna columna
+    clave NULL se insertan siempre, igual que con un índice único.
+    """
+    
+    def __init__(self, db_connector: DatabaseConnector):
+        self.db_connector = db_connector
+        self.engine = db_connector.get_engine()
+        self.db_type = db_connector.db_type
+        self.schema_reflector = SchemaReflector(db_connector)
+        self.query_builder = QueryBuilder(db_connector)
+        
+        # Setup logger
+        logger_setup = LoggerSetup()
+        self.logger = logger_setup.setup_logger(self.__class__.__name__)
+    
+    def load(self, table_name: str, source: Any, key_columns: List[str],
+             columns: Optional[List[str]] = None, mode: str = 'auto',
+             batch_size: Optional[int] = None,
+             cancel_token: Optional[CancellationToken] = None,
+             progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """
+        Inserta las filas de source cuya clave no existe todavía en la tabla
+        
+        Args:
+            table_name: Tabla destino
+            source: DataFrame, ruta a un CSV (con encabezado; '' se carga como
+                NULL) o iterable de diccionarios o de tuplas (estas requieren columns)
+            key_columns: Columnas que identifican una fila repetida
+            columns: Columnas a cargar (por defecto las del DataFrame, las del
+                CSV o las claves del primer diccionario)
+            mode: 'auto' (índice único si existe, si no tabla temporal),
+                'conflict' o 'staging'
+            batch_size: Filas por lote (por defecto LOAD_BATCH_SIZE); cada lote
+                es una transacción
+            cancel_token: Detiene la carga entre lotes; los lotes ya
+                confirmados quedan cargados
+            progress: Callback de avance (total conocido solo con DataFrame)
+        
+        Returns:
+            Diccionario con status, mode, copy, rows_read, inserted_count,
+            skipped_count (filas con clave existente o repetida en la carga)
+            y batches
+        """
+        if mode not in DatabaseConfig.LOAD_MODES:
+            raise ValueError(f"Modo de carga no soportado: {mode}")
+        
+        batch_size = batch_size or DatabaseConfig.LOAD_BATCH_SIZE
+        start = time.perf_counter()
+        columns, total, batches = self._read_source(source, columns, batch_size)
+        missing = [name for name in key_columns if name not in columns]
+        if missing:
+            raise ValueError(f"Las columnas clave {missing} no están entre las cargadas")
+        key_positions = [columns.index(name) for name in key_columns]
+        
+        mode = self._resolve_mode(table_name, key_columns, mode)
+        use_copy = self.db_type == 'postgresql' and self.engine.dialect.driver == 'psycopg2'
+        staging_name = None
+        if mode == 'staging' or use_copy:
+            staging_name = f"{DatabaseConfig.LOAD_STAGING_PREFIX}_{table_name.rpartition('.')[2]}"
+        
+        state = {"rows_read": 0, "inserted": 0, "batches": 0}
+        status, message = "success", None
+        try:
+            with database_phase('load'), self.engine.connect() as conn:
+                if staging_name:
+                    conn.execute(self.query_builder.create_staging(table_name, staging_name, columns))
+                    conn.commit()
+                try:
+                    with ProgressTracker('load', progress, total, table_name) as tracker:
+                        for batch in batches:
+                            if cancel_token is not None:
+                                cancel_token.raise_if_cancelled(state['rows_read'])
+                            rows = self._unique_in_batch(batch, key_positions)
+                            state['inserted'] += self.db_connector.run_with_retry(
+                                lambda: self._write_batch(conn, table_name, staging_name, columns,
+                                                          key_columns, mode, use_copy, rows),
+                                cancel_token, f"lote de carga de {table_name}"
+                            )
+                            state['rows_read'] += len(batch)
+                            state['batches'] += 1
+                            tracker.advance(len(batch))
+                finally:
+                    if staging_name:
+                        self._drop_staging(conn, staging_name)
+        
+        except OperationCancelled as e:
+            status, message = "cancelled", str(e)
+            self.logger.warning(f"Carga en {table_name} cancelada ({e})")
+        
+        except Exception as e:
+            self.logger.error(f"Error cargando filas en {table_name}: {str(e)}")
+            raise
+        
+        skipped = state['rows_read'] - state['inserted']
+        self.logger.info(
+            f"Carga en {table_name} ({mode}{', COPY' if use_copy else ''}): "
+            f"{state['inserted']} insertadas, {skipped} omitidas por clave repetida"
+        )
+        return {
+            "status": status,
+            "message": message,
+            "table": table_name,
+            "mode": mode,
+            "copy": use_copy,
+            "rows_read": state['rows_read'],
+            "inserted_count": state['inserted'],
+            "skipped_count": skipped,
+            "batches": state['batches'],
+            "elapsed_seconds": round(time.perf_counter() - start, 3)
+        }
+    
+    def has_unique_key(self, table_name: str, key_columns: Sequence[str]) -> bool:
+        """True si la PK o un índice único cubre exactamente las columnas clave"""
+        schema = self.schema_reflector.reflect(table_name)
+        keys = set(key_columns)
+        if set(schema['primary_key']) == keys:
+            return True
+        return any(index['unique'] and set(index['column_names']) == keys
+                   for index in schema['indexes'])
+    
+    def _resolve_mode(self, table_name: str, key_columns: List[str], mode: str) -> str:
+        if mode == 'staging':
+            return mode
+        unique = self.has_unique_key(table_name, key_columns)
+        if mode == 'conflict' and not unique:
+            raise ValueError(
+                f"{table_name} no tiene índice único sobre {key_columns}; "
+                f"use mode='staging' o instale el índice"
+            )
+        return 'conflict' if unique else 'staging'
+    
+    def _write_batch(self, conn, table_name: str, staging_name: Optional[str],
+                     columns: List[str], key_columns: List[str], mode: str, use_copy: bool,
+                     rows: List[Row]) -> int:
+        """Un lote en su propia transacción; retorna las filas insertadas"""
+        try:
+            if staging_name:
+                conn.execute(delete(self.query_builder.table(staging_name)))
+                if use_copy:
+                    self._copy_rows(conn, staging_name, columns, rows)
+                elif rows:
+                    conn.execute(self.query_builder.insert_rows(staging_name, columns),
+                                 [dict(zip(columns, row)) for row in rows])
+                query = self.query_builder.insert_new_rows(staging_name, table_name, columns,
+                                                           key_columns, mode == 'conflict')
+                inserted = conn.execute(query).rowcount
+            elif rows:
+                query = self.query_builder.insert_ignoring_conflicts(table_name, columns, key_columns)
+                inserted = conn.execute(query, [dict(zip(columns, row)) for row in rows]).rowcount
+            else:
+                inserted = 0
+            conn.commit()
+            return inserted
+        except Exception:
+            conn.rollback()
+            raise
+    
+    def _copy_rows(self, conn, staging_name: str, columns: List[str], rows: List[Row]):
+        """COPY ... FROM STDIN del lote a la tabla temporal (misma transacción que el INSERT)"""
+        quote = self.query_builder.dialect.identifier_preparer.quote
+        buffer = io.StringIO(''.join(
+            '\t'.join(_copy_value(value) for value in row) + '\n' for row in rows
+        ))
+        cursor = conn.connection.driver_connection.cursor()
+        try:
+            cursor.copy_expert(
+                f"COPY {self.query_builder.quote_table(staging_name)} "
+                f"({', '.join(quote(name) for name in columns)}) FROM STDIN",
+                buffer
+            )
+        finally:
+            cursor.close()
+    
+    def _drop_staging(self, conn, staging_name: str):
+        """La tabla temporal vive lo que la conexión, y el pool la reutiliza: se elimina al terminar"""
+        temporary = 'TEMPORARY ' if self.db_type == 'mysql' else ''
+        try:
+            conn.rollback()
+            conn.execute(text(
+                f"DROP {temporary}TABLE IF EXISTS {self.query_builder.quote_table(staging_name)}"
+            ))
+            conn.commit()
+        except Exception as e:
+            self.logger.warning(f"No se pudo eliminar la tabla temporal {staging_name}: {str(e)}")
+    
+    @staticmethod
+    def _unique_in_batch(batch: List[Row], key_positions: List[int]) -> List[Row]:
+        """Primera fila de cada clave del lote (las claves con NULL no se comparan)"""
+        seen = set()
+        rows = []
+        for row in batch:
+            key = tuple(row[position] for position in key_positions)
+            if None not in key:
+                if key in seen:
+                    continue
+                seen.add(key)
+            rows.append(row)
+        return rows
+    
+    def _read_source(self, source: Any, columns: Optional[List[str]],
+                     batch_size: int) -> Tuple[List[str], Optional[int], Iterator[List[Row]]]:
+        """Columnas, total (si se conoce) y lotes de tuplas en el orden de las columnas"""
+        if isinstance(source, (str, os.PathLike)):
+            return self._read_csv(source, columns, batch_size)
+        
+        if hasattr(source, 'itertuples') and hasattr(source, 'columns'):
+            columns = list(columns or source.columns)
+            return columns, len(source), self._frame_batches(source[columns], batch_size)
+        
+        rows = iter(source)
+        first = next(rows, None)
+        if first is None:
+            if not columns:
+                raise ValueError("Origen vacío: indique columns")
+            return list(columns), 0, iter(())
+        rows = itertools.chain([first], rows)
+        if isinstance(first, dict):
+            columns = list(columns or first)
+            rows = (tuple(row.get(name) for name in columns) for row in rows)
+        elif not columns:
+            raise ValueError("Las filas como tuplas requieren columns")
+        else:
+            columns = list(columns)
+            rows = (tuple(row) for row in rows)
+        return columns, None, self._chunked(rows, batch_size)
+    
+    def _read_csv(self, path: str, columns: Optional[List[str]],
+                  batch_size: int) -> Tuple[List[str], Optional[int], Iterator[List[Row]]]:
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            header = next(csv.reader(f), None) or []
+        columns = list(columns or header)
+        missing = [name for name in columns if name not in header]
+        if missing:
+            raise ValueError(f"El CSV {path} no tiene las columnas {missing}")
+        positions = [header.index(name) for name in columns]
+        
+        def rows() -> Iterator[Row]:
+            with open(path, newline='', encoding='utf-8-sig') as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                for record in reader:
+                    yield tuple(record[position] if record[position] != '' else None
+                                for position in positions)
+        
+        return columns, None, self._chunked(rows(), batch_size)
+    
+    @staticmethod
+    def _frame_batches(frame: Any, batch_size: int) -> Iterator[List[Row]]:
+        """Lotes de un DataFrame con NaN/NaT como None y escalares de Python"""
+        for start in range(0, len(frame), batch_size):
+            chunk = frame.iloc[start:start + batch_size].astype(object)
+            chunk = chunk.where(chunk.notna(), None)
+            yield list(chunk.itertuples(index=False, name=None))
+    
+    @staticmethod
+    def _chunked(rows: Iterable[Row], batch_size: int) -> Iterator[List[Row]]:
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, batch_size))
+            if not batch:
+                return
+            yield batch
@@ -0,0 +1,337 @@
+"""
+Flujo plan/apply: víctimas exactas persistidas y eliminación posterior de ese conjunto
+"""
+import hashlib
+import json
+import os
+import struct
+import time
+from array import array
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import false
+from .atomic_file import atomic_write
+from .database_connector import DatabaseConnector, database_phase
+from .backup_manager import BackupManager
+from .schema_reflector import SchemaReflector
+from .query_builder import QueryBuilder
+from .throttle_controller import ThrottleController
+from .cancellation import CancellationToken, OperationCancelled
+from .progress import ProgressCallback, ProgressTracker
+from .id_set import IdSet
+from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
+
+PLAN_MAGIC = b'DEDUPPLAN'
+PLAN_FORMAT_VERSION = 1
+
+class DeletionPlan:
+    """
+    Víctimas y supervivientes exactos de una tabla, con la huella del esquema
+    
+    Archivo: PLAN_MAGIC, versión y longitud de la cabecera JSON, la cabecera
+    y después las secciones de víctimas y supervivientes (IdSet.to_bytes). La
+    cabecera lleva el SHA-256 de las secciones para detectar archivos dañados.
+    """
+    
+    def __init__(self, header: Dict[str, Any], victims: IdSet, kept: IdSet):
+        self.header = header
+        self.victims = victims
+        self.kept = kept
+    
+    def save(self, path: str) -> int:
+        """Escribe el plan (archivo temporal + os.replace) y retorna su tamaño en bytes"""
+        victims_blob = self.victims.to_bytes()
+        kept_blob = self.kept.to_bytes()
+        self.header.update({
+            "victim_count": len(self.victims),
+            "kept_count": len(self.kept),
+            "sections": {"victims": len(victims_blob), "kept": len(kept_blob)},
+            "sha256": hashlib.sha256(victims_blob + kept_blob).hexdigest()
+        })
+        header_bytes = json.dumps(self.header, sort_keys=True).encode('utf-8')
+        
+        with atomic_write(path, binary=True) as f:
+            f.write(PLAN_MAGIC)
+            f.write(struct.pack('<HI', PLAN_FORMAT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            f.write(victims_blob)
+            f.write(kept_blob)
+        return os.path.getsize(path)
+    
+    @classmethod
+    def load(cls, path: str) -> 'DeletionPlan':
+        with open(path, 'rb') as f:
+            data = f.read()
+        
+        if not data.startswith(PLAN_MAGIC):
+            raise ValueError(f"{path} no es un plan de eliminación")
+        offset = len(PLAN_MAGIC)
+        version, header_size = struct.unpack_from('<HI', data, offset)
+        if version != PLAN_FORMAT_VERSION:
+            raise ValueError(f"Versión de plan no soportada: {version}")
+        offset += struct.calcsize('<HI')
+        header = json.loads(data[offset:offset + header_size].decode('utf-8'))
+        offset += header_size
+        
+        victims_end = offset + header['sections']['victims']
+        kept_end = victims_end + header['sections']['kept']
+        if hashlib.sha256(data[offset:kept_end]).hexdigest() != header['sha256']:
+            raise ValueError(f"El plan {path} está dañado (checksum distinto)")
+        
+        return cls(header, IdSet.from_bytes(data[offset:victims_end]),
+                   IdSet.from_bytes(data[victims_end:kept_end]))
+
+class DeletionPlanner:
+    """
+    Separa la revisión de la eliminación: plan() guarda las víctimas exactas
+    y apply() elimina ese mismo conjunto más tarde
+    
+    apply() no vuelve a agrupar la tabla: borra por clave primaria en lotes,
+    cuenta como omitidas las víctimas que ya no existen y se niega a seguir
+    si cambió el esquema o si falta alguna fila que el plan conservaba.
+    
+    Entre plan() y apply() la tabla sigue cambiando (y plan() puede leer de
+    una réplica atrasada), así que apply() revalida cada lote en el
+    primario: solo borra las víctimas cuya clave sigue repetida fuera del
+    lote; una víctima cuya clave un UPDATE dejó única se omite.
+    """
+    
+    def __init__(self, db_connector: DatabaseConnector):
+        self.db_connector = db_connector
+        self.engine = db_connector.get_engine()
+        self.db_type = db_connector.db_type
+        self.backup_manager = BackupManager(db_connector)
+        self.schema_reflector = SchemaReflector(db_connector)
+        self.query_builder = QueryBuilder(db_connector)
+        
+        # Setup logger
+        logger_setup = LoggerSetup()
+        self.logger = logger_setup.setup_logger(self.__class__.__name__)
+    
+    def plan(self, table_name: str, columns_to_check: List[str], strategy: str = 'oldest',
+             path: Optional[str] = None,
+             progress: Optional[ProgressCallback] = None) -> Dict[str, Any]:
+        """
+        Calcula víctimas y supervivientes con una sola pasada de ROW_NUMBER() y los guarda
+        
+        Args:
+            table_name: Nombre de la tabla (clave primaria entera de una columna)
+            columns_to_check: Columnas que definen duplicado
+            strategy: 'oldest' o 'newest'
+            path: Archivo del plan (por defecto <tabla>_<fecha>PLAN_FILE_SUFFIX)
+            progress: Callback de avance de la lectura de filas
+        
+        Returns:
+            Resumen del plan: archivo, víctimas, supervivientes, filas y tamaño
+        """
+        if strategy not in ('oldest', 'newest'):
+            raise ValueError(f"Estrategia no soportada: {strategy}")
+        
+        path = path or (f"{table_name}_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+                        f"{DatabaseConfig.PLAN_FILE_SUFFIX}")
+        
+        try:
+            key = self.schema_reflector.integer_key(table_name)
+            if key is None:
+                raise ValueError(f"El plan requiere una clave primaria entera de una columna "
+                                 f"en {table_name}")
+            keep_strategy = 'MIN' if strategy == 'oldest' else 'MAX'
+            query = self.query_builder.ranked_members(table_name, columns_to_check,
+                                                      keep_strategy, key)
+            victims, kept = array('q'), array('q')
+            
+            read_engine = self.db_connector.get_read_engine()
+            from_replica = self.db_connector.is_replica(read_engine)
+            with database_phase('analysis'):
+                with read_engine.connect() as conn:
+                    fingerprint = self.schema_reflector.fingerprint(table_name)
+                    rows_total = conn.execute(self.query_builder.count_rows(table_name)).scalar()
+                    
+                    with ProgressTracker('analysis', progress, table=table_name,
+                                         check_every=DatabaseConfig.PROGRESS_CHECK_ROWS) as tracker:
+                        result = conn.execution_options(stream_results=True).execute(query)
+                        for row_id, rank in result:
+                            (kept if rank == 1 else victims).append(row_id)
+                            tracker.advance()
+            
+            plan = DeletionPlan({
+                "format": PLAN_FORMAT_VERSION,
+                "created_at": datetime.now().isoformat(timespec='seconds'),
+                "database": self.engine.url.render_as_string(hide_password=True),
+                "db_type": self.db_type,
+                "table": table_name,
+                "columns": list(columns_to_check),
+                "strategy": strategy,
+                "key": key,
+                "fingerprint": fingerprint,
+                "rows_total": int(rows_total),
+                "read_from": "replica" if from_replica else "primary",
+                "replica_lag": self.db_connector.replica_lag(read_engine) if from_replica else None
+            }, IdSet(victims), IdSet(kept))
+            file_size = plan.save(path)
+            
+            self.logger.info(
+                f"Plan de {table_name}: {len(victims)} víctimas, {len(kept)} supervivientes "
+                f"en {path} ({file_size} bytes)"
+            )
+            return {
+                "status": "success",
+                "plan_file": path,
+                "table": table_name,
+                "victim_count": len(victims),
+                "kept_count": len(kept),
+                "rows_total": int(rows_total),
+                "file_bytes": file_size,
+                "read_from": plan.header['read_from']
+            }
+        
+        except Exception as e:
+            self.logger.error(f"Error creando el plan de {table_name}: {str(e)}")
+            raise
+    
+    def apply(self, path: str, backup: bool = True,
+              throttle: Optional[ThrottleController] = None,
+              cancel_token: Optional[CancellationToken] = None,
+              progress: Optional[ProgressCallback] = None,
+              force: bool = False) -> Dict[str, Any]:
+        """
+        Elimina exactamente las víctimas del plan, por lotes de clave primaria
+        
+        Args:
+            path: Archivo creado por plan()
+            backup: Si True, las filas que borra cada lote se copian a una
+                tabla de backup en la misma transacción en que se eliminan
+            throttle: Si se indica, tamaño de lote y pausas los decide el
+                controlador; si no, lotes fijos de PLAN_APPLY_BATCH_SIZE
+            cancel_token: Detiene la eliminación entre lotes; los lotes ya
+                confirmados quedan eliminados y el plan puede aplicarse de nuevo
+            progress: Callback de avance (total exacto: víctimas del plan)
+            force: Aplica aunque haya cambiado el esquema o falten supervivientes;
+                aun así nunca borra la última copia de una clave
+        
+        Returns:
+            Diccionario con status, deleted_count, skipped_count (víctimas que
+            ya no existían o ya no estaban repetidas), backup_table y timings
+        """
+        timings = {}
+        run_start = time.perf_counter()
+        plan = DeletionPlan.load(path)
+        table_name, key = plan.header['table'], plan.header['key']
+        state = {"position": 0, "deleted": 0}
+        backup_name = None
+        
+        try:
+            phase_start = time.perf_counter()
+            with database_phase('analysis'):
+                self._validate(plan, force)
+            timings['validation'] = time.perf_counter() - phase_start
+            
+            if backup and len(plan.victims):
+                with database_phase('backup'):
+                    backup_name = self.backup_manager.create_backup(table_name, where=false())
+            
+            columns = plan.header['columns']
+            copy_query = (self.query_builder.copy_revalidated(table_name, backup_name,
+                                                              columns, [key])
+                          if backup_name else None)
+            # El primario confirma en cada lote que las víctimas siguen repetidas
+            if plan.header.get('read_from') == 'replica':
+                self.logger.info(f"Plan calculado en una réplica (retraso "
+                                 f"{plan.header.get('replica_lag')}s)")
+            delete_query = self.query_builder.delete_revalidated(table_name, columns, [key])
+            
+            def delete_ids(row_ids: List[int]) -> int:
+                with self.engine.connect() as conn:
+                    if copy_query is not None:
+                        conn.execute(copy_query, {"row_ids": row_ids, "batch_ids": row_ids})
+                    deleted = conn.execute(delete_query, {"row_ids": row_ids,
+                                                          "batch_ids": row_ids}).rowcount
+                    conn.commit()
+                return deleted
+            
+            def delete_batch(batch_size: int) -> Optional[int]:
+                start = state['position']
+                row_ids = plan.victims[start:start + batch_size].tolist()
+                if not row_ids:
+                    return None
+                state['deleted'] += self.db_connector.run_with_retry(
+                    lambda: delete_ids(row_ids), cancel_token, f"lote del plan de {table_name}"
+                )
+                state['position'] += len(row_ids)
+                return len(row_ids)
+            
+            phase_start = time.perf_counter()
+            with database_phase('deletion'):
+                with ProgressTracker('deletion', progress, len(plan.victims), table_name) as tracker:
+                    if throttle is not None:
+                        throttle.run_batches(delete_batch, cancel_token, tracker)
+                    else:
+                        while True:
+                            if cancel_token is not None:
+                                cancel_token.raise_if_cancelled(state['position'])
+                            processed = delete_batch(DatabaseConfig.PLAN_APPLY_BATCH_SIZE)
+                            if processed is None:
+                                break
+                            tracker.advance(processed)
+            timings['deletion'] = time.perf_counter() - phase_start
+            
+            status, message = "success", None
+        
+        except OperationCancelled as e:
+            status, message = "cancelled", str(e)
+            self.logger.warning(f"Aplicación del plan cancelada ({e})")
+        
+        except Exception as e:
+            self.logger.error(f"Error aplicando el plan {path}: {str(e)}")
+            raise
+        
+        skipped = state['position'] - state['deleted']
+        self.logger.info(
+            f"Plan {path}: {state['deleted']} eliminadas, {skipped} ya no existían o ya no "
+            f"estaban repetidas ({len(plan.victims) - state['position']} pendientes)"
+        )
+        timings['total'] = time.perf_counter() - run_start
+        return {
+            "status": status,
+            "message": message,
+            "table": table_name,
+            "plan_file": path,
+            "planned": len(plan.victims),
+            "deleted_count": state['deleted'],
+            "skipped_count": skipped,
+            "pending_count": len(plan.victims) - state['position'],
+            "backup_table": backup_name,
+            "read_from": plan.header.get('read_from'),
+            "throttle": throttle.metrics() if throttle is not None else None,
+            "timings": {phase: round(seconds, 3) for phase, seconds in timings.items()}
+        }
+    
+    def _validate(self, plan: DeletionPlan, force: bool):
+        """Comprueba tipo de BD, huella del esquema y que los supervivientes sigan existiendo"""
+        header = plan.header
+        table_name = header['table']
+        problems = []
+        
+        if header['db_type'] != self.db_type:
+            raise ValueError(f"El plan es para {header['db_type']}, no para {self.db_type}")
+        if header['database'] != self.engine.url.render_as_string(hide_password=True):
+            self.logger.warning(f"El plan se creó en otra conexión: {header['database']}")
+        
+        if self.schema_reflector.fingerprint(table_name) != header['fingerprint']:
+            problems.append(f"el esquema de {table_name} cambió desde el plan")
+        
+        count_query = self.query_builder.count_by_locator(table_name, [header['key']])
+        present = 0
+        batch_size = DatabaseConfig.PLAN_APPLY_BATCH_SIZE
+        with self.engine.connect() as conn:
+            for batch in plan.kept.batches(batch_size):
+                present += conn.execute(count_query, {"row_ids": batch.tolist()}).scalar()
+        missing = len(plan.kept) - present
+        if missing:
+            problems.append(f"{missing} filas que el plan conservaba ya no existen")
+        
+        if problems and not force:
+            raise ValueError(f"Plan no aplicable: {'; '.join(problems)} (use force para aplicarlo)")
+        for problem in problems:
+            self.logger.warning(f"Aplicando el plan pese a que {problem}")
@@ -1,92 +1,217 @@
 """
 Análisis de registros duplicados
 """
-import pandas as pd
 from sqlalchemy import text
-from typing import List
+from sqlalchemy.sql.expression import Select
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Union
 from .database_connector import DatabaseConnector
+from .duplicate_groups import DuplicateGroups, parse_id_list
+from .lazy_import import is_available, lazy_module
+from .schema_reflector import SchemaReflector
+from .query_builder import QueryBuilder
+from .progress import ProgressCallback, ProgressTracker
 from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
+
+# pandas es opcional y se importa en el primer análisis que lo necesite
+pd = lazy_module('pandas')
 
 class DuplicateAnalyzer:
-    """Analiza y encuentra registros duplicados en tablas"""
+    """Analiza y encuentra registros duplicados en tablas (lee de una réplica si hay)"""
     
     def __init__(self, db_connector: DatabaseConnector):
         self.db_connector = db_connector
         self.engine = db_connector.get_engine()
         self.db_type = db_connector.db_type
+        self.schema_reflector = SchemaReflector(db_connector)
+        self.query_builder = QueryBuilder(db_connector)
         
         # Setup logger
         logger_setup = LoggerSetup()
         self.logger = logger_setup.setup_logger(self.__class__.__name__)
     
-    def analyze_duplicates(self, table_name: str, columns_to_check: List[str]) -> pd.DataFrame:
+    def analyze_duplicates(self, table_name: str, columns_to_check: List[str],
+                           as_frame: Optional[bool] = None,
+                           include_ids: bool = True,
+                           progress: Optional[ProgressCallback] = None
+                           ) -> Union['pd.DataFrame', DuplicateGroups]:
         """
         Analiza duplicados en una tabla específica
         
         Args:
             table_name: Nombre de la tabla
             columns_to_check: Columnas que definen un duplicado
+            as_frame: True para DataFrame (requiere pandas), False para
+                DuplicateGroups; None elige DataFrame si pandas está instalado
+            include_ids: Si False, solo resúmenes por grupo (sin all_ids)
+            progress: Callback de avance; cuenta las filas (o los grupos)
+                leídos, sin total porque no se conoce hasta terminar
             
         Returns:
-            DataFrame con información sobre duplicados
+            DataFrame o DuplicateGroups con un grupo por clave duplicada;
+            all_ids es siempre una lista de ids ordenada
+        
+        DuplicateGroups no agrega ids en la BD: lee los miembros fila a fila,
+        así que no sufre el truncado de GROUP_CONCAT ni construye un
+        ARRAY_AGG gigante para claves con millones de duplicados.
         """
+        if as_frame is None:
+            as_frame = is_available(pd)
+        
         try:
-            columns_str = ', '.join(columns_to_check)
-            
-            # Query base
-            query = f"""
-            WITH duplicates AS (
-                SELECT {columns_str}, COUNT(*) as duplicate_count,
-                       MIN(id) as min_id, MAX(id) as max_id,
-                       ARRAY_AGG(id ORDER BY id) as all_ids
-                FROM {table_name}
-                GROUP BY {columns_str}
-                HAVING COUNT(*) > 1
-            )
-            SELECT * FROM duplicates
-            ORDER BY duplicate_count DESC
-            """
-            
-            # Ajustar query según tipo de BD
-            query = self._adjust_query_for_db_type(query)
+            locator = self.schema_reflector.get_row_locator(table_name)
+            unit = 'rows' if include_ids and not as_frame else 'groups'
             
-            duplicates_df = pd.read_sql(query, self.engine)
+            with ProgressTracker('analysis', progress, table=table_name, unit=unit,
+                                 check_every=DatabaseConfig.PROGRESS_CHECK_ROWS) as tracker:
+                if as_frame:
+                    duplicates = self._read_frame(self.query_builder.duplicate_summary(
+                        table_name, columns_to_check, locator, include_ids=include_ids
+                    ))
+                    tracker.advance(len(duplicates))
+                    if 'all_ids' in duplicates:
+                        duplicates['all_ids'] = duplicates['all_ids'].map(parse_id_list)
+                        self._warn_truncated_ids(duplicates)
+                    total_duplicates = (duplicates['duplicate_count'].sum() - len(duplicates)
+                                        if len(duplicates) > 0 else 0)
+                else:
+                    if include_ids:
+                        duplicates = self._fetch_groups(table_name, columns_to_check, locator,
+                                                        tracker)
+                    else:
+                        duplicates = DuplicateGroups(columns_to_check)
+                        for summary in self.iter_duplicate_summaries(table_name, columns_to_check):
+                            duplicates.append([summary[column] for column in columns_to_check],
+                                              [], summary['duplicate_count'])
+                            tracker.advance()
+                    total_duplicates = duplicates.total_duplicates
             
-            self.logger.info(f"Encontrados {len(duplicates_df)} grupos de duplicados en {table_name}")
-            if len(duplicates_df) > 0:
-                total_duplicates = duplicates_df['duplicate_count'].sum() - len(duplicates_df)
+            self.logger.info(f"Encontrados {len(duplicates)} grupos de duplicados en {table_name}")
+            if len(duplicates) > 0:
                 self.logger.info(f"Total de registros duplicados: {total_duplicates}")
             
-            return duplicates_df
+            return duplicates
             
         except Exception as e:
             self.logger.error(f"Error analizando duplicados: {str(e)}")
             raise
     
-    def _adjust_query_for_db_type(self, query: str) -> str:
-        """Ajusta la query según el tipo de base de datos"""
-        if self.db_type == 'mysql':
-            query = query.replace('ARRAY_AGG(id ORDER BY id)', 'GROUP_CONCAT(id ORDER BY id)')
-        elif self.db_type == 'sqlite':
-            query = query.replace('ARRAY_AGG(id ORDER BY id)', 'GROUP_CONCAT(id)')
+    def iter_duplicate_summaries(self, table_name: str,
+                                 columns_to_check: List[str]) -> Iterator[Dict[str, Any]]:
+        """
+        Resúmenes por grupo (claves, duplicate_count, min_id, max_id) sin lista de ids
+        
+        Se leen en streaming, de mayor a menor grupo; los ids de cada grupo
+        se piden después con iter_group_ids.
+        """
+        locator = self.schema_reflector.get_row_locator(table_name)
+        query = self.query_builder.duplicate_summary(table_name, columns_to_check, locator)
         
-        return query
+        with self.db_connector.get_read_engine().connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(query)
+            for row in result:
+                yield dict(row._mapping)
+    
+    def iter_group_ids(self, table_name: str, columns_to_check: List[str], key: Sequence[Any],
+                       page_size: Optional[int] = None) -> Iterator[List[Any]]:
+        """
+        Ids de un grupo en páginas ordenadas, con paginación keyset
+        
+        Cada página continúa tras la última fila de la anterior según la
+        clave de orden del localizador (PK o ctid/rowid), así que ninguna
+        consulta materializa más de page_size ids por grande que sea el grupo.
+        
+        Args:
+            table_name: Nombre de la tabla
+            columns_to_check: Columnas que definen un duplicado
+            key: Valores de esas columnas para el grupo (None = IS NULL)
+            page_size: Ids por página (por defecto ID_PAGE_SIZE)
+        """
+        page_size = page_size or DatabaseConfig.ID_PAGE_SIZE
+        locator = self.schema_reflector.get_row_locator(table_name)
+        null_key = [value is None for value in key]
+        first_page, next_page = (
+            self.query_builder.group_id_page(table_name, columns_to_check, null_key, locator, after)
+            for after in (False, True)
+        )
+        
+        params: Dict[str, Any] = {f"key_{index}": value for index, value in enumerate(key)
+                                  if value is not None}
+        params['page_size'] = int(page_size)
+        
+        last_row = None
+        with self.db_connector.get_read_engine().connect() as conn:
+            while True:
+                if last_row:
+                    params.update({f"after_{index}": value for index, value in enumerate(last_row)})
+                
+                rows = conn.execute(next_page if last_row else first_page, params).fetchall()
+                if rows:
+                    yield [row[0] for row in rows]
+                if len(rows) < page_size:
+                    return
+                last_row = tuple(rows[-1][1:])
+    
+    def _fetch_groups(self, table_name: str, columns_to_check: List[str],
+                      locator: Dict[str, Any],
+                      progress: Optional[ProgressTracker] = None) -> DuplicateGroups:
+        """
+        Lee los miembros de los grupos fila a fila hacia arreglos compactos
+        
+        Una función de ventana marca el tamaño de cada grupo y las filas
+        llegan ordenadas por tamaño y clave, así que un grupo son las
+        siguientes dedup_group_size filas y los grupos ya vienen de mayor a
+        menor; no hace falta agregar ids en la BD ni reordenar (una copia).
+        """
+        query = self.query_builder.group_members(table_name, columns_to_check, locator)
+        
+        groups = DuplicateGroups(columns_to_check)
+        key_size = len(columns_to_check)
+        key, ids, remaining = None, [], 0
+        
+        with self.db_connector.get_read_engine().connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(query)
+            for row in result:
+                if remaining == 0:
+                    key, ids, remaining = row[:key_size], [], row[key_size + 1]
+                ids.append(row[key_size])
+                remaining -= 1
+                if progress is not None:
+                    progress.advance()
+                if remaining == 0:
+                    groups.append(key, ids)
+        
+        return groups
+    
+    def _read_frame(self, query: Select) -> 'pd.DataFrame':
+        """read_sql; en MySQL amplía group_concat_max_len en la misma sesión"""
+        if self.db_type != 'mysql':
+            return pd.read_sql(query, self.db_connector.get_read_engine())
+        
+        with self.db_connector.get_read_engine().connect() as conn:
+            conn.execute(text(f"SET SESSION group_concat_max_len = "
+                              f"{int(DatabaseConfig.MYSQL_GROUP_CONCAT_MAX_LEN)}"))
+            return pd.read_sql(query, conn)
+    
+    def _warn_truncated_ids(self, duplicates: 'pd.DataFrame'):
+        """Avisa si la lista agregada tiene menos ids que el grupo (GROUP_CONCAT truncado)"""
+        truncated = int((duplicates['all_ids'].map(len) < duplicates['duplicate_count']).sum())
+        if truncated:
+            self.logger.warning(
+                f"{truncated} grupos con lista de ids truncada; use as_frame=False "
+                "o iter_group_ids para obtenerlos completos"
+            )
     
     def count_total_duplicates(self, table_name: str, columns_to_check: List[str]) -> int:
-        """Cuenta el total de registros duplicados"""
+        """Cuenta el total de registros duplicados (filas sobrantes, como analyze_duplicates)"""
         try:
-            columns_str = ', '.join(columns_to_check)
-            
-            count_query = f"""
-            SELECT COUNT(*) - COUNT(DISTINCT {columns_str}) as duplicate_count
-            FROM {table_name}
-            """
+            count_query = self.query_builder.excess_rows(table_name, columns_to_check)
             
-            with self.engine.connect() as conn:
-                result = conn.execute(text(count_query))
+            with self.db_connector.get_read_engine().connect() as conn:
+                result = conn.execute(count_query)
                 count = result.fetchone()[0]
             
-            return count
+            return int(count)
             
         except Exception as e:
             self.logger.error(f"Error contando duplicados: {str(e)}")
@@ -0,0 +1,197 @@
+"""
+Resultado compacto del análisis de duplicados
+"""
+import re
+from array import array
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from .lazy_import import lazy_module
+from .id_set import IdSet
+
+np = lazy_module('numpy')
+pd = lazy_module('pandas')
+pa = lazy_module('pyarrow')
+
+# Elementos de un literal de array de PostgreSQL: "(0,1)" entre comillas o valores simples
+_PG_ARRAY_ITEM = re.compile(r'"([^"]*)"|([^,{}]+)')
+
+def parse_id_list(value: Any) -> List[Any]:
+    """
+    Normaliza la lista de ids agregada por la BD
+    
+    Acepta listas (ARRAY_AGG en PostgreSQL), literales de array ('{1,2}')
+    y cadenas separadas por comas (GROUP_CONCAT en MySQL/SQLite). Retorna
+    enteros si todos los ids lo son; si no, cadenas (ctid, PK compuesta).
+    """
+    if value is None:
+        return []
+    
+    if isinstance(value, (list, tuple)):
+        items = list(value)
+    else:
+        text_value = str(value).strip()
+        if text_value.startswith('{') and text_value.endswith('}'):
+            items = [quoted or bare for quoted, bare in _PG_ARRAY_ITEM.findall(text_value)]
+        else:
+            items = text_value.split(',') if text_value else []
+    
+    try:
+        return [int(item) for item in items]
+    except (TypeError, ValueError):
+        return [str(item).strip() for item in items]
+
+class DuplicateGroups:
+    """
+    Grupos de duplicados en arreglos contiguos
+    
+    Los ids de todos los grupos van en un único arreglo plano int64 y cada
+    grupo es el tramo ids[offsets[i]:offsets[i + 1]] (formato CSR). Así un
+    grupo cuesta unos bytes por id en lugar de un objeto int y una lista de
+    Python por fila de un DataFrame. Si la tabla se localiza por ctid o PK
+    compuesta, los ids se guardan como lista de cadenas.
+    """
+    
+    def __init__(self, key_columns: Sequence[str]):
+        self.key_columns = list(key_columns)
+        # Valores clave por columna (sin una tupla por grupo)
+        self.key_values: List[List[Any]] = [[] for _ in self.key_columns]
+        self.counts = array('q')
+        self.offsets = array('q', [0])
+        self.ids: Union[array, List[Any]] = array('q')
+    
+    def append(self, key: Sequence[Any], ids: Sequence[Any], count: Optional[int] = None):
+        """Agrega un grupo; los ids enteros se ordenan ascendentemente (ids vacíos: solo resumen)"""
+        ids = parse_id_list(ids)
+        if ids and isinstance(ids[0], str) and isinstance(self.ids, array):
+            # Primer id no entero: se abandona la representación int64
+            self.ids = [str(row_id) for row_id in self.ids]
+        
+        if ids and isinstance(ids[0], int):
+            ids.sort()
+        if isinstance(self.ids, array):
+            self.ids.extend(ids)
+        else:
+            self.ids.extend(str(row_id) for row_id in ids)
+        
+        for values, value in zip(self.key_values, key):
+            values.append(value)
+        self.counts.append(len(ids) if count is None else int(count))
+        self.offsets.append(len(self.ids))
+    
+    def __len__(self) -> int:
+        return len(self.counts)
+    
+    @property
+    def empty(self) -> bool:
+        """Compatible con DataFrame.empty"""
+        return len(self.counts) == 0
+    
+    @property
+    def total_duplicates(self) -> int:
+        """Registros sobrantes (total de filas en grupos menos un superviviente por grupo)"""
+        return sum(self.counts) - len(self.counts)
+    
+    @property
+    def nbytes(self) -> int:
+        """Memoria aproximada de los arreglos de ids, conteos y offsets"""
+        id_bytes = (self.ids.itemsize * len(self.ids) if isinstance(self.ids, array)
+                    else sum(len(row_id) for row_id in self.ids))
+        return id_bytes + self.counts.itemsize * (len(self.counts) + len(self.offsets))
+    
+    def survivors(self, strategy: str = 'oldest') -> IdSet:
+        """
+        Id conservado de cada grupo (el menor con 'oldest', el mayor con 'newest')
+        
+        Se toma directamente de los extremos de cada tramo CSR (los ids de cada
+        grupo están ordenados), sin recorrer los grupos en Python.
+        """
+        ids, starts, ends = self._int_arrays()
+        present = ends > starts
+        if strategy == 'oldest':
+            return IdSet(ids[starts[present]])
+        if strategy == 'newest':
+            return IdSet(ids[ends[present] - 1])
+        raise ValueError(f"Estrategia no soportada: {strategy}")
+    
+    def victims(self, strategy: str = 'oldest') -> IdSet:
+        """Ids a eliminar: todos los de los grupos menos los supervivientes"""
+        return self.id_set() - self.survivors(strategy)
+    
+    def id_set(self) -> IdSet:
+        """Todos los ids de los grupos como IdSet"""
+        return IdSet(self._int_arrays()[0])
+    
+    def _int_arrays(self) -> Tuple['np.ndarray', 'np.ndarray', 'np.ndarray']:
+        if not isinstance(self.ids, array):
+            raise ValueError("Los ids no son enteros (ctid o PK compuesta); no caben en un IdSet")
+        ids = np.frombuffer(self.ids, dtype=np.int64) if self.ids else np.empty(0, np.int64)
+        offsets = np.frombuffer(self.offsets, dtype=np.int64)
+        return ids, offsets[:-1], offsets[1:]
+    
+    def key(self, index: int) -> Tuple[Any, ...]:
+        """Valores de las columnas clave del grupo"""
+        return tuple(values[index] for values in self.key_values)
+    
+    def group_ids(self, index: int) -> Sequence[Any]:
+        """Ids del grupo; para int64 es una vista sin copia (append() falla mientras se conserve)"""
+        start, end = self.offsets[index], self.offsets[index + 1]
+        if isinstance(self.ids, array):
+            return memoryview(self.ids)[start:end]
+        return self.ids[start:end]
+    
+    def group(self, index: int) -> Dict[str, Any]:
+        """Grupo como diccionario con las mismas columnas que el DataFrame"""
+        ids = list(self.group_ids(index))
+        row = dict(zip(self.key_columns, self.key(index)))
+        row.update({
+            "duplicate_count": self.counts[index],
+            "min_id": ids[0] if ids else None,
+            "max_id": ids[-1] if ids else None,
+            "all_ids": ids
+        })
+        return row
+    
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        for index in range(len(self)):
+            yield self.group(index)
+    
+    def head(self, n: int = 5) -> List[Dict[str, Any]]:
+        """Primeros n grupos (los más grandes)"""
+        return [self.group(index) for index in range(min(n, len(self)))]
+    
+    def to_pandas(self) -> 'pd.DataFrame':
+        """DataFrame con columnas clave, duplicate_count, min_id, max_id y all_ids (lista)"""
+        columns = {column: list(values) for column, values in zip(self.key_columns, self.key_values)}
+        groups = [list(self.group_ids(index)) for index in range(len(self))]
+        columns.update({
+            "duplicate_count": list(self.counts),
+            "min_id": [ids[0] if ids else None for ids in groups],
+            "max_id": [ids[-1] if ids else None for ids in groups],
+            "all_ids": groups
+        })
+        return pd.DataFrame(columns)
+    
+    def to_arrow(self) -> 'pa.Table':
+        """
+        Tabla Arrow; all_ids es large_list<int64>
+        
+        Los buffers int64 se copian (un memcpy por columna): Arrow sobre el
+        array vivo lo dejaría fijado y un append() posterior fallaría con
+        BufferError.
+        """
+        columns = {
+            column: pa.array(values) for column, values in zip(self.key_columns, self.key_values)
+        }
+        
+        if isinstance(self.ids, array):
+            values = pa.Array.from_buffers(pa.int64(), len(self.ids),
+                                           [None, pa.py_buffer(self.ids.tobytes())])
+        else:
+            values = pa.array(self.ids, type=pa.string())
+        offsets = pa.Array.from_buffers(pa.int64(), len(self.offsets),
+                                        [None, pa.py_buffer(self.offsets.tobytes())])
+        
+        columns["duplicate_count"] = pa.Array.from_buffers(
+            pa.int64(), len(self.counts), [None, pa.py_buffer(self.counts.tobytes())]
+        )
+        columns["all_ids"] = pa.LargeListArray.from_arrays(offsets, values)
+        return pa.table(columns)
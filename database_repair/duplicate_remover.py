@@ -1,12 +1,27 @@
 """
 Eliminación de registros duplicados
 """
-from sqlalchemy import text
-from typing import List, Dict, Any
-from .database_connector import DatabaseConnector
+import time
+from contextlib import ExitStack, contextmanager, nullcontext
+from sqlalchemy import Delete, Executable
+from typing import List, Dict, Any, Optional, Sequence, Union
+from .database_connector import DatabaseConnector, database_phase
 from .backup_manager import BackupManager
 from .duplicate_analyzer import DuplicateAnalyzer
+from .index_advisor import IndexAdvisor
+from .foreign_key_remapper import ForeignKeyRemapper, ReferenceRemap
+from .constraint_installer import UniqueConstraintInstaller
+from .watermark_store import WatermarkStore
+from .schema_reflector import SchemaReflector
+from .query_builder import QueryBuilder
+from .key_normalizer import key_column_names
+from .survivor_order import SurvivorOrder, describe_survivor_order, parse_survivor_order
+from .throttle_controller import ThrottleController
+from .cancellation import CancellationToken, OperationCancelled
+from .progress import ProgressCallback, ProgressTracker
+from .id_set import IdSet
 from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
 
 class DuplicateRemover:
     """Elimina registros duplicados de las tablas"""
@@ -17,120 +32,683 @@ class DuplicateRemover:
         self.db_type = db_connector.db_type
         self.backup_manager = BackupManager(db_connector)
         self.analyzer = DuplicateAnalyzer(db_connector)
+        self.index_advisor = IndexAdvisor(db_connector)
+        self.constraint_installer = UniqueConstraintInstaller(db_connector)
+        self.watermark_store = WatermarkStore()
+        self.schema_reflector = SchemaReflector(db_connector)
+        self.query_builder = QueryBuilder(db_connector)
+        self.fk_remapper = ForeignKeyRemapper(db_connector)
         logger_setup = LoggerSetup()
         self.logger = logger_setup.setup_logger(self.__class__.__name__)
     
     def remove_duplicates_keep_oldest(self, table_name: str, columns_to_check: List[str], 
-                                    dry_run: bool = True) -> Dict[str, Any]:
+                                    dry_run: bool = True,
+                                    use_temp_index: bool = False,
+                                    enforce_unique: bool = False,
+                                    throttle: Optional[ThrottleController] = None,
+                                    cancel_token: Optional[CancellationToken] = None,
+                                    progress: Optional[ProgressCallback] = None,
+                                    remap_foreign_keys: Optional[bool] = None,
+                                    merge: Union[bool, List[str]] = False) -> Dict[str, Any]:
         """
         Elimina duplicados manteniendo el registro más antiguo (menor ID)
         """
-        return self._remove_duplicates(table_name, columns_to_check, 'MIN', dry_run)
+        return self._remove_duplicates(table_name, columns_to_check, 'MIN', dry_run,
+                                       use_temp_index, enforce_unique, throttle, cancel_token,
+                                       progress, remap_foreign_keys, merge)
     
     def remove_duplicates_keep_newest(self, table_name: str, columns_to_check: List[str], 
-                                    dry_run: bool = True) -> Dict[str, Any]:
+                                    dry_run: bool = True,
+                                    use_temp_index: bool = False,
+                                    enforce_unique: bool = False,
+                                    throttle: Optional[ThrottleController] = None,
+                                    cancel_token: Optional[CancellationToken] = None,
+                                    progress: Optional[ProgressCallback] = None,
+                                    remap_foreign_keys: Optional[bool] = None,
+                                    merge: Union[bool, List[str]] = False) -> Dict[str, Any]:
         """
         Elimina duplicados manteniendo el registro más reciente (mayor ID)
         """
-        return self._remove_duplicates(table_name, columns_to_check, 'MAX', dry_run)
+        return self._remove_duplicates(table_name, columns_to_check, 'MAX', dry_run,
+                                       use_temp_index, enforce_unique, throttle, cancel_token,
+                                       progress, remap_foreign_keys, merge)
+    
+    def remove_duplicates_keep_by(self, table_name: str, columns_to_check: List[str],
+                                  order_by: Union[str, Sequence[str]],
+                                  dry_run: bool = True,
+                                  use_temp_index: bool = False,
+                                  enforce_unique: bool = False,
+                                  throttle: Optional[ThrottleController] = None,
+                                  cancel_token: Optional[CancellationToken] = None,
+                                  progress: Optional[ProgressCallback] = None,
+                                  remap_foreign_keys: Optional[bool] = None,
+                                  merge: Union[bool, List[str]] = False) -> Dict[str, Any]:
+        """
+        Elimina duplicados manteniendo la primera fila de cada grupo según order_by
+        
+        order_by admite columnas y non_null(columnas...) con ASC/DESC, p. ej.
+        'updated_at DESC' o ['non_null(*) DESC', 'updated_at DESC'] (la fila más
+        completa y, a igualdad, la más reciente). Los NULL van al final y los
+        empates los decide la antigüedad. Se evalúa con una sola pasada de
+        ROW_NUMBER(), sin consultas por grupo.
+        """
+        columns = [column['name'] for column in self.schema_reflector.reflect(table_name)['columns']]
+        keep_strategy = parse_survivor_order(order_by, columns)
+        return self._remove_duplicates(table_name, columns_to_check, keep_strategy, dry_run,
+                                       use_temp_index, enforce_unique, throttle, cancel_token,
+                                       progress, remap_foreign_keys, merge)
     
     def _remove_duplicates(self, table_name: str, columns_to_check: List[str], 
-                          keep_strategy: str, dry_run: bool = True) -> Dict[str, Any]:
+                          keep_strategy: Union[str, SurvivorOrder], dry_run: bool = True,
+                          use_temp_index: bool = False,
+                          enforce_unique: bool = False,
+                          throttle: Optional[ThrottleController] = None,
+                          cancel_token: Optional[CancellationToken] = None,
+                          progress: Optional[ProgressCallback] = None,
+                          remap_foreign_keys: Optional[bool] = None,
+                          merge: Union[bool, List[str]] = False,
+                          backup: bool = True) -> Dict[str, Any]:
         """
         Método base para eliminar duplicados
         
         Args:
             table_name: Nombre de la tabla
             columns_to_check: Columnas que definen duplicado
-            keep_strategy: 'MIN' para más antiguo, 'MAX' para más reciente
+            keep_strategy: 'MIN' para más antiguo, 'MAX' para más reciente, o un
+                SurvivorOrder (ver remove_duplicates_keep_by)
             dry_run: Si True, solo simula la operación
+            use_temp_index: Si True, crea un índice temporal (columnas..., id)
+                cuando no existe uno utilizable y se estima beneficioso
+            enforce_unique: Si True (y no es dry_run), instala un índice único
+                sobre las columnas al terminar para impedir nuevos duplicados
+            throttle: Si se indica, backup y eliminación van por lotes con el
+                tamaño y la pausa que decida el controlador
+            cancel_token: Permite detener la ejecución entre fases y entre
+                lotes; el resultado queda con status 'cancelled'
+            progress: Callback de avance por fase (análisis, backup y
+                eliminación), con filas procesadas, total estimado, ritmo y ETA
+            remap_foreign_keys: Si True, las filas de tablas hijas que apuntan a
+                una víctima pasan a apuntar a su superviviente antes de borrarla;
+                antes se respaldan en una tabla por hija, ya que el backup de la
+                tabla no las cubre (por defecto DatabaseConfig.REMAP_FOREIGN_KEYS)
+            merge: Si True (o una lista de columnas), antes de borrar se llenan
+                los NULL del superviviente con el primer valor no NULL de las
+                víctimas, según el mismo orden, con un solo UPDATE por conjuntos
+            backup: Si False, no respalda la tabla ni las filas hijas reasignadas
+        
+        Cada fase se ejecuta bajo database_phase, así que usa los timeouts
+        de sentencia y de bloqueo configurados en el DatabaseConnector.
         """
+        timings = {}
+        run_start = time.perf_counter()
+        backup_name = None
+        deleted_count = 0
+        merged_count = None
+        if remap_foreign_keys is None:
+            remap_foreign_keys = DatabaseConfig.REMAP_FOREIGN_KEYS
+        
         try:
-            # Verificar si hay duplicados
-            duplicates_df = self.analyzer.analyze_duplicates(table_name, columns_to_check)
-            
-            if duplicates_df.empty:
-                return {
-                    "status": "success", 
-                    "deleted_count": 0, 
-                    "message": "No hay duplicados"
-                }
-            
-            # Crear backup si no es dry_run
-            backup_name = None
-            if not dry_run:
-                backup_name = self.backup_manager.create_backup(table_name)
-            
-            # Construir query de eliminación
-            columns_str = ', '.join(columns_to_check)
-            delete_query = self._build_delete_query(table_name, columns_str, keep_strategy)
-            
-            deleted_count = 0
+            index_context = (
+                self.index_advisor.temporary_index(table_name, columns_to_check)
+                if use_temp_index else nullcontext()
+            )
             
-            if dry_run:
-                deleted_count = self._count_records_to_delete(table_name, columns_str, keep_strategy)
-                self.logger.info(f"DRY RUN: Se eliminarían {deleted_count} registros duplicados")
-            else:
-                deleted_count = self._execute_deletion(delete_query)
-                self.logger.info(f"Eliminados {deleted_count} registros duplicados")
+            with self._entered_in_phase('index', index_context) as index_info:
+                if index_info is not None:
+                    timings['index_build'] = index_info['build_seconds']
+                
+                # Verificar si hay duplicados
+                phase_start = time.perf_counter()
+                with database_phase('analysis'):
+                    duplicate_groups = self.analyzer.analyze_duplicates(table_name, columns_to_check,
+                                                                        as_frame=False,
+                                                                        include_ids=False,
+                                                                        progress=progress)
+                timings['analysis'] = time.perf_counter() - phase_start
+                
+                if duplicate_groups.empty:
+                    return {
+                        "status": "success", 
+                        "deleted_count": 0, 
+                        "dry_run": dry_run,
+                        "message": "No hay duplicados",
+                        "merged_count": 0 if merge else None,
+                        "temporary_index": index_info,
+                        "timings": self._finish_timings(timings, run_start)
+                    }
+                
+                # Solo al reasignar: FK compuestas se rechazan aquí, antes de escribir nada
+                references = (self.fk_remapper.find_references(table_name)
+                              if remap_foreign_keys else [])
+                foreign_keys = None
+                
+                # Crear backup si no es dry_run
+                if not dry_run and backup:
+                    self._check_cancelled(cancel_token)
+                    phase_start = time.perf_counter()
+                    with database_phase('backup'):
+                        try:
+                            backup_name = self.backup_manager.create_backup(
+                                table_name, throttle=throttle, cancel_token=cancel_token,
+                                progress=progress
+                            )
+                        except OperationCancelled as e:
+                            # Las filas copiadas no cuentan como eliminadas
+                            raise OperationCancelled(e.reason) from None
+                    timings['backup'] = time.perf_counter() - phase_start
+                
+                # Construir query de eliminación
+                locator = self.schema_reflector.get_row_locator(table_name)
+                delete_query = self._build_delete_query(table_name, columns_to_check, keep_strategy,
+                                                        locator)
+                merge_columns = (self._merge_columns(table_name, columns_to_check, locator, merge)
+                                 if merge else [])
+                
+                unique_constraint = None
+                
+                phase_start = time.perf_counter()
+                if dry_run:
+                    with database_phase('analysis'):
+                        deleted_count = self._count_records_to_delete(table_name, columns_to_check,
+                                                                      keep_strategy, locator)
+                        if merge_columns:
+                            merged_count = self._count_merges(table_name, columns_to_check,
+                                                              keep_strategy, locator, merge_columns)
+                        if references:
+                            foreign_keys = self.fk_remapper.count_references(
+                                table_name, columns_to_check, keep_strategy, locator, references
+                            )
+                    self.logger.info(f"DRY RUN: Se eliminarían {deleted_count} registros duplicados")
+                else:
+                    self._check_cancelled(cancel_token)
+                    # Filas con id mayor a este límite pueden llegar durante la reparación
+                    # (el paso por id solo sabe de MIN/MAX; con otro orden, reparación completa)
+                    since_id = (self._get_max_id(table_name, locator)
+                                if enforce_unique and isinstance(keep_strategy, str) else None)
+                    if merge_columns:
+                        # Antes del mapeo y de las víctimas: el superviviente no cambia
+                        # (solo gana valores), así que todos ven el mismo
+                        with database_phase('deletion'):
+                            merged_count = self._merge_survivors(table_name, columns_to_check,
+                                                                 keep_strategy, locator,
+                                                                 merge_columns)
+                        self.logger.info(f"Supervivientes completados con datos de víctimas: "
+                                         f"{merged_count}")
+                    remap_context = (
+                        self.fk_remapper.mapping(table_name, columns_to_check, keep_strategy,
+                                                 locator, references)
+                        if references else nullcontext()
+                    )
+                    # El mapeo víctima -> superviviente se calcula como el análisis
+                    with self._entered_in_phase('analysis', remap_context) as remap:
+                        if remap is not None and backup:
+                            # Filas hijas afectadas, con su FK original, antes de tocarlas
+                            with database_phase('backup'):
+                                remap.backup(self.backup_manager)
+                        with database_phase('deletion'):
+                            if throttle is not None:
+                                deleted_count = self._execute_throttled_deletion(
+                                    table_name, columns_to_check, keep_strategy, locator,
+                                    throttle, cancel_token, progress, remap
+                                )
+                            else:
+                                with ProgressTracker('deletion', progress,
+                                                     table=table_name) as tracker:
+                                    # Con remap, exactamente las víctimas del mapeo
+                                    deleted_count = self._execute_deletion(
+                                        remap.delete_query() if remap is not None
+                                        else delete_query,
+                                        remap=remap
+                                    )
+                                    tracker.advance(deleted_count)
+                    if remap is not None:
+                        foreign_keys = remap.summary()
+                        self.logger.info(
+                            f"Filas hijas reasignadas al superviviente: "
+                            f"{sum(reference['remapped'] for reference in foreign_keys)}"
+                        )
+                    self.logger.info(f"Eliminados {deleted_count} registros duplicados")
+                timings['deletion'] = time.perf_counter() - phase_start
+                
+                if enforce_unique and not dry_run:
+                    self._check_cancelled(cancel_token, deleted_count)
+                    phase_start = time.perf_counter()
+                    with database_phase('index'):
+                        unique_constraint = self._install_unique_constraint(
+                            table_name, columns_to_check, keep_strategy, since_id
+                        )
+                    deleted_count += unique_constraint['delta_deleted']
+                    timings['unique_index'] = time.perf_counter() - phase_start
             
             return {
                 "status": "success",
                 "deleted_count": deleted_count,
                 "backup_table": backup_name,
                 "dry_run": dry_run,
-                "strategy": "oldest" if keep_strategy == "MIN" else "newest"
+                "strategy": self._strategy_name(keep_strategy),
+                "row_locator": locator['kind'],
+                "merged_count": merged_count,
+                "temporary_index": index_info,
+                "unique_constraint": unique_constraint,
+                "foreign_keys": foreign_keys,
+                "throttle": throttle.metrics() if throttle is not None else None,
+                "timings": self._finish_timings(timings, run_start)
             }
-            
+        
+        except OperationCancelled as e:
+            deleted_count += e.processed
+            self.logger.warning(
+                f"Eliminación cancelada ({e}); {deleted_count} registros ya eliminados"
+            )
+            return {
+                "status": "cancelled",
+                "deleted_count": deleted_count,
+                "backup_table": backup_name,
+                "dry_run": dry_run,
+                "strategy": self._strategy_name(keep_strategy),
+                "message": str(e),
+                "throttle": throttle.metrics() if throttle is not None else None,
+                "timings": self._finish_timings(timings, run_start)
+            }
+        
         except Exception as e:
             self.logger.error(f"Error eliminando duplicados: {str(e)}")
             raise
     
-    def _build_delete_query(self, table_name: str, columns_str: str, keep_strategy: str) -> str:
-        """Construye la query de eliminación según el tipo de BD"""
-        base_query = f"""
-        DELETE FROM {table_name}
-        WHERE id NOT IN (
-            SELECT {keep_strategy}(id)
-            FROM {table_name}
-            GROUP BY {columns_str}
-        )
+    @staticmethod
+    @contextmanager
+    def _entered_in_phase(phase: str, context):
+        """Entra al contexto dentro de la fase (p. ej. crear el índice) y lo cierra al final"""
+        with ExitStack() as stack:
+            with database_phase(phase):
+                value = stack.enter_context(context)
+            yield value
+    
+    def _check_cancelled(self, cancel_token: Optional[CancellationToken], processed: int = 0):
+        """Punto de cancelación entre fases"""
+        if cancel_token is not None:
+            cancel_token.raise_if_cancelled(processed)
+    
+    def _finish_timings(self, timings: Dict[str, float], run_start: float) -> Dict[str, float]:
+        """Completa el reporte de tiempos (segundos por fase) con el total"""
+        timings['total'] = time.perf_counter() - run_start
+        return {phase: round(seconds, 3) for phase, seconds in timings.items()}
+    
+    @staticmethod
+    def _strategy_name(keep_strategy: Union[str, SurvivorOrder]) -> str:
+        """'oldest', 'newest' o el orden de supervivencia en texto"""
+        if isinstance(keep_strategy, str):
+            return "oldest" if keep_strategy == "MIN" else "newest"
+        return describe_survivor_order(keep_strategy)
+    
+    def _merge_columns(self, table_name: str, columns_to_check: List[str],
+                       locator: Dict[str, Any], merge: Union[bool, List[str]]) -> List[str]:
+        """Columnas a completar: las indicadas, o todas salvo las clave y las de la PK"""
+        schema = self.schema_reflector.reflect(table_name)
+        available = [column['name'] for column in schema['columns']]
+        if merge is True:
+            excluded = {*key_column_names(columns_to_check), *schema['primary_key'],
+                        *locator['columns']}
+            return [name for name in available if name not in excluded]
+        unknown = [name for name in merge if name not in available]
+        if unknown:
+            raise ValueError(f"Columnas a fusionar inexistentes en {table_name}: {', '.join(unknown)}")
+        return list(merge)
+    
+    def _merge_survivors(self, table_name: str, columns_to_check: List[str],
+                         keep_strategy: Union[str, SurvivorOrder], locator: Dict[str, Any],
+                         merge_columns: List[str]) -> int:
+        """Llena los NULL de cada superviviente (un solo UPDATE); retorna las filas actualizadas"""
+        merge_query = self.query_builder.merge_survivors(table_name, columns_to_check,
+                                                         keep_strategy, locator, merge_columns)
+        with self.engine.connect() as conn:
+            merged = conn.execute(merge_query).rowcount
+            conn.commit()
+        return merged
+    
+    def _count_merges(self, table_name: str, columns_to_check: List[str],
+                      keep_strategy: Union[str, SurvivorOrder], locator: Dict[str, Any],
+                      merge_columns: List[str]) -> int:
+        """Cuenta los supervivientes que _merge_survivors actualizaría"""
+        count_query = self.query_builder.count_merges(table_name, columns_to_check,
+                                                      keep_strategy, locator, merge_columns)
+        with self.db_connector.get_read_engine().connect() as conn:
+            return conn.execute(count_query).scalar()
+    
+    def _build_delete_query(self, table_name: str, columns_to_check: List[str],
+                            keep_strategy: Union[str, SurvivorOrder],
+                            locator: Optional[Dict[str, Any]] = None) -> Delete:
         """
+        Construye la query de eliminación según el tipo de BD y el localizador de filas
         
-        # MySQL necesita subconsulta adicional
-        if self.db_type == 'mysql':
-            base_query = f"""
-            DELETE FROM {table_name}
-            WHERE id NOT IN (
-                SELECT * FROM (
-                    SELECT {keep_strategy}(id)
-                    FROM {table_name}
-                    GROUP BY {columns_str}
-                ) as temp
+        Con una PK simple conserva MIN/MAX(id) de cada grupo; con PK compuesta,
+        localizador físico u orden de supervivencia usa ROW_NUMBER(). En MySQL la subconsulta va en
+        una tabla derivada (no admite leer la tabla que se modifica).
+        """
+        locator = locator or self.schema_reflector.get_row_locator(table_name)
+        return self.query_builder.delete_duplicates(table_name, columns_to_check, keep_strategy,
+                                                    locator)
+    
+    def _count_records_to_delete(self, table_name: str, columns_to_check: List[str],
+                                 keep_strategy: Union[str, SurvivorOrder],
+                                 locator: Optional[Dict[str, Any]] = None) -> int:
+        """Cuenta registros que serían eliminados (solo lectura: réplica si hay)"""
+        locator = locator or self.schema_reflector.get_row_locator(table_name)
+        count_query = self.query_builder.count_victims(table_name, columns_to_check, keep_strategy,
+                                                       locator)
+        
+        with self.db_connector.get_read_engine().connect() as conn:
+            result = conn.execute(count_query)
+            return result.fetchone()[0]
+    
+    def _execute_deletion(self, delete_query: Executable,
+                          params: Optional[Dict[str, Any]] = None,
+                          remap: Optional[ReferenceRemap] = None) -> int:
+        """Ejecuta la eliminación real (con remap, tras reasignar las hijas en la misma transacción)"""
+        params = params or {}
+        with self.engine.connect() as conn:
+            if remap is not None:
+                remap(conn, params.get('row_ids'))
+            deleted = conn.execute(delete_query, params).rowcount
+            conn.commit()
+        if remap is not None:
+            remap.commit()
+        return deleted
+    
+    def _execute_throttled_deletion(self, table_name: str, columns_to_check: List[str],
+                                    keep_strategy: Union[str, SurvivorOrder],
+                                    locator: Dict[str, Any],
+                                    throttle: ThrottleController,
+                                    cancel_token: Optional[CancellationToken] = None,
+                                    progress: Optional[ProgressCallback] = None,
+                                    remap: Optional[ReferenceRemap] = None) -> int:
+        """
+        Eliminación por lotes de localizadores al ritmo del controlador
+        
+        Las víctimas se calculan una sola vez; cada lote es un DELETE corto
+        con su propia transacción, así los bloqueos y el WAL/binlog se reparten.
+        Un lote que agota el timeout de bloqueo se reintenta con espera.
+        Como las víctimas se conocen de antemano, el avance tiene total exacto.
+        Con PK entera de una columna las víctimas se guardan en un IdSet
+        (4-8 bytes por id) y se borran en orden de la clave. Con remap las
+        víctimas son las del mapeo (por la columna referida) y cada lote
+        reasigna antes las filas hijas de sus víctimas.
+        
+        Entre lotes pasa tiempo, así que cada DELETE revalida su lote: solo
+        borra filas cuya clave sigue repetida fuera del lote (si el
+        superviviente desapareció no se borra la última copia). Los lotes se
+        identifican por la PK, aunque sea compuesta, y no por ctid/rowid, que
+        un VACUUM puede reutilizar para otra fila; el localizador físico solo
+        queda para tablas sin PK.
+        """
+        if remap is not None:
+            victims_query, batch_columns = remap.victims_query(), [remap.referred]
+            reflected = True
+        else:
+            if locator['kind'] != 'primary_key':
+                locator = self.schema_reflector.get_row_locator(table_name, mode='primary_key')
+            victims_query = self.query_builder.ranked_victims(table_name, columns_to_check,
+                                                              keep_strategy, locator)
+            batch_columns, reflected = locator['columns'], locator['reflected']
+        integer_ids = (reflected and batch_columns == [self.schema_reflector.integer_key(table_name)])
+        with self.engine.connect() as conn:
+            result = conn.execute(victims_query)
+            if integer_ids:
+                victims = IdSet(row[0] for row in result)
+            else:
+                victims = [tuple(row) for row in result]
+        
+        position = 0
+        
+        def delete_batch(batch_size: int) -> Optional[int]:
+            nonlocal position
+            batch = victims[position:position + batch_size]
+            if not batch:
+                return None
+            deleted = self.db_connector.run_with_retry(
+                lambda: self._delete_locator_batch(table_name, columns_to_check, batch_columns,
+                                                   batch, remap),
+                cancel_token, f"lote de eliminación de {table_name}"
             )
-            """
-        
-        return base_query
-    
-    def _count_records_to_delete(self, table_name: str, columns_str: str, keep_strategy: str) -> int:
-        """Cuenta registros que serían eliminados"""
-        count_query = f"""
-        SELECT COUNT(*) as count
-        FROM {table_name}
-        WHERE id NOT IN (
-            SELECT {keep_strategy}(id)
-            FROM {table_name}
-            GROUP BY {columns_str}
+            position += len(batch)
+            return deleted
+        
+        with ProgressTracker('deletion', progress, len(victims), table_name) as tracker:
+            return throttle.run_batches(delete_batch, cancel_token, tracker)
+    
+    def _delete_locator_batch(self, table_name: str, columns_to_check: List[str],
+                              locator_columns: List[str], batch: Union[IdSet, List[tuple]],
+                              remap: Optional[ReferenceRemap] = None) -> int:
+        """
+        DELETE revalidado de un lote de filas identificadas por su localizador (misma sentencia)
+        
+        Con remap el lote son valores de la columna referida y se borran solo
+        las víctimas vigentes del mapeo.
+        """
+        if isinstance(batch, IdSet):
+            row_ids = batch.tolist()
+        else:
+            row_ids = [row[0] for row in batch] if len(locator_columns) == 1 else list(batch)
+        if remap is not None:
+            return self._execute_deletion(remap.delete_query(batched=True), {"row_ids": row_ids},
+                                          remap)
+        return self._execute_deletion(
+            self.query_builder.delete_revalidated(table_name, columns_to_check, locator_columns),
+            {"row_ids": row_ids, "batch_ids": row_ids}, remap
         )
+    
+    def _install_unique_constraint(self, table_name: str, columns_to_check: List[str],
+                                   keep_strategy: Union[str, SurvivorOrder],
+                                   since_id: Any) -> Dict[str, Any]:
+        """
+        Instala el índice único resolviendo duplicados que lleguen mientras se construye
+        
+        Los primeros reintentos solo depuran las filas nuevas (id > since_id);
+        el último recurre a la eliminación completa por si alguna transacción
+        concurrente confirmó un id menor al límite.
         """
+        max_attempts = DatabaseConfig.UNIQUE_INDEX_MAX_ATTEMPTS
+        
+        def resolve_conflicts(attempt: int) -> int:
+            if since_id is not None and attempt < max_attempts - 1:
+                deleted = self._delete_duplicates_since(table_name, columns_to_check,
+                                                        keep_strategy, since_id)
+            else:
+                deleted = self._execute_deletion(
+                    self._build_delete_query(table_name, columns_to_check, keep_strategy)
+                )
+            self.logger.info(f"Eliminados {deleted} duplicados nuevos antes de reintentar")
+            return deleted
+        
+        return self.constraint_installer.install(table_name, columns_to_check,
+                                                 resolve_conflicts, max_attempts)
+    
+    def _get_max_id(self, table_name: str, locator: Optional[Dict[str, Any]] = None) -> Any:
+        """Retorna el mayor valor actual de la PK (None si la PK no es de una columna)"""
+        locator = locator or self.schema_reflector.get_row_locator(table_name)
+        if locator['key'] is None:
+            return None
         
         with self.engine.connect() as conn:
-            result = conn.execute(text(count_query))
-            return result.fetchone()[0]
+            return conn.execute(
+                self.query_builder.max_value(table_name, locator['key'])
+            ).fetchone()[0]
     
-    def _execute_deletion(self, delete_query: str) -> int:
-        """Ejecuta la eliminación real"""
+    def _get_min_id(self, table_name: str, key: str) -> Any:
+        """Retorna el menor valor actual de la PK (None si la tabla está vacía)"""
         with self.engine.connect() as conn:
-            result = conn.execute(text(delete_query))
-            conn.commit()
-            return result.rowcount
+            return conn.execute(self.query_builder.min_value(table_name, key)).fetchone()[0]
+    
+    def watermark_column(self, table_name: str) -> str:
+        """Columna monótona para límites por id: la PK cuando es de una sola columna"""
+        key = self.schema_reflector.get_row_locator(table_name)['key']
+        if key is None:
+            raise ValueError(
+                f"{table_name} necesita una clave primaria de una sola columna para "
+                "procesar solo filas nuevas"
+            )
+        return key
+    
+    def _delete_duplicates_since(self, table_name: str, columns_to_check: List[str],
+                                 keep_strategy: str, since_id: Any,
+                                 until_id: Any = None, key: Optional[str] = None) -> int:
+        """
+        Elimina solo los duplicados en los que participa una fila con id > since_id
+        
+        Usa un join por las columnas clave (aprovecha el índice si existe) en lugar
+        de agrupar la tabla completa. Como en un índice único, las filas con NULL
+        en las columnas clave no se consideran duplicadas.
+        """
+        key = key or self.watermark_column(table_name)
+        delete_query = self.query_builder.delete_new_duplicates(
+            table_name, columns_to_check, keep_strategy, key, until_id is not None
+        )
+        return self._execute_deletion(delete_query, {"since_id": since_id, "until_id": until_id})
+    
+    def _count_duplicates_since(self, table_name: str, columns_to_check: List[str],
+                                keep_strategy: str, since_id: Any, until_id: Any = None,
+                                key: Optional[str] = None) -> int:
+        """Cuenta las víctimas que eliminaría _delete_duplicates_since"""
+        key = key or self.watermark_column(table_name)
+        count_query = self.query_builder.count_new_duplicates(
+            table_name, columns_to_check, keep_strategy, key, until_id is not None
+        )
+        with self.db_connector.get_read_engine().connect() as conn:
+            return conn.execute(
+                count_query, {"since_id": since_id, "until_id": until_id}
+            ).fetchone()[0]
+    
+    def remove_duplicates_incremental(self, table_name: str, columns_to_check: List[str],
+                                      strategy: str = 'oldest',
+                                      dry_run: bool = True,
+                                      max_new_rows: Optional[int] = None,
+                                      backup: bool = True) -> Dict[str, Any]:
+        """
+        Elimina solo los duplicados introducidos desde la última ejecución
+        
+        Guarda por (base de datos, tabla, columnas) el mayor id ya depurado. La
+        primera ejecución es completa (salvo con max_new_rows); las siguientes
+        solo comparan las filas con id mayor a la marca de agua contra las
+        claves existentes.
+        
+        Args:
+            table_name: Nombre de la tabla
+            columns_to_check: Columnas que definen duplicado
+            strategy: 'oldest' o 'newest'
+            dry_run: Si True, solo simula la operación (no mueve la marca de agua)
+            max_new_rows: Procesa como máximo este número de filas nuevas; el
+                resto queda para la siguiente ejecución. Sin marca de agua, en
+                lugar de la pasada completa se procesan por tramos desde la
+                fila más antigua
+            backup: Si False, no crea ningún backup (ni en la pasada completa)
+        """
+        if strategy not in ('oldest', 'newest'):
+            raise ValueError(f"Estrategia no soportada: {strategy}")
+        
+        keep_strategy = 'MIN' if strategy == 'oldest' else 'MAX'
+        key = self.watermark_key(table_name, columns_to_check)
+        watermark = self.watermark_store.get(key)
+        run_start = time.perf_counter()
+        
+        try:
+            key_column = self.watermark_column(table_name)
+            
+            since_id = watermark
+            if since_id is None and max_new_rows:
+                # La fila más antigua nunca es víctima ni desplaza a otra más antigua:
+                # sirve de marca inicial y el delta acotado recorre la tabla por tramos
+                since_id = self._get_min_id(table_name, key_column)
+                self.logger.info(f"Sin marca de agua para {table_name}: "
+                                 f"tramos de {max_new_rows} filas desde {since_id}")
+            
+            # Límite superior fijo: filas más nuevas quedan para la próxima ejecución
+            until_id = self._get_max_id(table_name)
+            if since_id is not None and max_new_rows:
+                until_id = self._get_delta_upper_bound(table_name, since_id,
+                                                       max_new_rows, until_id, key_column)
+            
+            if since_id is None:
+                self.logger.info(f"Sin marca de agua para {table_name}: ejecución completa")
+                result = self._remove_duplicates(table_name, columns_to_check,
+                                                 keep_strategy, dry_run, backup=backup)
+                result.update({"incremental": False, "watermark_from": None,
+                               "watermark_to": until_id})
+            else:
+                result = self._remove_new_duplicates(table_name, columns_to_check, keep_strategy,
+                                                     since_id, until_id, dry_run, backup,
+                                                     key_column)
+                result['timings'] = self._finish_timings({}, run_start)
+            
+            if not dry_run and until_id is not None:
+                self.watermark_store.set(key, until_id)
+            
+            return result
+        
+        except Exception as e:
+            self.logger.error(f"Error en eliminación incremental: {str(e)}")
+            raise
+    
+    def watermark_key(self, table_name: str, columns_to_check: List[str]) -> str:
+        """Clave de la marca de agua de esta base de datos para la tabla/columnas"""
+        database = self.engine.url.render_as_string(hide_password=True)
+        return WatermarkStore.make_key(database, table_name, columns_to_check)
+    
+    def _get_delta_upper_bound(self, table_name: str, since_id: Any,
+                               max_new_rows: int, max_id: Any, key: str = 'id') -> Any:
+        """Id de la fila número max_new_rows por encima de since_id (o max_id si hay menos)"""
+        with self.engine.connect() as conn:
+            bound = conn.execute(
+                self.query_builder.range_bound(table_name, [key], None, after=True),
+                {"after_0": since_id, "offset": int(max_new_rows) - 1}
+            ).fetchone()
+        return bound[0] if bound else max_id
+    
+    def _remove_new_duplicates(self, table_name: str, columns_to_check: List[str],
+                               keep_strategy: str, since_id: Any, until_id: Any,
+                               dry_run: bool, backup: bool = True,
+                               key: str = 'id') -> Dict[str, Any]:
+        """Paso incremental: depura solo las filas entre la marca de agua y until_id"""
+        result = {
+            "status": "success",
+            "deleted_count": 0,
+            "backup_table": None,
+            "dry_run": dry_run,
+            "strategy": "oldest" if keep_strategy == "MIN" else "newest",
+            "incremental": True,
+            "watermark_from": since_id,
+            "watermark_to": until_id
+        }
+        
+        if until_id is None or until_id <= since_id:
+            result['message'] = "No hay filas nuevas"
+            return result
+        
+        if dry_run:
+            result['deleted_count'] = self._count_duplicates_since(
+                table_name, columns_to_check, keep_strategy, since_id, until_id, key
+            )
+            self.logger.info(
+                f"DRY RUN: Se eliminarían {result['deleted_count']} duplicados nuevos"
+            )
+            return result
+        
+        # Respaldar solo las víctimas, no la tabla completa
+        if backup:
+            victims_condition = self.query_builder.new_duplicates_condition(
+                table_name, columns_to_check, keep_strategy, key, bounded=True
+            )
+            with database_phase('backup'):
+                result['backup_table'] = self.backup_manager.create_backup(
+                    table_name, backup_suffix=f"delta_{since_id}_{until_id}",
+                    where=victims_condition,
+                    params={"since_id": since_id, "until_id": until_id}
+                )
+        with database_phase('deletion'):
+            result['deleted_count'] = self._delete_duplicates_since(
+                table_name, columns_to_check, keep_strategy, since_id, until_id, key
+            )
+        self.logger.info(
+            f"Eliminados {result['deleted_count']} duplicados nuevos "
+            f"({since_id} < {key} <= {until_id})"
+        )
+        return result
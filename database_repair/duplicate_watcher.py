@@ -0,0 +1,225 @@
+"""
+Modo vigilancia: depuración continua de duplicados en tablas de ingesta
+"""
+import json
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from .atomic_file import atomic_write
+from .database_connector import DatabaseConnector
+from .duplicate_remover import DuplicateRemover
+from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
+
+class DuplicateWatcher:
+    """Consulta periódicamente filas nuevas y elimina duplicados con el modo incremental"""
+    
+    def __init__(self, db_connector: DatabaseConnector, tables: List[Dict[str, Any]],
+                 min_interval: Optional[float] = None, max_interval: Optional[float] = None,
+                 busy_latency: Optional[float] = None, max_delta_rows: Optional[int] = None,
+                 backup: bool = True, status_file: Optional[str] = None):
+        """
+        Args:
+            db_connector: Conexión a la base de datos
+            tables: Lista de {'table': str, 'columns': [str], 'strategy': 'oldest'|'newest'}
+            min_interval: Intervalo mínimo entre ciclos (segundos)
+            max_interval: Intervalo máximo entre ciclos (segundos)
+            busy_latency: Latencia de la sonda (segundos) a partir de la cual la
+                base se considera ocupada y se espacian los ciclos
+            max_delta_rows: Filas nuevas máximas a depurar por tabla y ciclo
+            backup: Si True, respalda las víctimas de cada ciclo
+            status_file: Archivo JSON donde publicar salud y métricas en cada ciclo
+        """
+        self.db_connector = db_connector
+        self.engine = db_connector.get_engine()
+        self.remover = DuplicateRemover(db_connector)
+        self.tables = tables
+        
+        self.min_interval = DatabaseConfig.WATCH_MIN_INTERVAL if min_interval is None else min_interval
+        self.max_interval = DatabaseConfig.WATCH_MAX_INTERVAL if max_interval is None else max_interval
+        self.busy_latency = DatabaseConfig.WATCH_BUSY_LATENCY if busy_latency is None else busy_latency
+        self.max_delta_rows = max_delta_rows or DatabaseConfig.WATCH_MAX_DELTA_ROWS
+        self.backup = backup
+        self.status_file = status_file
+        
+        self.interval = self.min_interval
+        self._stop_event = threading.Event()
+        self._health = {
+            "status": "starting",
+            "cycles": 0,
+            "interval": self.interval,
+            "consecutive_errors": 0,
+            "last_cycle_at": None,
+            "last_probe_latency": None,
+            "tables": {
+                config['table']: {
+                    "lag_rows": None,
+                    "lag_seconds": None,
+                    "watermark": None,
+                    "deleted_total": 0,
+                    "last_deleted": 0,
+                    "last_success_at": None,
+                    "last_error": None
+                }
+                for config in tables
+            }
+        }
+        self._last_success: Dict[str, float] = {}
+        
+        # Setup logger
+        logger_setup = LoggerSetup()
+        self.logger = logger_setup.setup_logger(self.__class__.__name__)
+    
+    def run(self, max_cycles: Optional[int] = None):
+        """
+        Ejecuta ciclos hasta que se llame a stop() (o hasta max_cycles)
+        
+        Cada ciclo depura los deltas de todas las tablas y ajusta el intervalo:
+        se acorta si hubo trabajo, se alarga si no, y se duplica si la base
+        está ocupada o hubo errores.
+        """
+        self.logger.info(f"Vigilando {len(self.tables)} tablas")
+        self._health['status'] = "running"
+        
+        while not self._stop_event.is_set():
+            self.run_cycle()
+            
+            if max_cycles is not None and self._health['cycles'] >= max_cycles:
+                break
+            
+            self._stop_event.wait(self.interval)
+        
+        self._health['status'] = "stopped"
+        self._publish_health()
+        self.logger.info("Vigilancia detenida")
+    
+    def stop(self):
+        """Solicita detener el bucle al terminar el ciclo en curso"""
+        self._stop_event.set()
+    
+    def run_cycle(self) -> Dict[str, Any]:
+        """Ejecuta un ciclo de depuración sobre todas las tablas configuradas"""
+        did_work = False
+        had_error = False
+        
+        busy = self._is_database_busy()
+        if busy is None:
+            had_error = True
+        elif busy:
+            self._health['status'] = "backoff"
+            self.logger.warning(
+                f"Base de datos ocupada (sonda {self._health['last_probe_latency']:.3f}s); "
+                "se omite el ciclo"
+            )
+        else:
+            self._health['status'] = "running"
+            for config in self.tables:
+                if self._stop_event.is_set():
+                    break
+                try:
+                    did_work |= self._process_table(config)
+                except Exception as e:
+                    had_error = True
+                    self._health['tables'][config['table']]['last_error'] = str(e)
+                    self.logger.error(f"Error vigilando {config['table']}: {str(e)}")
+        
+        self._adjust_interval(did_work, busy or had_error)
+        self._health['consecutive_errors'] = self._health['consecutive_errors'] + 1 if had_error else 0
+        self._health['cycles'] += 1
+        self._health['last_cycle_at'] = datetime.now().isoformat(timespec='seconds')
+        self._update_lag_seconds()
+        self._publish_health()
+        return self.get_health()
+    
+    def get_health(self) -> Dict[str, Any]:
+        """Retorna una copia de las métricas de salud y retraso"""
+        return json.loads(json.dumps(self._health))
+    
+    def _process_table(self, config: Dict[str, Any]) -> bool:
+        """Depura el delta de una tabla; retorna True si había filas nuevas"""
+        table_name = config['table']
+        columns = config['columns']
+        metrics = self._health['tables'][table_name]
+        
+        key = self.remover.watermark_key(table_name, columns)
+        watermark = self.remover.watermark_store.get(key)
+        metrics['lag_rows'] = self._count_pending_rows(table_name, watermark)
+        
+        if metrics['lag_rows'] == 0:
+            self._last_success[table_name] = time.time()
+            metrics['last_error'] = None
+            return False
+        
+        result = self.remover.remove_duplicates_incremental(
+            table_name, columns, config.get('strategy', 'oldest'), dry_run=False,
+            max_new_rows=self.max_delta_rows, backup=self.backup
+        )
+        
+        metrics['last_deleted'] = result['deleted_count']
+        metrics['deleted_total'] += result['deleted_count']
+        metrics['watermark'] = result.get('watermark_to')
+        metrics['lag_rows'] = self._count_pending_rows(table_name, metrics['watermark'])
+        metrics['last_success_at'] = datetime.now().isoformat(timespec='seconds')
+        metrics['last_error'] = None
+        self._last_success[table_name] = time.time()
+        
+        if result['deleted_count']:
+            self.logger.info(f"{table_name}: {result['deleted_count']} duplicados eliminados")
+        return True
+    
+    def _count_pending_rows(self, table_name: str, watermark: Any) -> int:
+        """Filas por encima de la marca de agua (rango indexado sobre la PK)"""
+        builder = self.remover.query_builder
+        query = builder.count_rows(table_name)
+        params = {}
+        if watermark is not None:
+            key = self.remover.watermark_column(table_name)
+            query = query.where(builder.range_condition(table_name, [key], None, after=True,
+                                                        bounded=False))
+            params = {"after_0": watermark}
+        
+        with self.engine.connect() as conn:
+            return conn.execute(query, params).scalar()
+    
+    def _is_database_busy(self) -> Optional[bool]:
+        """Sonda de latencia; None si la base no responde"""
+        start = time.perf_counter()
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+        except OperationalError as e:
+            self.logger.error(f"Sonda de salud fallida: {str(e)}")
+            self._health['last_probe_latency'] = None
+            return None
+        
+        latency = time.perf_counter() - start
+        self._health['last_probe_latency'] = round(latency, 4)
+        return latency > self.busy_latency
+    
+    def _adjust_interval(self, did_work: bool, backoff: bool):
+        """Intervalo adaptativo entre min_interval y max_interval"""
+        if backoff:
+            self.interval = min(self.max_interval, max(self.interval, self.min_interval, 0.1) * 2)
+        elif did_work:
+            self.interval = max(self.min_interval, self.interval / 2)
+        else:
+            self.interval = min(self.max_interval, max(self.interval, 0.1) * 1.5)
+        self._health['interval'] = round(self.interval, 3)
+    
+    def _update_lag_seconds(self):
+        """Segundos desde la última depuración completa de cada tabla"""
+        now = time.time()
+        for table_name, metrics in self._health['tables'].items():
+            last = self._last_success.get(table_name)
+            metrics['lag_seconds'] = round(now - last, 3) if last else None
+    
+    def _publish_health(self):
+        """Escribe las métricas en status_file (escritura atómica)"""
+        if not self.status_file:
+            return
+        
+        with atomic_write(self.status_file) as f:
+            json.dump(self._health, f, indent=2)
@@ -0,0 +1,233 @@
+"""
+Reasignación de las filas hijas de las víctimas a su superviviente antes de eliminar
+"""
+import hashlib
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple, Union
+from sqlalchemy import Delete, Select, column, or_, select, text
+from sqlalchemy.engine import Connection
+from .database_connector import DatabaseConnector
+from .backup_manager import BackupManager
+from .schema_reflector import SchemaReflector
+from .query_builder import CreateTableAs, QueryBuilder
+from .survivor_order import SurvivorOrder
+from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
+
+class ForeignKeyRemapper:
+    """
+    Descubre las claves foráneas que apuntan a la tabla y reasigna las filas hijas
+    
+    Antes de eliminar se materializa, una vez por columna referida, una
+    tabla de mapeo (old_value, new_value) de víctima a superviviente con una
+    función de ventana; luego cada tabla hija se actualiza con un solo
+    UPDATE ... FROM contra ese mapeo, en la misma transacción que el DELETE
+    (o que cada lote del DELETE). Así no fallan las FK ni quedan huérfanas,
+    sin un UPDATE por fila.
+    
+    Con reasignación el DELETE borra exactamente las víctimas del mapeo
+    (ReferenceRemap.delete_query), no las recalcula: las filas que llegan
+    después de construirlo quedan para la próxima ejecución.
+    
+    El backup de la tabla no cubre las hijas: antes de reasignar,
+    ReferenceRemap.backup copia las filas hijas afectadas (con su valor de
+    FK original) a una tabla de backup por tabla hija.
+    """
+    
+    def __init__(self, db_connector: DatabaseConnector):
+        self.db_connector = db_connector
+        self.engine = db_connector.get_engine()
+        self.db_type = db_connector.db_type
+        self.schema_reflector = SchemaReflector(db_connector)
+        self.query_builder = QueryBuilder(db_connector)
+        
+        # Setup logger
+        logger_setup = LoggerSetup()
+        self.logger = logger_setup.setup_logger(self.__class__.__name__)
+    
+    def find_references(self, table_name: str) -> List[Dict[str, Any]]:
+        """
+        Claves foráneas hacia table_name que se pueden reasignar
+        
+        Raises:
+            ValueError: Si alguna es compuesta; se rechaza antes de borrar
+                nada para no dejar filas huérfanas
+        """
+        references = self.schema_reflector.referencing_foreign_keys(table_name)
+        composite = [reference for reference in references if len(reference['columns']) != 1]
+        if composite:
+            raise ValueError(
+                f"Claves foráneas compuestas hacia {table_name} no admitidas para reasignar: "
+                f"{', '.join(reference['table'] for reference in composite)}"
+            )
+        return references
+    
+    def count_references(self, table_name: str, columns_to_check: List[str],
+                         keep_strategy: Union[str, SurvivorOrder], locator: Dict[str, Any],
+                         references: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Filas hijas que se reasignarían, por clave foránea (simulacro, sin escribir)"""
+        counts = []
+        with self.db_connector.get_read_engine().connect() as conn:
+            for reference in references:
+                mapping = self.query_builder.survivor_mapping(
+                    table_name, columns_to_check, keep_strategy, locator,
+                    reference['referred_columns'][0]
+                )
+                query = self.query_builder.count_references(reference['table'],
+                                                            reference['columns'][0], mapping)
+                counts.append({**_describe(reference), "remapped": conn.execute(query).scalar()})
+        return counts
+    
+    @contextmanager
+    def mapping(self, table_name: str, columns_to_check: List[str],
+                keep_strategy: Union[str, SurvivorOrder], locator: Dict[str, Any],
+                references: List[Dict[str, Any]]) -> Iterator['ReferenceRemap']:
+        """
+        Materializa las tablas de mapeo y las elimina al salir
+        
+        Yields:
+            ReferenceRemap para llamar dentro de la transacción de cada DELETE
+        """
+        mappings = {}
+        # Sufijo por ejecución: dos trabajos sobre la misma tabla no comparten mapeo
+        run_id = uuid.uuid4().hex[:8]
+        try:
+            for referred in dict.fromkeys(reference['referred_columns'][0]
+                                          for reference in references):
+                mapping_name = self._mapping_name(table_name, referred, run_id)
+                mappings[referred] = mapping_name
+                query = self.query_builder.survivor_mapping(table_name, columns_to_check,
+                                                            keep_strategy, locator, referred)
+                with self.engine.connect() as conn:
+                    conn.execute(CreateTableAs(self.query_builder.table(mapping_name), query))
+                    conn.execute(text(
+                        f"CREATE INDEX {mapping_name}_old ON "
+                        f"{self.query_builder.quote_table(mapping_name)} (old_value)"
+                    ))
+                    conn.commit()
+            
+            yield ReferenceRemap(self, table_name, columns_to_check, references, mappings, run_id)
+        
+        finally:
+            for mapping_name in mappings.values():
+                self._drop(mapping_name)
+    
+    def _mapping_name(self, table_name: str, referred: str, run_id: str) -> str:
+        digest = hashlib.md5(f"{table_name}:{referred}".encode('utf-8')).hexdigest()[:8]
+        return (f"{DatabaseConfig.FK_MAPPING_PREFIX}_{table_name.rpartition('.')[2][:30]}_"
+                f"{digest}_{run_id}")
+    
+    def _drop(self, mapping_name: str):
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text(
+                    f"DROP TABLE IF EXISTS {self.query_builder.quote_table(mapping_name)}"
+                ))
+                conn.commit()
+        except Exception as e:
+            self.logger.warning(f"No se pudo eliminar la tabla de mapeo {mapping_name}: {str(e)}")
+
+def _describe(reference: Dict[str, Any]) -> Dict[str, Any]:
+    return {"table": reference['table'], "column": reference['columns'][0],
+            "referred_column": reference['referred_columns'][0], "name": reference['name']}
+
+class ReferenceRemap:
+    """Reasignación sobre las tablas de mapeo ya materializadas (ver ForeignKeyRemapper.mapping)"""
+    
+    def __init__(self, remapper: ForeignKeyRemapper, table_name: str, columns_to_check: List[str],
+                 references: List[Dict[str, Any]], mappings: Dict[str, str], run_id: str):
+        self.remapper = remapper
+        self.table_name = table_name
+        self.columns_to_check = columns_to_check
+        self.references = references
+        self.mappings = mappings
+        self.run_id = run_id
+        # Tabla hija -> tabla de backup de sus filas afectadas (ver backup)
+        self.backups: Dict[str, str] = {}
+        # Columna referida que identifica a las víctimas en el DELETE y en los lotes
+        self.referred = references[0]['referred_columns'][0]
+        self.remapped = [0] * len(references)
+        self._done = set()
+        self._pending: Dict[int, Tuple[int, bool]] = {}
+    
+    def __call__(self, conn: Connection, row_ids: Optional[Sequence[Any]] = None) -> int:
+        """
+        Ejecuta los UPDATE de las tablas hijas en la conexión (y transacción) del DELETE
+        
+        Con row_ids (valores de self.referred) solo se reasignan las víctimas
+        del lote; las FK hacia otra columna se reasignan todas en la primera
+        llamada, siempre solo las víctimas vigentes (mapped_victims). Las
+        cuentas se confirman con commit() tras el COMMIT del llamador, así
+        un lote que se revierte y reintenta vuelve a reasignar.
+        """
+        self._pending = {}
+        total = 0
+        query_builder = self.remapper.query_builder
+        for index, reference in enumerate(self.references):
+            referred = reference['referred_columns'][0]
+            batched = row_ids is not None and referred == self.referred
+            if not batched and index in self._done:
+                continue
+            victims = query_builder.mapped_victims(self.table_name, self.columns_to_check,
+                                                   self.mappings[referred], referred)
+            statement = query_builder.remap_references(reference['table'], reference['columns'][0],
+                                                       self.mappings[referred], batched, victims)
+            count = conn.execute(statement, {"row_ids": list(row_ids)} if batched else {}).rowcount
+            self._pending[index] = (count, batched)
+            total += count
+        return total
+    
+    def backup(self, backup_manager: BackupManager) -> Dict[str, str]:
+        """
+        Copia, antes de reasignar, las filas hijas que apuntan a una víctima del mapeo
+        
+        Una tabla de backup por tabla hija ({hija}_backup_fk_{run_id}) con las
+        filas tal como están, es decir, con la FK original. Es parcial: no se
+        restaura con restore_from_backup (reemplazaría la tabla entera), sino
+        devolviendo la FK por la PK de la hija.
+        
+        Returns:
+            Tabla hija -> tabla de backup
+        """
+        query_builder = self.remapper.query_builder
+        conditions: Dict[str, list] = {}
+        for reference in self.references:
+            referred = reference['referred_columns'][0]
+            victims = query_builder.mapped_victims(self.table_name, self.columns_to_check,
+                                                   self.mappings[referred], referred)
+            # Columna sin tabla: copy_rows pone su propia FROM de la hija
+            conditions.setdefault(reference['table'], []).append(
+                column(reference['columns'][0]).in_(victims)
+            )
+        for child_name, child_conditions in conditions.items():
+            self.backups[child_name] = backup_manager.create_backup(
+                child_name, f"fk_{self.run_id}", where=or_(*child_conditions)
+            )
+        return self.backups
+    
+    def victims_query(self) -> Select:
+        """Valores de self.referred de todas las víctimas del mapeo, en orden"""
+        mapping = self.remapper.query_builder.table(self.mappings[self.referred], 'old_value')
+        return select(mapping.c.old_value).order_by(mapping.c.old_value)
+    
+    def delete_query(self, batched: bool = False) -> Delete:
+        """DELETE de las víctimas vigentes del mapeo (con batched, las del lote row_ids)"""
+        return self.remapper.query_builder.delete_mapped_victims(
+            self.table_name, self.columns_to_check, self.mappings[self.referred], self.referred,
+            batched
+        )
+    
+    def commit(self):
+        """Registra lo reasignado en la última llamada (su transacción ya se confirmó)"""
+        for index, (count, batched) in self._pending.items():
+            self.remapped[index] += count
+            if not batched:
+                self._done.add(index)
+        self._pending = {}
+    
+    def summary(self) -> List[Dict[str, Any]]:
+        """Filas hijas reasignadas por clave foránea"""
+        return [{**_describe(reference), "remapped": self.remapped[index],
+                 "backup_table": self.backups.get(reference['table'])}
+                for index, reference in enumerate(self.references)]
@@ -0,0 +1,167 @@
+"""
+Conjuntos compactos de ids enteros (víctimas, supervivientes y lotes)
+"""
+import zlib
+from typing import Any, Iterable, Iterator, List, Optional, Union
+from .lazy_import import lazy_module
+from .config import DatabaseConfig
+
+np = lazy_module('numpy')
+
+def _sorted_unique(values: 'np.ndarray') -> 'np.ndarray':
+    """
+    Ordena y quita repetidos; evita el ordenamiento si ya viene ordenado
+    
+    Más rápido que np.unique, que en NumPy 2 pasa primero por una tabla hash.
+    """
+    if len(values) < 2:
+        return values
+    if not np.all(values[1:] >= values[:-1]):
+        values = np.sort(values)
+    distinct = np.empty(len(values), dtype=bool)
+    distinct[0] = True
+    np.not_equal(values[1:], values[:-1], out=distinct[1:])
+    return values if distinct.all() else values[distinct]
+
+class IdSet:
+    """
+    Conjunto inmutable de ids enteros sobre un arreglo NumPy ordenado y sin repetidos
+    
+    Si todos los ids caben en 2^32 a partir del menor, se guardan como
+    desplazamientos uint32 (4 bytes por id: 100M de ids ocupan ~400 MB);
+    si no, como int64. Unión, intersección y diferencia son operaciones
+    vectorizadas sobre arreglos ordenados, y los cortes (ids[a:b],
+    batches()) son vistas sin copia.
+    """
+    
+    __slots__ = ('_base', '_offsets')
+    
+    def __init__(self, ids: Union['IdSet', Iterable[int]] = ()):
+        """
+        Args:
+            ids: Cualquier colección de enteros (lista, set, array('q'),
+                arreglo NumPy, generador); se ordena y se quitan repetidos
+        """
+        if isinstance(ids, IdSet):
+            self._base, self._offsets = ids._base, ids._offsets
+            return
+        if isinstance(ids, (set, frozenset)):
+            values = np.fromiter(ids, dtype=np.int64, count=len(ids))
+        elif hasattr(ids, '__len__'):
+            values = np.array(ids, dtype=np.int64)
+        else:
+            values = np.fromiter(ids, dtype=np.int64)
+        self._store(_sorted_unique(values))
+    
+    @classmethod
+    def from_sorted(cls, values: 'np.ndarray') -> 'IdSet':
+        """Crea el conjunto desde un arreglo int64 ya ordenado y sin repetidos (sin verificarlo)"""
+        id_set = cls.__new__(cls)
+        id_set._store(np.asarray(values, dtype=np.int64))
+        return id_set
+    
+    @classmethod
+    def _wrap(cls, base: int, offsets: 'np.ndarray') -> 'IdSet':
+        id_set = cls.__new__(cls)
+        id_set._base, id_set._offsets = base, offsets
+        return id_set
+    
+    def _store(self, values: 'np.ndarray'):
+        if len(values) and int(values[-1]) - int(values[0]) <= np.iinfo(np.uint32).max:
+            self._base = int(values[0])
+            self._offsets = (values - self._base).astype(np.uint32)
+        else:
+            self._base, self._offsets = 0, values
+    
+    @property
+    def values(self) -> 'np.ndarray':
+        """Ids como arreglo int64 ordenado"""
+        if self._offsets.dtype == np.int64:
+            return self._offsets
+        return self._offsets.astype(np.int64) + self._base
+    
+    @property
+    def nbytes(self) -> int:
+        """Memoria de los ids (sin la cabecera del objeto)"""
+        return self._offsets.nbytes
+    
+    def __len__(self) -> int:
+        return len(self._offsets)
+    
+    def __iter__(self) -> Iterator[int]:
+        for chunk in self.batches(DatabaseConfig.ID_SET_CHUNK_SIZE):
+            yield from chunk.tolist()
+    
+    def __contains__(self, row_id: Any) -> bool:
+        if not isinstance(row_id, (int, np.integer)) or not len(self):
+            return False
+        offset = int(row_id) - self._base
+        if offset < 0 or offset > int(self._offsets[-1]):
+            return False
+        position = int(np.searchsorted(self._offsets, offset))
+        return int(self._offsets[position]) == offset
+    
+    def __getitem__(self, index: Union[int, slice]) -> Union[int, 'IdSet']:
+        """ids[i] es el i-ésimo menor id; ids[a:b] es un IdSet que comparte memoria"""
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                raise ValueError("IdSet solo admite cortes contiguos")
+            return self._wrap(self._base, self._offsets[index])
+        return int(self._offsets[index]) + self._base
+    
+    def __eq__(self, other: object) -> bool:
+        if not isinstance(other, IdSet):
+            return NotImplemented
+        return len(self) == len(other) and bool(np.array_equal(self.values, other.values))
+    
+    def __repr__(self) -> str:
+        return f"IdSet({len(self)} ids, {self.nbytes} bytes)"
+    
+    def union(self, other: 'IdSet') -> 'IdSet':
+        return self.from_sorted(_sorted_unique(np.concatenate([self.values, other.values])))
+    
+    def intersection(self, other: 'IdSet') -> 'IdSet':
+        return self.from_sorted(np.intersect1d(self.values, other.values, assume_unique=True))
+    
+    def difference(self, other: 'IdSet') -> 'IdSet':
+        return self.from_sorted(np.setdiff1d(self.values, other.values, assume_unique=True))
+    
+    __or__ = union
+    __and__ = intersection
+    __sub__ = difference
+    
+    def batches(self, batch_size: int, start: int = 0) -> Iterator['IdSet']:
+        """Cortes consecutivos de hasta batch_size ids en orden ascendente, desde la posición start"""
+        for position in range(start, len(self), batch_size):
+            yield self[position:position + batch_size]
+    
+    def tolist(self) -> List[int]:
+        """Ids como lista de int de Python (parámetros de un lote)"""
+        return self.values.tolist()
+    
+    def to_bytes(self, level: Optional[int] = None) -> bytes:
+        """
+        Serializa como deltas int64 little-endian comprimidos con zlib
+        
+        Las diferencias entre ids consecutivos son pequeñas, así que casi todos
+        los bytes son cero; se comprime por bloques para no duplicar en memoria
+        un conjunto grande.
+        """
+        compressor = zlib.compressobj(DatabaseConfig.ID_SET_COMPRESSION_LEVEL
+                                      if level is None else level)
+        chunks = []
+        previous = 0
+        for batch in self.batches(DatabaseConfig.ID_SET_CHUNK_SIZE):
+            values = batch.values
+            chunks.append(compressor.compress(
+                np.diff(values, prepend=previous).astype('<i8').tobytes()
+            ))
+            previous = int(values[-1])
+        chunks.append(compressor.flush())
+        return b''.join(chunks)
+    
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> 'IdSet':
+        """Inversa de to_bytes"""
+        deltas = np.frombuffer(zlib.decompress(blob), dtype='<i8')
+        return cls.from_sorted(np.cumsum(deltas, dtype=np.int64))
@@ -0,0 +1,283 @@
+"""
+Asesor de índices de soporte para el análisis de duplicados
+"""
+import hashlib
+import math
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+from sqlalchemy import text
+from .database_connector import DatabaseConnector
+from .schema_reflector import SchemaReflector
+from .query_builder import QueryBuilder
+from .key_normalizer import is_normalized, key_column_names, parse_key_column
+from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
+
+class IndexAdvisor:
+    """Detecta, evalúa y crea índices temporales que evitan ordenar la tabla completa"""
+    
+    def __init__(self, db_connector: DatabaseConnector):
+        self.db_connector = db_connector
+        self.engine = db_connector.get_engine()
+        self.db_type = db_connector.db_type
+        self.schema_reflector = SchemaReflector(db_connector)
+        self.query_builder = QueryBuilder(db_connector)
+        
+        # Setup logger
+        logger_setup = LoggerSetup()
+        self.logger = logger_setup.setup_logger(self.__class__.__name__)
+    
+    def find_supporting_index(self, table_name: str, columns_to_check: List[str]) -> Optional[Dict[str, Any]]:
+        """
+        Busca un índice cuyas columnas iniciales sean exactamente las columnas a agrupar
+        
+        Args:
+            table_name: Nombre de la tabla
+            columns_to_check: Columnas que definen un duplicado
+        
+        Returns:
+            Diccionario con nombre, columnas y si cubre la clave primaria, o None
+        
+        Con columnas normalizadas (lower(email), ...) solo sirve un índice de
+        expresión; se reconoce por su nombre determinista (create_key_index o
+        el temporario de una ejecución anterior que no llegó a borrarlo).
+        """
+        if is_normalized(columns_to_check):
+            for index_name in (self._key_index_name(table_name, columns_to_check),
+                               self._temporary_index_name(table_name, columns_to_check)):
+                if self.schema_reflector.index_exists(table_name, index_name):
+                    return {"name": index_name, "columns": list(columns_to_check), "covering": True}
+            return None
+        
+        schema = self.schema_reflector.reflect(table_name)
+        candidates = list(schema['indexes'])
+        
+        primary_key = schema['primary_key']
+        if primary_key:
+            candidates.append({
+                "name": schema['primary_key_name'] or 'PRIMARY KEY',
+                "column_names": primary_key
+            })
+        
+        wanted = set(columns_to_check)
+        for candidate in candidates:
+            index_columns = candidate['column_names']
+            # El orden interno no importa para GROUP BY, pero deben ir al inicio
+            if set(index_columns[:len(columns_to_check)]) == wanted:
+                trailing = set(index_columns[len(columns_to_check):])
+                return {
+                    "name": candidate['name'],
+                    "columns": index_columns,
+                    "covering": bool(primary_key) and set(primary_key) <= trailing
+                }
+        
+        return None
+    
+    def estimate_row_count(self, table_name: str) -> int:
+        """Estimación barata del número de filas de la tabla"""
+        with self.engine.connect() as conn:
+            if self.db_type == 'postgresql':
+                estimate = conn.execute(
+                    text("SELECT reltuples FROM pg_class WHERE oid = CAST(:t AS regclass)"),
+                    {"t": QueryBuilder(self.db_connector).quote_table(table_name)}
+                ).scalar()
+            elif self.db_type == 'mysql':
+                estimate = conn.execute(text("""
+                    SELECT TABLE_ROWS FROM information_schema.TABLES
+                    WHERE table_schema = DATABASE() AND table_name = :t
+                """), {"t": table_name}).scalar()
+            else:
+                estimate = conn.execute(QueryBuilder(self.db_connector).count_rows(table_name)).scalar()
+        
+        return max(int(estimate or 0), 0)
+    
+    def estimate_benefit(self, table_name: str, columns_to_check: List[str],
+                         group_by_passes: int = 3) -> Dict[str, Any]:
+        """
+        Estima si conviene un índice temporal para las columnas dadas
+        
+        Modelo simple: cada GROUP BY sin índice cuesta un ordenamiento n·log2(n);
+        con índice se paga un ordenamiento al construirlo y luego un recorrido
+        ordenado (n) por pasada.
+        
+        Args:
+            table_name: Nombre de la tabla
+            columns_to_check: Columnas que definen un duplicado
+            group_by_passes: Número de GROUP BY que hará la ejecución
+        
+        Returns:
+            Diccionario con la estimación y la recomendación
+        """
+        existing = self.find_supporting_index(table_name, columns_to_check)
+        rows = self.estimate_row_count(table_name)
+        
+        sort_cost = rows * math.log2(rows) if rows > 1 else float(rows)
+        cost_without = group_by_passes * sort_cost
+        cost_with = sort_cost + group_by_passes * rows
+        speedup = round(cost_without / cost_with, 2) if cost_with else 1.0
+        
+        recommended = (
+            existing is None
+            and rows >= DatabaseConfig.TEMP_INDEX_MIN_ROWS
+            and speedup > 1.0
+        )
+        
+        return {
+            "estimated_rows": rows,
+            "existing_index": existing,
+            "group_by_passes": group_by_passes,
+            "estimated_speedup": speedup,
+            "recommended": recommended
+        }
+    
+    def create_temporary_index(self, table_name: str, columns_to_check: List[str]) -> Dict[str, Any]:
+        """
+        Crea un índice (columnas..., clave primaria) para la ejecución
+        
+        Returns:
+            Diccionario con el nombre del índice y el tiempo de construcción
+        """
+        index_name = self._temporary_index_name(table_name, columns_to_check)
+        info = self._create_index(table_name, columns_to_check, index_name)
+        self.logger.info(f"Índice temporal {index_name} creado en {info['build_seconds']:.2f}s")
+        return info
+    
+    def create_key_index(self, table_name: str, columns_to_check: List[str]) -> Dict[str, Any]:
+        """
+        Crea (si falta) un índice permanente sobre las columnas clave, normalizadas o no
+        
+        Con columnas normalizadas es un índice de expresión con las mismas
+        expresiones que compila QueryBuilder, así que el GROUP BY normalizado
+        lo recorre en orden en lugar de ordenar la tabla; las ejecuciones
+        siguientes lo reutilizan (find_supporting_index) sin crear uno temporal.
+        """
+        index_name = self._key_index_name(table_name, columns_to_check)
+        if self.schema_reflector.index_exists(table_name, index_name):
+            self.logger.info(f"Índice de claves {index_name} ya presente")
+            return {"name": index_name, "build_seconds": 0.0, "created": False}
+        if not self.is_indexable(columns_to_check):
+            raise ValueError(f"No se puede indexar {columns_to_check} en {self.db_type}")
+        
+        info = self._create_index(table_name, columns_to_check, index_name)
+        self.schema_reflector.invalidate(table_name)
+        self.logger.info(f"Índice de claves {index_name} creado en {info['build_seconds']:.2f}s")
+        return {**info, "created": True}
+    
+    def is_indexable(self, columns_to_check: List[str]) -> bool:
+        """False si alguna normalización no admite índice de expresión en esta BD"""
+        # unaccent() de PostgreSQL es STABLE (depende del diccionario) y no se indexa
+        return not (self.db_type == 'postgresql' and any(
+            'unaccent' in parse_key_column(spec)[1] for spec in columns_to_check
+        ))
+    
+    def _create_index(self, table_name: str, columns_to_check: List[str],
+                      index_name: str) -> Dict[str, Any]:
+        """
+        Crea un índice (columnas o expresiones..., clave primaria)
+        
+        En PostgreSQL se usa CREATE INDEX CONCURRENTLY y en MySQL DDL online
+        para no bloquear escrituras mientras se construye.
+        """
+        primary_key = self.schema_reflector.reflect(table_name)['primary_key']
+        key_columns = key_column_names(columns_to_check)
+        index_columns = ', '.join(
+            self.query_builder.index_elements(columns_to_check)
+            + [column for column in primary_key if column not in key_columns]
+        )
+        
+        start = time.perf_counter()
+        try:
+            if self.db_type == 'postgresql':
+                autocommit_engine = self.engine.execution_options(isolation_level="AUTOCOMMIT")
+                with autocommit_engine.connect() as conn:
+                    # Sin text(): las expresiones pueden tener ':' (p. ej. [[:space:]])
+                    conn.exec_driver_sql(
+                        f"CREATE INDEX CONCURRENTLY {index_name} ON {table_name} ({index_columns})"
+                    )
+            else:
+                create_query = f"CREATE INDEX {index_name} ON {table_name} ({index_columns})"
+                if self.db_type == 'mysql':
+                    create_query += " ALGORITHM=INPLACE LOCK=NONE"
+                with self.engine.connect() as conn:
+                    conn.exec_driver_sql(create_query)
+                    conn.commit()
+        
+        except Exception as e:
+            self.logger.error(f"Error creando índice {index_name}: {str(e)}")
+            # Un CREATE INDEX CONCURRENTLY fallido deja un índice inválido
+            self.drop_index(table_name, index_name)
+            raise
+        
+        return {"name": index_name, "build_seconds": time.perf_counter() - start}
+    
+    def drop_index(self, table_name: str, index_name: str) -> bool:
+        """Elimina un índice sin bloquear escrituras cuando la BD lo permite"""
+        try:
+            if self.db_type == 'postgresql':
+                autocommit_engine = self.engine.execution_options(isolation_level="AUTOCOMMIT")
+                with autocommit_engine.connect() as conn:
+                    conn.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {index_name}"))
+            else:
+                if self.db_type == 'mysql':
+                    drop_query = f"DROP INDEX {index_name} ON {table_name}"
+                else:
+                    drop_query = f"DROP INDEX IF EXISTS {index_name}"
+                with self.engine.connect() as conn:
+                    conn.execute(text(drop_query))
+                    conn.commit()
+            
+            self.logger.info(f"Índice {index_name} eliminado")
+            return True
+        
+        except Exception as e:
+            self.logger.error(f"Error eliminando índice: {str(e)}")
+            return False
+    
+    @contextmanager
+    def temporary_index(self, table_name: str, columns_to_check: List[str],
+                        only_if_beneficial: bool = True) -> Iterator[Dict[str, Any]]:
+        """
+        Context manager que crea el índice temporal si hace falta y lo elimina al salir
+        
+        Yields:
+            Diccionario con la estimación, si se creó el índice y su tiempo de construcción
+        """
+        estimate = self.estimate_benefit(table_name, columns_to_check)
+        info = {
+            "created": False,
+            "name": None,
+            "build_seconds": 0.0,
+            "estimate": estimate
+        }
+        
+        if estimate['existing_index'] is not None:
+            self.logger.info(f"Índice existente reutilizable: {estimate['existing_index']['name']}")
+        elif only_if_beneficial and not estimate['recommended']:
+            self.logger.info("Índice temporal no recomendado para esta tabla")
+        elif not self.is_indexable(columns_to_check):
+            self.logger.warning(
+                f"Sin índice temporal: {columns_to_check} no es indexable en {self.db_type}"
+            )
+        else:
+            info.update(self.create_temporary_index(table_name, columns_to_check))
+            info['created'] = True
+        
+        try:
+            yield info
+        finally:
+            if info['created']:
+                self.drop_index(table_name, info['name'])
+    
+    def _temporary_index_name(self, table_name: str, columns_to_check: List[str]) -> str:
+        """Nombre determinista y corto (límite de 63 caracteres en PostgreSQL)"""
+        digest = hashlib.md5(
+            f"{table_name}:{','.join(columns_to_check)}".encode('utf-8')
+        ).hexdigest()[:10]
+        return f"{DatabaseConfig.TEMP_INDEX_PREFIX}_{table_name[:40]}_{digest}"
+    
+    def _key_index_name(self, table_name: str, columns_to_check: List[str]) -> str:
+        digest = hashlib.md5(
+            f"{table_name}:{','.join(columns_to_check)}".encode('utf-8')
+        ).hexdigest()[:10]
+        return f"{DatabaseConfig.KEY_INDEX_PREFIX}_{table_name[:40]}_{digest}"
@@ -0,0 +1,375 @@
+"""
+Ejecución de archivos de trabajos: varias tablas y bases de datos en un solo proceso
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from .database_connector import DatabaseConnector, database_phase
+from .duplicate_remover import DuplicateRemover
+from .query_builder import QueryBuilder
+from .throttle_controller import ThrottleController
+from .cancellation import CancellationToken
+from .lazy_import import is_available, lazy_module
+from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
+
+# PyYAML es opcional: solo hace falta para archivos .yaml/.yml
+yaml = lazy_module('yaml')
+
+class JobRunner:
+    """
+    Ejecuta la lista de trabajos de un archivo JSON/YAML
+    
+    Cada base de datos se conecta una sola vez y su engine (con su pool) lo
+    comparten todos sus trabajos; los trabajos corren en paralelo hasta
+    `parallelism` a la vez y como máximo `max_parallel` contra la misma base.
+    
+    Formato del archivo:
+        
+        parallelism: 4
+        defaults: {strategy: oldest, dry_run: true}
+        databases:
+          main: {db_type: postgresql, connection_string: "${MAIN_DB_URL}",
+                 max_parallel: 2, timeouts: {deletion: {lock_timeout: 5}},
+                 replicas: ["${MAIN_REPLICA_URL}"]}
+        jobs:
+          - {database: main, table: users, columns: [email], dry_run: false,
+             throttle: {target_latency: 0.2}, max_deletions: 10000}
+    """
+    
+    DATABASE_KEYS = {'db_type', 'connection_string', 'max_parallel', 'timeouts', 'engine_options',
+                     'replicas'}
+    JOB_KEYS = {'database', 'table', 'columns', 'strategy', 'incremental', 'dry_run',
+                'temp_index', 'enforce_unique', 'throttle', 'max_new_rows', 'backup',
+                'max_deletions', 'count_rows'}
+    THROTTLE_KEYS = {'target_latency', 'max_replica_lag', 'max_lock_waits', 'initial_batch_size',
+                     'min_batch_size', 'max_batch_size', 'max_sleep'}
+    JOB_DEFAULTS = {
+        'strategy': 'oldest',
+        'incremental': False,
+        'dry_run': True,
+        'temp_index': False,
+        'enforce_unique': False,
+        'throttle': False,
+        'max_new_rows': None,
+        'backup': True,
+        'max_deletions': None,
+        'count_rows': DatabaseConfig.JOB_COUNT_ROWS
+    }
+    
+    def __init__(self, spec: Dict[str, Any], parallelism: Optional[int] = None,
+                 dry_run: Optional[bool] = None,
+                 timeouts: Optional[Dict[str, Dict[str, Optional[float]]]] = None,
+                 cancel_token: Optional[CancellationToken] = None):
+        """
+        Args:
+            spec: Contenido del archivo de trabajos (ver load_spec)
+            parallelism: Trabajos simultáneos; tiene prioridad sobre el del archivo
+            dry_run: Si True, fuerza el simulacro en todos los trabajos
+            timeouts: Timeouts por fase comunes a todas las bases (cada base
+                puede sobrescribirlos con su propia clave timeouts)
+            cancel_token: Detiene los trabajos en curso entre lotes y no
+                inicia los pendientes
+        """
+        self.databases = self._parse_databases(spec.get('databases') or {})
+        self.jobs = self._parse_jobs(spec.get('jobs') or [], spec.get('defaults') or {})
+        self.parallelism = int(parallelism or spec.get('parallelism') or DatabaseConfig.JOB_PARALLELISM)
+        if self.parallelism < 1:
+            raise ValueError(f"parallelism debe ser al menos 1: {self.parallelism}")
+        self.dry_run = dry_run
+        self.timeouts = timeouts or {}
+        self.cancel_token = cancel_token or CancellationToken()
+        
+        self._connectors: Dict[str, DatabaseConnector] = {}
+        self._removers: Dict[str, DuplicateRemover] = {}
+        self._slots: Dict[str, threading.Semaphore] = {}
+        
+        # Setup logger
+        logger_setup = LoggerSetup()
+        self.logger = logger_setup.setup_logger(self.__class__.__name__)
+    
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> 'JobRunner':
+        """Crea el runner a partir de un archivo .json, .yaml o .yml"""
+        return cls(cls.load_spec(path), **kwargs)
+    
+    @staticmethod
+    def load_spec(path: str) -> Dict[str, Any]:
+        """
+        Lee el archivo de trabajos
+        
+        Las variables de entorno (${VAR}) de las cadenas de conexión se
+        expanden al conectar, así las credenciales no quedan en el archivo.
+        """
+        extension = os.path.splitext(path)[1].lower()
+        if extension not in DatabaseConfig.JOB_FILE_FORMATS:
+            raise ValueError(f"Formato de archivo de trabajos no soportado: {extension or path}")
+        
+        with open(path, 'r', encoding='utf-8-sig') as f:
+            if extension == '.json':
+                spec = json.load(f)
+            else:
+                if not is_available(yaml):
+                    raise ImportError("Los archivos YAML requieren PyYAML (pip install pyyaml)")
+                spec = yaml.safe_load(f)
+        
+        if not isinstance(spec, dict):
+            raise ValueError(f"El archivo de trabajos debe contener un objeto: {path}")
+        return spec
+    
+    def run(self) -> Dict[str, Any]:
+        """
+        Ejecuta todos los trabajos y retorna el resumen
+        
+        Un trabajo fallido no detiene a los demás; el estado global es
+        'success', 'partial' (algún fallo), 'failed' (todos fallaron) o
+        'cancelled'.
+        
+        Returns:
+            Diccionario serializable a JSON con totales y, por trabajo,
+            estado, filas eliminadas, conteos de filas y tiempos
+        """
+        started_at = datetime.now()
+        run_start = time.perf_counter()
+        
+        try:
+            self._connect()
+            
+            with ThreadPoolExecutor(max_workers=min(self.parallelism, len(self.jobs) or 1),
+                                    thread_name_prefix='dedup_job') as executor:
+                results = list(executor.map(self._run_job, self.jobs))
+        finally:
+            self.close()
+        
+        summary = {
+            "status": self._overall_status(results),
+            "started_at": started_at.isoformat(timespec='seconds'),
+            "finished_at": datetime.now().isoformat(timespec='seconds'),
+            "elapsed_seconds": round(time.perf_counter() - run_start, 3),
+            "parallelism": self.parallelism,
+            "totals": self._totals(results),
+            "jobs": results
+        }
+        self.logger.info(
+            f"Trabajos terminados ({summary['status']}): {summary['totals']['succeeded']} de "
+            f"{summary['totals']['jobs']} correctos, {summary['totals']['deleted_rows']} "
+            f"filas eliminadas en {summary['elapsed_seconds']}s"
+        )
+        return summary
+    
+    def close(self):
+        """Libera los pools de conexiones de todas las bases"""
+        for connector in self._connectors.values():
+            connector.get_engine().dispose()
+        self._connectors.clear()
+        self._removers.clear()
+    
+    def _connect(self):
+        """Un DatabaseConnector (y un DuplicateRemover) por base, compartido por sus trabajos"""
+        for name in sorted({job['database'] for job in self.jobs}):
+            settings = self.databases[name]
+            max_parallel = settings.get('max_parallel') or (
+                1 if settings['db_type'] == 'sqlite' else self.parallelism
+            )
+            
+            engine_options = dict(settings.get('engine_options') or {})
+            if settings['db_type'] != 'sqlite':
+                # Una conexión por trabajo más margen para las sondas del control de ritmo
+                engine_options.setdefault('pool_size', max_parallel)
+                engine_options.setdefault('max_overflow', max_parallel)
+            
+            timeouts = {phase: dict(values) for phase, values in self.timeouts.items()}
+            for phase, values in (settings.get('timeouts') or {}).items():
+                timeouts.setdefault(phase, {}).update(values)
+            
+            replicas = settings.get('replicas') or []
+            connector = DatabaseConnector(os.path.expandvars(settings['connection_string']),
+                                          settings['db_type'], timeouts=timeouts,
+                                          engine_options=engine_options,
+                                          replicas=[os.path.expandvars(replica) for replica in
+                                                    ([replicas] if isinstance(replicas, str)
+                                                     else replicas)])
+            self._connectors[name] = connector
+            self._removers[name] = DuplicateRemover(connector)
+            self._slots[name] = threading.Semaphore(max_parallel)
+    
+    def _run_job(self, job: Dict[str, Any]) -> Dict[str, Any]:
+        """Ejecuta un trabajo; los errores quedan en su entrada del resumen"""
+        dry_run = job['dry_run'] if self.dry_run is None else self.dry_run
+        entry = {
+            "database": job['database'],
+            "table": job['table'],
+            "columns": job['columns'],
+            "strategy": job['strategy'],
+            "incremental": job['incremental'],
+            "dry_run": dry_run,
+            "status": "pending",
+            "deleted_count": 0,
+            "backup_table": None,
+            "rows_before": None,
+            "rows_after": None,
+            "elapsed_seconds": None,
+            "timings": {},
+            "message": None
+        }
+        
+        with self._slots[job['database']]:
+            if self.cancel_token.cancelled:
+                entry.update(status="cancelled", message="No iniciado: ejecución cancelada")
+                return entry
+            
+            job_start = time.perf_counter()
+            remover = self._removers[job['database']]
+            try:
+                if job['count_rows']:
+                    entry['rows_before'] = self._count_rows(job)
+                
+                if self._exceeds_max_deletions(job, dry_run, entry):
+                    return entry
+                
+                result = self._execute(remover, job, dry_run)
+                entry.update(
+                    status=result['status'],
+                    deleted_count=result.get('deleted_count', 0),
+                    backup_table=result.get('backup_table'),
+                    timings=result.get('timings') or {},
+                    message=result.get('message')
+                )
+                if job['count_rows']:
+                    entry['rows_after'] = (entry['rows_before'] if dry_run
+                                           else self._count_rows(job))
+            except Exception as e:
+                self.logger.error(f"Error en el trabajo {job['database']}.{job['table']}: {str(e)}")
+                entry.update(status="error", message=str(e))
+            finally:
+                entry['elapsed_seconds'] = round(time.perf_counter() - job_start, 3)
+        
+        return entry
+    
+    def _execute(self, remover: DuplicateRemover, job: Dict[str, Any],
+                 dry_run: bool) -> Dict[str, Any]:
+        if job['incremental']:
+            return remover.remove_duplicates_incremental(
+                job['table'], job['columns'], job['strategy'], dry_run,
+                max_new_rows=job['max_new_rows'], backup=job['backup']
+            )
+        
+        throttle = None
+        if job['throttle']:
+            options = job['throttle'] if isinstance(job['throttle'], dict) else {}
+            throttle = ThrottleController(self._connectors[job['database']], **options)
+        
+        method = (remover.remove_duplicates_keep_oldest if job['strategy'] == 'oldest'
+                  else remover.remove_duplicates_keep_newest)
+        return method(job['table'], job['columns'], dry_run,
+                      use_temp_index=job['temp_index'],
+                      enforce_unique=job['enforce_unique'],
+                      throttle=throttle, cancel_token=self.cancel_token)
+    
+    def _exceeds_max_deletions(self, job: Dict[str, Any], dry_run: bool,
+                               entry: Dict[str, Any]) -> bool:
+        """
+        Omite el trabajo si eliminaría más filas que max_deletions (solo modo completo)
+        
+        Falla cerrado: si el conteo falla la excepción llega a _run_job y el
+        trabajo queda en error, nunca se borra sin haber contado.
+        """
+        if dry_run or job['incremental'] or job['max_deletions'] is None:
+            return False
+        
+        connector = self._connectors[job['database']]
+        query = QueryBuilder(connector).excess_rows(job['table'], job['columns'])
+        with database_phase('analysis'):
+            with connector.get_read_engine().connect() as conn:
+                pending = int(conn.execute(query).scalar())
+        if pending <= job['max_deletions']:
+            return False
+        
+        entry.update(
+            status="skipped",
+            message=f"Eliminaría {pending} filas (límite max_deletions={job['max_deletions']})"
+        )
+        self.logger.warning(f"{job['database']}.{job['table']}: {entry['message']}")
+        return True
+    
+    def _count_rows(self, job: Dict[str, Any]) -> int:
+        connector = self._connectors[job['database']]
+        with connector.get_engine().connect() as conn:
+            return int(conn.execute(QueryBuilder(connector).count_rows(job['table'])).scalar())
+    
+    def _parse_databases(self, databases: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        if not databases:
+            raise ValueError("El archivo de trabajos no define bases de datos (databases)")
+        
+        for name, settings in databases.items():
+            unknown = set(settings) - self.DATABASE_KEYS
+            if unknown:
+                raise ValueError(f"Claves desconocidas en la base {name}: {sorted(unknown)}")
+            if settings.get('db_type') not in DatabaseConfig.SUPPORTED_DB_TYPES:
+                raise ValueError(f"Tipo de BD no soportado en la base {name}: {settings.get('db_type')}")
+            if not settings.get('connection_string'):
+                raise ValueError(f"La base {name} no tiene connection_string")
+        return databases
+    
+    def _parse_jobs(self, jobs: List[Dict[str, Any]],
+                    defaults: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Valida los trabajos y completa cada uno con defaults y JOB_DEFAULTS"""
+        if not jobs:
+            raise ValueError("El archivo de trabajos no define trabajos (jobs)")
+        
+        parsed = []
+        for index, raw in enumerate(jobs):
+            job = {**self.JOB_DEFAULTS, **defaults, **raw}
+            label = f"trabajo {index} ({raw.get('table', '?')})"
+            
+            unknown = set(job) - self.JOB_KEYS
+            if unknown:
+                raise ValueError(f"Claves desconocidas en el {label}: {sorted(unknown)}")
+            if 'database' not in job and len(self.databases) == 1:
+                job['database'] = next(iter(self.databases))
+            if job.get('database') not in self.databases:
+                raise ValueError(f"Base de datos desconocida en el {label}: {job.get('database')}")
+            if not job.get('table'):
+                raise ValueError(f"Falta la tabla en el {label}")
+            if isinstance(job.get('columns'), str):
+                job['columns'] = [column.strip() for column in job['columns'].split(',')]
+            if not job.get('columns'):
+                raise ValueError(f"Faltan las columnas en el {label}")
+            if job['strategy'] not in ('oldest', 'newest'):
+                raise ValueError(f"Estrategia inválida en el {label}: {job['strategy']}")
+            if isinstance(job['throttle'], dict):
+                unknown = set(job['throttle']) - self.THROTTLE_KEYS
+                if unknown:
+                    raise ValueError(f"Límites de ritmo desconocidos en el {label}: {sorted(unknown)}")
+            parsed.append(job)
+        return parsed
+    
+    @staticmethod
+    def _overall_status(results: List[Dict[str, Any]]) -> str:
+        statuses = [result['status'] for result in results]
+        if 'cancelled' in statuses:
+            return 'cancelled'
+        if statuses and all(status == 'error' for status in statuses):
+            return 'failed'
+        if 'error' in statuses:
+            return 'partial'
+        return 'success'
+    
+    @staticmethod
+    def _totals(results: List[Dict[str, Any]]) -> Dict[str, int]:
+        statuses = [result['status'] for result in results]
+        return {
+            "jobs": len(results),
+            "succeeded": statuses.count('success'),
+            "failed": statuses.count('error'),
+            "skipped": statuses.count('skipped'),
+            "cancelled": statuses.count('cancelled'),
+            "deleted_rows": sum(result['deleted_count'] for result in results
+                                if not result['dry_run']),
+            "dry_run_rows": sum(result['deleted_count'] for result in results
+                                if result['dry_run'])
+        }
@@ -0,0 +1,466 @@
+"""
+Filtro de Bloom persistido de las claves de una tabla (¿ya existe este registro?)
+"""
+import hashlib
+import json
+import math
+import os
+import struct
+import threading
+import time
+from datetime import date, datetime, time as time_of_day
+from decimal import Decimal, InvalidOperation
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from .atomic_file import atomic_write
+from .database_connector import DatabaseConnector, database_phase
+from .schema_reflector import SchemaReflector
+from .key_normalizer import parse_key_column
+from .query_builder import QueryBuilder
+from .lazy_import import lazy_module
+from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
+
+np = lazy_module('numpy')
+
+FILTER_MAGIC = b'DEDUPBLOOM'
+FILTER_FORMAT_VERSION = 1
+
+_MASK64 = (1 << 64) - 1
+
+# Primera palabra del tipo reflejado -> clase de valor para encode_key
+_NUMERIC_TYPES = {'INT', 'INTEGER', 'BIGINT', 'SMALLINT', 'TINYINT', 'MEDIUMINT',
+                  'NUMERIC', 'DECIMAL', 'REAL', 'FLOAT', 'DOUBLE'}
+_TEMPORAL_TYPES = {'DATE': 'date', 'TIMESTAMP': 'datetime', 'TIMESTAMPTZ': 'datetime',
+                   'DATETIME': 'datetime', 'TIME': 'time', 'TIMETZ': 'time'}
+_TEMPORAL_PARSERS = {'date': date.fromisoformat, 'datetime': datetime.fromisoformat,
+                     'time': time_of_day.fromisoformat}
+
+def key_value_kind(column_type: Optional[str]) -> Optional[str]:
+    """Clase de valor según el tipo reflejado: 'numeric', 'date', 'datetime', 'time' o None"""
+    words = (column_type or '').upper().split('(')[0].split()
+    if not words:
+        return None
+    if words[0] in _NUMERIC_TYPES:
+        return 'numeric'
+    return _TEMPORAL_TYPES.get(words[0])
+
+def _canonical_value(value: Any, kind: Optional[str]) -> Any:
+    """Forma canónica de un valor no nulo; si no se puede interpretar, el valor tal cual"""
+    if kind == 'numeric' and not isinstance(value, bool):
+        try:
+            number = value if isinstance(value, Decimal) else Decimal(str(value).strip())
+        except InvalidOperation:
+            return value
+        if not number.is_finite():
+            return value
+        return '0' if number.is_zero() else format(number.normalize(), 'f')
+    if kind in _TEMPORAL_PARSERS:
+        if isinstance(value, str):
+            try:
+                value = _TEMPORAL_PARSERS[kind](value.strip())
+            except ValueError:
+                return value
+        if kind == 'date' and isinstance(value, datetime):
+            value = value.date()
+        elif kind == 'datetime' and type(value) is date:
+            value = datetime.combine(value, time_of_day())
+        if isinstance(value, (date, time_of_day)):
+            return value.isoformat()
+    return value
+
+def encode_key(values: Sequence[Any], kinds: Optional[Sequence[Optional[str]]] = None) -> bytes:
+    """
+    Representación canónica de una clave: str() de cada valor (NULL aparte)
+    
+    Así 42 y '42' coinciden, igual que al comparar con la BD; un servicio
+    que envía los valores como texto obtiene la misma huella. Con kinds
+    (key_value_kind de cada columna) números y fechas se normalizan antes:
+    Decimal('10.50'), 10.5 y '10.50' dan '10.5'; un datetime y su texto
+    ISO (con espacio o 'T') dan la misma huella.
+    """
+    kinds = kinds or [None] * len(values)
+    return '\x1f'.join('\x00' if value is None else str(_canonical_value(value, kind))
+                       for value, kind in zip(values, kinds)).encode('utf-8')
+
+class BloomFilter:
+    """Filtro de Bloom de m bits y k hashes (doble hashing sobre blake2b de 128 bits)"""
+    
+    def __init__(self, bits: int, hashes: int, data: Optional['np.ndarray'] = None):
+        self.bits = bits
+        self.hashes = hashes
+        self.data = np.zeros((bits + 7) // 8, dtype=np.uint8) if data is None else data
+    
+    @classmethod
+    def for_capacity(cls, capacity: int, false_positive_rate: float) -> 'BloomFilter':
+        """Tamaño óptimo para capacity claves con la tasa de falsos positivos dada"""
+        bits = math.ceil(-capacity * math.log(false_positive_rate) / math.log(2) ** 2)
+        bits = max(64, (bits + 63) // 64 * 64)
+        hashes = max(1, round(bits / capacity * math.log(2)))
+        return cls(bits, hashes)
+    
+    def false_positive_rate(self, count: int) -> float:
+        """Tasa esperada de falsos positivos con count claves insertadas"""
+        return (1 - math.exp(-self.hashes * count / self.bits)) ** self.hashes
+    
+    def add_many(self, keys: Sequence[bytes]):
+        if not keys:
+            return
+        positions = self._positions(keys)
+        np.bitwise_or.at(self.data, positions >> 3,
+                         np.left_shift(1, positions & 7).astype(np.uint8))
+    
+    def contains_many(self, keys: Sequence[bytes]) -> 'np.ndarray':
+        if not keys:
+            return np.zeros(0, dtype=bool)
+        positions = self._positions(keys)
+        masks = np.left_shift(1, positions & 7).astype(np.uint8)
+        return ((self.data[positions >> 3] & masks) != 0).all(axis=1)
+    
+    def contains(self, key: bytes) -> bool:
+        """Versión escalar sin NumPy por llamada (misma aritmética que _positions)"""
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        second = int.from_bytes(digest[8:], 'little') | 1
+        data = self.data
+        for index in range(self.hashes):
+            position = ((first + index * second) & _MASK64) % self.bits
+            if not data[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+    
+    def _positions(self, keys: Sequence[bytes]) -> 'np.ndarray':
+        """Posiciones (n, k) de bits: (h1 + i * h2) mod m, con h2 impar"""
+        digests = b''.join(hashlib.blake2b(key, digest_size=16).digest() for key in keys)
+        halves = np.frombuffer(digests, dtype='<u8').reshape(-1, 2)
+        first, second = halves[:, :1], halves[:, 1:] | np.uint64(1)
+        index = np.arange(self.hashes, dtype=np.uint64)
+        return ((first + index * second) % np.uint64(self.bits)).astype(np.int64)
+
+class KeyFilter:
+    """
+    Responde "¿ya existe una fila con esta clave?" en memoria, sin ir a la BD
+    
+    El filtro se construye leyendo la tabla una vez y se guarda en disco;
+    refresh() agrega solo las filas con id mayor a la marca de agua. Un
+    negativo es seguro (la clave no existía al último refresh); un positivo
+    puede ser falso (tasa configurable), por eso exists()/exists_many()
+    consultan la BD solo para los positivos. Las filas borradas siguen
+    dando positivo hasta reconstruir el filtro.
+    
+    Limitación: refresh() solo ve filas nuevas, no cambios. Si un UPDATE
+    cambia la clave de una fila existente, la clave nueva da falso negativo
+    (might_exist() y exists() responden False) hasta la próxima
+    reconstrucción. refresh() reconstruye desde cero si el filtro tiene más
+    de max_age segundos o con refresh(force=True); en tablas donde la clave
+    se actualiza conviene llamar a build() tras esos cambios.
+    
+    Los valores se comparan por su forma canónica según el tipo reflejado de
+    cada columna (ver encode_key): un NUMERIC o una fecha se pueden pasar
+    como número, Decimal, texto o datetime. Las zonas horarias no se
+    convierten: un timestamptz se compara con el desfase que traiga.
+    """
+    
+    def __init__(self, db_connector: DatabaseConnector, table_name: str, key_columns: List[str],
+                 path: Optional[str] = None, false_positive_rate: Optional[float] = None,
+                 max_age: Optional[float] = None):
+        self.db_connector = db_connector
+        self.engine = db_connector.get_engine()
+        self.db_type = db_connector.db_type
+        self.table_name = table_name
+        self.key_columns = list(key_columns)
+        self.path = path or DatabaseConfig.KEY_FILTER_FILE.format(table=table_name)
+        self.false_positive_rate = false_positive_rate or DatabaseConfig.KEY_FILTER_FP_RATE
+        self.max_age = max_age if max_age is not None else DatabaseConfig.KEY_FILTER_MAX_AGE
+        self.schema_reflector = SchemaReflector(db_connector)
+        self.query_builder = QueryBuilder(db_connector)
+        
+        self.bloom: Optional[BloomFilter] = None
+        self.header: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+        self._stats = {"checks": 0, "positives": 0, "lookups": 0, "confirmed": 0}
+        
+        # Setup logger
+        logger_setup = LoggerSetup()
+        self.logger = logger_setup.setup_logger(self.__class__.__name__)
+        
+        if os.path.exists(self.path):
+            self.load()
+    
+    # --- Construcción y persistencia ---
+    
+    def build(self, expected_rows: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Lee las claves de toda la tabla y guarda un filtro nuevo
+        
+        Args:
+            expected_rows: Filas previstas; por defecto las actuales. La
+                capacidad es expected_rows * KEY_FILTER_GROWTH para que los
+                refresh() no degraden la tasa de falsos positivos
+        """
+        start = time.perf_counter()
+        try:
+            key = self.schema_reflector.integer_key(self.table_name)
+            kinds = self._key_kinds()
+            with database_phase('analysis'):
+                with self.engine.connect() as conn:
+                    if expected_rows is None:
+                        expected_rows = conn.execute(
+                            self.query_builder.count_rows(self.table_name)
+                        ).scalar()
+                    capacity = max(DatabaseConfig.KEY_FILTER_MIN_CAPACITY,
+                                   int(expected_rows * DatabaseConfig.KEY_FILTER_GROWTH))
+                    bloom = BloomFilter.for_capacity(capacity, self.false_positive_rate)
+                    bound = (conn.execute(self.query_builder.max_value(self.table_name, key)).scalar()
+                             if key else None)
+                    added = self._stream_keys(conn, bloom, key, None, bound, kinds)
+            
+            header = {
+                "format": FILTER_FORMAT_VERSION,
+                "built_at": datetime.now().isoformat(timespec='seconds'),
+                "database": self.engine.url.render_as_string(hide_password=True),
+                "table": self.table_name,
+                "columns": self.key_columns,
+                "key_kinds": kinds,
+                "key": key,
+                "watermark": bound,
+                "count": added,
+                "capacity": capacity,
+                "false_positive_rate": self.false_positive_rate
+            }
+            with self._lock:
+                self.bloom, self.header = bloom, header
+            self.save()
+            
+            self.logger.info(
+                f"Filtro de claves de {self.table_name}{self.key_columns}: {added} claves, "
+                f"{bloom.data.nbytes} bytes, {bloom.hashes} hashes "
+                f"({time.perf_counter() - start:.2f}s)"
+            )
+            return self.stats()
+        
+        except Exception as e:
+            self.logger.error(f"Error construyendo el filtro de {self.table_name}: {str(e)}")
+            raise
+    
+    def refresh(self, force: bool = False) -> Dict[str, Any]:
+        """
+        Agrega las filas nuevas (id mayor a la marca de agua) y guarda el filtro
+        
+        Reconstruye desde cero si no hay filtro, si la tabla no tiene PK
+        entera, si el filtro es anterior a la normalización por tipo, si las
+        claves superan la capacidad, si el filtro es más antiguo que max_age
+        o con force (recoge claves cambiadas por UPDATE y descarta las
+        borradas).
+        """
+        if (self.bloom is None or self.header.get('key') is None
+                or 'key_kinds' not in self.header):
+            return self.build()
+        if force or self._expired():
+            self.logger.info(f"Filtro de {self.table_name} reconstruido desde cero "
+                             f"({'forzado' if force else f'más de {self.max_age}s'})")
+            return self.build()
+        
+        key = self.header['key']
+        try:
+            with database_phase('analysis'):
+                with self.engine.connect() as conn:
+                    bound = conn.execute(self.query_builder.max_value(self.table_name, key)).scalar()
+                    watermark = self.header['watermark']
+                    if bound is None or (watermark is not None and bound <= watermark):
+                        return self.stats()
+                    # Se agrega sobre una copia: las consultas concurrentes ven el filtro anterior
+                    bloom = BloomFilter(self.bloom.bits, self.bloom.hashes, self.bloom.data.copy())
+                    added = self._stream_keys(conn, bloom, key, watermark, bound,
+                                              self.header['key_kinds'])
+            
+            count = self.header['count'] + added
+            if count > self.header['capacity']:
+                self.logger.info(
+                    f"Filtro de {self.table_name} lleno ({count} > {self.header['capacity']}); "
+                    f"se reconstruye"
+                )
+                return self.build()
+            
+            with self._lock:
+                self.bloom = bloom
+                self.header.update(watermark=bound, count=count)
+            self.save()
+            self.logger.info(f"Filtro de {self.table_name}: {added} claves nuevas hasta id {bound}")
+            return {**self.stats(), "added": added}
+        
+        except Exception as e:
+            self.logger.error(f"Error actualizando el filtro de {self.table_name}: {str(e)}")
+            raise
+    
+    def save(self):
+        """Escribe el filtro (archivo temporal + os.replace)"""
+        header_bytes = json.dumps(self.header, sort_keys=True, default=str).encode('utf-8')
+        with atomic_write(self.path, binary=True) as f:
+            f.write(FILTER_MAGIC)
+            f.write(struct.pack('<HI', FILTER_FORMAT_VERSION, len(header_bytes)))
+            f.write(header_bytes)
+            f.write(struct.pack('<QI', self.bloom.bits, self.bloom.hashes))
+            f.write(self.bloom.data.tobytes())
+    
+    def load(self):
+        """Lee el filtro de self.path; debe ser de la misma tabla y columnas"""
+        with open(self.path, 'rb') as f:
+            data = f.read()
+        
+        if not data.startswith(FILTER_MAGIC):
+            raise ValueError(f"{self.path} no es un filtro de claves")
+        offset = len(FILTER_MAGIC)
+        version, header_size = struct.unpack_from('<HI', data, offset)
+        if version != FILTER_FORMAT_VERSION:
+            raise ValueError(f"Versión de filtro no soportada: {version}")
+        offset += struct.calcsize('<HI')
+        header = json.loads(data[offset:offset + header_size].decode('utf-8'))
+        offset += header_size
+        bits, hashes = struct.unpack_from('<QI', data, offset)
+        offset += struct.calcsize('<QI')
+        
+        if header['table'] != self.table_name or header['columns'] != self.key_columns:
+            raise ValueError(
+                f"El filtro {self.path} es de {header['table']}{header['columns']}, "
+                f"no de {self.table_name}{self.key_columns}"
+            )
+        if len(data) - offset != (bits + 7) // 8:
+            raise ValueError(f"El filtro {self.path} está truncado")
+        if header['database'] != self.engine.url.render_as_string(hide_password=True):
+            self.logger.warning(f"El filtro se construyó en otra conexión: {header['database']}")
+        
+        bloom = BloomFilter(bits, hashes, np.frombuffer(data, dtype=np.uint8, offset=offset).copy())
+        with self._lock:
+            self.bloom, self.header = bloom, header
+    
+    # --- Consultas ---
+    
+    def might_exist(self, row: Any) -> bool:
+        """
+        False si la clave seguro no existía al último refresh; True si puede existir
+        
+        Args:
+            row: Diccionario con las columnas clave o secuencia en su orden
+        """
+        bloom = self._require_bloom()
+        found = bloom.contains(encode_key(self._key_of(row), self.header.get('key_kinds')))
+        self._count(1, int(found))
+        return found
+    
+    def might_exist_many(self, rows: Iterable[Any]) -> List[bool]:
+        """might_exist() de un lote, con el hashing de bits vectorizado"""
+        bloom = self._require_bloom()
+        kinds = self.header.get('key_kinds')
+        found = bloom.contains_many([encode_key(self._key_of(row), kinds) for row in rows])
+        self._count(len(found), int(found.sum()))
+        return found.tolist()
+    
+    def exists(self, row: Any) -> bool:
+        """Respuesta exacta: filtro en memoria y, solo si da positivo, consulta a la BD"""
+        return self.exists_many([row])[0]
+    
+    def exists_many(self, rows: Iterable[Any]) -> List[bool]:
+        """exists() de un lote; los positivos se verifican con una consulta por cada LOOKUP_BATCH"""
+        keys = [self._key_of(row) for row in rows]
+        result = self.might_exist_many(keys)
+        positives = [position for position, found in enumerate(result) if found]
+        if not positives:
+            return result
+        
+        present = set()
+        kinds = self.header.get('key_kinds')
+        query = self.query_builder.existing_keys(self.table_name, self.key_columns)
+        batch_size = DatabaseConfig.KEY_FILTER_LOOKUP_BATCH
+        with self.engine.connect() as conn:
+            for start in range(0, len(positives), batch_size):
+                batch = [keys[position] if len(self.key_columns) > 1 else keys[position][0]
+                         for position in positives[start:start + batch_size]]
+                present.update(encode_key(found, kinds)
+                               for found in conn.execute(query, {"keys": batch}))
+        
+        for position in positives:
+            result[position] = encode_key(keys[position], kinds) in present
+        self._count(0, 0, len(positives), sum(result[position] for position in positives))
+        return result
+    
+    def stats(self) -> Dict[str, Any]:
+        """Tamaño, ocupación, tasa esperada de falsos positivos y fracción de positivos no confirmados"""
+        bloom = self.bloom
+        with self._lock:
+            counters = dict(self._stats)
+        observed = None
+        if counters['lookups']:
+            observed = round(1 - counters['confirmed'] / counters['lookups'], 4)
+        return {
+            "status": "success" if bloom is not None else "empty",
+            "table": self.table_name,
+            "columns": self.key_columns,
+            "path": self.path,
+            "count": self.header.get('count'),
+            "capacity": self.header.get('capacity'),
+            "watermark": self.header.get('watermark'),
+            "bits": bloom.bits if bloom else None,
+            "hashes": bloom.hashes if bloom else None,
+            "bytes": bloom.data.nbytes if bloom else None,
+            "expected_false_positive_rate": (round(bloom.false_positive_rate(self.header['count']), 6)
+                                             if bloom else None),
+            "unconfirmed_positive_rate": observed,
+            **counters
+        }
+    
+    # --- Auxiliares ---
+    
+    def _stream_keys(self, conn, bloom: BloomFilter, key: Optional[str], watermark: Any,
+                     bound: Any, kinds: Sequence[Optional[str]]) -> int:
+        """Agrega al filtro las claves de las filas con watermark < id <= bound, por bloques"""
+        query = self.query_builder.key_values(self.table_name, self.key_columns, key,
+                                              watermark is not None)
+        params = {}
+        if key:
+            params['bound'] = bound
+        if watermark is not None:
+            params['after_0'] = watermark
+        
+        added = 0
+        result = conn.execution_options(stream_results=True).execute(query, params)
+        for rows in result.partitions(DatabaseConfig.KEY_FILTER_CHUNK_ROWS):
+            bloom.add_many([encode_key(row, kinds) for row in rows])
+            added += len(rows)
+        return added
+    
+    def _key_kinds(self) -> List[Optional[str]]:
+        """key_value_kind de cada columna clave; las normalizadas (lower, trim...) son texto"""
+        types = {column['name']: column['type']
+                 for column in self.schema_reflector.reflect(self.table_name)['columns']}
+        kinds = []
+        for spec in self.key_columns:
+            name, normalizers = parse_key_column(spec)
+            kinds.append(None if normalizers else key_value_kind(types.get(name)))
+        return kinds
+    
+    def _expired(self) -> bool:
+        """True si el filtro se construyó hace más de max_age segundos"""
+        if self.max_age is None or not self.header.get('built_at'):
+            return False
+        age = datetime.now() - datetime.fromisoformat(self.header['built_at'])
+        return age.total_seconds() > self.max_age
+    
+    def _key_of(self, row: Any) -> Tuple[Any, ...]:
+        if isinstance(row, dict):
+            return tuple(row[name] for name in self.key_columns)
+        if isinstance(row, (str, bytes)) or not isinstance(row, Sequence):
+            # Clave de una sola columna pasada como valor suelto
+            return (row,)
+        return tuple(row)
+    
+    def _require_bloom(self) -> BloomFilter:
+        if self.bloom is None:
+            raise RuntimeError(f"No hay filtro para {self.table_name}: ejecute build()")
+        return self.bloom
+    
+    def _count(self, checks: int, positives: int, lookups: int = 0, confirmed: int = 0):
+        with self._lock:
+            self._stats['checks'] += checks
+            self._stats['positives'] += positives
+            self._stats['lookups'] += lookups
+            self._stats['confirmed'] += confirmed
@@ -0,0 +1,43 @@
+"""
+Columnas clave normalizadas: lower(email), collapse(trim(nombre)), ...
+"""
+import re
+from typing import List, Sequence, Tuple
+from .config import DatabaseConfig
+
+_CALL = re.compile(r'^\s*(\w+)\s*\((.*)\)\s*$', re.DOTALL)
+_NAME = re.compile(r'^\s*([\w.$]+)\s*$')
+
+def parse_key_column(spec: str) -> Tuple[str, Tuple[str, ...]]:
+    """
+    Separa una columna clave en (columna, normalizaciones de adentro hacia afuera)
+    
+    'email' -> ('email', ()); 'lower(trim(email))' -> ('email', ('trim', 'lower')).
+    Normalizaciones válidas: DatabaseConfig.KEY_NORMALIZERS.
+    """
+    normalizers = []
+    inner = spec
+    match = _CALL.match(inner)
+    while match:
+        name = match.group(1).lower()
+        if name not in DatabaseConfig.KEY_NORMALIZERS:
+            raise ValueError(
+                f"Normalización desconocida '{match.group(1)}' en '{spec}'; "
+                f"opciones: {', '.join(DatabaseConfig.KEY_NORMALIZERS)}"
+            )
+        normalizers.append(name)
+        inner = match.group(2)
+        match = _CALL.match(inner)
+    
+    column = _NAME.match(inner)
+    if column is None:
+        raise ValueError(f"Columna clave inválida: '{spec}'")
+    return column.group(1), tuple(reversed(normalizers))
+
+def key_column_names(columns: Sequence[str]) -> List[str]:
+    """Columnas físicas de una lista de columnas clave (sin repetir, en orden)"""
+    return list(dict.fromkeys(parse_key_column(spec)[0] for spec in columns))
+
+def is_normalized(columns: Sequence[str]) -> bool:
+    """True si alguna columna clave lleva normalización"""
+    return any(parse_key_column(spec)[1] for spec in columns)
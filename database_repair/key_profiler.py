@@ -0,0 +1,260 @@
+"""
+Perfilado de claves candidatas de deduplicación en una sola pasada
+"""
+import hashlib
+import math
+import time
+from collections import Counter
+from operator import itemgetter
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from sqlalchemy import text
+from .database_connector import DatabaseConnector
+from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
+
+class HyperLogLog:
+    """Estimador de cardinalidad sobre hashes de 64 bits (2^precision registros de un byte)"""
+    
+    def __init__(self, precision: Optional[int] = None):
+        self.precision = precision or DatabaseConfig.PROFILE_HLL_PRECISION
+        self.size = 1 << self.precision
+        self.registers = bytearray(self.size)
+    
+    def add_hash(self, value: int):
+        """Registra un hash de 64 bits"""
+        rest_bits = 64 - self.precision
+        index = value >> rest_bits
+        rank = rest_bits - (value & ((1 << rest_bits) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+    
+    def estimate(self) -> int:
+        """Cardinalidad estimada (error típico 1.04 / sqrt(2^precision))"""
+        alpha = 0.7213 / (1 + 1.079 / self.size)
+        raw = alpha * self.size * self.size / sum(2.0 ** -rank for rank in self.registers)
+        zeros = self.registers.count(0)
+        # Corrección para cardinalidades pequeñas (linear counting)
+        if raw <= 2.5 * self.size and zeros:
+            return round(self.size * math.log(self.size / zeros))
+        return round(raw)
+
+class KeyProfiler:
+    """Evalúa varias combinaciones de columnas candidatas a clave con una sola lectura de la tabla"""
+    
+    def __init__(self, db_connector: DatabaseConnector):
+        self.db_connector = db_connector
+        self.engine = db_connector.get_engine()
+        self.db_type = db_connector.db_type
+        
+        # Setup logger
+        logger_setup = LoggerSetup()
+        self.logger = logger_setup.setup_logger(self.__class__.__name__)
+    
+    def profile(self, table_name: str, candidates: Sequence[Sequence[str]],
+                method: str = 'auto', exact_max_keys: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Perfila todas las claves candidatas en un único recorrido
+        
+        Args:
+            table_name: Nombre de la tabla
+            candidates: Lista de combinaciones de columnas, p. ej.
+                [['email'], ['email', 'nombre'], ['telefono']]
+            method: 'grouping_sets' (PostgreSQL agrupa todas las combinaciones
+                en una consulta), 'stream' (una lectura en streaming con
+                contadores por candidata) o 'auto'
+            exact_max_keys: Claves distintas por candidata a partir de las
+                cuales el modo stream pasa a HyperLogLog (solo estima
+                cardinalidad, sin distribución de tamaños)
+        
+        Returns:
+            Diccionario con total_rows y, por candidata, distinct_keys,
+            duplicate_groups, duplicate_rows (sobrantes), duplicate_ratio,
+            max_group_size y group_size_distribution
+        """
+        if method not in DatabaseConfig.PROFILE_METHODS:
+            raise ValueError(f"Método de perfilado no soportado: {method}")
+        if method == 'auto':
+            method = 'grouping_sets' if self.db_type == 'postgresql' else 'stream'
+        
+        candidates = self._unique_candidates(candidates)
+        start = time.perf_counter()
+        
+        try:
+            self.logger.info(f"Perfilando {len(candidates)} claves candidatas de {table_name} ({method})")
+            
+            if method == 'grouping_sets':
+                total_rows, profiles = self._profile_grouping_sets(table_name, candidates)
+            else:
+                total_rows, profiles = self._profile_stream(
+                    table_name, candidates, exact_max_keys or DatabaseConfig.PROFILE_EXACT_MAX_KEYS
+                )
+            
+            return {
+                "status": "success",
+                "table": table_name,
+                "method": method,
+                "total_rows": total_rows,
+                "candidates": profiles,
+                "elapsed_seconds": round(time.perf_counter() - start, 3)
+            }
+        
+        except Exception as e:
+            self.logger.error(f"Error perfilando claves de {table_name}: {str(e)}")
+            raise
+    
+    def _profile_grouping_sets(self, table_name: str,
+                               candidates: List[List[str]]) -> Tuple[int, List[Dict[str, Any]]]:
+        """Histograma de tamaños de grupo por candidata con GROUP BY GROUPING SETS"""
+        all_columns = self._all_columns(candidates)
+        grouping_sets = ', '.join(f"({', '.join(columns)})" for columns in candidates)
+        
+        # GROUPING() marca con un bit cada columna ausente del conjunto (la primera es el bit alto)
+        query = f"""
+        SELECT set_id, group_size, COUNT(*) AS groups
+        FROM (
+            SELECT GROUPING({', '.join(all_columns)}) AS set_id, COUNT(*) AS group_size
+            FROM {table_name}
+            GROUP BY GROUPING SETS ({grouping_sets})
+        ) key_groups
+        GROUP BY set_id, group_size
+        """
+        
+        histograms: Dict[int, Counter] = {}
+        with self.engine.connect() as conn:
+            for set_id, group_size, groups in conn.execute(text(query)):
+                histograms.setdefault(set_id, Counter())[group_size] = groups
+        
+        profiles = []
+        total_rows = 0
+        for columns in candidates:
+            mask = sum(1 << (len(all_columns) - 1 - position)
+                       for position, column in enumerate(all_columns) if column not in columns)
+            histogram = histograms.get(mask, Counter())
+            total_rows = sum(size * groups for size, groups in histogram.items())
+            profiles.append((columns, histogram))
+        
+        return total_rows, [self._summarize(columns, total_rows, histogram=histogram)
+                            for columns, histogram in profiles]
+    
+    def _profile_stream(self, table_name: str, candidates: List[List[str]],
+                        exact_max_keys: int) -> Tuple[int, List[Dict[str, Any]]]:
+        """Una lectura en streaming con un contador exacto (o HyperLogLog) por candidata"""
+        all_columns = self._all_columns(candidates)
+        getters = [itemgetter(*[all_columns.index(column) for column in columns])
+                   for columns in candidates]
+        counters: List[Optional[Counter]] = [Counter() for _ in candidates]
+        sketches: List[Optional[HyperLogLog]] = [None for _ in candidates]
+        total_rows = 0
+        
+        query = f"SELECT {', '.join(all_columns)} FROM {table_name}"
+        with self.engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(text(query))
+            for row in result:
+                total_rows += 1
+                for index, getter in enumerate(getters):
+                    key = getter(row)
+                    counter = counters[index]
+                    if counter is not None:
+                        counter[key] += 1
+                        if len(counter) > exact_max_keys:
+                            sketches[index] = self._to_sketch(candidates[index], counter)
+                            counters[index] = None
+                    else:
+                        sketches[index].add_hash(self._hash_key(key))
+        
+        profiles = []
+        for columns, counter, sketch in zip(candidates, counters, sketches):
+            if counter is not None:
+                profiles.append(self._summarize(columns, total_rows,
+                                                histogram=Counter(counter.values())))
+            else:
+                profiles.append(self._summarize(columns, total_rows,
+                                                distinct_estimate=sketch.estimate()))
+        return total_rows, profiles
+    
+    def _to_sketch(self, columns: List[str], counter: Counter) -> HyperLogLog:
+        """Pasa una candidata de conteo exacto a HyperLogLog al superar el límite de memoria"""
+        self.logger.info(f"Clave {columns}: más de {len(counter) - 1} valores distintos, "
+                         "se estima con HyperLogLog")
+        sketch = HyperLogLog()
+        for key in counter:
+            sketch.add_hash(self._hash_key(key))
+        return sketch
+    
+    def _summarize(self, columns: List[str], total_rows: int,
+                   histogram: Optional[Counter] = None,
+                   distinct_estimate: Optional[int] = None) -> Dict[str, Any]:
+        """Métricas de una candidata a partir de su histograma {tamaño: grupos}"""
+        if histogram is None:
+            distinct_keys = min(distinct_estimate, total_rows)
+        else:
+            distinct_keys = sum(histogram.values())
+        duplicate_rows = total_rows - distinct_keys
+        duplicate_ratio = round(duplicate_rows / total_rows, 6) if total_rows else 0.0
+        
+        if histogram is None:
+            return {
+                "columns": columns,
+                "exact": False,
+                "distinct_keys": distinct_keys,
+                "duplicate_groups": None,
+                "duplicate_rows": duplicate_rows,
+                "duplicate_ratio": duplicate_ratio,
+                "max_group_size": None,
+                "group_size_distribution": None
+            }
+        
+        distribution = {self._bucket_label(position): 0
+                        for position in range(len(DatabaseConfig.PROFILE_SIZE_BUCKETS))}
+        for size, groups in histogram.items():
+            distribution[self._bucket_label(self._bucket_position(size))] += groups
+        
+        return {
+            "columns": columns,
+            "exact": True,
+            "distinct_keys": distinct_keys,
+            "duplicate_groups": sum(groups for size, groups in histogram.items() if size > 1),
+            "duplicate_rows": duplicate_rows,
+            "duplicate_ratio": duplicate_ratio,
+            "max_group_size": max(histogram) if histogram else 0,
+            "group_size_distribution": distribution
+        }
+    
+    def _bucket_position(self, size: int) -> int:
+        buckets = DatabaseConfig.PROFILE_SIZE_BUCKETS
+        position = 0
+        while position + 1 < len(buckets) and size >= buckets[position + 1]:
+            position += 1
+        return position
+    
+    def _bucket_label(self, position: int) -> str:
+        """'2', '3-5', ..., '1001+' según PROFILE_SIZE_BUCKETS"""
+        buckets = DatabaseConfig.PROFILE_SIZE_BUCKETS
+        low = buckets[position]
+        if position + 1 == len(buckets):
+            return f"{low}+"
+        high = buckets[position + 1] - 1
+        return str(low) if low == high else f"{low}-{high}"
+    
+    def _unique_candidates(self, candidates: Sequence[Sequence[str]]) -> List[List[str]]:
+        """Descarta candidatas vacías y repetidas (el orden de columnas no importa)"""
+        unique = []
+        seen = set()
+        for columns in candidates:
+            columns = list(columns)
+            if not columns:
+                raise ValueError("Una clave candidata debe tener al menos una columna")
+            if frozenset(columns) not in seen:
+                seen.add(frozenset(columns))
+                unique.append(columns)
+        if not unique:
+            raise ValueError("Se requiere al menos una clave candidata")
+        return unique
+    
+    def _all_columns(self, candidates: List[List[str]]) -> List[str]:
+        """Unión ordenada de las columnas de todas las candidatas"""
+        return list(dict.fromkeys(column for columns in candidates for column in columns))
+    
+    def _hash_key(self, key: Any) -> int:
+        """Hash de 64 bits estable y uniforme (hash() no lo es para enteros)"""
+        return int.from_bytes(hashlib.blake2b(repr(key).encode('utf-8'), digest_size=8).digest(), 'big')
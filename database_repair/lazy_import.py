@@ -0,0 +1,42 @@
+"""
+Importación diferida de dependencias pesadas
+"""
+import importlib.util
+import sys
+from types import ModuleType
+
+class _MissingModule(ModuleType):
+    """Módulo ausente: el error se difiere hasta el primer uso"""
+    
+    def __getattr__(self, attribute):
+        raise ImportError(
+            f"El módulo '{self.__name__}' no está instalado (pip install {self.__name__})"
+        )
+
+def is_available(module: ModuleType) -> bool:
+    """True si el módulo retornado por lazy_module está instalado"""
+    return not isinstance(module, _MissingModule)
+
+def lazy_module(name: str) -> ModuleType:
+    """
+    Retorna el módulo sin ejecutarlo; se carga en el primer acceso a un atributo
+    
+    Usa importlib.util.LazyLoader, de modo que `unittest.mock.patch` sobre sus
+    atributos sigue funcionando igual que con un import normal.
+    
+    Args:
+        name: Nombre completo del módulo (p. ej. 'pandas')
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return _MissingModule(name)
+    
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,179 @@
+"""
+Reporte de avance (filas procesadas, total estimado, ritmo y ETA) de las fases largas
+"""
+import sys
+import time
+from typing import Any, Callable, Dict, Optional, TextIO
+from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
+
+ProgressCallback = Callable[[Dict[str, Any]], None]
+
+class ProgressTracker:
+    """
+    Lleva la cuenta de una fase y avisa al callback como mucho cada min_interval
+    
+    El callback recibe diccionarios con event ('start', 'progress', 'finish'
+    o 'abort' si la fase terminó con una excepción), phase, table, unit,
+    processed, total (None si no se conoce), percent, rate (unidades/s,
+    suavizado), eta y elapsed (segundos).
+    advance() solo consulta el reloj cada check_every unidades, así que se
+    puede llamar fila a fila; sin callback no hace nada.
+    """
+    
+    # Peso del último tramo en el ritmo suavizado (media móvil exponencial)
+    RATE_SMOOTHING = 0.3
+    
+    def __init__(self, phase: str, callback: Optional[ProgressCallback] = None,
+                 total: Optional[int] = None, table: Optional[str] = None,
+                 unit: str = 'rows', min_interval: Optional[float] = None,
+                 check_every: int = 1):
+        self.phase = phase
+        self.callback = callback
+        self.total = total or None
+        self.table = table
+        self.unit = unit
+        self.min_interval = (DatabaseConfig.PROGRESS_MIN_INTERVAL
+                             if min_interval is None else min_interval)
+        self.check_every = max(1, check_every)
+        self.processed = 0
+        
+        self._unchecked = 0
+        self._started_at = time.monotonic()
+        self._last_emit_at = self._started_at
+        self._last_emit_processed = 0
+        self._rate: Optional[float] = None
+        self._finished = False
+        
+        # Setup logger
+        logger_setup = LoggerSetup()
+        self.logger = logger_setup.setup_logger(self.__class__.__name__)
+        
+        self._emit('start', self._started_at)
+    
+    def advance(self, units: int = 1):
+        """Suma unidades procesadas; emite 'progress' si pasó min_interval"""
+        self.processed += units
+        if self.callback is None:
+            return
+        self._unchecked += units
+        if self._unchecked < self.check_every:
+            return
+        
+        self._unchecked = 0
+        now = time.monotonic()
+        if now - self._last_emit_at >= self.min_interval:
+            self._emit('progress', now)
+    
+    def finish(self, event: str = 'finish'):
+        """Emite el evento final (una sola vez)"""
+        if not self._finished:
+            self._finished = True
+            self._emit(event, time.monotonic())
+    
+    def __enter__(self) -> 'ProgressTracker':
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.finish('finish' if exc_type is None else 'abort')
+    
+    def snapshot(self, event: str = 'progress', now: Optional[float] = None) -> Dict[str, Any]:
+        """Estado actual como diccionario (el mismo que recibe el callback)"""
+        now = time.monotonic() if now is None else now
+        elapsed = now - self._started_at
+        rate = self._rate
+        if (rate is None or event != 'progress') and elapsed > 0 and self.processed:
+            # Al cerrar la fase se informa el ritmo medio, no el último tramo
+            rate = self.processed / elapsed
+        
+        remaining = None if self.total is None else max(self.total - self.processed, 0)
+        eta = None
+        if event == 'finish':
+            eta = 0.0
+        elif remaining is not None and rate:
+            eta = remaining / rate
+        
+        return {
+            "event": event,
+            "phase": self.phase,
+            "table": self.table,
+            "unit": self.unit,
+            "processed": self.processed,
+            "total": self.total,
+            "percent": (None if self.total is None
+                        else round(min(100.0, 100.0 * self.processed / self.total), 1)),
+            "rate": None if rate is None else round(rate, 1),
+            "eta": None if eta is None else round(eta, 1),
+            "elapsed": round(elapsed, 3)
+        }
+    
+    def _emit(self, event: str, now: float):
+        if self.callback is None:
+            return
+        
+        interval = now - self._last_emit_at
+        if event == 'progress' and interval > 0:
+            recent = (self.processed - self._last_emit_processed) / interval
+            self._rate = (recent if self._rate is None
+                          else self.RATE_SMOOTHING * recent + (1 - self.RATE_SMOOTHING) * self._rate)
+        self._last_emit_at = now
+        self._last_emit_processed = self.processed
+        
+        try:
+            self.callback(self.snapshot(event, now))
+        except Exception as e:
+            # Un fallo al mostrar el avance no debe interrumpir la fase
+            self.logger.warning(f"Error en el callback de progreso: {str(e)}")
+
+class TerminalProgressBar:
+    """
+    Callback de progreso que dibuja una barra en la terminal
+    
+    En una TTY reescribe la misma línea; si la salida se redirige escribe
+    una línea por evento (ya limitados por min_interval del tracker).
+    """
+    
+    UNIT_LABELS = {'rows': 'filas', 'groups': 'grupos'}
+    
+    def __init__(self, stream: Optional[TextIO] = None, width: Optional[int] = None):
+        self.stream = stream or sys.stderr
+        self.width = width or DatabaseConfig.PROGRESS_BAR_WIDTH
+        self.interactive = hasattr(self.stream, 'isatty') and self.stream.isatty()
+    
+    def __call__(self, event: Dict[str, Any]):
+        line = self.render(event)
+        if self.interactive:
+            end = '' if event['event'] in ('start', 'progress') else '\n'
+            self.stream.write(f"\r\033[K{line}{end}")
+        else:
+            self.stream.write(f"{line}\n")
+        self.stream.flush()
+    
+    def render(self, event: Dict[str, Any]) -> str:
+        """Texto de la barra para un evento"""
+        unit = self.UNIT_LABELS.get(event['unit'], event['unit'])
+        label = f"{event['phase']} {event['table']}" if event['table'] else event['phase']
+        parts = [label]
+        
+        if event['percent'] is not None:
+            filled = int(self.width * event['percent'] / 100)
+            parts.append(f"[{'#' * filled}{'-' * (self.width - filled)}] {event['percent']:5.1f}%")
+            parts.append(f"{event['processed']:,}/{event['total']:,} {unit}")
+        else:
+            parts.append(f"{event['processed']:,} {unit}")
+        
+        if event['rate'] is not None:
+            parts.append(f"{event['rate']:,.0f} {unit}/s")
+        if event['event'] == 'finish':
+            parts.append(f"en {self._format_seconds(event['elapsed'])}")
+        elif event['event'] == 'abort':
+            parts.append("interrumpido")
+        elif event['eta'] is not None:
+            parts.append(f"ETA {self._format_seconds(event['eta'])}")
+        return '  '.join(parts)
+    
+    @staticmethod
+    def _format_seconds(seconds: float) -> str:
+        minutes, seconds = divmod(int(round(seconds)), 60)
+        hours, minutes = divmod(minutes, 60)
+        return f"{hours:d}:{minutes:02d}:{seconds:02d}"
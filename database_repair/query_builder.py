@@ -0,0 +1,960 @@
+"""
+Construcción de consultas con SQLAlchemy Core y caché de sentencias por dialecto
+"""
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Union
+from sqlalchemy import (ColumnElement, Delete, Insert, Integer, Select, Update, and_, bindparam,
+                        case, column, delete, exists, false, func, insert, literal_column, or_,
+                        select, table, text, true, tuple_, update)
+from sqlalchemy.dialects import mysql, postgresql, sqlite
+from sqlalchemy.engine.default import DefaultDialect
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ClauseElement, Executable, FunctionElement, TableClause
+from .database_connector import DatabaseConnector
+from .key_normalizer import parse_key_column
+from .survivor_order import SurvivorOrder, survivor_order_columns
+from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
+
+class ordered_id_list(FunctionElement):
+    """Ids de un grupo en una sola columna: ARRAY_AGG en PostgreSQL, GROUP_CONCAT en MySQL/SQLite"""
+    name = 'ordered_id_list'
+    inherit_cache = True
+
+@compiles(ordered_id_list)
+def _compile_ordered_id_list(element, compiler, **kw):
+    # SQLite anterior a 3.44 no admite ORDER BY dentro del agregado; parse_id_list ordena
+    return f"GROUP_CONCAT({compiler.process(element.clauses, **kw)})"
+
+@compiles(ordered_id_list, 'postgresql')
+def _compile_ordered_id_list_postgresql(element, compiler, **kw):
+    row_id = compiler.process(element.clauses, **kw)
+    return f"ARRAY_AGG({row_id} ORDER BY {row_id})"
+
+@compiles(ordered_id_list, 'mysql')
+def _compile_ordered_id_list_mysql(element, compiler, **kw):
+    row_id = compiler.process(element.clauses, **kw)
+    return f"GROUP_CONCAT({row_id} ORDER BY {row_id})"
+
+class CreateTableAs(Executable, ClauseElement):
+    """CREATE [TEMPORARY] TABLE destino AS SELECT ..."""
+    inherit_cache = False
+    
+    def __init__(self, target: TableClause, query: Select, temporary: bool = False):
+        self.target = target
+        self.query = query
+        self.temporary = temporary
+
+@compiles(CreateTableAs)
+def _compile_create_table_as(element, compiler, **kw):
+    kind = "TEMPORARY TABLE" if element.temporary else "TABLE"
+    return (f"CREATE {kind} {compiler.process(element.target, asfrom=True, **kw)} "
+            f"AS {compiler.process(element.query, **kw)}")
+
+class InsertFromSelect(Executable, ClauseElement):
+    """INSERT INTO destino SELECT ... (mismas columnas, sin lista explícita)"""
+    inherit_cache = False
+    
+    def __init__(self, target: TableClause, query: Select):
+        self.target = target
+        self.query = query
+
+@compiles(InsertFromSelect)
+def _compile_insert_from_select(element, compiler, **kw):
+    return (f"INSERT INTO {compiler.process(element.target, asfrom=True, **kw)} "
+            f"{compiler.process(element.query, **kw)}")
+
+class QueryBuilder:
+    """
+    Construye las consultas de análisis, eliminación y backup con SQLAlchemy Core
+    
+    Los identificadores se citan según el dialecto (no se interpolan en el
+    SQL) y las diferencias entre bases se resuelven al compilar. Cada
+    sentencia se construye una vez por (dialecto, tabla, columnas,
+    estrategia) y se guarda en una caché LRU compartida; al ejecutar siempre
+    el mismo objeto, el engine reutiliza también su forma compilada en lugar
+    de volver a generar y analizar el SQL en cada lote.
+    
+    Las columnas clave pueden llevar normalización (lower(email),
+    collapse(trim(nombre))); se compilan a la expresión de cada dialecto
+    con constantes literales, para que coincidan con su índice de expresión.
+    
+    keep_strategy es 'MIN'/'MAX' (conserva la fila más antigua o más
+    reciente) o un SurvivorOrder (ver survivor_order): la fila conservada
+    es la primera según ese orden, elegida con ROW_NUMBER() en una pasada.
+    """
+    
+    DIALECTS = {
+        'postgresql': postgresql.dialect,
+        'mysql': mysql.dialect,
+        'sqlite': sqlite.dialect
+    }
+    
+    _cache: 'OrderedDict[Hashable, Any]' = OrderedDict()
+    _cache_lock = threading.Lock()
+    _cache_stats = {"hits": 0, "misses": 0}
+    
+    def __init__(self, db_connector: DatabaseConnector):
+        self.db_connector = db_connector
+        self.db_type = db_connector.db_type
+        # Otros tipos compilan con el dialecto genérico de SQLAlchemy
+        self.dialect = self.DIALECTS.get(self.db_type, DefaultDialect)()
+        
+        # Setup logger
+        logger_setup = LoggerSetup()
+        self.logger = logger_setup.setup_logger(self.__class__.__name__)
+    
+    @classmethod
+    def cache_info(cls) -> Dict[str, int]:
+        """Aciertos, fallos y tamaño de la caché de sentencias"""
+        with cls._cache_lock:
+            return {**cls._cache_stats, "size": len(cls._cache)}
+    
+    @classmethod
+    def clear_cache(cls):
+        with cls._cache_lock:
+            cls._cache.clear()
+            cls._cache_stats.update(hits=0, misses=0)
+    
+    def sql(self, statement: ClauseElement) -> str:
+        """SQL compilado para el dialecto (para logs y pruebas)"""
+        return str(statement.compile(dialect=self.dialect))
+    
+    def table(self, table_name: str, *column_names: str) -> TableClause:
+        """Tabla ligera con las columnas indicadas; admite 'esquema.tabla' y columnas normalizadas"""
+        schema, _, name = table_name.rpartition('.')
+        columns = [column(name) for name in
+                   dict.fromkeys(parse_key_column(spec)[0] for spec in column_names)]
+        return table(name, *columns, schema=schema or None)
+    
+    def quote_table(self, table_name: str) -> str:
+        """Nombre de tabla citado, para DDL que SQLAlchemy Core no modela"""
+        return self.dialect.identifier_preparer.format_table(self.table(table_name))
+    
+    def row_id(self, source: TableClause, locator: Dict[str, Any]) -> ColumnElement:
+        """Identificador de fila a reportar: la PK si es simple, si no el localizador"""
+        if locator['key']:
+            return source.c[locator['key']]
+        if len(locator['columns']) == 1:
+            return source.c[locator['columns'][0]]
+        # PK compuesta sin localizador físico: identificador textual
+        parts = [source.c[name] for name in locator['columns']]
+        if self.db_type == 'mysql':
+            return func.concat_ws(':', *parts)
+        expression = parts[0]
+        for part in parts[1:]:
+            expression = expression.op('||')(literal_column("':'")).op('||')(part)
+        return expression
+    
+    def key_expressions(self, source: TableClause, columns: Sequence[str]) -> List[ColumnElement]:
+        """Expresiones de las columnas clave (la columna, o su versión normalizada)"""
+        expressions = []
+        for spec in columns:
+            name, normalizers = parse_key_column(spec)
+            expressions.append(self._key_expression(source.c[name], normalizers))
+        return expressions
+    
+    def index_elements(self, columns: Sequence[str]) -> List[str]:
+        """Elementos de un CREATE INDEX: el nombre, o (expresión) si está normalizada"""
+        elements = []
+        for spec in columns:
+            name, normalizers = parse_key_column(spec)
+            if not normalizers:
+                elements.append(spec)
+                continue
+            expression = self._key_expression(column(name), normalizers)
+            compiled = expression.compile(dialect=self.dialect,
+                                          compile_kwargs={"literal_binds": True})
+            elements.append(f"({compiled})")
+        return elements
+    
+    def _key_expression(self, expression: ColumnElement, normalizers: Sequence[str]) -> ColumnElement:
+        for normalizer in normalizers:
+            expression = self._normalize(expression, normalizer)
+        return expression
+    
+    def _labeled(self, expressions: List[ColumnElement], columns: Sequence[str]) -> List[ColumnElement]:
+        """Expresiones normalizadas etiquetadas con su especificación (p. ej. 'lower(email)')"""
+        return [expression if parse_key_column(spec)[1] == () else expression.label(spec)
+                for spec, expression in zip(columns, expressions)]
+    
+    def _normalize(self, expression: ColumnElement, normalizer: str) -> ColumnElement:
+        """Una normalización en el dialecto actual; las constantes van literales (indexables)"""
+        if normalizer == 'lower':
+            return func.lower(expression)
+        if normalizer == 'trim':
+            return func.trim(expression)
+        if normalizer == 'collapse':
+            if self.db_type == 'postgresql':
+                return func.regexp_replace(expression, literal_column(r"'\s+'"),
+                                           literal_column("' '"), literal_column("'g'"))
+            if self.db_type == 'mysql':
+                return func.regexp_replace(expression, literal_column("'[[:space:]]+'"),
+                                           literal_column("' '"))
+            # Sin expresiones regulares: tabulaciones y saltos a espacio, y luego
+            # ' ' -> ' ' + char(1), char(1) + ' ' -> '', char(1) -> '' deja un solo espacio
+            space, empty, mark = literal_column("' '"), literal_column("''"), literal_column('char(1)')
+            for control in (9, 10, 13):
+                expression = func.replace(expression, literal_column(f'char({control})'), space)
+            expression = func.replace(expression, space, space.op('||')(mark))
+            expression = func.replace(expression, mark.op('||')(space), empty)
+            return func.replace(expression, mark, empty)
+        if self.db_type == 'postgresql':
+            # Requiere la extensión unaccent (CREATE EXTENSION unaccent)
+            return func.unaccent(expression)
+        if self.db_type == 'mysql':
+            # Colación insensible a acentos: agrupa y compara sin acentos
+            return expression.collate('utf8mb4_0900_ai_ci')
+        raise ValueError(f"unaccent no está disponible en {self.db_type}")
+    
+    # --- Análisis ---
+    
+    def duplicate_summary(self, table_name: str, columns: Sequence[str], locator: Dict[str, Any],
+                          include_ids: bool = False) -> Select:
+        """Un renglón por clave repetida: claves, duplicate_count, min_id, max_id (y all_ids)"""
+        def build():
+            source = self._locator_table(table_name, columns, locator)
+            row_id = self.row_id(source, locator)
+            key = self.key_expressions(source, columns)
+            duplicate_count = func.count().label('duplicate_count')
+            selected = [*self._labeled(key, columns), duplicate_count, func.min(row_id).label('min_id'),
+                        func.max(row_id).label('max_id')]
+            if include_ids:
+                selected.append(ordered_id_list(row_id).label('all_ids'))
+            return (select(*selected)
+                    .group_by(*key)
+                    .having(func.count() > 1)
+                    .order_by(duplicate_count.desc()))
+        
+        return self._cached('duplicate_summary', table_name, columns,
+                            (include_ids, self._locator_key(locator)), build)
+    
+    def group_members(self, table_name: str, columns: Sequence[str],
+                      locator: Dict[str, Any]) -> Select:
+        """
+        Filas de los grupos repetidos con el tamaño de su grupo
+        
+        Ordenadas de mayor a menor grupo y luego por clave, así cada grupo
+        llega contiguo y en el orden final (no hay que reordenar después).
+        """
+        def build():
+            source = self._locator_table(table_name, columns, locator)
+            key = self.key_expressions(source, columns)
+            members = select(
+                *self._labeled(key, columns),
+                self.row_id(source, locator).label('dedup_row_id'),
+                func.count().over(partition_by=key).label('dedup_group_size')
+            ).subquery('members')
+            member_key = [members.c[name] for name in columns]
+            return (select(*member_key, members.c.dedup_row_id, members.c.dedup_group_size)
+                    .where(members.c.dedup_group_size > 1)
+                    .order_by(members.c.dedup_group_size.desc(), *member_key,
+                              members.c.dedup_row_id))
+        
+        return self._cached('group_members', table_name, columns, self._locator_key(locator), build)
+    
+    def group_id_page(self, table_name: str, columns: Sequence[str], null_key: Sequence[bool],
+                      locator: Dict[str, Any], after: bool) -> Select:
+        """
+        Página de ids de un grupo (keyset)
+        
+        Parámetros: key_<i> para las columnas no nulas, after_<i> para la
+        última fila de la página anterior y page_size.
+        """
+        def build():
+            source = self._locator_table(table_name, columns, locator)
+            order_by = [source.c[name] for name in locator['order_by']]
+            conditions = [
+                expression.is_(None) if is_null else expression == bindparam(f"key_{index}")
+                for index, (expression, is_null) in enumerate(zip(self.key_expressions(source, columns),
+                                                                 null_key))
+            ]
+            if after:
+                conditions.append(self._after(order_by))
+            return (select(self.row_id(source, locator).label('dedup_row_id'), *order_by)
+                    .where(and_(*conditions))
+                    .order_by(*order_by)
+                    .limit(bindparam('page_size', type_=Integer, literal_execute=True)))
+        
+        return self._cached('group_id_page', table_name, columns,
+                            (tuple(null_key), after, self._locator_key(locator)), build)
+    
+    def excess_rows(self, table_name: str, columns: Sequence[str]) -> Select:
+        """Filas sobrantes: suma de (tamaño - 1) de los grupos repetidos"""
+        def build():
+            source = self.table(table_name, *columns)
+            groups = (select(func.count().label('group_size'))
+                      .select_from(source)
+                      .group_by(*self.key_expressions(source, columns))
+                      .having(func.count() > 1)
+                      .subquery('duplicate_groups'))
+            return select(func.coalesce(func.sum(groups.c.group_size - 1), 0))
+        
+        return self._cached('excess_rows', table_name, columns, None, build)
+    
+    # --- Eliminación ---
+    
+    def delete_duplicates(self, table_name: str, columns: Sequence[str],
+                          keep_strategy: Union[str, SurvivorOrder],
+                          locator: Dict[str, Any]) -> Delete:
+        """DELETE de todas las filas de cada grupo salvo la conservada (MIN, MAX u orden dado)"""
+        def build():
+            source = self._locator_table(table_name, columns, locator)
+            if self.is_single_key_locator(locator) and isinstance(keep_strategy, str):
+                row_id = source.c[locator['columns'][0]]
+                return delete(source).where(
+                    row_id.not_in(self._materialized(self._kept_ids(source, columns, keep_strategy,
+                                                                    locator)))
+                )
+            victims = self.ranked_victims(table_name, columns, keep_strategy, locator)
+            return delete(source).where(
+                self._locator_target(source, locator).in_(self._materialized(victims))
+            )
+        
+        return self._cached('delete_duplicates', table_name, columns,
+                            (keep_strategy, self._locator_key(locator)), build)
+    
+    def count_victims(self, table_name: str, columns: Sequence[str],
+                      keep_strategy: Union[str, SurvivorOrder],
+                      locator: Dict[str, Any]) -> Select:
+        """COUNT(*) de las filas que eliminaría delete_duplicates"""
+        def build():
+            source = self._locator_table(table_name, columns, locator)
+            if self.is_single_key_locator(locator) and isinstance(keep_strategy, str):
+                row_id = source.c[locator['columns'][0]]
+                return (select(func.count())
+                        .select_from(source)
+                        .where(row_id.not_in(self._kept_ids(source, columns, keep_strategy,
+                                                            locator))))
+            victims = self.ranked_victims(table_name, columns, keep_strategy, locator)
+            return select(func.count()).select_from(victims.subquery('victims'))
+        
+        return self._cached('count_victims', table_name, columns,
+                            (keep_strategy, self._locator_key(locator)), build)
+    
+    def ranked_victims(self, table_name: str, columns: Sequence[str],
+                       keep_strategy: Union[str, SurvivorOrder],
+                       locator: Dict[str, Any]) -> Select:
+        """
+        Localizadores (loc_0, loc_1, ...) de todas las filas salvo la conservada
+        
+        La antigüedad (o el orden de supervivencia) se evalúa con ROW_NUMBER();
+        sirve para PK compuesta o localizador físico (ctid/rowid).
+        """
+        def build():
+            source = self._locator_table(table_name, columns, locator, keep_strategy)
+            order_by = self._survivor_order(source, keep_strategy, locator)
+            ranked = select(
+                *[source.c[name].label(f"loc_{position}")
+                  for position, name in enumerate(locator['columns'])],
+                func.row_number().over(partition_by=self.key_expressions(source, columns),
+                                       order_by=order_by).label('dedup_rn')
+            ).subquery('ranked')
+            return (select(*[ranked.c[f"loc_{position}"]
+                             for position in range(len(locator['columns']))])
+                    .where(ranked.c.dedup_rn > 1))
+        
+        return self._cached('ranked_victims', table_name, columns,
+                            (keep_strategy, self._locator_key(locator)), build)
+    
+    def delete_by_locator(self, table_name: str, locator_columns: Sequence[str]) -> Delete:
+        """DELETE de un lote de localizadores (parámetro expandible row_ids)"""
+        def build():
+            source = self.table(table_name, *locator_columns)
+            if len(locator_columns) == 1:
+                target = source.c[locator_columns[0]]
+            else:
+                target = tuple_(*[source.c[name] for name in locator_columns])
+            return delete(source).where(target.in_(bindparam('row_ids', expanding=True)))
+        
+        return self._cached('delete_by_locator', table_name, locator_columns, None, build)
+    
+    def revalidated_victims(self, table_name: str, columns: Sequence[str],
+                            locator_columns: Sequence[str]) -> Select:
+        """Localizadores del lote (row_ids) cuya clave sigue repetida fuera del lote (batch_ids)"""
+        def build():
+            source = self.table(table_name, *columns, *locator_columns)
+            victim, other = source.alias('victim'), source.alias('other')
+            same_key = [or_(other_key == victim_key, and_(other_key.is_(None), victim_key.is_(None)))
+                        for other_key, victim_key in zip(self.key_expressions(other, columns),
+                                                         self.key_expressions(victim, columns))]
+            other_target = self._target([other.c[name] for name in locator_columns])
+            victim_target = self._target([victim.c[name] for name in locator_columns])
+            # batch_ids repite row_ids: SQLAlchemy no expande dos veces un parámetro de tuplas
+            still_duplicated = exists().where(
+                *same_key, other_target.not_in(bindparam('batch_ids', expanding=True))
+            )
+            return select(*[victim.c[name] for name in locator_columns]).where(
+                victim_target.in_(bindparam('row_ids', expanding=True)), still_duplicated
+            )
+        
+        return self._cached('revalidated_victims', table_name, columns, tuple(locator_columns),
+                            build)
+    
+    def delete_revalidated(self, table_name: str, columns: Sequence[str],
+                           locator_columns: Sequence[str]) -> Delete:
+        """
+        DELETE de un lote (row_ids) solo de las filas cuya clave sigue repetida fuera del lote
+        
+        Para víctimas calculadas antes de borrar (en una réplica, en un plan
+        o entre lotes espaciados): si una fila cambió de clave o perdió a su
+        superviviente, no se borra la última copia. Cada víctima cuesta una
+        búsqueda por la clave (su índice). Con PK compuesta los row_ids son
+        tuplas; el lote se pasa también como batch_ids.
+        """
+        def build():
+            source = self.table(table_name, *locator_columns)
+            target = self._target([source.c[name] for name in locator_columns])
+            victims = self.revalidated_victims(table_name, columns, locator_columns)
+            return delete(source).where(target.in_(self._materialized(victims)))
+        
+        return self._cached('delete_revalidated', table_name, columns, tuple(locator_columns), build)
+    
+    def copy_revalidated(self, source_name: str, target_name: str, columns: Sequence[str],
+                         locator_columns: Sequence[str]) -> Executable:
+        """INSERT INTO destino SELECT * de las filas del lote que borrará delete_revalidated"""
+        def build():
+            target = self._target([column(name) for name in locator_columns])
+            victims = self.revalidated_victims(source_name, columns, locator_columns)
+            return self.copy_rows(source_name, target_name, target.in_(victims), create=False)
+        
+        return self._cached('copy_revalidated', source_name, columns,
+                            (target_name, tuple(locator_columns)), build)
+    
+    def count_by_locator(self, table_name: str, locator_columns: Sequence[str]) -> Select:
+        """COUNT(*) de las filas de un lote de localizadores que siguen existiendo"""
+        def build():
+            source = self.table(table_name, *locator_columns)
+            target = self._target([source.c[name] for name in locator_columns])
+            return (select(func.count())
+                    .select_from(source)
+                    .where(target.in_(bindparam('row_ids', expanding=True))))
+        
+        return self._cached('count_by_locator', table_name, locator_columns, None, build)
+    
+    def ranked_members(self, table_name: str, columns: Sequence[str], keep_strategy: str,
+                       key: str) -> Select:
+        """
+        (row_id, dedup_rn) de cada fila de un grupo repetido, en una sola pasada
+        
+        dedup_rn = 1 es la fila conservada (MIN/MAX de la clave); el resto son
+        víctimas. Las filas de grupos sin repetir no se devuelven.
+        """
+        def build():
+            source = self.table(table_name, *columns, key)
+            partition = self.key_expressions(source, columns)
+            order_by = source.c[key].asc() if keep_strategy == 'MIN' else source.c[key].desc()
+            ranked = select(
+                source.c[key].label('row_id'),
+                func.row_number().over(partition_by=partition, order_by=order_by).label('dedup_rn'),
+                func.count().over(partition_by=partition).label('dedup_group_size')
+            ).subquery('ranked')
+            return (select(ranked.c.row_id, ranked.c.dedup_rn)
+                    .where(ranked.c.dedup_group_size > 1))
+        
+        return self._cached('ranked_members', table_name, columns, (keep_strategy, key), build)
+    
+    def key_values(self, table_name: str, columns: Sequence[str], key: Optional[str],
+                   after: bool) -> Select:
+        """
+        Valores de las columnas de todas las filas, acotados por la clave entera
+        
+        Con key: key <= :bound y, si after, key > :after_0 (tramo nuevo desde
+        una marca de agua). Sin key: toda la tabla.
+        """
+        def build():
+            source = self.table(table_name, *columns, *([key] if key else []))
+            query = select(*[source.c[name] for name in columns])
+            if key is None:
+                return query
+            query = query.where(source.c[key] <= bindparam('bound'))
+            if after:
+                query = query.where(self._after([source.c[key]]))
+            return query
+        
+        return self._cached('key_values', table_name, columns, (key, after), build)
+    
+    def existing_keys(self, table_name: str, columns: Sequence[str]) -> Select:
+        """Claves de un lote (parámetro expandible keys) que existen en la tabla"""
+        def build():
+            source = self.table(table_name, *columns)
+            target = self._target([source.c[name] for name in columns])
+            return (select(*[source.c[name] for name in columns])
+                    .where(target.in_(bindparam('keys', expanding=True)))
+                    .distinct())
+        
+        return self._cached('existing_keys', table_name, columns, None, build)
+    
+    def max_value(self, table_name: str, column_name: str) -> Select:
+        def build():
+            source = self.table(table_name, column_name)
+            return select(func.max(source.c[column_name]))
+        
+        return self._cached('max_value', table_name, [column_name], None, build)
+    
+    def min_value(self, table_name: str, column_name: str) -> Select:
+        def build():
+            source = self.table(table_name, column_name)
+            return select(func.min(source.c[column_name]))
+        
+        return self._cached('min_value', table_name, [column_name], None, build)
+    
+    def count_rows(self, table_name: str) -> Select:
+        return self._cached('count_rows', table_name, [], None,
+                            lambda: select(func.count()).select_from(self.table(table_name)))
+    
+    # --- Duplicados nuevos (modo incremental) ---
+    
+    def new_duplicate_victims(self, table_name: str, columns: Sequence[str], keep_strategy: str,
+                              key: str, bounded: bool) -> Select:
+        """
+        Ids víctima en los que participa una fila con :since_id < id (<= :until_id)
+        
+        Usa un join por las columnas clave en lugar de agrupar la tabla
+        completa. Como en un índice único, las filas con NULL en las
+        columnas clave no se consideran duplicadas.
+        """
+        def build():
+            source = self.table(table_name, *columns, key)
+            victim, kept = source.alias('v'), source.alias('k')
+            if keep_strategy == 'MIN':
+                # Víctima: fila nueva con una fila más antigua con la misma clave
+                ordering, new_side = kept.c[key] < victim.c[key], victim
+            else:
+                # Víctima: cualquier fila con una fila nueva más reciente con la misma clave
+                ordering, new_side = kept.c[key] > victim.c[key], kept
+            
+            conditions = [new_side.c[key] > bindparam('since_id')]
+            if bounded:
+                conditions.append(new_side.c[key] <= bindparam('until_id'))
+            join_condition = and_(*[victim_key == kept_key for victim_key, kept_key in
+                                    zip(self.key_expressions(victim, columns),
+                                        self.key_expressions(kept, columns))], ordering)
+            return (select(victim.c[key])
+                    .distinct()
+                    .select_from(victim.join(kept, join_condition))
+                    .where(and_(*conditions)))
+        
+        return self._cached('new_duplicate_victims', table_name, columns,
+                            (keep_strategy, key, bounded), build)
+    
+    def new_duplicates_condition(self, table_name: str, columns: Sequence[str],
+                                 keep_strategy: str, key: str, bounded: bool) -> ColumnElement:
+        """Condición `id IN (víctimas)` para borrar o respaldar los duplicados nuevos"""
+        def build():
+            # Columna sin tabla: la condición se aplica a cualquier sentencia sobre table_name
+            victims = self.new_duplicate_victims(table_name, columns, keep_strategy, key, bounded)
+            return column(key).in_(self._materialized(victims))
+        
+        return self._cached('new_duplicates_condition', table_name, columns,
+                            (keep_strategy, key, bounded), build)
+    
+    def delete_new_duplicates(self, table_name: str, columns: Sequence[str], keep_strategy: str,
+                              key: str, bounded: bool) -> Delete:
+        def build():
+            return delete(self.table(table_name, key)).where(
+                self.new_duplicates_condition(table_name, columns, keep_strategy, key, bounded)
+            )
+        
+        return self._cached('delete_new_duplicates', table_name, columns,
+                            (keep_strategy, key, bounded), build)
+    
+    def count_new_duplicates(self, table_name: str, columns: Sequence[str], keep_strategy: str,
+                             key: str, bounded: bool) -> Select:
+        def build():
+            victims = self.new_duplicate_victims(table_name, columns, keep_strategy, key, bounded)
+            return select(func.count()).select_from(victims.subquery('victims'))
+        
+        return self._cached('count_new_duplicates', table_name, columns,
+                            (keep_strategy, key, bounded), build)
+    
+    # --- Claves foráneas ---
+    
+    def survivor_mapping(self, table_name: str, columns: Sequence[str],
+                         keep_strategy: Union[str, SurvivorOrder],
+                         locator: Dict[str, Any], referred: str) -> Select:
+        """
+        (old_value, new_value): columna referida de cada víctima y de su superviviente
+        
+        Misma partición y orden que ranked_victims: dedup_rn = 1 es la fila
+        conservada y FIRST_VALUE la lleva a todas las demás del grupo.
+        """
+        def build():
+            source = self._locator_table(table_name, [*columns, referred], locator, keep_strategy)
+            partition = self.key_expressions(source, columns)
+            order_by = self._survivor_order(source, keep_strategy, locator)
+            ranked = select(
+                source.c[referred].label('old_value'),
+                func.first_value(source.c[referred]).over(partition_by=partition,
+                                                          order_by=order_by).label('new_value'),
+                func.row_number().over(partition_by=partition, order_by=order_by).label('dedup_rn')
+            ).subquery('ranked')
+            return select(ranked.c.old_value, ranked.c.new_value).where(ranked.c.dedup_rn > 1)
+        
+        return self._cached('survivor_mapping', table_name, columns,
+                            (keep_strategy, referred, self._locator_key(locator)), build)
+    
+    def mapped_victims(self, table_name: str, columns: Sequence[str], mapping_name: str,
+                       referred: str) -> Select:
+        """
+        old_value del mapeo cuya víctima y cuyo superviviente siguen existiendo con la misma clave
+        
+        El mapeo es una foto tomada antes de borrar: las filas que llegan
+        después no están en él y las que cambian o desaparecen se descartan
+        aquí, así la reasignación y el DELETE actúan sobre el mismo conjunto.
+        """
+        def build():
+            mapping = self.table(mapping_name, 'old_value', 'new_value').alias('mapped')
+            source = self.table(table_name, *columns, referred)
+            victim, survivor = source.alias('victim'), source.alias('survivor')
+            same_key = [or_(victim_key == survivor_key,
+                            and_(victim_key.is_(None), survivor_key.is_(None)))
+                        for victim_key, survivor_key in zip(self.key_expressions(victim, columns),
+                                                            self.key_expressions(survivor, columns))]
+            return (select(mapping.c.old_value)
+                    .select_from(mapping
+                                 .join(victim, victim.c[referred] == mapping.c.old_value)
+                                 .join(survivor, survivor.c[referred] == mapping.c.new_value))
+                    .where(*same_key))
+        
+        return self._cached('mapped_victims', table_name, columns, (mapping_name, referred), build)
+    
+    def remap_references(self, child_name: str, child_column: str, mapping_name: str,
+                         batched: bool, victims: Select) -> Update:
+        """
+        UPDATE hija SET fk = new_value FROM mapeo WHERE fk = old_value
+        
+        Una sola sentencia por tabla hija (UPDATE ... FROM en PostgreSQL y
+        SQLite, UPDATE multitabla en MySQL), limitada a las víctimas vigentes
+        (mapped_victims). Con batched solo las víctimas del lote (parámetro
+        expandible row_ids).
+        """
+        def build():
+            child = self.table(child_name, child_column)
+            mapping = self.table(mapping_name, 'old_value', 'new_value')
+            statement = (update(child)
+                         .values({child_column: mapping.c.new_value})
+                         .where(child.c[child_column] == mapping.c.old_value,
+                                mapping.c.old_value.in_(self._materialized(victims))))
+            if batched:
+                statement = statement.where(mapping.c.old_value.in_(bindparam('row_ids', expanding=True)))
+            return statement
+        
+        return self._cached('remap_references', child_name, [child_column],
+                            (mapping_name, batched), build)
+    
+    def delete_mapped_victims(self, table_name: str, columns: Sequence[str], mapping_name: str,
+                              referred: str, batched: bool) -> Delete:
+        """
+        DELETE exactamente de las víctimas vigentes del mapeo (ver mapped_victims)
+        
+        No recalcula las víctimas: una fila nueva tras construir el mapeo no
+        se borra ni cambia qué fila sobrevive. Con batched solo las del lote
+        (parámetro expandible row_ids).
+        """
+        def build():
+            source = self.table(table_name, referred)
+            victims = self.mapped_victims(table_name, columns, mapping_name, referred)
+            if batched:
+                victims = victims.where(victims.selected_columns.old_value.in_(
+                    bindparam('row_ids', expanding=True)
+                ))
+            return delete(source).where(source.c[referred].in_(self._materialized(victims)))
+        
+        return self._cached('delete_mapped_victims', table_name, columns,
+                            (mapping_name, referred, batched), build)
+    
+    def count_references(self, child_name: str, child_column: str, mapping: Select) -> Select:
+        """Filas de la tabla hija que apuntan a alguna víctima (para el simulacro)"""
+        child = self.table(child_name, child_column)
+        victims = select(mapping.subquery('mapping').c.old_value)
+        return select(func.count()).select_from(child).where(child.c[child_column].in_(victims))
+    
+    # --- Fusión en el superviviente ---
+    
+    def merge_survivors(self, table_name: str, columns: Sequence[str],
+                        keep_strategy: Union[str, SurvivorOrder], locator: Dict[str, Any],
+                        merge_columns: Sequence[str]) -> Update:
+        """
+        UPDATE del superviviente: cada columna NULL toma el primer valor no NULL del grupo
+        
+        Una sola sentencia contra merged_values (UPDATE ... FROM en PostgreSQL
+        y SQLite, UPDATE multitabla en MySQL); solo toca supervivientes con
+        algún hueco que otra fila del grupo puede llenar.
+        """
+        def build():
+            target = self._locator_table(table_name, merge_columns, locator)
+            merged = self.merged_values(table_name, columns, keep_strategy, locator,
+                                        merge_columns).subquery('merged')
+            return (update(target)
+                    .values({name: func.coalesce(target.c[name], merged.c[f"merge_{position}"])
+                             for position, name in enumerate(merge_columns)})
+                    .where(self._merge_condition(target, merged, locator, merge_columns)))
+        
+        return self._cached('merge_survivors', table_name, columns,
+                            (keep_strategy, tuple(merge_columns), self._locator_key(locator)), build)
+    
+    def count_merges(self, table_name: str, columns: Sequence[str],
+                     keep_strategy: Union[str, SurvivorOrder], locator: Dict[str, Any],
+                     merge_columns: Sequence[str]) -> Select:
+        """COUNT(*) de los supervivientes que actualizaría merge_survivors"""
+        def build():
+            target = self._locator_table(table_name, merge_columns, locator).alias('target')
+            merged = self.merged_values(table_name, columns, keep_strategy, locator,
+                                        merge_columns).subquery('merged')
+            return (select(func.count())
+                    .select_from(target)
+                    .where(self._merge_condition(target, merged, locator, merge_columns)))
+        
+        return self._cached('count_merges', table_name, columns,
+                            (keep_strategy, tuple(merge_columns), self._locator_key(locator)), build)
+    
+    def merged_values(self, table_name: str, columns: Sequence[str],
+                      keep_strategy: Union[str, SurvivorOrder], locator: Dict[str, Any],
+                      merge_columns: Sequence[str]) -> Select:
+        """
+        (loc_0, ..., merge_0, ...) del superviviente de cada grupo repetido
+        
+        merge_i es FIRST_VALUE de la columna ordenando primero los no NULL y
+        luego por el orden de supervivencia: el valor propio del superviviente
+        si lo tiene, si no el de la mejor víctima que lo tenga. Todo sale de
+        un solo recorrido de la tabla con funciones de ventana.
+        """
+        def build():
+            source = self._locator_table(table_name, [*columns, *merge_columns], locator,
+                                         keep_strategy)
+            partition = self.key_expressions(source, columns)
+            order_by = self._survivor_order(source, keep_strategy, locator)
+            merged = [
+                func.first_value(source.c[name]).over(
+                    partition_by=partition,
+                    order_by=[case((source.c[name].is_(None), 1), else_=0), *order_by],
+                    rows=(None, None)
+                ).label(f"merge_{position}")
+                for position, name in enumerate(merge_columns)
+            ]
+            ranked = select(
+                *[source.c[name].label(f"loc_{position}")
+                  for position, name in enumerate(locator['columns'])],
+                *merged,
+                func.row_number().over(partition_by=partition, order_by=order_by).label('dedup_rn'),
+                func.count().over(partition_by=partition).label('dedup_group_size')
+            ).subquery('ranked')
+            return (select(*[ranked.c[f"loc_{position}"]
+                             for position in range(len(locator['columns']))],
+                           *[ranked.c[f"merge_{position}"]
+                             for position in range(len(merge_columns))])
+                    .where(ranked.c.dedup_rn == 1, ranked.c.dedup_group_size > 1))
+        
+        return self._cached('merged_values', table_name, columns,
+                            (keep_strategy, tuple(merge_columns), self._locator_key(locator)), build)
+    
+    def _merge_condition(self, target: Any, merged: Any, locator: Dict[str, Any],
+                         merge_columns: Sequence[str]) -> ColumnElement:
+        """Fila del superviviente y al menos un hueco que se puede llenar"""
+        return and_(
+            *[target.c[name] == merged.c[f"loc_{position}"]
+              for position, name in enumerate(locator['columns'])],
+            or_(*[and_(target.c[name].is_(None), merged.c[f"merge_{position}"].is_not(None))
+                  for position, name in enumerate(merge_columns)])
+        )
+    
+    # --- Backup ---
+    
+    def copy_rows(self, source_name: str, target_name: str,
+                  where: Optional[Union[str, ColumnElement]] = None,
+                  create: bool = True) -> Executable:
+        """CREATE TABLE destino AS SELECT * (o INSERT INTO ... SELECT *) con filtro opcional"""
+        target = self.table(target_name)
+        query = select(literal_column('*')).select_from(self.table(source_name))
+        if where is not None:
+            query = query.where(self.condition(where))
+        return CreateTableAs(target, query) if create else InsertFromSelect(target, query)
+    
+    def copy_by_locator(self, source_name: str, target_name: str,
+                        locator_columns: Sequence[str]) -> Executable:
+        """INSERT INTO destino SELECT * de un lote de localizadores (parámetro expandible row_ids)"""
+        def build():
+            target = self._target([column(name) for name in locator_columns])
+            return self.copy_rows(source_name, target_name,
+                                  target.in_(bindparam('row_ids', expanding=True)), create=False)
+        
+        return self._cached('copy_by_locator', source_name, locator_columns, target_name, build)
+    
+    # --- Carga sin duplicados ---
+    
+    def create_staging(self, table_name: str, staging_name: str,
+                       columns: Sequence[str]) -> Executable:
+        """CREATE TEMPORARY TABLE staging AS SELECT columnas FROM tabla WHERE false (mismos tipos, vacía)"""
+        query = (select(*[column(name) for name in columns])
+                 .select_from(self.table(table_name))
+                 .where(false()))
+        return CreateTableAs(self.table(staging_name), query, temporary=True)
+    
+    def insert_rows(self, table_name: str, columns: Sequence[str]) -> Insert:
+        """INSERT simple de filas (executemany), p. ej. para llenar la tabla temporal"""
+        return self._cached('insert_rows', table_name, columns, None,
+                            lambda: insert(self.table(table_name, *columns)))
+    
+    def insert_ignoring_conflicts(self, table_name: str, columns: Sequence[str],
+                                  key_columns: Sequence[str]) -> Insert:
+        """INSERT de filas (executemany) que omite las que violan el índice único de key_columns"""
+        def build():
+            return self._insert_ignore(self.table(table_name, *columns), key_columns)
+        
+        return self._cached('insert_ignoring_conflicts', table_name, columns,
+                            tuple(key_columns), build)
+    
+    def insert_new_rows(self, staging_name: str, table_name: str, columns: Sequence[str],
+                        key_columns: Sequence[str], on_conflict: bool) -> Insert:
+        """
+        INSERT INTO tabla SELECT ... FROM staging con las filas cuya clave no existe
+        
+        Con on_conflict lo resuelve el índice único (ON CONFLICT DO NOTHING /
+        INSERT IGNORE); si no, un anti-join NOT EXISTS contra la tabla.
+        """
+        def build():
+            staged = self.table(staging_name, *columns)
+            query = select(*[staged.c[name] for name in columns])
+            if on_conflict:
+                # SQLite exige un WHERE en INSERT ... SELECT ... ON CONFLICT
+                return self._insert_ignore(self.table(table_name, *columns), key_columns) \
+                    .from_select(list(columns), query.where(true()))
+            existing = self.table(table_name, *key_columns).alias('existing')
+            query = query.where(~exists().where(
+                and_(*[existing.c[name] == staged.c[name] for name in key_columns])
+            ))
+            return insert(self.table(table_name, *columns)).from_select(list(columns), query)
+        
+        return self._cached('insert_new_rows', table_name, columns,
+                            (staging_name, tuple(key_columns), on_conflict), build)
+    
+    def _insert_ignore(self, target: TableClause, key_columns: Sequence[str]) -> Insert:
+        if self.db_type == 'postgresql':
+            return postgresql.insert(target).on_conflict_do_nothing(index_elements=list(key_columns))
+        if self.db_type == 'sqlite':
+            return sqlite.insert(target).on_conflict_do_nothing(index_elements=list(key_columns))
+        return insert(target).prefix_with('IGNORE')
+    
+    def range_bound(self, table_name: str, order_by: Sequence[str],
+                    where: Optional[Union[str, ColumnElement]], after: bool) -> Select:
+        """Última clave de un lote: fila número :offset + 1 tras :after_<i> en orden de la clave"""
+        order_columns = [column(name) for name in order_by]
+        conditions = [self.condition(where)] if where is not None else []
+        if after:
+            conditions.append(self._after(order_columns))
+        return (select(*order_columns)
+                .select_from(self.table(table_name))
+                .where(and_(true(), *conditions))
+                .order_by(*order_columns)
+                .limit(1)
+                .offset(bindparam('offset', type_=Integer, literal_execute=True)))
+    
+    def range_condition(self, table_name: str, order_by: Sequence[str],
+                        where: Optional[Union[str, ColumnElement]], after: bool,
+                        bounded: bool) -> ColumnElement:
+        """Filtro de un lote: (where) AND clave > :after_<i> AND clave <= :bound_<i>"""
+        order_columns = [column(name) for name in order_by]
+        conditions = [self.condition(where)] if where is not None else []
+        if after:
+            conditions.append(self._after(order_columns))
+        if bounded:
+            conditions.append(self._target(order_columns) <= self._target(
+                [bindparam(f"bound_{position}") for position in range(len(order_by))]
+            ))
+        return and_(true(), *conditions)
+    
+    def condition(self, where: Union[str, ColumnElement]) -> ColumnElement:
+        """Filtro del llamador: SQL textual (con sus :parámetros) o expresión de Core"""
+        return text(f"({where})") if isinstance(where, str) else where
+    
+    # --- Auxiliares ---
+    
+    def is_single_key_locator(self, locator: Dict[str, Any]) -> bool:
+        """True si la misma columna localiza la fila y define su antigüedad (MIN/MAX directo)"""
+        return len(locator['columns']) == 1 and locator['order_by'] == locator['columns']
+    
+    def _survivor_order(self, source: TableClause, keep_strategy: Union[str, SurvivorOrder],
+                        locator: Dict[str, Any]) -> List[ColumnElement]:
+        """
+        ORDER BY de la ventana: la primera fila de cada grupo es la conservada
+        
+        Con un SurvivorOrder los NULL de cada columna van siempre al final
+        (igual en los tres dialectos) y los empates los decide la antigüedad.
+        """
+        if isinstance(keep_strategy, str):
+            return [source.c[name].asc() if keep_strategy == 'MIN' else source.c[name].desc()
+                    for name in locator['order_by']]
+        
+        order_by = []
+        for kind, names, descending in keep_strategy:
+            if kind == 'non_null':
+                expression = case((source.c[names[0]].is_(None), 0), else_=1)
+                for name in names[1:]:
+                    expression = expression + case((source.c[name].is_(None), 0), else_=1)
+            else:
+                expression = source.c[names[0]]
+                order_by.append(case((expression.is_(None), 1), else_=0))
+            order_by.append(expression.desc() if descending else expression.asc())
+        return order_by + [source.c[name].asc() for name in locator['order_by']]
+    
+    def _kept_ids(self, source: TableClause, columns: Sequence[str], keep_strategy: str,
+                  locator: Dict[str, Any]) -> Select:
+        """SELECT MIN/MAX(id) por grupo; sin correlación con la sentencia externa"""
+        row_id = source.c[locator['columns'][0]]
+        aggregate = func.min(row_id) if keep_strategy == 'MIN' else func.max(row_id)
+        return (select(aggregate)
+                .select_from(source)
+                .group_by(*self.key_expressions(source, columns))
+                .correlate(None))
+    
+    def _materialized(self, query: Select) -> Select:
+        """MySQL no permite leer en una subconsulta la tabla que se modifica: tabla derivada"""
+        if self.db_type != 'mysql':
+            return query
+        return select(literal_column('*')).select_from(query.subquery('temp'))
+    
+    def _locator_target(self, source: TableClause, locator: Dict[str, Any]) -> ColumnElement:
+        """Columna simple o tupla de la PK compuesta, para comparar con IN"""
+        return self._target([source.c[name] for name in locator['columns']])
+    
+    def _target(self, expressions: List[Any]) -> ColumnElement:
+        return expressions[0] if len(expressions) == 1 else tuple_(*expressions)
+    
+    def _after(self, order_columns: List[ColumnElement]) -> ColumnElement:
+        """Clave de orden mayor que :after_<i> (comparación de filas si es compuesta)"""
+        return self._target(order_columns) > self._target(
+            [bindparam(f"after_{position}") for position in range(len(order_columns))]
+        )
+    
+    def _locator_table(self, table_name: str, columns: Sequence[str], locator: Dict[str, Any],
+                       keep_strategy: Union[str, SurvivorOrder, None] = None) -> TableClause:
+        names = [*columns, *locator['columns'], *locator['order_by']]
+        if keep_strategy is not None and not isinstance(keep_strategy, str):
+            names.extend(survivor_order_columns(keep_strategy))
+        if locator['key']:
+            names.append(locator['key'])
+        return self.table(table_name, *names)
+    
+    def _locator_key(self, locator: Dict[str, Any]) -> Hashable:
+        return (tuple(locator['columns']), tuple(locator['order_by']), locator['key'])
+    
+    def _cached(self, kind: str, table_name: str, columns: Sequence[str], strategy: Hashable,
+                build: Callable[[], Any]) -> Any:
+        """Sentencia de la caché LRU por (dialecto, tipo, tabla, columnas, estrategia)"""
+        key = (self.db_type, kind, table_name, tuple(columns), strategy)
+        with self._cache_lock:
+            statement = self._cache.get(key)
+            if statement is not None:
+                self._cache.move_to_end(key)
+                self._cache_stats['hits'] += 1
+                return statement
+            self._cache_stats['misses'] += 1
+        
+        statement = build()
+        with self._cache_lock:
+            self._cache[key] = statement
+            while len(self._cache) > DatabaseConfig.QUERY_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return statement
@@ -0,0 +1,324 @@
+"""
+Reflexión del esquema de tablas con caché en disco
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import warnings
+from typing import Any, Dict, List, Optional
+from sqlalchemy import inspect, text
+from .atomic_file import atomic_write
+from .database_connector import DatabaseConnector
+from .query_builder import QueryBuilder
+from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
+
+class SchemaReflector:
+    """Descubre clave primaria, columnas e índices una vez por tabla y los guarda en caché"""
+    
+    # Localizador físico de fila por tipo de BD (MySQL/InnoDB agrupa por la PK)
+    PHYSICAL_LOCATORS = {
+        'postgresql': 'ctid',
+        'sqlite': 'rowid'
+    }
+    
+    # Un solo archivo de caché para todas las bases: el cerrojo es de clase
+    _lock = threading.Lock()
+    
+    def __init__(self, db_connector: DatabaseConnector, cache_path: Optional[str] = None):
+        self.db_connector = db_connector
+        self.engine = db_connector.get_engine()
+        self.db_type = db_connector.db_type
+        self.cache_path = cache_path or DatabaseConfig.SCHEMA_CACHE_FILE
+        
+        # Setup logger
+        logger_setup = LoggerSetup()
+        self.logger = logger_setup.setup_logger(self.__class__.__name__)
+    
+    def reflect(self, table_name: str, refresh: bool = False) -> Dict[str, Any]:
+        """
+        Retorna el esquema de la tabla, reutilizando la caché si sigue vigente
+        
+        La entrada en caché se invalida cuando cambia la huella del catálogo
+        (columnas e índices de la tabla) o cuando supera SCHEMA_CACHE_TTL.
+        
+        Args:
+            table_name: Nombre de la tabla
+            refresh: Si True, ignora la caché
+        
+        Returns:
+            Diccionario con columns, primary_key, indexes y physical_locator
+        """
+        key = self._cache_key(table_name)
+        token = self._schema_token(table_name)
+        
+        if not refresh:
+            entry = self._load().get(key)
+            if (entry and entry['token'] == token
+                    and time.time() - entry['reflected_at'] < DatabaseConfig.SCHEMA_CACHE_TTL):
+                return entry['schema']
+        
+        schema = self._reflect_table(table_name)
+        with self._lock:
+            data = self._load()
+            data[key] = {"token": token, "reflected_at": time.time(), "schema": schema}
+            self._save(data)
+        
+        self.logger.info(
+            f"Esquema de {table_name} reflejado: PK {schema['primary_key'] or 'ninguna'}, "
+            f"{len(schema['indexes'])} índices"
+        )
+        return schema
+    
+    def invalidate(self, table_name: Optional[str] = None):
+        """Olvida el esquema de una tabla (o de todas las de esta base de datos)"""
+        prefix = f"{self._database_name()}|"
+        with self._lock:
+            data = self._load()
+            if table_name:
+                stale = [self._cache_key(table_name)] if self._cache_key(table_name) in data else []
+            else:
+                stale = [key for key in data if key.startswith(prefix)]
+            for key in stale:
+                del data[key]
+            if stale:
+                self._save(data)
+    
+    def get_row_locator(self, table_name: str, mode: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Elige cómo identificar y ordenar filas para la deduplicación
+        
+        Modos:
+            'primary_key': siempre la clave primaria (o el localizador físico si no hay PK)
+            'physical': ctid/rowid cuando existe (la antigüedad sigue la PK si la hay)
+            'auto': localizador físico solo donde evita una búsqueda por clave
+                secundaria: PK compuesta o ausente en PostgreSQL, y en SQLite
+                cuando la PK no es alias de rowid
+        
+        Returns:
+            Diccionario con kind, columns (localizan la fila para borrarla),
+            order_by (definen más antiguo/más reciente), key (columna única
+            monótona para marcas de agua, o None) y reflected
+        
+        Si la reflexión falla se asume la columna `id`, como antes de existir
+        esta capa.
+        """
+        mode = mode or DatabaseConfig.ROW_LOCATOR_MODE
+        if mode not in DatabaseConfig.ROW_LOCATOR_MODES:
+            raise ValueError(f"Modo de localizador no soportado: {mode}")
+        
+        try:
+            schema = self.reflect(table_name)
+        except Exception as e:
+            self.logger.warning(f"No se pudo reflejar {table_name}, se asume columna id: {str(e)}")
+            return {"kind": "primary_key", "columns": ['id'], "order_by": ['id'],
+                    "key": 'id', "reflected": False}
+        
+        primary_key = schema['primary_key']
+        physical = schema['physical_locator']
+        
+        if not primary_key and physical is None:
+            raise ValueError(f"{table_name} no tiene clave primaria ni localizador físico de filas")
+        
+        if not primary_key or mode == 'physical':
+            use_physical = physical is not None
+        elif mode == 'primary_key':
+            use_physical = False
+        elif self.db_type == 'sqlite':
+            use_physical = physical is not None and not schema['rowid_alias']
+        else:
+            use_physical = physical is not None and len(primary_key) != 1
+        
+        order_by = primary_key or [physical]
+        return {
+            "kind": "physical" if use_physical else "primary_key",
+            "columns": [physical] if use_physical else primary_key,
+            "order_by": order_by,
+            "key": primary_key[0] if len(primary_key) == 1 else None,
+            "reflected": True
+        }
+    
+    def _reflect_table(self, table_name: str) -> Dict[str, Any]:
+        """Reflexión completa con el inspector de SQLAlchemy"""
+        inspector = inspect(self.engine)
+        
+        columns = [
+            {"name": column['name'], "type": str(column['type']), "nullable": column['nullable']}
+            for column in inspector.get_columns(table_name)
+        ]
+        pk_constraint = inspector.get_pk_constraint(table_name)
+        primary_key = pk_constraint.get('constrained_columns') or []
+        
+        with warnings.catch_warnings():
+            # SQLite omite los índices de expresión (columnas normalizadas); index_exists los ve
+            warnings.filterwarnings('ignore',
+                                    message='Skipped unsupported reflection of expression-based index')
+            indexes = [
+                {"name": index['name'], "column_names": index['column_names'],
+                 "unique": bool(index.get('unique'))}
+                for index in inspector.get_indexes(table_name)
+            ]
+            indexes += [
+                {"name": constraint['name'], "column_names": constraint['column_names'], "unique": True}
+                for constraint in inspector.get_unique_constraints(table_name)
+                if constraint.get('name') not in {index['name'] for index in indexes}
+            ]
+        
+        physical = self.PHYSICAL_LOCATORS.get(self.db_type)
+        rowid_alias = False
+        if self.db_type == 'sqlite':
+            create_sql = self._sqlite_create_sql(table_name)
+            if 'WITHOUT ROWID' in create_sql.upper():
+                physical = None
+            types = {column['name']: column['type'].upper() for column in columns}
+            # Solo INTEGER PRIMARY KEY (exacto) es alias de rowid
+            rowid_alias = (physical is not None and len(primary_key) == 1
+                           and types.get(primary_key[0]) == 'INTEGER')
+        
+        return {
+            "table": table_name,
+            "columns": columns,
+            "primary_key": primary_key,
+            "primary_key_name": pk_constraint.get('name'),
+            "indexes": indexes,
+            "physical_locator": physical,
+            "rowid_alias": rowid_alias
+        }
+    
+    def integer_key(self, table_name: str) -> Optional[str]:
+        """Clave primaria entera de una columna (sus valores caben en un IdSet), o None"""
+        schema = self.reflect(table_name)
+        primary_key = schema['primary_key']
+        types = {column['name']: column['type'].upper() for column in schema['columns']}
+        if len(primary_key) == 1 and 'INT' in types.get(primary_key[0], ''):
+            return primary_key[0]
+        return None
+    
+    def fingerprint(self, table_name: str) -> str:
+        """Huella actual del esquema de la tabla (cambia con cualquier DDL de columnas o índices)"""
+        return self._schema_token(table_name)
+    
+    def referencing_foreign_keys(self, table_name: str) -> List[Dict[str, Any]]:
+        """
+        Claves foráneas de otras tablas (o de la misma) que apuntan a table_name
+        
+        Se buscan en el esquema de la tabla con una sola lectura del catálogo;
+        no se guardan en caché porque cambian con el DDL de las tablas hijas.
+        
+        Returns:
+            Lista de {name, table, columns, referred_columns}
+        """
+        schema, _, name = table_name.rpartition('.')
+        inspector = inspect(self.engine)
+        references = []
+        for (child_schema, child_name), foreign_keys in sorted(
+            inspector.get_multi_foreign_keys(schema=schema or None).items(),
+            key=lambda item: item[0][1]
+        ):
+            for foreign_key in foreign_keys:
+                if foreign_key['referred_table'] != name:
+                    continue
+                if schema and foreign_key.get('referred_schema') not in (None, schema):
+                    continue
+                references.append({
+                    "name": foreign_key.get('name'),
+                    "table": f"{child_schema}.{child_name}" if child_schema else child_name,
+                    "columns": foreign_key['constrained_columns'],
+                    "referred_columns": foreign_key['referred_columns']
+                })
+        return references
+    
+    def index_exists(self, table_name: str, index_name: str) -> bool:
+        """
+        True si existe un índice con ese nombre sobre la tabla
+        
+        Consulta el catálogo directamente: el inspector omite los índices de
+        expresión en SQLite, así que reflect() no los lista.
+        """
+        with self.engine.connect() as conn:
+            if self.db_type == 'postgresql':
+                return bool(conn.execute(text("""
+                    SELECT 1 FROM pg_index
+                    WHERE indexrelid = to_regclass(:name) AND indrelid = CAST(:t AS regclass)
+                """), {"name": index_name,
+                       "t": QueryBuilder(self.db_connector).quote_table(table_name)}).scalar())
+            if self.db_type == 'mysql':
+                return bool(conn.execute(text("""
+                    SELECT 1 FROM information_schema.STATISTICS
+                    WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t AND INDEX_NAME = :name
+                    LIMIT 1
+                """), {"t": table_name, "name": index_name}).scalar())
+            return bool(conn.execute(text("""
+                SELECT 1 FROM sqlite_master WHERE type = 'index' AND tbl_name = :t AND name = :name
+            """), {"t": table_name, "name": index_name}).scalar())
+    
+    def _schema_token(self, table_name: str) -> str:
+        """Huella barata del catálogo; cambia con cualquier DDL sobre columnas o índices"""
+        with self.engine.connect() as conn:
+            if self.db_type == 'postgresql':
+                fingerprint = conn.execute(text("""
+                    SELECT coalesce((
+                        SELECT string_agg(attname || ':' || atttypid::text, ',' ORDER BY attnum)
+                        FROM pg_attribute
+                        WHERE attrelid = CAST(:t AS regclass) AND attnum > 0 AND NOT attisdropped
+                    ), '') || '|' || coalesce((
+                        SELECT string_agg(indexrelid::text || ':' || indisvalid::text, ','
+                                          ORDER BY indexrelid)
+                        FROM pg_index WHERE indrelid = CAST(:t AS regclass)
+                    ), '')
+                """), {"t": QueryBuilder(self.db_connector).quote_table(table_name)}).scalar()
+            elif self.db_type == 'mysql':
+                fingerprint = conn.execute(text("""
+                    SELECT CONCAT_WS('|', (
+                        SELECT GROUP_CONCAT(CONCAT(COLUMN_NAME, ':', COLUMN_TYPE)
+                                            ORDER BY ORDINAL_POSITION)
+                        FROM information_schema.COLUMNS
+                        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t
+                    ), (
+                        SELECT GROUP_CONCAT(CONCAT(INDEX_NAME, ':', COLUMN_NAME)
+                                            ORDER BY INDEX_NAME, SEQ_IN_INDEX)
+                        FROM information_schema.STATISTICS
+                        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :t
+                    ))
+                """), {"t": table_name}).scalar()
+            else:
+                fingerprint = conn.execute(text("""
+                    SELECT group_concat(sql, ';') FROM (
+                        SELECT sql FROM sqlite_master
+                        WHERE tbl_name = :t AND sql IS NOT NULL ORDER BY name
+                    )
+                """), {"t": table_name}).scalar()
+        
+        if not fingerprint:
+            raise ValueError(f"Tabla no encontrada: {table_name}")
+        return hashlib.md5(str(fingerprint).encode('utf-8')).hexdigest()
+    
+    def _sqlite_create_sql(self, table_name: str) -> str:
+        with self.engine.connect() as conn:
+            return conn.execute(
+                text("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = :t"),
+                {"t": table_name}
+            ).scalar() or ''
+    
+    def _database_name(self) -> str:
+        return self.engine.url.render_as_string(hide_password=True)
+    
+    def _cache_key(self, table_name: str) -> str:
+        return f"{self._database_name()}|{table_name}"
+    
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.cache_path):
+            return {}
+        try:
+            with open(self.cache_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except ValueError:
+            # Caché corrupta: se reconstruye en la próxima escritura
+            return {}
+    
+    def _save(self, data: Dict[str, Dict[str, Any]]):
+        """Escritura atómica: archivo temporal + os.replace"""
+        with atomic_write(self.cache_path) as f:
+            json.dump(data, f, indent=2, sort_keys=True)
@@ -1,9 +1,10 @@
 """
 Recolección de estadísticas de tablas
 """
-from sqlalchemy import text
+from sqlalchemy import bindparam, func, select, text
 from typing import Dict, Any
 from .database_connector import DatabaseConnector
+from .query_builder import QueryBuilder
 from .logger_setup import LoggerSetup
 
 class StatsCollector:
@@ -13,6 +14,7 @@ class StatsCollector:
         self.db_connector = db_connector
         self.engine = db_connector.get_engine()
         self.db_type = db_connector.db_type
+        self.query_builder = QueryBuilder(db_connector)
         
         # Setup logger
         logger_setup = LoggerSetup()
@@ -31,9 +33,10 @@ class StatsCollector:
         try:
             stats = {}
             
-            with self.engine.connect() as conn:
+            # Solo lecturas: una réplica al día basta
+            with self.db_connector.get_read_engine().connect() as conn:
                 # Contar registros totales
-                count_result = conn.execute(text(f"SELECT COUNT(*) FROM {table_name}"))
+                count_result = conn.execute(self.query_builder.count_rows(table_name))
                 stats['total_records'] = count_result.fetchone()[0]
                 
                 # Estadísticas específicas por tipo de BD
@@ -57,18 +60,20 @@ class StatsCollector:
             }
     
     def _get_postgresql_stats(self, conn, table_name: str) -> Dict[str, Any]:
-        """Estadísticas específicas de PostgreSQL"""
+        """Estadísticas específicas de PostgreSQL (el nombre citado se resuelve como regclass)"""
         stats = {}
         
         # Tamaño de tabla (por que el tamaño importa (?))
         size_result = conn.execute(
-            text(f"SELECT pg_size_pretty(pg_total_relation_size('{table_name}'))")
+            select(func.pg_size_pretty(func.pg_total_relation_size(bindparam('table_name')))),
+            {"table_name": self.query_builder.quote_table(table_name)}
         )
         stats['table_size'] = size_result.fetchone()[0]
         
         # Tamaño de índices (ya use el unico chiste que me sabia sobre el tamaño)
         index_size_result = conn.execute(
-            text(f"SELECT pg_size_pretty(pg_indexes_size('{table_name}'))")
+            select(func.pg_size_pretty(func.pg_indexes_size(bindparam('table_name')))),
+            {"table_name": self.query_builder.quote_table(table_name)}
         )
         stats['index_size'] = index_size_result.fetchone()[0]
         
@@ -78,13 +83,13 @@ class StatsCollector:
         """Estadísticas específicas de MySQL"""
         stats = {}
         
-        info_result = conn.execute(text(f"""
+        info_result = conn.execute(text("""
             SELECT 
                 ROUND(((data_length + index_length) / 1024 / 1024), 2) AS table_size_mb,
                 ROUND((index_length / 1024 / 1024), 2) AS index_size_mb
             FROM information_schema.TABLES 
-            WHERE table_name = '{table_name}'
-        """))
+            WHERE table_schema = DATABASE() AND table_name = :table_name
+        """), {"table_name": table_name})
         
         result = info_result.fetchone()
         if result:
@@ -0,0 +1,73 @@
+"""
+Orden de supervivencia: qué fila de cada grupo se conserva (updated_at DESC, non_null(*) DESC, ...)
+"""
+import re
+from typing import List, Optional, Sequence, Tuple, Union
+
+# (tipo, columnas, descendente): ('column', ('updated_at',), True) o ('non_null', ('a', 'b'), True)
+SurvivorTerm = Tuple[str, Tuple[str, ...], bool]
+SurvivorOrder = Tuple[SurvivorTerm, ...]
+
+_TERM = re.compile(r'^\s*(.+?)(?:\s+(ASC|DESC))?\s*$', re.IGNORECASE | re.DOTALL)
+_NON_NULL = re.compile(r'^non_null\s*\((.*)\)$', re.IGNORECASE | re.DOTALL)
+_NAME = re.compile(r'^\s*([\w.$]+)\s*$')
+
+def parse_survivor_order(order_by: Union[str, Sequence[str]],
+                         table_columns: Optional[Sequence[str]] = None) -> SurvivorOrder:
+    """
+    Convierte 'updated_at DESC, non_null(telefono, direccion) DESC' en términos de orden
+    
+    Cada término es una columna o non_null(columnas...) (cuántas no son
+    NULL; non_null(*) cuenta todas las de table_columns), con ASC por
+    defecto. La primera fila según este orden es la superviviente.
+    """
+    specs = [order_by] if isinstance(order_by, str) else list(order_by)
+    terms = []
+    for spec in specs:
+        for part in _split(spec):
+            match = _TERM.match(part)
+            if match is None:
+                raise ValueError(f"Término de orden inválido: '{part}'")
+            expression, direction = match.group(1).strip(), (match.group(2) or 'ASC').upper()
+            non_null = _NON_NULL.match(expression)
+            if non_null:
+                kind, names = 'non_null', [name.strip() for name in non_null.group(1).split(',')]
+                if names == ['*']:
+                    if not table_columns:
+                        raise ValueError("non_null(*) necesita las columnas de la tabla")
+                    names = list(table_columns)
+            else:
+                kind, names = 'column', [expression]
+            for name in names:
+                if _NAME.match(name) is None:
+                    raise ValueError(f"Columna inválida en el orden de supervivencia: '{part}'")
+            terms.append((kind, tuple(names), direction == 'DESC'))
+    
+    if not terms:
+        raise ValueError("El orden de supervivencia está vacío")
+    return tuple(terms)
+
+def survivor_order_columns(order: SurvivorOrder) -> List[str]:
+    """Columnas que lee el orden de supervivencia (sin repetir, en orden)"""
+    return list(dict.fromkeys(name for _, names, _ in order for name in names))
+
+def describe_survivor_order(order: SurvivorOrder) -> str:
+    """Forma textual normalizada del orden, para logs y resultados"""
+    terms = []
+    for kind, names, descending in order:
+        expression = names[0] if kind == 'column' else f"non_null({', '.join(names)})"
+        terms.append(f"{expression} {'DESC' if descending else 'ASC'}")
+    return ', '.join(terms)
+
+def _split(spec: str) -> List[str]:
+    """Separa por comas de primer nivel (las de non_null(a, b) no cuentan)"""
+    parts, depth, current = [], 0, ''
+    for char in spec:
+        if char == ',' and depth == 0:
+            parts.append(current)
+            current = ''
+            continue
+        depth += {'(': 1, ')': -1}.get(char, 0)
+        current += char
+    parts.append(current)
+    return [part for part in parts if part.strip()]
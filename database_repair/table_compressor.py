@@ -1,9 +1,15 @@
 """
 Compresión y optimización de tablas
 """
+import os
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
 from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
 from .database_connector import DatabaseConnector
 from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
 
 class TableCompressor:
     """Comprime y optimiza tablas después de la limpieza"""
@@ -17,16 +23,36 @@ class TableCompressor:
         logger_setup = LoggerSetup()
         self.logger = logger_setup.setup_logger(self.__class__.__name__)
     
-    def compress_table(self, table_name: str) -> bool:
+    def compress_table(self, table_name: str, sqlite_mode: str = 'full',
+                       online: bool = False) -> bool:
         """
         Comprime la tabla según el tipo de base de datos
         
         Args:
             table_name: Nombre de la tabla a comprimir
+            sqlite_mode: Modo de compactación en SQLite: 'full' (VACUUM global),
+                'incremental' (PRAGMA incremental_vacuum por pasos) o
+                'into' (VACUUM INTO + intercambio atómico del archivo)
+            online: En PostgreSQL, reconstruye la tabla en línea (sin bloquear
+                escrituras) en lugar de un VACUUM que no reduce el archivo
             
         Returns:
             True si la compresión fue exitosa
         """
+        if self.db_type == 'postgresql' and online:
+            result = self.online_rebuild_table(table_name)
+            return result['status'] == 'success' and self.analyze_table_stats(table_name)
+        
+        if self.db_type == 'sqlite' and sqlite_mode != 'full':
+            if sqlite_mode not in DatabaseConfig.SQLITE_COMPACTION_MODES:
+                raise ValueError(f"Modo de compactación SQLite no soportado: {sqlite_mode}")
+            
+            if sqlite_mode == 'incremental':
+                result = self.incremental_vacuum()
+            else:
+                result = self.vacuum_into()
+            return result['status'] == 'success'
+        
         try:
             with self.engine.connect() as conn:
                 if self.db_type == 'postgresql':
@@ -45,6 +71,158 @@ class TableCompressor:
             self.logger.error(f"Error comprimiendo tabla: {str(e)}")
             return False
     
+    def incremental_vacuum(self, pages_per_step: Optional[int] = None,
+                           max_steps: Optional[int] = None,
+                           pause_seconds: float = 0.0) -> Dict[str, Any]:
+        """
+        Libera páginas de la freelist de SQLite en pasos acotados (solo SQLite)
+        
+        Cada paso ejecuta PRAGMA incremental_vacuum(N) en su propia transacción,
+        de modo que el bloqueo de escritura se libera entre pasos. Requiere que
+        la base de datos tenga auto_vacuum=INCREMENTAL.
+        
+        Args:
+            pages_per_step: Páginas a liberar por paso
+            max_steps: Máximo de pasos (None = hasta vaciar la freelist)
+            pause_seconds: Pausa entre pasos para dejar pasar a otros escritores
+            
+        Returns:
+            Diccionario con el resultado y las páginas liberadas
+        """
+        if self.db_type != 'sqlite':
+            raise ValueError("incremental_vacuum solo está disponible para SQLite")
+        
+        if pages_per_step is None:
+            pages_per_step = DatabaseConfig.SQLITE_INCREMENTAL_VACUUM_PAGES
+        
+        try:
+            with self.engine.connect() as conn:
+                auto_vacuum = conn.execute(text("PRAGMA auto_vacuum")).fetchone()[0]
+                if auto_vacuum != 2:
+                    self.logger.warning(
+                        "La base de datos no usa auto_vacuum=INCREMENTAL; "
+                        "ejecute VACUUM una vez tras activarlo"
+                    )
+                    return {
+                        "status": "skipped",
+                        "freed_pages": 0,
+                        "message": "auto_vacuum no es INCREMENTAL"
+                    }
+                
+                initial_free = conn.execute(text("PRAGMA freelist_count")).fetchone()[0]
+                remaining = initial_free
+                steps = 0
+                
+                while remaining > 0 and (max_steps is None or steps < max_steps):
+                    # sqlite3 avanza un solo paso por execute(); executescript
+                    # recorre el PRAGMA completo y confirma al terminar
+                    conn.connection.driver_connection.executescript(
+                        f"PRAGMA incremental_vacuum({int(pages_per_step)});"
+                    )
+                    steps += 1
+                    remaining = conn.execute(text("PRAGMA freelist_count")).fetchone()[0]
+                    self.logger.debug(f"Paso {steps}: quedan {remaining} páginas libres")
+                    
+                    if pause_seconds and remaining > 0:
+                        time.sleep(pause_seconds)
+            
+            freed = initial_free - remaining
+            self.logger.info(f"Vacuum incremental: {freed} páginas liberadas en {steps} pasos")
+            return {
+                "status": "success",
+                "freed_pages": freed,
+                "remaining_free_pages": remaining,
+                "steps": steps
+            }
+            
+        except Exception as e:
+            self.logger.error(f"Error en vacuum incremental: {str(e)}")
+            return {"status": "error", "freed_pages": 0, "message": str(e)}
+    
+    def vacuum_into(self, target_path: Optional[str] = None, swap: bool = True) -> Dict[str, Any]:
+        """
+        Compacta la base SQLite con VACUUM INTO y opcionalmente intercambia el archivo
+        
+        La copia compacta se genera leyendo una instantánea, por lo que los
+        lectores no se bloquean. Si swap=True se toma un bloqueo de escritura
+        (BEGIN IMMEDIATE) durante la copia para que ningún cambio se pierda y
+        luego se reemplaza el archivo original con os.replace (atómico).
+        Otros procesos con el archivo abierto deben reconectarse tras el swap.
+        
+        Args:
+            target_path: Ruta del archivo compacto (por defecto junto al original)
+            swap: Si True, reemplaza el archivo original por la copia compacta
+            
+        Returns:
+            Diccionario con el resultado y los tamaños antes/después
+        """
+        if self.db_type != 'sqlite':
+            raise ValueError("vacuum_into solo está disponible para SQLite")
+        
+        db_path = self.engine.url.database
+        if not db_path or db_path == ':memory:':
+            raise ValueError("VACUUM INTO requiere una base SQLite en archivo")
+        
+        if target_path is None:
+            target_path = f"{db_path}.compact_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        
+        if os.path.exists(target_path):
+            raise ValueError(f"El archivo destino ya existe: {target_path}")
+        
+        wal_path = f"{db_path}-wal"
+        size_before = os.path.getsize(db_path)
+        if os.path.exists(wal_path):
+            size_before += os.path.getsize(wal_path)
+        lock_conn = None
+        
+        try:
+            if swap:
+                with self.engine.connect() as conn:
+                    journal_mode = conn.execute(text("PRAGMA journal_mode")).fetchone()[0]
+                    if journal_mode.lower() == 'wal':
+                        conn.execute(text("PRAGMA wal_checkpoint(TRUNCATE)"))
+                
+                # Bloquear escritores (no lectores) mientras se genera la copia
+                lock_conn = self.engine.connect()
+                lock_conn.exec_driver_sql("BEGIN IMMEDIATE")
+                
+                if os.path.exists(wal_path) and os.path.getsize(wal_path) > 0:
+                    raise RuntimeError("El WAL no está vacío; no es seguro intercambiar el archivo")
+            
+            with self.engine.connect() as conn:
+                conn.exec_driver_sql("VACUUM INTO ?", (target_path,))
+            
+            size_after = os.path.getsize(target_path)
+            
+            if swap:
+                os.replace(target_path, db_path)
+                lock_conn.rollback()
+                lock_conn.close()
+                lock_conn = None
+                # Las conexiones del pool apuntan al archivo anterior
+                self.engine.dispose()
+                self.logger.info(f"Archivo {db_path} reemplazado por su copia compacta")
+            
+            self.logger.info(f"VACUUM INTO completado: {size_before} -> {size_after} bytes")
+            return {
+                "status": "success",
+                "size_before": size_before,
+                "size_after": size_after,
+                "target_path": db_path if swap else target_path,
+                "swapped": swap
+            }
+            
+        except Exception as e:
+            self.logger.error(f"Error en VACUUM INTO: {str(e)}")
+            if swap and os.path.exists(target_path):
+                os.remove(target_path)
+            return {"status": "error", "swapped": False, "message": str(e)}
+            
+        finally:
+            if lock_conn is not None:
+                lock_conn.rollback()
+                lock_conn.close()
+    
     def analyze_table_stats(self, table_name: str) -> bool:
         """Actualiza estadísticas de la tabla (PostgreSQL)"""
         if self.db_type != 'postgresql':
@@ -63,20 +241,357 @@ class TableCompressor:
             self.logger.error(f"Error actualizando estadísticas: {str(e)}")
             return False
     
-    def reindex_table(self, table_name: str) -> bool:
-        """Reindexar tabla (PostgreSQL)"""
+    def reindex_table(self, table_name: str, concurrently: bool = False) -> bool:
+        """
+        Reindexar tabla (PostgreSQL)
+        
+        Args:
+            table_name: Nombre de la tabla
+            concurrently: Usa REINDEX ... CONCURRENTLY (PostgreSQL 12+), que no
+                bloquea escrituras pero no puede ejecutarse dentro de una transacción
+        """
         if self.db_type != 'postgresql':
             self.logger.info("Reindexación solo disponible para PostgreSQL")
             return True
             
         try:
-            with self.engine.connect() as conn:
-                conn.execute(text(f"REINDEX TABLE {table_name}"))
-                conn.commit()
+            if concurrently:
+                autocommit_engine = self.engine.execution_options(isolation_level="AUTOCOMMIT")
+                with autocommit_engine.connect() as conn:
+                    conn.execute(text(f"REINDEX TABLE CONCURRENTLY {table_name}"))
+            else:
+                with self.engine.connect() as conn:
+                    conn.execute(text(f"REINDEX TABLE {table_name}"))
+                    conn.commit()
                 
             self.logger.info(f"Tabla {table_name} reindexada")
             return True
             
         except Exception as e:
             self.logger.error(f"Error reindexando tabla: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+    
+    def online_rebuild_table(self, table_name: str, batch_size: Optional[int] = None,
+                             lock_timeout: Optional[str] = None,
+                             max_lock_attempts: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Reconstruye una tabla PostgreSQL en línea para recuperar espacio
+        
+        Copia la tabla por lotes a una tabla sombra mientras un trigger registra
+        las claves modificadas en una tabla de cambios. Los cambios se reaplican
+        hasta que el pendiente es pequeño y luego, bajo un bloqueo breve
+        (limitado por lock_timeout), se aplica el resto y se intercambian las tablas.
+        Requiere clave primaria `id`. La sombra (LIKE ... INCLUDING ALL) no hereda
+        FK (entrantes ni salientes), triggers, vistas dependientes, permisos,
+        dueño, políticas RLS ni publicaciones; si la tabla tiene alguno se
+        rechaza antes de copiar nada (status 'error' con la lista).
+        TRUNCATE sobre la tabla durante la reconstrucción no se registra.
+        
+        Args:
+            table_name: Tabla a reconstruir
+            batch_size: Filas por lote en la copia inicial
+            lock_timeout: Tiempo máximo de espera por el bloqueo del intercambio
+            max_lock_attempts: Intentos de intercambio antes de abortar
+            
+        Returns:
+            Diccionario con el resultado y los tamaños antes/después
+        """
+        if self.db_type != 'postgresql':
+            raise ValueError("La reconstrucción online solo está disponible para PostgreSQL")
+        
+        batch_size = batch_size or DatabaseConfig.ONLINE_REBUILD_BATCH_SIZE
+        lock_timeout = lock_timeout or DatabaseConfig.ONLINE_REBUILD_LOCK_TIMEOUT
+        max_lock_attempts = max_lock_attempts or DatabaseConfig.ONLINE_REBUILD_MAX_LOCK_ATTEMPTS
+        
+        shadow = f"{table_name}_shadow"
+        log_table = f"{table_name}_changelog"
+        function = f"{table_name}_changelog_fn"
+        trigger = f"{table_name}_changelog_trg"
+        
+        try:
+            with self.engine.connect() as conn:
+                size_before = self._check_online_rebuild_prerequisites(conn, table_name, trigger)
+                self._install_change_capture(conn, table_name, shadow, log_table,
+                                             function, trigger, lock_timeout)
+            
+            rows_copied = self._copy_to_shadow(table_name, shadow, batch_size)
+            
+            replayed = 0
+            with self.engine.connect() as conn:
+                # Reaplicar hasta que el pendiente quepa en el bloqueo breve
+                while True:
+                    applied = self._replay_changes(conn, table_name, shadow, log_table)
+                    conn.commit()
+                    replayed += applied
+                    if applied <= DatabaseConfig.ONLINE_REBUILD_REPLAY_THRESHOLD:
+                        break
+            
+            attempts = 0
+            while True:
+                attempts += 1
+                try:
+                    replayed += self._swap_tables(table_name, shadow, log_table,
+                                                  trigger, lock_timeout)
+                    break
+                except OperationalError as e:
+                    if attempts >= max_lock_attempts:
+                        raise
+                    self.logger.warning(
+                        f"Bloqueo no obtenido para el intercambio (intento {attempts}): {str(e)}"
+                    )
+                    with self.engine.connect() as conn:
+                        replayed += self._replay_changes(conn, table_name, shadow, log_table)
+                        conn.commit()
+            
+            with self.engine.connect() as conn:
+                conn.execute(text(f"DROP TABLE IF EXISTS {log_table}"))
+                conn.execute(text(f"DROP FUNCTION IF EXISTS {function}()"))
+                size_after = conn.execute(
+                    text("SELECT pg_total_relation_size(CAST(:t AS regclass))"), {"t": table_name}
+                ).scalar()
+                conn.commit()
+            
+            self.logger.info(
+                f"Tabla {table_name} reconstruida en línea: {size_before} -> {size_after} bytes"
+            )
+            return {
+                "status": "success",
+                "rows_copied": rows_copied,
+                "changes_replayed": replayed,
+                "lock_attempts": attempts,
+                "size_before": size_before,
+                "size_after": size_after
+            }
+            
+        except Exception as e:
+            self.logger.error(f"Error en reconstrucción online: {str(e)}")
+            self._cleanup_online_rebuild(table_name, shadow, log_table, function, trigger)
+            return {"status": "error", "message": str(e)}
+    
+    def _check_online_rebuild_prerequisites(self, conn, table_name: str, trigger: str) -> int:
+        """
+        Valida la tabla para la reconstrucción online y retorna su tamaño
+        
+        Rechaza lo que la sombra no conserva y DROP TABLE descartaría (o lo
+        que haría fallar el DROP después de toda la copia).
+        """
+        params = {"t": table_name, "trigger": trigger}
+        checks = [
+            ("claves foráneas entrantes", """
+                SELECT conname || ' (' || CAST(conrelid AS regclass) || ')' FROM pg_constraint
+                WHERE contype = 'f' AND confrelid = CAST(:t AS regclass)
+            """),
+            ("claves foráneas salientes", """
+                SELECT conname FROM pg_constraint
+                WHERE contype = 'f' AND conrelid = CAST(:t AS regclass)
+            """),
+            ("triggers", """
+                SELECT tgname FROM pg_trigger
+                WHERE tgrelid = CAST(:t AS regclass) AND NOT tgisinternal AND tgname <> :trigger
+            """),
+            ("vistas dependientes", """
+                SELECT DISTINCT CAST(CAST(r.ev_class AS regclass) AS text) FROM pg_depend d
+                JOIN pg_rewrite r ON r.oid = d.objid
+                WHERE d.classid = CAST('pg_rewrite' AS regclass)
+                  AND d.refobjid = CAST(:t AS regclass) AND r.ev_class <> CAST(:t AS regclass)
+            """),
+            ("permisos (GRANT)", """
+                SELECT array_to_string(relacl, ', ') FROM pg_class
+                WHERE oid = CAST(:t AS regclass) AND relacl IS NOT NULL
+            """),
+            ("dueño distinto del usuario actual", """
+                SELECT pg_get_userbyid(relowner) FROM pg_class
+                WHERE oid = CAST(:t AS regclass) AND relowner <> (
+                    SELECT oid FROM pg_roles WHERE rolname = current_user
+                )
+            """),
+            ("seguridad por filas (RLS)", """
+                SELECT 'activa' FROM pg_class
+                WHERE oid = CAST(:t AS regclass) AND relrowsecurity
+                UNION ALL
+                SELECT polname FROM pg_policy WHERE polrelid = CAST(:t AS regclass)
+            """),
+            ("publicaciones", """
+                SELECT p.pubname FROM pg_publication_rel pr
+                JOIN pg_publication p ON p.oid = pr.prpubid
+                WHERE pr.prrelid = CAST(:t AS regclass)
+            """),
+        ]
+        unsupported = []
+        for label, query in checks:
+            names = [row[0] for row in conn.execute(text(query), params)]
+            if names:
+                unsupported.append(f"{label}: {', '.join(names)}")
+        if unsupported:
+            raise ValueError(
+                f"{table_name} tiene objetos que la reconstrucción online no conserva "
+                f"({'; '.join(unsupported)})"
+            )
+        
+        has_id = conn.execute(text("""
+            SELECT COUNT(*) FROM pg_attribute
+            WHERE attrelid = CAST(:t AS regclass) AND attname = 'id' AND NOT attisdropped
+        """), {"t": table_name}).scalar()
+        if not has_id:
+            raise ValueError(f"{table_name} no tiene columna id")
+        
+        return conn.execute(
+            text("SELECT pg_total_relation_size(CAST(:t AS regclass))"), {"t": table_name}
+        ).scalar()
+    
+    def _install_change_capture(self, conn, table_name: str, shadow: str, log_table: str,
+                                function: str, trigger: str, lock_timeout: str):
+        """Crea la tabla sombra, la tabla de cambios y el trigger de captura"""
+        id_type = conn.execute(text("""
+            SELECT format_type(atttypid, atttypmod) FROM pg_attribute
+            WHERE attrelid = CAST(:t AS regclass) AND attname = 'id'
+        """), {"t": table_name}).scalar()
+        
+        conn.execute(text(f"CREATE TABLE {shadow} (LIKE {table_name} INCLUDING ALL)"))
+        conn.execute(text(
+            f"CREATE TABLE {log_table} (seq BIGSERIAL PRIMARY KEY, pk {id_type} NOT NULL)"
+        ))
+        conn.execute(text(f"""
+            CREATE OR REPLACE FUNCTION {function}() RETURNS trigger AS $$
+            BEGIN
+                IF TG_OP = 'DELETE' THEN
+                    INSERT INTO {log_table} (pk) VALUES (OLD.id);
+                    RETURN OLD;
+                END IF;
+                IF TG_OP = 'UPDATE' AND NEW.id IS DISTINCT FROM OLD.id THEN
+                    INSERT INTO {log_table} (pk) VALUES (OLD.id);
+                END IF;
+                INSERT INTO {log_table} (pk) VALUES (NEW.id);
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+        """))
+        # CREATE TRIGGER toma un bloqueo breve; no esperar indefinidamente por él
+        conn.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+        conn.execute(text(f"""
+            CREATE TRIGGER {trigger}
+            AFTER INSERT OR UPDATE OR DELETE ON {table_name}
+            FOR EACH ROW EXECUTE FUNCTION {function}()
+        """))
+        conn.commit()
+    
+    def _copy_to_shadow(self, table_name: str, shadow: str, batch_size: int) -> int:
+        """
+        Copia la tabla a la sombra por lotes de batch_size ids, un lote por transacción
+        
+        Lotes por clave (keyset): cada uno busca en el índice el id de su
+        batch_size-ésima fila y copia hasta él, así los huecos entre ids no
+        cuestan consultas vacías.
+        """
+        rows_copied = 0
+        last_id = None
+        with self.engine.connect() as conn:
+            while True:
+                after = "" if last_id is None else "WHERE id > :last_id"
+                upper = conn.execute(
+                    text(f"""
+                        SELECT MAX(id) FROM (
+                            SELECT id FROM {table_name} {after} ORDER BY id LIMIT :batch_size
+                        ) batch
+                    """),
+                    {"last_id": last_id, "batch_size": batch_size}
+                ).scalar()
+                if upper is None:
+                    break
+                
+                lower = "" if last_id is None else "id > :last_id AND"
+                result = conn.execute(
+                    text(f"""
+                        INSERT INTO {shadow}
+                        SELECT * FROM {table_name} WHERE {lower} id <= :upper
+                    """),
+                    {"last_id": last_id, "upper": upper}
+                )
+                conn.commit()
+                rows_copied += result.rowcount
+                last_id = upper
+        
+        self.logger.debug(f"Copiadas {rows_copied} filas a {shadow}")
+        return rows_copied
+    
+    def _replay_changes(self, conn, table_name: str, shadow: str, log_table: str) -> int:
+        """Reaplica en la sombra las filas registradas en la tabla de cambios"""
+        max_seq = conn.execute(text(f"SELECT MAX(seq) FROM {log_table}")).scalar()
+        if max_seq is None:
+            return 0
+        
+        pending = f"SELECT pk FROM {log_table} WHERE seq <= :max_seq"
+        conn.execute(text(f"DELETE FROM {shadow} WHERE id IN ({pending})"), {"max_seq": max_seq})
+        conn.execute(
+            text(f"INSERT INTO {shadow} SELECT * FROM {table_name} WHERE id IN ({pending})"),
+            {"max_seq": max_seq}
+        )
+        result = conn.execute(
+            text(f"DELETE FROM {log_table} WHERE seq <= :max_seq"), {"max_seq": max_seq}
+        )
+        return result.rowcount
+    
+    def _swap_tables(self, table_name: str, shadow: str, log_table: str,
+                     trigger: str, lock_timeout: str) -> int:
+        """Aplica los últimos cambios e intercambia las tablas bajo un bloqueo breve"""
+        old_table = f"{table_name}_old"
+        
+        with self.engine.connect() as conn:
+            conn.execute(text(f"SET LOCAL lock_timeout = '{lock_timeout}'"))
+            conn.execute(text(f"LOCK TABLE {table_name} IN ACCESS EXCLUSIVE MODE"))
+            
+            replayed = self._replay_changes(conn, table_name, shadow, log_table)
+            
+            sequence = conn.execute(
+                text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": table_name}
+            ).scalar()
+            shadow_sequence = conn.execute(
+                text("SELECT pg_get_serial_sequence(:t, 'id')"), {"t": shadow}
+            ).scalar()
+            
+            conn.execute(text(f"DROP TRIGGER {trigger} ON {table_name}"))
+            conn.execute(text(f"ALTER TABLE {table_name} RENAME TO {old_table}"))
+            conn.execute(text(f"ALTER TABLE {shadow} RENAME TO {table_name}"))
+            
+            if sequence and shadow_sequence:
+                # Columna IDENTITY: la sombra tiene su propia secuencia
+                conn.execute(
+                    text("SELECT setval(CAST(:new AS regclass), last_value, is_called) "
+                         f"FROM {sequence}"),
+                    {"new": shadow_sequence}
+                )
+            elif sequence:
+                # SERIAL: la secuencia pertenece a la tabla antigua y se borraría con ella
+                conn.execute(text(f"ALTER SEQUENCE {sequence} OWNED BY {table_name}.id"))
+            
+            conn.execute(text(f"DROP TABLE {old_table}"))
+
+            # Recuperar los nombres originales de índices y secuencias
+            shadow_objects = conn.execute(text("""
+                SELECT DISTINCT c.relname, c.relkind FROM pg_class c
+                LEFT JOIN pg_index i ON i.indexrelid = c.oid
+                LEFT JOIN pg_depend d ON d.objid = c.oid AND d.deptype IN ('a', 'i')
+                WHERE (i.indrelid = CAST(:t AS regclass) OR d.refobjid = CAST(:t AS regclass))
+                  AND c.relname LIKE :prefix
+            """), {"t": table_name, "prefix": f"{shadow}%"}).fetchall()
+            for relname, relkind in shadow_objects:
+                kind = 'SEQUENCE' if relkind == 'S' else 'INDEX'
+                new_name = table_name + relname[len(shadow):]
+                conn.execute(text(f"ALTER {kind} {relname} RENAME TO {new_name}"))
+
+            conn.commit()
+        
+        return replayed
+    
+    def _cleanup_online_rebuild(self, table_name: str, shadow: str, log_table: str,
+                                function: str, trigger: str):
+        """Elimina los objetos auxiliares tras un fallo"""
+        try:
+            with self.engine.connect() as conn:
+                conn.execute(text(f"DROP TRIGGER IF EXISTS {trigger} ON {table_name}"))
+                conn.execute(text(f"DROP TABLE IF EXISTS {shadow}"))
+                conn.execute(text(f"DROP TABLE IF EXISTS {log_table}"))
+                conn.execute(text(f"DROP FUNCTION IF EXISTS {function}()"))
+                conn.commit()
+        except Exception as e:
+            self.logger.error(f"Error limpiando la reconstrucción online: {str(e)}")
@@ -0,0 +1,236 @@
+"""
+Control adaptativo del ritmo de escritura en fases por lotes
+"""
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+from sqlalchemy import text
+from .database_connector import DatabaseConnector
+from .cancellation import CancellationToken, OperationCancelled
+from .progress import ProgressTracker
+from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
+
+class ThrottleController:
+    """
+    Ajusta el tamaño de lote y la pausa entre lotes para no saturar la base
+    
+    Después de cada lote compara la latencia observada, las esperas de
+    bloqueo y (en PostgreSQL/MySQL) el retraso de réplica con sus objetivos:
+    si alguno se supera reduce el lote a la mitad y duplica la pausa; si hay
+    holgura los vuelve a relajar (aumento aditivo, reducción multiplicativa).
+    """
+    
+    def __init__(self, db_connector: DatabaseConnector,
+                 target_latency: Optional[float] = None,
+                 max_replica_lag: Optional[float] = None,
+                 max_lock_waits: Optional[int] = None,
+                 initial_batch_size: Optional[int] = None,
+                 min_batch_size: Optional[int] = None,
+                 max_batch_size: Optional[int] = None,
+                 max_sleep: Optional[float] = None,
+                 replica_connector: Optional[DatabaseConnector] = None):
+        """
+        Args:
+            db_connector: Conexión al primario (esperas de bloqueo y, en
+                PostgreSQL, retraso de las réplicas vía pg_stat_replication)
+            target_latency: Latencia máxima deseada por lote (segundos)
+            max_replica_lag: Retraso de réplica máximo tolerado (segundos)
+            max_lock_waits: Sesiones esperando bloqueos a partir de las cuales se frena
+            initial_batch_size, min_batch_size, max_batch_size: Límites del lote
+            max_sleep: Pausa máxima entre lotes (segundos)
+            replica_connector: Conexión a una réplica para medir su retraso
+                directamente (necesario en MySQL si db_connector no tiene réplicas)
+        """
+        self.db_connector = db_connector
+        self.engine = db_connector.get_engine()
+        self.db_type = db_connector.db_type
+        self.replica_connector = replica_connector
+        
+        self.target_latency = target_latency or DatabaseConfig.THROTTLE_TARGET_LATENCY
+        self.max_replica_lag = max_replica_lag or DatabaseConfig.THROTTLE_MAX_REPLICA_LAG
+        self.max_lock_waits = (DatabaseConfig.THROTTLE_MAX_LOCK_WAITS
+                               if max_lock_waits is None else max_lock_waits)
+        self.min_batch_size = min_batch_size or DatabaseConfig.THROTTLE_MIN_BATCH_SIZE
+        self.max_batch_size = max_batch_size or DatabaseConfig.THROTTLE_MAX_BATCH_SIZE
+        self.max_sleep = DatabaseConfig.THROTTLE_MAX_SLEEP if max_sleep is None else max_sleep
+        
+        self.batch_size = initial_batch_size or DatabaseConfig.THROTTLE_INITIAL_BATCH_SIZE
+        self.batch_size = min(self.max_batch_size, max(self.min_batch_size, self.batch_size))
+        self.sleep = 0.0
+        
+        self.decisions = deque(maxlen=DatabaseConfig.THROTTLE_HISTORY)
+        self._stats = {
+            "batches": 0,
+            "rows": 0,
+            "throttled_batches": 0,
+            "slept_seconds": 0.0,
+            "smallest_batch_size": self.batch_size,
+            "largest_batch_size": self.batch_size
+        }
+        self._last_probe_at = None
+        self._last_probe = {"replica_lag": None, "lock_waits": None}
+        
+        # Setup logger
+        logger_setup = LoggerSetup()
+        self.logger = logger_setup.setup_logger(self.__class__.__name__)
+    
+    def run_batches(self, process_batch: Callable[[int], Optional[int]],
+                    cancel_token: Optional[CancellationToken] = None,
+                    progress: Optional[ProgressTracker] = None) -> int:
+        """
+        Ejecuta process_batch(tamaño) hasta que retorne None
+        
+        process_batch procesa como máximo `tamaño` filas y retorna cuántas
+        procesó; entre lotes se aplica la pausa decidida por el controlador.
+        Si cancel_token se cancela, se lanza OperationCancelled antes del
+        siguiente lote (con las filas ya procesadas en processed).
+        progress, si se indica, avanza con las filas de cada lote.
+        
+        Returns:
+            Total de filas procesadas
+        """
+        total = 0
+        while True:
+            if cancel_token is not None:
+                cancel_token.raise_if_cancelled(total)
+            start = time.perf_counter()
+            try:
+                rows = process_batch(self.batch_size)
+            except OperationCancelled as e:
+                # Cancelado durante los reintentos del lote: sumar lo ya procesado
+                raise OperationCancelled(e.reason, total + e.processed) from None
+            if rows is None:
+                return total
+            
+            total += rows
+            if progress is not None:
+                progress.advance(rows)
+            self.record(time.perf_counter() - start, rows)
+            self.wait(cancel_token)
+    
+    def record(self, latency: float, rows: int) -> Dict[str, Any]:
+        """Registra un lote y decide el siguiente tamaño de lote y la pausa"""
+        probe = self._probe()
+        reasons = []
+        if latency > self.target_latency:
+            reasons.append('latency')
+        if probe['replica_lag'] is not None and probe['replica_lag'] > self.max_replica_lag:
+            reasons.append('replica_lag')
+        if probe['lock_waits'] is not None and probe['lock_waits'] > self.max_lock_waits:
+            reasons.append('lock_waits')
+        
+        if reasons:
+            action = 'backoff'
+            self.batch_size = max(self.min_batch_size, self.batch_size // 2)
+            self.sleep = min(self.max_sleep, max(self.sleep * 2, DatabaseConfig.THROTTLE_MIN_SLEEP))
+            if 'replica_lag' in reasons:
+                # Dar tiempo a la réplica a recuperar al menos el exceso
+                self.sleep = min(self.max_sleep,
+                                 max(self.sleep, probe['replica_lag'] - self.max_replica_lag))
+            self._stats['throttled_batches'] += 1
+        elif (latency < self.target_latency / 2
+              and (probe['replica_lag'] is None or probe['replica_lag'] < self.max_replica_lag / 2)):
+            action = 'increase'
+            self.batch_size = min(self.max_batch_size,
+                                  self.batch_size + max(1, self.batch_size // 4))
+            self.sleep = self.sleep / 2 if self.sleep / 2 >= DatabaseConfig.THROTTLE_MIN_SLEEP else 0.0
+        else:
+            action = 'hold'
+        
+        self._stats['batches'] += 1
+        self._stats['rows'] += rows
+        self._stats['smallest_batch_size'] = min(self._stats['smallest_batch_size'], self.batch_size)
+        self._stats['largest_batch_size'] = max(self._stats['largest_batch_size'], self.batch_size)
+        
+        decision = {
+            "batch": self._stats['batches'],
+            "rows": rows,
+            "latency": round(latency, 4),
+            "replica_lag": probe['replica_lag'],
+            "lock_waits": probe['lock_waits'],
+            "action": action,
+            "reasons": reasons,
+            "next_batch_size": self.batch_size,
+            "sleep": round(self.sleep, 3)
+        }
+        self.decisions.append(decision)
+        
+        if reasons:
+            self.logger.info(
+                f"Frenando ({', '.join(reasons)}): lote {self.batch_size}, pausa {self.sleep:.2f}s"
+            )
+        return decision
+    
+    def wait(self, cancel_token: Optional[CancellationToken] = None):
+        """Pausa entre lotes (se interrumpe si se cancela)"""
+        if self.sleep > 0:
+            if cancel_token is not None:
+                cancel_token.wait(self.sleep)
+            else:
+                time.sleep(self.sleep)
+            self._stats['slept_seconds'] += self.sleep
+    
+    def metrics(self) -> Dict[str, Any]:
+        """Resumen de decisiones para el reporte de resultados"""
+        return {
+            **self._stats,
+            "slept_seconds": round(self._stats['slept_seconds'], 3),
+            "batch_size": self.batch_size,
+            "sleep": round(self.sleep, 3),
+            "targets": {
+                "latency": self.target_latency,
+                "replica_lag": self.max_replica_lag,
+                "lock_waits": self.max_lock_waits
+            },
+            "decisions": list(self.decisions)
+        }
+    
+    def _probe(self) -> Dict[str, Any]:
+        """Mide retraso de réplica y esperas de bloqueo (como mucho cada THROTTLE_PROBE_INTERVAL)"""
+        now = time.monotonic()
+        if (self._last_probe_at is not None
+                and now - self._last_probe_at < DatabaseConfig.THROTTLE_PROBE_INTERVAL):
+            return self._last_probe
+        
+        self._last_probe_at = now
+        self._last_probe = {
+            "replica_lag": self._probe_replica_lag(),
+            "lock_waits": self._probe_lock_waits()
+        }
+        return self._last_probe
+    
+    def _probe_replica_lag(self) -> Optional[float]:
+        """Segundos de retraso de la réplica más atrasada; None si no se puede medir"""
+        try:
+            if self.replica_connector is not None:
+                return self.replica_connector.replica_lag()
+            if self.db_connector.replica_engines:
+                # Réplicas de lectura del propio conector: se miden directamente
+                return self.db_connector.max_replica_lag()
+            
+            if self.db_type == 'postgresql':
+                with self.engine.connect() as conn:
+                    lag = conn.execute(text(
+                        "SELECT COALESCE(MAX(EXTRACT(EPOCH FROM replay_lag)), 0) FROM pg_stat_replication"
+                    )).scalar()
+                return float(lag)
+        except Exception as e:
+            self.logger.debug(f"No se pudo medir el retraso de réplica: {str(e)}")
+        return None
+    
+    def _probe_lock_waits(self) -> Optional[int]:
+        """Sesiones esperando un bloqueo; None si no se puede medir"""
+        queries = {
+            'postgresql': "SELECT COUNT(*) FROM pg_locks WHERE NOT granted",
+            'mysql': "SELECT COUNT(*) FROM performance_schema.data_lock_waits"
+        }
+        if self.db_type not in queries:
+            return None
+        
+        try:
+            with self.engine.connect() as conn:
+                return int(conn.execute(text(queries[self.db_type])).scalar())
+        except Exception as e:
+            self.logger.debug(f"No se pudieron medir las esperas de bloqueo: {str(e)}")
+            return None
@@ -0,0 +1,70 @@
+"""
+Persistencia de marcas de agua (id máximo procesado) por tabla
+"""
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from .atomic_file import atomic_write, file_lock
+from .logger_setup import LoggerSetup
+from .config import DatabaseConfig
+
+class WatermarkStore:
+    """
+    Guarda en disco el mayor id ya depurado por (base de datos, tabla, columnas)
+    
+    Cada escritura relee y combina el archivo bajo un bloqueo de hilos y
+    otro entre procesos (file_lock), así dos procesos que actualizan tablas
+    distintas no pisan la entrada del otro.
+    """
+    
+    # Compartido entre instancias: varios removedores en hilos escriben el mismo archivo
+    _lock = threading.Lock()
+    
+    def __init__(self, path: Optional[str] = None):
+        self.path = path or DatabaseConfig.WATERMARK_FILE
+        
+        # Setup logger
+        logger_setup = LoggerSetup()
+        self.logger = logger_setup.setup_logger(self.__class__.__name__)
+    
+    @staticmethod
+    def make_key(database: str, table_name: str, columns_to_check: List[str]) -> str:
+        """Clave estable; el orden de las columnas no cambia el significado del duplicado"""
+        return f"{database}|{table_name}|{','.join(sorted(columns_to_check))}"
+    
+    def get(self, key: str) -> Optional[Any]:
+        """Retorna la marca de agua guardada o None si nunca se procesó"""
+        entry = self._load().get(key)
+        return entry['watermark'] if entry else None
+    
+    def set(self, key: str, watermark: Any):
+        """Guarda la marca de agua"""
+        with self._lock, file_lock(self.path):
+            data = self._load()
+            data[key] = {
+                "watermark": watermark,
+                "updated_at": datetime.now().isoformat(timespec='seconds')
+            }
+            self._save(data)
+        
+        self.logger.debug(f"Marca de agua {key} = {watermark}")
+    
+    def reset(self, key: str):
+        """Olvida la marca de agua; la próxima ejecución será completa"""
+        with self._lock, file_lock(self.path):
+            data = self._load()
+            if data.pop(key, None) is not None:
+                self._save(data)
+    
+    def _load(self) -> Dict[str, Dict[str, Any]]:
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    
+    def _save(self, data: Dict[str, Dict[str, Any]]):
+        """Escritura atómica: archivo temporal + os.replace"""
+        with atomic_write(self.path) as f:
+            json.dump(data, f, indent=2, sort_keys=True)
@@ -0,0 +1,26 @@
+﻿"""
+Script launcher del modo vigilancia
+"""
+#!/usr/bin/env python3
+import sys
+import os
+
+# Agregar el directorio del proyecto al path
+project_root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, project_root)
+
+def main():
+    """Función principal del launcher de vigilancia"""
+    try:
+        from support_utilities.watch_cli import main_watch
+        main_watch()
+    except ImportError as e:
+        print(f"❌ Error importando modo vigilancia: {str(e)}")
+        print("\nVerifica que el archivo support_utilities/watch_cli.py existe")
+        sys.exit(1)
+    except Exception as e:
+        print(f"❌ Error ejecutando modo vigilancia: {str(e)}")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -2,13 +2,14 @@
 Interfaz de línea de comandos
 """
 import argparse
+import json
+from functools import partial
 import sys
 import os
 
 # Agregar el directorio padre al path para importar database_repair
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
-from database_repair import DatabaseConnector, DuplicateRemover, StatsCollector
 from database_repair.config import DatabaseConfig
 
 def create_parser():
@@ -20,25 +21,29 @@ def create_parser():
     parser.add_argument(
         '--db-type', 
         choices=['postgresql', 'mysql', 'sqlite'],
-        required=True,
-        help='Tipo de base de datos'
+        help='Tipo de base de datos (no se usa con --job-file)'
     )
     
     parser.add_argument(
         '--connection-string',
-        required=True,
         help='String de conexión a la BD'
     )
     
+    parser.add_argument(
+        '--replica',
+        action='append',
+        default=[],
+        metavar='URL',
+        help='Réplica de solo lectura para análisis, simulacros, estadísticas y --plan; repetible'
+    )
+    
     parser.add_argument(
         '--table',
-        required=True,
         help='Nombre de la tabla a procesar'
     )
     
     parser.add_argument(
         '--columns',
-        required=True,
         nargs='+',
         help='Columnas que definen duplicados'
     )
@@ -50,12 +55,142 @@ def create_parser():
         help='Estrategia: mantener registro más antiguo o más nuevo'
     )
     
+    parser.add_argument(
+        '--keep-order',
+        nargs='+',
+        metavar='TERMINO',
+        help='Conservar la primera fila según este orden en lugar de --strategy, p. ej. '
+             '"updated_at DESC" "non_null(*) DESC"'
+    )
+    
+    parser.add_argument(
+        '--merge',
+        action='store_true',
+        help='Llenar los NULL del superviviente con valores de los duplicados antes de borrarlos'
+    )
+    
     parser.add_argument(
         '--dry-run',
         action='store_true',
         help='Solo simular, no ejecutar cambios'
     )
     
+    parser.add_argument(
+        '--temp-index',
+        action='store_true',
+        help='Crear un índice temporal (columnas..., id) si no existe uno utilizable'
+    )
+    
+    parser.add_argument(
+        '--key-index',
+        action='store_true',
+        help='Crear (si falta) un índice permanente sobre --columns; de expresión si '
+             'están normalizadas, p. ej. --columns "lower(trim(email))"'
+    )
+    
+    parser.add_argument(
+        '--enforce-unique',
+        action='store_true',
+        help='Instalar un índice único sobre las columnas tras la reparación'
+    )
+    
+    parser.add_argument(
+        '--remap-fks',
+        action='store_true',
+        help='Reasignar al superviviente las filas de tablas hijas que apuntan a los duplicados '
+             '(se respaldan antes en una tabla por hija)'
+    )
+    
+    parser.add_argument(
+        '--incremental',
+        action='store_true',
+        help='Procesar solo las filas nuevas desde la última ejecución (marca de agua de id)'
+    )
+    
+    parser.add_argument(
+        '--throttle',
+        action='store_true',
+        help='Backup y eliminación por lotes con ritmo adaptativo (latencia, bloqueos, réplica)'
+    )
+    
+    parser.add_argument(
+        '--target-latency',
+        type=float,
+        default=DatabaseConfig.THROTTLE_TARGET_LATENCY,
+        help='Latencia objetivo por lote en segundos (con --throttle)'
+    )
+    
+    parser.add_argument(
+        '--max-replica-lag',
+        type=float,
+        default=DatabaseConfig.THROTTLE_MAX_REPLICA_LAG,
+        help='Retraso de réplica máximo tolerado en segundos (con --throttle)'
+    )
+    
+    parser.add_argument(
+        '--statement-timeout',
+        action='append',
+        default=[],
+        metavar='[FASE=]SEGUNDOS',
+        help='Timeout de sentencia para todas las fases o para una '
+             '(analysis, backup, deletion, index, load); repetible'
+    )
+    
+    parser.add_argument(
+        '--lock-timeout',
+        action='append',
+        default=[],
+        metavar='[FASE=]SEGUNDOS',
+        help='Timeout de espera de bloqueos para todas las fases o para una; repetible'
+    )
+    
+    parser.add_argument(
+        '--progress',
+        action='store_true',
+        help='Mostrar barra de avance (filas, ritmo y ETA) de análisis, backup y eliminación'
+    )
+    
+    parser.add_argument(
+        '--plan',
+        metavar='ARCHIVO',
+        help='Guardar en ARCHIVO las víctimas y supervivientes exactos sin eliminar nada'
+    )
+    
+    parser.add_argument(
+        '--apply',
+        metavar='ARCHIVO',
+        help='Eliminar exactamente las víctimas de un plan (tabla y columnas salen del plan)'
+    )
+    
+    parser.add_argument(
+        '--force',
+        action='store_true',
+        help='Con --apply, aplicar aunque cambió el esquema o faltan filas que el plan conservaba'
+    )
+    
+    parser.add_argument(
+        '--load',
+        metavar='CSV',
+        help='Cargar el CSV en --table omitiendo las filas cuya clave (--columns) ya existe'
+    )
+    
+    parser.add_argument(
+        '--job-file',
+        help='Archivo JSON/YAML con bases, tablas, columnas, estrategias y límites; '
+             'se procesan todos en un solo proceso'
+    )
+    
+    parser.add_argument(
+        '--parallelism',
+        type=int,
+        help=f'Trabajos simultáneos con --job-file (por defecto {DatabaseConfig.JOB_PARALLELISM})'
+    )
+    
+    parser.add_argument(
+        '--summary-file',
+        help='Con --job-file, escribe aquí el resumen JSON en lugar de imprimirlo'
+    )
+    
     parser.add_argument(
         '--verbose',
         action='store_true',
@@ -64,19 +199,137 @@ def create_parser():
     
     return parser
 
+def parse_timeouts(args) -> dict:
+    """Convierte --statement-timeout/--lock-timeout en el diccionario por fase del conector"""
+    timeouts = {}
+    for setting, values in (('statement_timeout', args.statement_timeout),
+                            ('lock_timeout', args.lock_timeout)):
+        for value in values:
+            phase, _, seconds = value.rpartition('=')
+            phases = [phase] if phase else list(DatabaseConfig.PHASE_TIMEOUTS)
+            for name in phases:
+                if name not in DatabaseConfig.PHASE_TIMEOUTS:
+                    raise ValueError(f"Fase no soportada: {name}")
+                timeouts.setdefault(name, {})[setting] = float(seconds)
+    return timeouts
+
+def run_job_file(args):
+    """Ejecuta un archivo de trabajos y emite el resumen JSON"""
+    from database_repair import CancellationToken, JobRunner
+    
+    cancel_token = CancellationToken()
+    cancel_token.install_signal_handlers()
+    
+    runner = JobRunner.from_file(args.job_file, parallelism=args.parallelism,
+                                 dry_run=True if args.dry_run else None,
+                                 timeouts=parse_timeouts(args), cancel_token=cancel_token)
+    summary = runner.run()
+    
+    output = json.dumps(summary, indent=2, ensure_ascii=False, default=str)
+    if args.summary_file:
+        with open(args.summary_file, 'w', encoding='utf-8') as f:
+            f.write(output)
+        totals = summary['totals']
+        print(f"📋 {totals['jobs']} trabajos: {totals['succeeded']} correctos, "
+              f"{totals['failed']} con error, {totals['skipped']} omitidos; "
+              f"{totals['deleted_rows']} duplicados eliminados")
+        print(f"📄 Resumen: {args.summary_file}")
+    else:
+        print(output)
+    
+    if summary['status'] != 'success':
+        sys.exit(1)
+
+def run_plan_workflow(args, connector, planner):
+    """--plan guarda las víctimas exactas; --apply elimina las de un plan guardado"""
+    from database_repair import CancellationToken, TerminalProgressBar, ThrottleController
+    
+    progress = TerminalProgressBar() if args.progress else None
+    if args.plan:
+        result = planner.plan(args.table, args.columns, args.strategy, args.plan, progress)
+        print(f"📝 Plan guardado en {result['plan_file']} ({result['file_bytes']} bytes): "
+              f"{result['victim_count']} víctimas, {result['kept_count']} supervivientes")
+        return
+    
+    cancel_token = CancellationToken()
+    cancel_token.install_signal_handlers()
+    throttle = (ThrottleController(connector, target_latency=args.target_latency,
+                                   max_replica_lag=args.max_replica_lag)
+                if args.throttle else None)
+    result = planner.apply(args.apply, throttle=throttle, cancel_token=cancel_token,
+                           progress=progress, force=args.force)
+    
+    if result['status'] == 'cancelled':
+        print(f"⏹️  Cancelado ({result['message']}): {result['deleted_count']} eliminados, "
+              f"{result['pending_count']} pendientes; el plan puede aplicarse de nuevo")
+    else:
+        print(f"✅ Eliminados {result['deleted_count']} de {result['planned']} planificados "
+              f"({result['skipped_count']} ya no existían)")
+    if result['backup_table']:
+        print(f"💾 Backup creado: {result['backup_table']}")
+    if args.verbose:
+        timings = ', '.join(f"{phase}={seconds}s" for phase, seconds in result['timings'].items())
+        print(f"⏱️  Tiempos: {timings}")
+
 def main_cli():
     """Función principal CLI"""
     parser = create_parser()
     args = parser.parse_args()
     
+    if args.job_file:
+        try:
+            run_job_file(args)
+        except (OSError, ImportError, ValueError) as e:
+            print(f"❌ Error: {str(e)}")
+            sys.exit(1)
+        return
+    
+    required = [('--db-type', args.db_type), ('--connection-string', args.connection_string)]
+    if not args.apply:
+        required += [('--table', args.table), ('--columns', args.columns)]
+    missing = [flag for flag, value in required if not value]
+    if missing:
+        parser.error(f"faltan argumentos: {', '.join(missing)} (o use --job-file)")
+    if sum(1 for value in (args.plan, args.apply, args.load) if value) > 1:
+        parser.error("--plan, --apply y --load no se pueden combinar")
+    if (args.keep_order or args.merge) and (args.incremental or args.plan or args.apply):
+        parser.error("--keep-order y --merge no se combinan con --incremental, --plan ni --apply")
+    
+    # Import diferido: --help y los errores de argumentos no cargan SQLAlchemy/pandas
+    from database_repair import (CancellationToken, DatabaseConnector, DedupLoader,
+                                 DeletionPlanner, DuplicateRemover, IndexAdvisor, StatsCollector,
+                                 TerminalProgressBar, ThrottleController)
+    
     try:
         # Conectar
-        connector = DatabaseConnector(args.connection_string, args.db_type)
+        connector = DatabaseConnector(args.connection_string, args.db_type,
+                                      timeouts=parse_timeouts(args), replicas=args.replica)
         
         if not connector.test_connection():
             print("❌ Error: No se pudo conectar a la base de datos")
             sys.exit(1)
         
+        if args.key_index and args.table:
+            index = IndexAdvisor(connector).create_key_index(args.table, args.columns)
+            print(f"🗂️  Índice de claves {index['name']} "
+                  f"{'creado' if index['created'] else 'ya presente'}")
+        
+        if args.plan or args.apply:
+            run_plan_workflow(args, connector, DeletionPlanner(connector))
+            return
+        
+        if args.load:
+            cancel_token = CancellationToken()
+            cancel_token.install_signal_handlers()
+            result = DedupLoader(connector).load(
+                args.table, args.load, args.columns, cancel_token=cancel_token,
+                progress=TerminalProgressBar() if args.progress else None
+            )
+            state = "⏹️  Carga cancelada" if result['status'] == 'cancelled' else "✅ Carga terminada"
+            print(f"{state}: {result['inserted_count']} filas insertadas, "
+                  f"{result['skipped_count']} omitidas por clave repetida ({result['mode']})")
+            return
+        
         # Componentes
         remover = DuplicateRemover(connector)
         stats_collector = StatsCollector(connector)
@@ -86,20 +339,66 @@ def main_cli():
             initial_stats = stats_collector.get_table_stats(args.table)
             print(f"Registros iniciales: {initial_stats['total_records']}")
         
-        # Ejecutar reparación
-        method = (remover.remove_duplicates_keep_oldest 
-                 if args.strategy == 'oldest' 
-                 else remover.remove_duplicates_keep_newest)
+        # Ctrl+C / SIGTERM detienen el trabajo al terminar el lote en curso
+        cancel_token = CancellationToken()
+        cancel_token.install_signal_handlers()
         
-        result = method(args.table, args.columns, args.dry_run)
+        # Ejecutar reparación
+        if args.incremental:
+            result = remover.remove_duplicates_incremental(
+                args.table, args.columns, args.strategy, args.dry_run
+            )
+        else:
+            method = (remover.remove_duplicates_keep_oldest 
+                     if args.strategy == 'oldest' 
+                     else remover.remove_duplicates_keep_newest)
+            if args.keep_order:
+                method = partial(remover.remove_duplicates_keep_by, order_by=args.keep_order)
+            
+            throttle = (ThrottleController(connector, target_latency=args.target_latency,
+                                           max_replica_lag=args.max_replica_lag)
+                        if args.throttle else None)
+            result = method(args.table, args.columns, dry_run=args.dry_run,
+                            use_temp_index=args.temp_index,
+                            enforce_unique=args.enforce_unique,
+                            remap_foreign_keys=args.remap_fks,
+                            merge=args.merge,
+                            throttle=throttle, cancel_token=cancel_token,
+                            progress=TerminalProgressBar() if args.progress else None)
         
         # Mostrar resultados
-        if args.dry_run:
+        if result['status'] == 'cancelled':
+            print(f"⏹️  Cancelado ({result['message']}): {result['deleted_count']} duplicados "
+                  "eliminados antes de detenerse")
+            if result.get('backup_table'):
+                print(f"💾 Backup creado: {result['backup_table']}")
+        elif args.dry_run:
             print(f"🔍 SIMULACRO: Se eliminarían {result['deleted_count']} duplicados")
+            if result.get('merged_count'):
+                print(f"🧩 Se completarían {result['merged_count']} supervivientes")
         else:
             print(f"✅ Eliminados {result['deleted_count']} duplicados")
+            if result.get('merged_count'):
+                print(f"🧩 Supervivientes completados: {result['merged_count']}")
             if result.get('backup_table'):
                 print(f"💾 Backup creado: {result['backup_table']}")
+            if result.get('unique_constraint'):
+                constraint = result['unique_constraint']
+                if constraint['installed']:
+                    print(f"🔒 Restricción única activa: {constraint['index_name']}")
+                else:
+                    print("⚠️  No se pudo instalar la restricción única")
+        
+        if args.verbose and result.get('timings'):
+            timings = ', '.join(f"{phase}={seconds}s" for phase, seconds in result['timings'].items())
+            print(f"⏱️  Tiempos: {timings}")
+        
+        if args.verbose and result.get('throttle'):
+            throttle_metrics = result['throttle']
+            print(f"🐢 Control de ritmo: {throttle_metrics['batches']} lotes, "
+                  f"{throttle_metrics['throttled_batches']} frenados, "
+                  f"{throttle_metrics['slept_seconds']}s en pausa, "
+                  f"lote final {throttle_metrics['batch_size']}")
         
         if args.verbose and not args.dry_run and result['deleted_count'] > 0:
             final_stats = stats_collector.get_table_stats(args.table)
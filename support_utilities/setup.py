@@ -16,10 +16,10 @@ def read_requirements():
             return [line.strip() for line in f if line.strip() and not line.startswith('#')]
     except FileNotFoundError:
         return [
-            "pandas>=1.3.0",
             "sqlalchemy>=1.4.0", 
             "psycopg2-binary>=2.9.0",
             "pymysql>=1.0.0",
+            "numpy>=1.21",
         ]
 
 def read_long_description():
@@ -49,6 +49,7 @@ setup(
         'console_scripts': [
             'repair-duplicates=database_repair.main:main',
             'repair-duplicates-cli=support_utilities.cli:main_cli',
+            'repair-duplicates-watch=support_utilities.watch_cli:main_watch',
         ],
     },
     
@@ -69,6 +70,9 @@ setup(
     },
     
     extras_require={
+        'pandas': ['pandas>=1.3.0'],
+        'arrow': ['pyarrow>=10.0'],
+        'yaml': ['pyyaml>=5.1'],
         'dev': [
             'pytest>=6.0',
             'pytest-cov>=2.0',
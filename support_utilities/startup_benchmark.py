@@ -0,0 +1,56 @@
+"""
+Benchmark de arranque basado en `python -X importtime`
+"""
+import subprocess
+import sys
+import os
+from typing import Any, Dict, List
+
+PROJECT_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+# Escenarios de arranque de procesos cortos (contenedores de trabajos)
+SCENARIOS = {
+    'import database_repair': ['-c', 'import database_repair'],
+    'run_cli.py --help': ['run_cli.py', '--help'],
+    'run_watch.py --help': ['run_watch.py', '--help']
+}
+
+def measure_imports(args: List[str]) -> Dict[str, Any]:
+    """
+    Ejecuta `python -X importtime <args>` desde la raíz del proyecto
+    
+    Returns:
+        Diccionario con el tiempo acumulado por módulo (microsegundos), el
+        total de los imports de primer nivel y el código de salida
+    """
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime'] + args,
+        cwd=PROJECT_ROOT, capture_output=True, text=True
+    )
+    
+    modules = {}
+    total_us = 0
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        modules[name.strip()] = int(cumulative_us)
+        # Los imports de primer nivel llevan un solo espacio de sangría
+        if not name.startswith('  '):
+            total_us += int(cumulative_us)
+    
+    return {"modules": modules, "total_us": total_us, "returncode": completed.returncode}
+
+def main():
+    """Imprime el tiempo de arranque y los imports más costosos de cada escenario"""
+    for scenario, args in SCENARIOS.items():
+        result = measure_imports(args)
+        print(f"\n⏱️  {scenario}: {result['total_us'] / 1000:.1f} ms")
+        
+        slowest = sorted(result['modules'].items(), key=lambda item: item[1], reverse=True)[:10]
+        for name, cumulative_us in slowest:
+            print(f"   {cumulative_us / 1000:8.1f} ms  {name}")
+
+if __name__ == '__main__':
+    main()
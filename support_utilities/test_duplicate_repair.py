@@ -4,15 +4,40 @@ Tests unitarios para el sistema
 import unittest
 import sys
 import os
+import tempfile
+import shutil
+import json
+import io
+import time
+import importlib.util
+import subprocess
+from datetime import datetime
+from decimal import Decimal
 from unittest.mock import Mock, patch, MagicMock
+import numpy as np
 import pandas as pd
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import IntegrityError, OperationalError
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
 
 from database_repair import (
     DatabaseConnector, DuplicateAnalyzer, 
-    DuplicateRemover, StatsCollector, BackupManager
+    DuplicateRemover, StatsCollector, BackupManager,
+    TableCompressor, IndexAdvisor, WatermarkStore, DuplicateWatcher,
+    SchemaReflector, DuplicateGroups, KeyProfiler, CrossShardDetector,
+    ThrottleController, CancellationToken, QueryBuilder, JobRunner,
+    ProgressTracker, TerminalProgressBar, DeletionPlan, DeletionPlanner, IdSet, DedupLoader,
+    KeyFilter
 )
+from database_repair.duplicate_groups import parse_id_list
+from database_repair.key_profiler import HyperLogLog
+from database_repair.key_normalizer import parse_key_column
+from database_repair.survivor_order import parse_survivor_order
+from database_repair.atomic_file import atomic_write
+from database_repair.config import DatabaseConfig
+from database_repair.database_connector import database_phase
+from startup_benchmark import measure_imports
 
 class TestDatabaseConnector(unittest.TestCase):
     """Tests para DatabaseConnector"""
@@ -86,25 +111,32 @@ class TestDuplicateAnalyzer(unittest.TestCase):
         
         self.assertTrue(result.empty)
     
+    def aggregated_query(self, db_type):
+        self.mock_connector.db_type = db_type
+        builder = QueryBuilder(self.mock_connector)
+        locator = {"columns": ['id'], "order_by": ['id'], "key": 'id'}
+        return builder.sql(builder.duplicate_summary('users', ['email'], locator, include_ids=True))
+    
+    def test_adjust_query_for_postgresql(self):
+        """Test lista de ids agregada para PostgreSQL"""
+        query = self.aggregated_query('postgresql')
+        
+        self.assertIn('ARRAY_AGG(users.id ORDER BY users.id)', query)
+        self.assertNotIn('GROUP_CONCAT', query)
+    
     def test_adjust_query_for_mysql(self):
         """Test ajuste de query para MySQL"""
-        self.analyzer.db_type = 'mysql'
-        
-        original_query = "SELECT ARRAY_AGG(id ORDER BY id) FROM table"
-        adjusted_query = self.analyzer._adjust_query_for_db_type(original_query)
+        query = self.aggregated_query('mysql')
         
-        self.assertIn('GROUP_CONCAT(id ORDER BY id)', adjusted_query)
-        self.assertNotIn('ARRAY_AGG', adjusted_query)
+        self.assertIn('GROUP_CONCAT(users.id ORDER BY users.id)', query)
+        self.assertNotIn('ARRAY_AGG', query)
     
     def test_adjust_query_for_sqlite(self):
         """Test ajuste de query para SQLite"""
-        self.analyzer.db_type = 'sqlite'
+        query = self.aggregated_query('sqlite')
         
-        original_query = "SELECT ARRAY_AGG(id ORDER BY id) FROM table"
-        adjusted_query = self.analyzer._adjust_query_for_db_type(original_query)
-        
-        self.assertIn('GROUP_CONCAT(id)', adjusted_query)
-        self.assertNotIn('ARRAY_AGG', adjusted_query)
+        self.assertIn('GROUP_CONCAT(users.id)', query)
+        self.assertNotIn('ARRAY_AGG', query)
 
 class TestDuplicateRemover(unittest.TestCase):
     """Tests para DuplicateRemover"""
@@ -142,6 +174,10 @@ class TestDuplicateRemover(unittest.TestCase):
         # Mock count method
         self.remover._count_records_to_delete = Mock(return_value=5)
         
+        # Sin tablas hijas que reasignar
+        self.remover.fk_remapper = Mock()
+        self.remover.fk_remapper.find_references.return_value = []
+        
         # Test estrategia oldest
         result_oldest = self.remover.remove_duplicates_keep_oldest(
             'users', ['email'], dry_run=True
@@ -154,30 +190,32 @@ class TestDuplicateRemover(unittest.TestCase):
         )
         self.assertEqual(result_newest['strategy'], 'newest')
     
+    def build_delete_sql(self, db_type, keep_strategy):
+        self.mock_connector.db_type = db_type
+        remover = DuplicateRemover(self.mock_connector)
+        query = remover._build_delete_query('users', ['email', 'name'], keep_strategy)
+        return remover.query_builder.sql(query)
+    
     def test_build_delete_query_postgresql(self):
         """Test construcción de query para PostgreSQL"""
-        self.remover.db_type = 'postgresql'
-        
-        query = self.remover._build_delete_query('users', 'email, name', 'MIN')
+        query = self.build_delete_sql('postgresql', 'MIN')
         
         self.assertIn('DELETE FROM users', query)
-        self.assertIn('MIN(id)', query)
-        self.assertIn('GROUP BY email, name', query)
+        self.assertIn('min(users.id)', query)
+        self.assertIn('GROUP BY users.email, users.name', query)
         # PostgreSQL no necesita subconsulta extra
-        self.assertNotIn('SELECT * FROM (', query)
+        self.assertNotIn('SELECT *', query)
     
     def test_build_delete_query_mysql(self):
         """Test construcción de query para MySQL"""
-        self.remover.db_type = 'mysql'
-        
-        query = self.remover._build_delete_query('users', 'email, name', 'MAX')
+        query = self.build_delete_sql('mysql', 'MAX')
         
         self.assertIn('DELETE FROM users', query)
-        self.assertIn('MAX(id)', query) 
-        self.assertIn('GROUP BY email, name', query)
+        self.assertIn('max(users.id)', query) 
+        self.assertIn('GROUP BY users.email, users.name', query)
         # MySQL SI necesita subconsulta extra
-        self.assertIn('SELECT * FROM (', query)
-        self.assertIn(') as temp', query)
+        self.assertIn('SELECT * \nFROM (', query)
+        self.assertIn(') AS temp', query)
 
 class TestBackupManager(unittest.TestCase):
     """Tests para BackupManager"""
@@ -270,6 +308,2111 @@ class TestStatsCollector(unittest.TestCase):
         self.assertEqual(comparison['before'], before_stats)
         self.assertEqual(comparison['after'], after_stats)
 
+class TestTableCompressor(unittest.TestCase):
+    """Tests para TableCompressor (SQLite real en archivo temporal)"""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'test.db')
+    
+    def tearDown(self):
+        self.connector.get_engine().dispose()
+        self.tmp_dir.cleanup()
+    
+    def _create_fragmented_db(self, incremental: bool):
+        """Crea una tabla con la mitad de sus filas eliminadas"""
+        self.connector = DatabaseConnector(f"sqlite:///{self.db_path}", "sqlite")
+        with self.connector.get_engine().connect() as conn:
+            if incremental:
+                conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+            conn.exec_driver_sql("CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT)")
+            conn.exec_driver_sql(
+                "INSERT INTO users (email) "
+                "WITH RECURSIVE r(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM r WHERE x < 2000) "
+                "SELECT hex(randomblob(100)) FROM r"
+            )
+            conn.commit()
+            conn.exec_driver_sql("DELETE FROM users WHERE id > 1000")
+            conn.commit()
+        return TableCompressor(self.connector)
+    
+    def _count_users(self):
+        with self.connector.get_engine().connect() as conn:
+            return conn.exec_driver_sql("SELECT COUNT(*) FROM users").scalar()
+    
+    def test_incremental_vacuum_frees_pages_in_steps(self):
+        """Test vacuum incremental acotado por pasos"""
+        compressor = self._create_fragmented_db(incremental=True)
+        size_before = os.path.getsize(self.db_path)
+        
+        result = compressor.incremental_vacuum(pages_per_step=10, max_steps=2)
+        self.assertEqual(result['steps'], 2)
+        self.assertEqual(result['freed_pages'], 20)
+        
+        result = compressor.incremental_vacuum(pages_per_step=10)
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(result['remaining_free_pages'], 0)
+        self.assertLess(os.path.getsize(self.db_path), size_before)
+        self.assertEqual(self._count_users(), 1000)
+    
+    def test_incremental_vacuum_requires_incremental_mode(self):
+        """Test que se omite si auto_vacuum no es INCREMENTAL"""
+        compressor = self._create_fragmented_db(incremental=False)
+        
+        result = compressor.incremental_vacuum()
+        
+        self.assertEqual(result['status'], 'skipped')
+    
+    def test_vacuum_into_with_swap(self):
+        """Test VACUUM INTO con intercambio atómico del archivo"""
+        compressor = self._create_fragmented_db(incremental=False)
+        
+        result = compressor.vacuum_into()
+        
+        self.assertEqual(result['status'], 'success')
+        self.assertTrue(result['swapped'])
+        self.assertLess(result['size_after'], result['size_before'])
+        self.assertEqual(os.path.getsize(self.db_path), result['size_after'])
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['test.db'])
+        self.assertEqual(self._count_users(), 1000)
+    
+    def test_compress_table_invalid_sqlite_mode(self):
+        """Test modo de compactación inválido"""
+        compressor = self._create_fragmented_db(incremental=False)
+        
+        with self.assertRaises(ValueError):
+            compressor.compress_table('users', sqlite_mode='invalid')
+
+class TestOnlineRebuild(unittest.TestCase):
+    """Tests de reconstrucción online (requiere TEST_POSTGRESQL_URL)"""
+    
+    def test_reindex_concurrently_uses_autocommit(self):
+        """Test REINDEX CONCURRENTLY fuera de transacción"""
+        mock_connector = Mock()
+        mock_engine = MagicMock()
+        mock_connector.get_engine.return_value = mock_engine
+        mock_connector.db_type = 'postgresql'
+        mock_conn = MagicMock()
+        autocommit_engine = mock_engine.execution_options.return_value
+        autocommit_engine.connect.return_value.__enter__.return_value = mock_conn
+        
+        compressor = TableCompressor(mock_connector)
+        
+        self.assertTrue(compressor.reindex_table('users', concurrently=True))
+        mock_engine.execution_options.assert_called_once_with(isolation_level="AUTOCOMMIT")
+        executed_sql = str(mock_conn.execute.call_args[0][0])
+        self.assertIn('REINDEX TABLE CONCURRENTLY users', executed_sql)
+        mock_conn.commit.assert_not_called()
+    
+    @unittest.skipUnless(os.getenv('TEST_POSTGRESQL_URL'), "PostgreSQL no disponible")
+    def test_online_rebuild_preserves_rows_and_sequence(self):
+        """Test reconstrucción online contra un PostgreSQL real"""
+        connector = DatabaseConnector(os.getenv('TEST_POSTGRESQL_URL'), 'postgresql')
+        engine = connector.get_engine()
+        with engine.connect() as conn:
+            conn.exec_driver_sql("DROP TABLE IF EXISTS rebuild_test")
+            conn.exec_driver_sql("CREATE TABLE rebuild_test (id SERIAL PRIMARY KEY, email TEXT)")
+            conn.exec_driver_sql(
+                "INSERT INTO rebuild_test (email) SELECT md5(g::text) FROM generate_series(1, 5000) g"
+            )
+            conn.exec_driver_sql("DELETE FROM rebuild_test WHERE mod(id, 2) = 0")
+            conn.commit()
+        
+        try:
+            result = TableCompressor(connector).online_rebuild_table('rebuild_test', batch_size=1000)
+            
+            self.assertEqual(result['status'], 'success')
+            self.assertEqual(result['rows_copied'], 2500)
+            with engine.connect() as conn:
+                self.assertEqual(conn.exec_driver_sql("SELECT COUNT(*) FROM rebuild_test").scalar(), 2500)
+                conn.exec_driver_sql("INSERT INTO rebuild_test (email) VALUES ('nuevo')")
+                new_id = conn.exec_driver_sql("SELECT MAX(id) FROM rebuild_test").scalar()
+                conn.commit()
+            self.assertEqual(new_id, 5001)
+        finally:
+            with engine.connect() as conn:
+                conn.exec_driver_sql("DROP TABLE IF EXISTS rebuild_test")
+                conn.commit()
+    
+    @unittest.skipUnless(os.getenv('TEST_POSTGRESQL_URL'), "PostgreSQL no disponible")
+    def test_online_rebuild_sparse_ids(self):
+        """Test copia por lotes de clave: ids muy dispersos no generan lotes vacíos"""
+        connector = DatabaseConnector(os.getenv('TEST_POSTGRESQL_URL'), 'postgresql')
+        engine = connector.get_engine()
+        with engine.connect() as conn:
+            conn.exec_driver_sql("DROP TABLE IF EXISTS rebuild_sparse")
+            conn.exec_driver_sql("CREATE TABLE rebuild_sparse (id BIGINT PRIMARY KEY, email TEXT)")
+            conn.exec_driver_sql("INSERT INTO rebuild_sparse VALUES (1, 'a'), (2, 'b'), "
+                                 "(5000000000, 'c'), (9000000000000, 'd'), (9000000000001, 'e')")
+            conn.commit()
+        
+        try:
+            result = TableCompressor(connector).online_rebuild_table('rebuild_sparse', batch_size=2)
+            
+            self.assertEqual(result['status'], 'success')
+            self.assertEqual(result['rows_copied'], 5)
+            with engine.connect() as conn:
+                self.assertEqual(conn.exec_driver_sql("SELECT COUNT(*) FROM rebuild_sparse").scalar(), 5)
+        finally:
+            with engine.connect() as conn:
+                conn.exec_driver_sql("DROP TABLE IF EXISTS rebuild_sparse")
+                conn.commit()
+    
+    @unittest.skipUnless(os.getenv('TEST_POSTGRESQL_URL'), "PostgreSQL no disponible")
+    def test_online_rebuild_rejects_objects_it_would_drop(self):
+        """Test FK salientes, triggers, vistas, permisos y RLS se rechazan antes de copiar"""
+        connector = DatabaseConnector(os.getenv('TEST_POSTGRESQL_URL'), 'postgresql')
+        engine = connector.get_engine()
+        setups = {
+            'claves foráneas salientes': "ALTER TABLE rebuild_objects ADD FOREIGN KEY (org_id) "
+                                         "REFERENCES rebuild_orgs (id)",
+            'triggers': "CREATE TRIGGER rebuild_objects_audit BEFORE UPDATE ON rebuild_objects "
+                        "FOR EACH ROW EXECUTE FUNCTION suppress_redundant_updates_trigger()",
+            'vistas dependientes': "CREATE VIEW rebuild_objects_view AS SELECT id FROM rebuild_objects",
+            'permisos (GRANT)': "GRANT SELECT ON rebuild_objects TO PUBLIC",
+            'seguridad por filas (RLS)': "ALTER TABLE rebuild_objects ENABLE ROW LEVEL SECURITY",
+        }
+        try:
+            for label, setup in setups.items():
+                with engine.connect() as conn:
+                    conn.exec_driver_sql("DROP TABLE IF EXISTS rebuild_objects CASCADE")
+                    conn.exec_driver_sql("DROP TABLE IF EXISTS rebuild_orgs")
+                    conn.exec_driver_sql("CREATE TABLE rebuild_orgs (id INT PRIMARY KEY)")
+                    conn.exec_driver_sql("INSERT INTO rebuild_orgs VALUES (1)")
+                    conn.exec_driver_sql("CREATE TABLE rebuild_objects "
+                                         "(id SERIAL PRIMARY KEY, org_id INT)")
+                    conn.exec_driver_sql("INSERT INTO rebuild_objects (org_id) VALUES (1), (1)")
+                    conn.exec_driver_sql(setup)
+                    conn.commit()
+                
+                result = TableCompressor(connector).online_rebuild_table('rebuild_objects')
+                
+                self.assertEqual(result['status'], 'error', label)
+                self.assertIn(label, result['message'])
+                with engine.connect() as conn:
+                    self.assertIsNone(conn.exec_driver_sql(
+                        "SELECT to_regclass('rebuild_objects_shadow')"
+                    ).scalar())
+                    self.assertEqual(conn.exec_driver_sql(
+                        "SELECT COUNT(*) FROM rebuild_objects"
+                    ).scalar(), 2)
+        finally:
+            with engine.connect() as conn:
+                conn.exec_driver_sql("DROP TABLE IF EXISTS rebuild_objects CASCADE")
+                conn.exec_driver_sql("DROP TABLE IF EXISTS rebuild_orgs")
+                conn.commit()
+
+class SQLiteTestCase(unittest.TestCase):
+    """Base para tests contra una base SQLite real en un directorio temporal"""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.db_path = os.path.join(self.tmp_dir.name, 'test.db')
+        self.connector = DatabaseConnector(f"sqlite:///{self.db_path}", "sqlite")
+        self.engine = self.connector.get_engine()
+        
+        cache_patcher = patch.object(DatabaseConfig, 'SCHEMA_CACHE_FILE',
+                                     os.path.join(self.tmp_dir.name, 'schema.json'))
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+    
+    def tearDown(self):
+        self.engine.dispose()
+        self.tmp_dir.cleanup()
+    
+    def create_users_table(self, rows):
+        """Crea la tabla users con las filas (email, nombre) dadas"""
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql(
+                "CREATE TABLE users (id INTEGER PRIMARY KEY, email TEXT, nombre TEXT)"
+            )
+            conn.exec_driver_sql("INSERT INTO users (email, nombre) VALUES (?, ?)", rows)
+            conn.commit()
+    
+    def insert_users(self, emails):
+        """Inserta filas nuevas en users con los emails dados"""
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("INSERT INTO users (email, nombre) VALUES (?, 'X')",
+                                 [(email,) for email in emails])
+            conn.commit()
+    
+    def fetch_ids(self, table_name='users'):
+        with self.engine.connect() as conn:
+            return [row[0] for row in conn.exec_driver_sql(f"SELECT id FROM {table_name} ORDER BY id")]
+
+class TestIndexAdvisor(SQLiteTestCase):
+    """Tests para IndexAdvisor"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_users_table([
+            ('a@test.com', 'Ana'), ('a@test.com', 'Ana'), ('b@test.com', 'Beto'),
+            ('b@test.com', 'Beto'), ('b@test.com', 'Beto'), ('c@test.com', 'Caro')
+        ])
+        self.advisor = IndexAdvisor(self.connector)
+    
+    def test_find_supporting_index(self):
+        """Test detección de índice con las columnas al inicio"""
+        self.assertIsNone(self.advisor.find_supporting_index('users', ['email']))
+        
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("CREATE INDEX ix_users_nombre_email ON users (nombre, email, id)")
+            conn.commit()
+        
+        index = self.advisor.find_supporting_index('users', ['email', 'nombre'])
+        self.assertEqual(index['name'], 'ix_users_nombre_email')
+        self.assertTrue(index['covering'])
+        self.assertIsNone(self.advisor.find_supporting_index('users', ['email']))
+    
+    def test_estimate_benefit_small_table_not_recommended(self):
+        """Test que no se recomienda índice para tablas pequeñas"""
+        estimate = self.advisor.estimate_benefit('users', ['email'])
+        
+        self.assertEqual(estimate['estimated_rows'], 6)
+        self.assertFalse(estimate['recommended'])
+    
+    def test_remover_with_temporary_index(self):
+        """Test ejecución con índice temporal creado y eliminado"""
+        remover = DuplicateRemover(self.connector)
+        
+        with patch('database_repair.index_advisor.DatabaseConfig.TEMP_INDEX_MIN_ROWS', 1):
+            result = remover.remove_duplicates_keep_oldest('users', ['email'], dry_run=True,
+                                                           use_temp_index=True)
+        
+        self.assertEqual(result['deleted_count'], 3)
+        self.assertTrue(result['temporary_index']['created'])
+        self.assertIn('index_build', result['timings'])
+        self.assertIn('total', result['timings'])
+        self.assertIsNone(self.advisor.find_supporting_index('users', ['email']))
+
+class TestUniqueConstraintInstaller(SQLiteTestCase):
+    """Tests para la instalación de la restricción única post-reparación"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_users_table([
+            ('a@test.com', 'Ana'), ('a@test.com', 'Ana'), ('b@test.com', 'Beto')
+        ])
+        self.remover = DuplicateRemover(self.connector)
+    
+    def _insert_user(self, email):
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("INSERT INTO users (email, nombre) VALUES (?, 'X')", (email,))
+            conn.commit()
+    
+    def test_remove_with_enforce_unique(self):
+        """Test que la restricción queda instalada y bloquea nuevos duplicados"""
+        with patch.object(self.remover.backup_manager, 'create_backup', return_value='users_backup'):
+            result = self.remover.remove_duplicates_keep_oldest('users', ['email'], dry_run=False,
+                                                                enforce_unique=True)
+        
+        self.assertEqual(result['deleted_count'], 1)
+        self.assertTrue(result['unique_constraint']['installed'])
+        self.assertEqual(result['unique_constraint']['attempts'], 1)
+        with self.assertRaises(IntegrityError):
+            self._insert_user('a@test.com')
+    
+    def test_install_retries_after_new_duplicates(self):
+        """Test que se depura el delta de duplicados nuevos y se reintenta"""
+        self.remover._execute_deletion(self.remover._build_delete_query('users', ['email'], 'MIN'))
+        since_id = self.remover._get_max_id('users')
+        # Duplicados que llegan durante la construcción del índice
+        self._insert_user('a@test.com')
+        self._insert_user('c@test.com')
+        self._insert_user('c@test.com')
+        
+        result = self.remover._install_unique_constraint('users', ['email'], 'MIN', since_id)
+        
+        self.assertTrue(result['installed'])
+        self.assertEqual(result['attempts'], 2)
+        self.assertEqual(result['delta_deleted'], 2)
+        self.assertEqual(self.fetch_ids(), [1, 3, 5])
+    
+    def test_delete_duplicates_since_keep_newest(self):
+        """Test que con 'newest' la fila antigua es la víctima"""
+        since_id = self.remover._get_max_id('users')
+        self._insert_user('b@test.com')
+        
+        deleted = self.remover._delete_duplicates_since('users', ['email'], 'MAX', since_id)
+        
+        # El par a@test.com anterior al límite no se toca
+        self.assertEqual(deleted, 1)
+        self.assertEqual(self.fetch_ids(), [1, 2, 4])
+
+class TestIncrementalRemoval(SQLiteTestCase):
+    """Tests para la eliminación incremental por marca de agua"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_users_table([
+            ('a@test.com', 'Ana'), ('a@test.com', 'Ana'), ('b@test.com', 'Beto')
+        ])
+        self.remover = DuplicateRemover(self.connector)
+        self.remover.watermark_store = WatermarkStore(os.path.join(self.tmp_dir.name, 'wm.json'))
+    
+    def test_first_run_is_full_then_incremental(self):
+        """Test primera ejecución completa y luego solo filas nuevas"""
+        first = self.remover.remove_duplicates_incremental('users', ['email'], dry_run=False)
+        self.assertFalse(first['incremental'])
+        self.assertEqual(first['deleted_count'], 1)
+        self.assertEqual(first['watermark_to'], 3)
+        
+        self.insert_users(['a@test.com', 'c@test.com', 'c@test.com'])
+        
+        dry = self.remover.remove_duplicates_incremental('users', ['email'], dry_run=True)
+        self.assertEqual(dry['deleted_count'], 2)
+        
+        second = self.remover.remove_duplicates_incremental('users', ['email'], dry_run=False)
+        self.assertTrue(second['incremental'])
+        self.assertEqual(second['watermark_from'], 3)
+        self.assertEqual(second['watermark_to'], 6)
+        self.assertEqual(second['deleted_count'], 2)
+        self.assertEqual(self.fetch_ids(), [1, 3, 5])
+        # Solo las víctimas quedan respaldadas
+        self.assertEqual(self.fetch_ids(second['backup_table']), [4, 6])
+        
+        third = self.remover.remove_duplicates_incremental('users', ['email'], dry_run=False)
+        self.assertEqual(third['message'], "No hay filas nuevas")
+    
+    def test_first_run_honors_backup_and_max_new_rows(self):
+        """Test sin marca de agua: backup=False no respalda y max_new_rows recorre por tramos"""
+        self.insert_users(['a@test.com', 'c@test.com', 'c@test.com'])
+        
+        with patch.object(self.remover.backup_manager, 'create_backup') as mock_backup:
+            chunks = []
+            for _ in range(3):
+                result = self.remover.remove_duplicates_incremental(
+                    'users', ['email'], dry_run=False, max_new_rows=2, backup=False
+                )
+                self.assertTrue(result['incremental'])
+                chunks.append((result['watermark_from'], result['watermark_to'],
+                               result['deleted_count']))
+            mock_backup.assert_not_called()
+        
+        self.assertEqual(chunks, [(1, 3, 1), (3, 5, 1), (5, 6, 1)])
+        self.assertEqual(self.fetch_ids(), [1, 3, 5])
+    
+    def test_full_pass_without_backup(self):
+        """Test la pasada completa sin marca de agua respeta backup=False"""
+        with patch.object(self.remover.backup_manager, 'create_backup') as mock_backup:
+            result = self.remover.remove_duplicates_incremental('users', ['email'], dry_run=False,
+                                                                backup=False)
+        mock_backup.assert_not_called()
+        self.assertFalse(result['incremental'])
+        self.assertIsNone(result['backup_table'])
+        self.assertEqual(self.fetch_ids(), [1, 3])
+    
+    def test_incremental_keep_newest_removes_old_rows(self):
+        """Test que con 'newest' una fila nueva desplaza a la antigua"""
+        self.remover.remove_duplicates_incremental('users', ['email'], 'newest', dry_run=False)
+        self.insert_users(['b@test.com'])
+        
+        result = self.remover.remove_duplicates_incremental('users', ['email'], 'newest',
+                                                            dry_run=False)
+        
+        self.assertEqual(result['deleted_count'], 1)
+        self.assertEqual(self.fetch_ids(), [2, 4])
+    
+    def test_watermark_key_ignores_column_order(self):
+        """Test clave de marca de agua independiente del orden de columnas"""
+        self.assertEqual(
+            WatermarkStore.make_key('db', 'users', ['email', 'nombre']),
+            WatermarkStore.make_key('db', 'users', ['nombre', 'email'])
+        )
+
+class TestSchemaReflector(SQLiteTestCase):
+    """Tests para la reflexión de esquema y el localizador de filas"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_users_table([('a@test.com', 'Ana')])
+        self.reflector = SchemaReflector(self.connector)
+    
+    def create_events_table(self, without_rowid=False):
+        """Tabla con PK compuesta (tenant, seq) y eventos duplicados por payload"""
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql(
+                "CREATE TABLE events (tenant TEXT, seq INTEGER, payload TEXT, "
+                "PRIMARY KEY (tenant, seq))" + (" WITHOUT ROWID" if without_rowid else "")
+            )
+            conn.exec_driver_sql("INSERT INTO events VALUES (?, ?, ?)", [
+                ('b', 1, 'x'), ('a', 2, 'x'), ('a', 1, 'y'), ('a', 3, 'y'), ('c', 1, 'z')
+            ])
+            conn.commit()
+    
+    def fetch_events(self):
+        with self.engine.connect() as conn:
+            return [tuple(row) for row in conn.exec_driver_sql(
+                "SELECT tenant, seq FROM events ORDER BY tenant, seq"
+            )]
+    
+    def test_reflect_uses_cache_until_schema_changes(self):
+        """Test que la caché se reutiliza y se invalida con DDL"""
+        schema = self.reflector.reflect('users')
+        self.assertEqual(schema['primary_key'], ['id'])
+        self.assertTrue(schema['rowid_alias'])
+        self.assertTrue(os.path.exists(DatabaseConfig.SCHEMA_CACHE_FILE))
+        
+        with patch.object(self.reflector, '_reflect_table') as mock_reflect:
+            self.reflector.reflect('users')
+            mock_reflect.assert_not_called()
+        
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("CREATE INDEX ix_users_email ON users (email)")
+            conn.commit()
+        
+        schema = self.reflector.reflect('users')
+        self.assertIn('ix_users_email', [index['name'] for index in schema['indexes']])
+        
+        self.reflector.invalidate('users')
+        with patch.object(self.reflector, '_reflect_table', return_value=schema) as mock_reflect:
+            self.reflector.reflect('users')
+            mock_reflect.assert_called_once()
+    
+    def test_row_locator_auto(self):
+        """Test elección de localizador según la PK"""
+        self.create_events_table()
+        
+        users = self.reflector.get_row_locator('users')
+        self.assertEqual(users['kind'], 'primary_key')
+        self.assertEqual(users['columns'], ['id'])
+        
+        events = self.reflector.get_row_locator('events')
+        self.assertEqual(events['kind'], 'physical')
+        self.assertEqual(events['columns'], ['rowid'])
+        self.assertEqual(events['order_by'], ['tenant', 'seq'])
+        self.assertIsNone(events['key'])
+        
+        pk_only = self.reflector.get_row_locator('events', mode='primary_key')
+        self.assertEqual(pk_only['columns'], ['tenant', 'seq'])
+    
+    def test_fallback_to_id_when_reflection_fails(self):
+        """Test que sin reflexión se mantiene el comportamiento con columna id"""
+        mock_connector = Mock()
+        mock_connector.db_type = 'postgresql'
+        reflector = SchemaReflector(mock_connector)
+        
+        locator = reflector.get_row_locator('users')
+        
+        self.assertEqual(locator['columns'], ['id'])
+        self.assertFalse(locator['reflected'])
+    
+    def test_remove_duplicates_composite_primary_key(self):
+        """Test eliminación con PK compuesta por rowid y por tupla de PK"""
+        for without_rowid in (False, True):
+            with self.subTest(without_rowid=without_rowid):
+                self.create_events_table(without_rowid)
+                remover = DuplicateRemover(self.connector)
+                
+                dry = remover.remove_duplicates_keep_oldest('events', ['payload'], dry_run=True)
+                self.assertEqual(dry['deleted_count'], 2)
+                
+                with patch.object(remover.backup_manager, 'create_backup', return_value=None):
+                    result = remover.remove_duplicates_keep_oldest('events', ['payload'],
+                                                                   dry_run=False)
+                
+                self.assertEqual(result['row_locator'], 'primary_key' if without_rowid else 'physical')
+                self.assertEqual(self.fetch_events(), [('a', 1), ('a', 2), ('c', 1)])
+                
+                with self.assertRaises(ValueError):
+                    remover.remove_duplicates_incremental('events', ['payload'])
+                
+                with self.engine.connect() as conn:
+                    conn.exec_driver_sql("DROP TABLE events")
+                    conn.commit()
+
+class TestDuplicateGroups(SQLiteTestCase):
+    """Tests para el resultado compacto del análisis"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_users_table([
+            ('a@test.com', 'Ana'), ('b@test.com', 'Beto'), ('a@test.com', 'Ana'),
+            ('b@test.com', 'Beto'), ('b@test.com', 'Beto'), ('c@test.com', 'Caro')
+        ])
+        self.analyzer = DuplicateAnalyzer(self.connector)
+    
+    def test_parse_id_list(self):
+        """Test normalización de los formatos de ids de cada BD"""
+        self.assertEqual(parse_id_list([3, 1]), [3, 1])
+        self.assertEqual(parse_id_list('{1,2}'), [1, 2])
+        self.assertEqual(parse_id_list('5,4'), [5, 4])
+        self.assertEqual(parse_id_list('{"(0,1)","(0,2)"}'), ['(0,1)', '(0,2)'])
+        self.assertEqual(parse_id_list(None), [])
+    
+    def test_compact_groups(self):
+        """Test grupos en arreglos contiguos ordenados por tamaño"""
+        groups = self.analyzer.analyze_duplicates('users', ['email'], as_frame=False)
+        
+        self.assertIsInstance(groups, DuplicateGroups)
+        self.assertEqual(len(groups), 2)
+        self.assertEqual(groups.key(0), ('b@test.com',))
+        self.assertEqual(groups.key_values, [['b@test.com', 'a@test.com']])
+        self.assertEqual(list(groups.counts), [3, 2])
+        self.assertEqual(list(groups.offsets), [0, 3, 5])
+        self.assertEqual(list(groups.group_ids(0)), [2, 4, 5])
+        self.assertEqual(groups.total_duplicates, 3)
+        self.assertEqual(groups.nbytes, 5 * 8 + 5 * 8)
+        self.assertEqual(groups.group(1)['min_id'], 1)
+    
+    def test_groups_arrive_in_final_order(self):
+        """Test la consulta entrega los grupos por tamaño y luego clave, sin reordenar en memoria"""
+        self.insert_users(['c@test.com'])
+        
+        groups = self.analyzer.analyze_duplicates('users', ['email'], as_frame=False)
+        
+        self.assertEqual(groups.key_values, [['b@test.com', 'a@test.com', 'c@test.com']])
+        self.assertEqual(list(groups.counts), [3, 2, 2])
+        self.assertEqual(list(groups.group_ids(2)), [6, 7])
+    
+    def test_to_pandas_matches_frame_result(self):
+        """Test que to_pandas() coincide con el resultado DataFrame"""
+        frame = self.analyzer.analyze_duplicates('users', ['email'], as_frame=True)
+        groups = self.analyzer.analyze_duplicates('users', ['email'], as_frame=False)
+        
+        converted = groups.to_pandas()
+        self.assertEqual(list(converted['all_ids']), list(frame['all_ids']))
+        self.assertEqual(list(converted['min_id']), list(frame['min_id']))
+        self.assertEqual(list(converted['duplicate_count']), list(frame['duplicate_count']))
+    
+    @unittest.skipUnless(importlib.util.find_spec('pyarrow'), "pyarrow no instalado")
+    def test_to_arrow(self):
+        """Test conversión a Arrow con listas de ids"""
+        groups = self.analyzer.analyze_duplicates('users', ['email'], as_frame=False)
+        table = groups.to_arrow()
+        
+        self.assertEqual(table.column('email').to_pylist(), ['b@test.com', 'a@test.com'])
+        self.assertEqual(table.column('all_ids').to_pylist(), [[2, 4, 5], [1, 3]])
+        # La tabla no fija los buffers: el objeto sigue admitiendo grupos
+        groups.append(('c@test.com',), [7, 6])
+        self.assertEqual(list(groups.group_ids(2)), [6, 7])
+        self.assertEqual(table.column('all_ids').to_pylist(), [[2, 4, 5], [1, 3]])
+    
+    def test_remover_does_not_need_pandas(self):
+        """Test que la eliminación no usa pandas"""
+        remover = DuplicateRemover(self.connector)
+        
+        with patch('database_repair.duplicate_analyzer.pd') as mock_pd:
+            mock_pd.read_sql.side_effect = AssertionError("pandas no debe usarse")
+            result = remover.remove_duplicates_keep_oldest('users', ['email'], dry_run=True)
+        
+        self.assertEqual(result['deleted_count'], 3)
+    
+    def test_default_without_pandas_returns_groups(self):
+        """Test que sin pandas instalado el análisis retorna DuplicateGroups"""
+        with patch('database_repair.duplicate_analyzer.is_available', return_value=False):
+            result = self.analyzer.analyze_duplicates('users', ['email'])
+        
+        self.assertIsInstance(result, DuplicateGroups)
+
+class TestPaginatedIds(SQLiteTestCase):
+    """Tests para resúmenes por grupo e ids paginados"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_users_table([
+            ('a@test.com', 'Ana'), ('b@test.com', 'Beto'), ('a@test.com', 'Ana'),
+            ('b@test.com', 'Beto'), ('b@test.com', 'Beto'), (None, 'Nadie'), (None, 'Nadie')
+        ])
+        self.analyzer = DuplicateAnalyzer(self.connector)
+    
+    def test_summaries_without_ids(self):
+        """Test resúmenes por grupo sin agregar ids"""
+        summaries = list(self.analyzer.iter_duplicate_summaries('users', ['email']))
+        
+        self.assertEqual(summaries[0], {'email': 'b@test.com', 'duplicate_count': 3,
+                                        'min_id': 2, 'max_id': 5})
+        self.assertEqual(len(summaries), 3)
+        self.assertNotIn('all_ids', summaries[0])
+    
+    def test_group_ids_keyset_pages(self):
+        """Test ids de un grupo en páginas acotadas"""
+        pages = list(self.analyzer.iter_group_ids('users', ['email'], ('b@test.com',), page_size=2))
+        self.assertEqual(pages, [[2, 4], [5]])
+        
+        pages = list(self.analyzer.iter_group_ids('users', ['email'], (None,), page_size=2))
+        self.assertEqual(pages, [[6, 7]])
+    
+    def test_groups_without_aggregated_ids(self):
+        """Test que DuplicateGroups no depende de GROUP_CONCAT"""
+        with patch.object(self.analyzer.query_builder, 'duplicate_summary',
+                          side_effect=AssertionError("no debe agregar ids")):
+            groups = self.analyzer.analyze_duplicates('users', ['email'], as_frame=False)
+        
+        self.assertEqual(list(groups.counts), [3, 2, 2])
+        self.assertEqual([list(groups.group_ids(index)) for index in range(3)],
+                         [[2, 4, 5], [6, 7], [1, 3]])
+    
+    def test_summary_only_groups(self):
+        """Test análisis solo con resúmenes (usado por el eliminador)"""
+        groups = self.analyzer.analyze_duplicates('users', ['email'], as_frame=False,
+                                                  include_ids=False)
+        
+        self.assertEqual(list(groups.counts), [3, 2, 2])
+        self.assertEqual(len(groups.ids), 0)
+        self.assertEqual(groups.total_duplicates, 4)
+
+class TestKeyProfiler(SQLiteTestCase):
+    """Tests para el perfilado de claves candidatas"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_users_table([
+            ('a@test.com', 'Ana'), ('a@test.com', 'Ana'), ('a@test.com', 'Otra'),
+            ('b@test.com', 'Beto'), ('b@test.com', 'Beto'), ('c@test.com', 'Beto')
+        ])
+        self.profiler = KeyProfiler(self.connector)
+    
+    def test_stream_profile_all_candidates(self):
+        """Test métricas exactas de varias candidatas en una pasada"""
+        result = self.profiler.profile('users', [['email'], ['email', 'nombre'],
+                                                 ['nombre'], ['nombre', 'email']])
+        
+        self.assertEqual(result['method'], 'stream')
+        self.assertEqual(result['total_rows'], 6)
+        by_email, by_pair, by_name = result['candidates']
+        
+        self.assertEqual(by_email['distinct_keys'], 3)
+        self.assertEqual(by_email['duplicate_rows'], 3)
+        self.assertEqual(by_email['duplicate_ratio'], 0.5)
+        self.assertEqual(by_email['max_group_size'], 3)
+        self.assertEqual(by_email['group_size_distribution']['1'], 1)
+        self.assertEqual(by_email['group_size_distribution']['3-5'], 1)
+        self.assertEqual(by_pair['duplicate_groups'], 2)
+        self.assertEqual(by_pair['duplicate_rows'], 2)
+        self.assertEqual(by_name['columns'], ['nombre'])
+        self.assertEqual(by_name['distinct_keys'], 3)
+    
+    def test_falls_back_to_hyperloglog(self):
+        """Test estimación aproximada al superar el límite de claves exactas"""
+        result = self.profiler.profile('users', [['email'], ['id']], exact_max_keys=3)
+        by_email, by_id = result['candidates']
+        
+        self.assertTrue(by_email['exact'])
+        self.assertFalse(by_id['exact'])
+        self.assertIsNone(by_id['group_size_distribution'])
+        self.assertEqual(by_id['distinct_keys'], 6)
+    
+    def test_hyperloglog_estimate(self):
+        """Test error de HyperLogLog dentro de lo esperado"""
+        sketch = HyperLogLog(precision=12)
+        for value in range(50000):
+            sketch.add_hash(self.profiler._hash_key((value,)))
+        
+        self.assertAlmostEqual(sketch.estimate(), 50000, delta=50000 * 0.05)
+    
+    def test_invalid_method(self):
+        """Test método de perfilado no soportado"""
+        with self.assertRaises(ValueError):
+            self.profiler.profile('users', [['email']], method='sample')
+    
+    @unittest.skipUnless(os.getenv('TEST_POSTGRESQL_URL'), "PostgreSQL no disponible")
+    def test_grouping_sets_matches_stream(self):
+        """Test GROUPING SETS en PostgreSQL coincide con la pasada en streaming"""
+        connector = DatabaseConnector(os.getenv('TEST_POSTGRESQL_URL'), 'postgresql')
+        engine = connector.get_engine()
+        with engine.connect() as conn:
+            conn.exec_driver_sql("DROP TABLE IF EXISTS profile_test")
+            conn.exec_driver_sql("CREATE TABLE profile_test (id SERIAL PRIMARY KEY, a INT, b TEXT)")
+            conn.exec_driver_sql(
+                "INSERT INTO profile_test (a, b) SELECT mod(g, 7), md5(mod(g, 3)::text) "
+                "FROM generate_series(1, 1000) g"
+            )
+            conn.commit()
+        
+        try:
+            profiler = KeyProfiler(connector)
+            candidates = [['a'], ['b'], ['a', 'b'], ['id']]
+            grouped = profiler.profile('profile_test', candidates)
+            streamed = profiler.profile('profile_test', candidates, method='stream')
+            
+            self.assertEqual(grouped['method'], 'grouping_sets')
+            self.assertEqual(grouped['total_rows'], 1000)
+            self.assertEqual(grouped['candidates'], streamed['candidates'])
+        finally:
+            with engine.connect() as conn:
+                conn.exec_driver_sql("DROP TABLE IF EXISTS profile_test")
+                conn.commit()
+            engine.dispose()
+
+class TestCrossShardDetector(unittest.TestCase):
+    """Tests de duplicados entre shards (archivos SQLite como shards)"""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        cache_patcher = patch.object(DatabaseConfig, 'SCHEMA_CACHE_FILE',
+                                     os.path.join(self.tmp_dir.name, 'schema.json'))
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+        
+        self.connectors = {}
+        for name, emails in [('eu', ['a', 'b', 'c', 'c']), ('us', ['b', 'd', 'e']),
+                             ('apac', ['a', 'b', 'f'])]:
+            connector = DatabaseConnector(
+                f"sqlite:///{os.path.join(self.tmp_dir.name, name + '.db')}", 'sqlite'
+            )
+            with connector.get_engine().connect() as conn:
+                conn.exec_driver_sql("CREATE TABLE customers (id INTEGER PRIMARY KEY, email TEXT)")
+                conn.exec_driver_sql("INSERT INTO customers (email) VALUES (?)",
+                                     [(email,) for email in emails])
+                conn.commit()
+            self.connectors[name] = connector
+        
+        self.shards = [{'name': name, 'connector': connector, 'table': 'customers'}
+                       for name, connector in self.connectors.items()]
+    
+    def tearDown(self):
+        for connector in self.connectors.values():
+            connector.get_engine().dispose()
+        self.tmp_dir.cleanup()
+    
+    def fetch_emails(self, name):
+        with self.connectors[name].get_engine().connect() as conn:
+            return [row[0] for row in conn.exec_driver_sql("SELECT email FROM customers ORDER BY id")]
+    
+    def test_find_cross_shard_duplicates(self):
+        """Test reporte sin modificar los shards"""
+        report = CrossShardDetector(self.shards, partitions=4).find_duplicates(['email'])
+        
+        self.assertEqual(report['cross_shard_groups'], 2)
+        self.assertEqual(report['rows_to_delete'], {'eu': 0, 'us': 1, 'apac': 2})
+        self.assertEqual([shard['rows_scanned'] for shard in report['shards']], [4, 3, 3])
+        self.assertEqual(self.fetch_emails('apac'), ['a', 'b', 'f'])
+        
+        sample = {group['key']['email']: group for group in report['sample']}
+        self.assertEqual(sample['b']['keep'], 'eu')
+        self.assertEqual(sample['b']['rows'], {'eu': [2], 'us': [1], 'apac': [2]})
+    
+    def test_partition_count_does_not_change_result(self):
+        """Test mismo resultado con una o muchas particiones"""
+        single = CrossShardDetector(self.shards, partitions=1).find_duplicates(['email'])
+        many = CrossShardDetector(self.shards, partitions=16).find_duplicates(['email'])
+        
+        self.assertEqual(single['rows_to_delete'], many['rows_to_delete'])
+        self.assertEqual(single['cross_shard_groups'], many['cross_shard_groups'])
+    
+    def test_remove_with_precedence(self):
+        """Test eliminación según precedencia de shards"""
+        detector = CrossShardDetector(self.shards, partitions=4)
+        result = detector.remove_duplicates(['email'], precedence=['apac'], dry_run=False)
+        
+        self.assertEqual(result['deleted'], {'eu': 2, 'us': 1})
+        self.assertEqual(self.fetch_emails('apac'), ['a', 'b', 'f'])
+        # Los duplicados internos de un shard no se tocan
+        self.assertEqual(self.fetch_emails('eu'), ['c', 'c'])
+        self.assertEqual(self.fetch_emails('us'), ['d', 'e'])
+        self.assertEqual(set(result['backup_tables']), {'eu', 'us'})
+    
+    def test_victims_revalidated_before_delete(self):
+        """Test que no se borra una víctima si su ganador desapareció o si cambió de clave"""
+        detector = CrossShardDetector(self.shards, partitions=4)
+        join_partitions = detector._join_partitions
+        
+        def join_then_change(*args):
+            summary = join_partitions(*args)
+            # Tras la lectura: 'a' desaparece del ganador (eu) y la 'b' de apac cambia
+            for name, statement in (('eu', "DELETE FROM customers WHERE email = 'a'"),
+                                    ('apac', "UPDATE customers SET email = 'z' WHERE id = 2")):
+                with self.connectors[name].get_engine().connect() as conn:
+                    conn.exec_driver_sql(statement)
+                    conn.commit()
+            return summary
+        
+        with patch.object(detector, '_join_partitions', side_effect=join_then_change):
+            result = detector.remove_duplicates(['email'], dry_run=False, backup=False)
+        
+        self.assertEqual(result['rows_to_delete'], {'eu': 0, 'us': 1, 'apac': 2})
+        self.assertEqual(result['deleted'], {'us': 1, 'apac': 0})
+        self.assertEqual(self.fetch_emails('apac'), ['a', 'z', 'f'])
+        self.assertEqual(self.fetch_emails('us'), ['d', 'e'])
+    
+    def test_unknown_shard_in_precedence(self):
+        """Test precedencia con un shard inexistente"""
+        with self.assertRaises(ValueError):
+            CrossShardDetector(self.shards).find_duplicates(['email'], precedence=['mx'])
+
+class TestThrottleController(SQLiteTestCase):
+    """Tests para el control adaptativo de lotes"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_users_table([
+            ('a@test.com', 'Ana'), ('b@test.com', 'Beto'), ('a@test.com', 'Ana'),
+            ('b@test.com', 'Beto'), ('b@test.com', 'Beto'), ('c@test.com', 'Caro')
+        ])
+    
+    def make_controller(self, **kwargs):
+        options = dict(target_latency=0.1, initial_batch_size=400, min_batch_size=100,
+                       max_batch_size=1000, max_sleep=2.0)
+        options.update(kwargs)
+        return ThrottleController(self.connector, **options)
+    
+    def test_backoff_on_slow_batch(self):
+        """Test lote a la mitad y pausa al superar la latencia objetivo"""
+        controller = self.make_controller()
+        decision = controller.record(0.5, 400)
+        
+        self.assertEqual(decision['action'], 'backoff')
+        self.assertEqual(decision['reasons'], ['latency'])
+        self.assertEqual(controller.batch_size, 200)
+        self.assertEqual(controller.sleep, DatabaseConfig.THROTTLE_MIN_SLEEP)
+        
+        controller.record(0.5, 200)
+        controller.record(0.5, 100)
+        self.assertEqual(controller.batch_size, 100)
+    
+    def test_increase_when_fast(self):
+        """Test aumento del lote y reducción de la pausa con holgura"""
+        controller = self.make_controller()
+        controller.sleep = 1.0
+        decision = controller.record(0.01, 400)
+        
+        self.assertEqual(decision['action'], 'increase')
+        self.assertEqual(controller.batch_size, 500)
+        self.assertEqual(controller.sleep, 0.5)
+    
+    def test_replica_lag_extends_sleep(self):
+        """Test pausa proporcional al exceso de retraso de réplica"""
+        controller = self.make_controller(max_replica_lag=5.0)
+        with patch.object(controller, '_probe_replica_lag', return_value=6.5):
+            decision = controller.record(0.01, 400)
+        
+        self.assertEqual(decision['reasons'], ['replica_lag'])
+        self.assertEqual(controller.sleep, 1.5)
+        self.assertEqual(controller.metrics()['throttled_batches'], 1)
+    
+    def test_throttled_removal_and_backup(self):
+        """Test backup y eliminación por lotes con el controlador"""
+        controller = self.make_controller(initial_batch_size=2, min_batch_size=1, max_batch_size=2,
+                                          target_latency=60)
+        remover = DuplicateRemover(self.connector)
+        
+        with patch('database_repair.throttle_controller.time.sleep'):
+            result = remover.remove_duplicates_keep_oldest('users', ['email'], dry_run=False,
+                                                           throttle=controller)
+        
+        self.assertEqual(result['deleted_count'], 3)
+        self.assertEqual(self.fetch_ids(), [1, 2, 6])
+        self.assertEqual(self.fetch_ids(result['backup_table']), [1, 2, 3, 4, 5, 6])
+        # 3 lotes de backup (2+2+2) y 2 de eliminación (2+1)
+        self.assertEqual(result['throttle']['batches'], 5)
+        self.assertEqual(result['throttle']['rows'], 9)
+        self.assertEqual(len(result['throttle']['decisions']), 5)
+    
+    def test_throttled_batches_revalidate_survivor(self):
+        """Test que un lote no borra la última copia si el superviviente desapareció entre lotes"""
+        controller = self.make_controller(initial_batch_size=1, min_batch_size=1, max_batch_size=1,
+                                          target_latency=60)
+        remover = DuplicateRemover(self.connector)
+        delete_batch = remover._delete_locator_batch
+        calls = []
+        
+        def delete_then_drop_survivor(*args):
+            deleted = delete_batch(*args)
+            calls.append(deleted)
+            if len(calls) == 1:
+                # Otro proceso borra el superviviente de b@test.com (id 2)
+                with self.engine.connect() as conn:
+                    conn.exec_driver_sql("DELETE FROM users WHERE id = 2")
+                    conn.commit()
+            return deleted
+        
+        with patch.object(remover, '_delete_locator_batch', side_effect=delete_then_drop_survivor), \
+                patch('database_repair.throttle_controller.time.sleep'):
+            result = remover.remove_duplicates_keep_oldest('users', ['email'], dry_run=False,
+                                                           throttle=controller)
+        
+        # Víctimas 3, 4, 5: el 4 aún tenía copia (5), el 5 ya era la última
+        self.assertEqual(calls, [1, 1, 0])
+        self.assertEqual(result['deleted_count'], 2)
+        self.assertEqual(self.fetch_ids(), [1, 5, 6])
+    
+    def test_throttled_batches_use_composite_primary_key(self):
+        """Test lotes por la PK compuesta (no por rowid) con revalidación"""
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("CREATE TABLE pairs (a INTEGER, b INTEGER, email TEXT, "
+                                 "PRIMARY KEY (a, b)) WITHOUT ROWID")
+            conn.exec_driver_sql("INSERT INTO pairs VALUES (1, 1, 'x'), (1, 2, 'x'), "
+                                 "(2, 1, 'y'), (2, 2, 'x'), (3, 1, 'y')")
+            conn.commit()
+        controller = self.make_controller(initial_batch_size=2, min_batch_size=2, max_batch_size=2,
+                                          target_latency=60)
+        
+        with patch('database_repair.throttle_controller.time.sleep'):
+            result = DuplicateRemover(self.connector).remove_duplicates_keep_oldest(
+                'pairs', ['email'], dry_run=False, throttle=controller
+            )
+        
+        self.assertEqual(result['deleted_count'], 3)
+        with self.engine.connect() as conn:
+            rows = conn.exec_driver_sql("SELECT a, b FROM pairs ORDER BY a, b").fetchall()
+        self.assertEqual([tuple(row) for row in rows], [(1, 1), (2, 1)])
+
+class TestQueryBuilder(SQLiteTestCase):
+    """Tests para el constructor de consultas con caché de sentencias"""
+    
+    def setUp(self):
+        super().setUp()
+        QueryBuilder.clear_cache()
+        self.builder = QueryBuilder(self.connector)
+    
+    def test_statements_are_cached_per_key(self):
+        """Test que la misma (tabla, columnas, estrategia) reutiliza la sentencia"""
+        locator = {"columns": ['id'], "order_by": ['id'], "key": 'id'}
+        first = self.builder.delete_duplicates('users', ['email'], 'MIN', locator)
+        second = QueryBuilder(self.connector).delete_duplicates('users', ['email'], 'MIN', locator)
+        newest = self.builder.delete_duplicates('users', ['email'], 'MAX', locator)
+        
+        self.assertIs(first, second)
+        self.assertIsNot(first, newest)
+        self.assertEqual(QueryBuilder.cache_info(), {"hits": 1, "misses": 2, "size": 2})
+    
+    def test_identifiers_are_quoted(self):
+        """Test tablas y columnas con palabras reservadas o mayúsculas"""
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql('CREATE TABLE "order" (id INTEGER PRIMARY KEY, "Group" TEXT)')
+            conn.exec_driver_sql('INSERT INTO "order" ("Group") VALUES (\'a\'), (\'a\'), (\'b\')')
+            conn.commit()
+        
+        remover = DuplicateRemover(self.connector)
+        result = remover.remove_duplicates_keep_newest('order', ['Group'], dry_run=False)
+        
+        self.assertEqual(result['deleted_count'], 1)
+        self.assertEqual(self.fetch_ids('"order"'), [2, 3])
+        self.assertEqual(self.fetch_ids(f'"{result["backup_table"]}"'), [1, 2, 3])
+    
+    def test_table_name_is_not_interpolated(self):
+        """Test que un nombre de tabla malicioso queda como identificador"""
+        self.create_users_table([('a@test.com', 'Ana'), ('a@test.com', 'Ana')])
+        statement = self.builder.count_rows('users; DROP TABLE users')
+        
+        self.assertIn('"users; DROP TABLE users"', self.builder.sql(statement))
+        with self.assertRaises(OperationalError):
+            with self.engine.connect() as conn:
+                conn.execute(statement)
+        self.assertEqual(self.fetch_ids(), [1, 2])
+
+class TestJobRunner(SQLiteTestCase):
+    """Tests para la ejecución de archivos de trabajos"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_users_table([
+            ('a@test.com', 'Ana'), ('a@test.com', 'Ana'), ('b@test.com', 'Beto'),
+            ('b@test.com', 'Beto'), ('b@test.com', 'Beto'), ('c@test.com', 'Caro')
+        ])
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("CREATE TABLE orders (id INTEGER PRIMARY KEY, ref TEXT)")
+            conn.exec_driver_sql("INSERT INTO orders (ref) VALUES ('r1'), ('r1'), ('r2')")
+            conn.commit()
+    
+    def make_spec(self, jobs, **extra):
+        return {
+            "databases": {"main": {"db_type": "sqlite",
+                                   "connection_string": f"sqlite:///{self.db_path}"}},
+            "jobs": jobs,
+            **extra
+        }
+    
+    def test_runs_all_tables_with_summary(self):
+        """Test varias tablas en un proceso con conteos y tiempos por tabla"""
+        runner = JobRunner(self.make_spec([
+            {"table": "users", "columns": ["email"], "dry_run": False},
+            {"table": "orders", "columns": "ref", "strategy": "newest", "dry_run": False}
+        ], parallelism=2))
+        summary = runner.run()
+        
+        self.assertEqual(summary['status'], 'success')
+        self.assertEqual(summary['totals']['deleted_rows'], 4)
+        users, orders = summary['jobs']
+        self.assertEqual((users['rows_before'], users['rows_after']), (6, 3))
+        self.assertEqual(orders['deleted_count'], 1)
+        self.assertIn('analysis', users['timings'])
+        self.assertEqual(self.fetch_ids('orders'), [2, 3])
+        json.dumps(summary)
+    
+    def test_failed_and_limited_jobs_do_not_stop_others(self):
+        """Test que un error o el límite max_deletions solo afectan a su tabla"""
+        summary = JobRunner(self.make_spec([
+            {"table": "missing", "columns": ["email"]},
+            {"table": "users", "columns": ["email"], "dry_run": False, "max_deletions": 2},
+            {"table": "orders", "columns": ["ref"]}
+        ])).run()
+        
+        self.assertEqual(summary['status'], 'partial')
+        self.assertEqual([job['status'] for job in summary['jobs']],
+                         ['error', 'skipped', 'success'])
+        self.assertEqual(summary['totals']['dry_run_rows'], 1)
+        self.assertEqual(len(self.fetch_ids()), 6)
+    
+    def test_max_deletions_fails_closed(self):
+        """Test que si no se puede contar, el trabajo con max_deletions queda en error sin borrar"""
+        failure = OperationalError("SELECT", {}, Exception("canceling statement due to timeout"))
+        with patch.object(QueryBuilder, 'excess_rows', side_effect=failure):
+            summary = JobRunner(self.make_spec([
+                {"table": "users", "columns": ["email"], "dry_run": False, "max_deletions": 10}
+            ])).run()
+        
+        self.assertEqual(summary['jobs'][0]['status'], 'error')
+        self.assertEqual(len(self.fetch_ids()), 6)
+    
+    def test_cancelled_runner_starts_no_jobs(self):
+        """Test que con el token cancelado los trabajos quedan sin iniciar"""
+        token = CancellationToken()
+        token.cancel("prueba")
+        summary = JobRunner(self.make_spec([{"table": "users", "columns": ["email"]}]),
+                            dry_run=False, cancel_token=token).run()
+        
+        self.assertEqual(summary['status'], 'cancelled')
+        self.assertEqual(len(self.fetch_ids()), 6)
+    
+    def test_invalid_spec_is_rejected(self):
+        """Test claves desconocidas y bases inexistentes"""
+        with self.assertRaises(ValueError):
+            JobRunner(self.make_spec([{"table": "users", "columns": ["email"], "stratgy": "oldest"}]))
+        with self.assertRaises(ValueError):
+            JobRunner(self.make_spec([{"database": "other", "table": "users", "columns": ["email"]}]))
+    
+    @unittest.skipUnless(importlib.util.find_spec('yaml'), "PyYAML no instalado")
+    def test_load_yaml_file_with_env_connection(self):
+        """Test archivo YAML con la cadena de conexión en una variable de entorno"""
+        job_file = os.path.join(self.tmp_dir.name, 'jobs.yaml')
+        with open(job_file, 'w', encoding='utf-8') as f:
+            f.write("databases:\n"
+                    "  main: {db_type: sqlite, connection_string: 'sqlite:///${DEDUP_TEST_DB}'}\n"
+                    "jobs:\n"
+                    "  - {table: users, columns: [email, nombre]}\n")
+        
+        with patch.dict(os.environ, {"DEDUP_TEST_DB": self.db_path}):
+            summary = JobRunner.from_file(job_file).run()
+        
+        self.assertEqual(summary['jobs'][0]['deleted_count'], 3)
+        self.assertTrue(summary['jobs'][0]['dry_run'])
+
+class TestProgressReporting(SQLiteTestCase):
+    """Tests para el reporte de avance con ritmo y ETA"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_users_table([
+            ('a@test.com', 'Ana'), ('a@test.com', 'Ana'), ('b@test.com', 'Beto'),
+            ('b@test.com', 'Beto'), ('b@test.com', 'Beto'), ('c@test.com', 'Caro')
+        ])
+        self.events = []
+    
+    def test_emission_is_throttled(self):
+        """Test que advance() no llama al callback antes de min_interval"""
+        with ProgressTracker('backup', self.events.append, total=1000,
+                             min_interval=3600) as tracker:
+            for _ in range(1000):
+                tracker.advance()
+        
+        self.assertEqual([event['event'] for event in self.events], ['start', 'finish'])
+        self.assertEqual(self.events[-1]['processed'], 1000)
+        self.assertEqual(self.events[-1]['percent'], 100.0)
+        self.assertEqual(self.events[-1]['eta'], 0.0)
+    
+    def test_progress_event_has_rate_and_eta(self):
+        """Test porcentaje, ritmo y ETA con total conocido"""
+        tracker = ProgressTracker('deletion', self.events.append, total=100, min_interval=0)
+        time.sleep(0.01)
+        tracker.advance(25)
+        
+        event = self.events[-1]
+        self.assertEqual((event['event'], event['percent']), ('progress', 25.0))
+        self.assertGreater(event['rate'], 0)
+        self.assertAlmostEqual(event['eta'], 75 / event['rate'], places=1)
+    
+    def test_failing_callback_does_not_abort_phase(self):
+        """Test que un error del callback solo se registra"""
+        def broken(event):
+            raise RuntimeError("terminal cerrada")
+        
+        remover = DuplicateRemover(self.connector)
+        result = remover.remove_duplicates_keep_oldest('users', ['email'], dry_run=False,
+                                                       progress=broken)
+        self.assertEqual(result['deleted_count'], 3)
+    
+    def test_remover_reports_each_phase(self):
+        """Test eventos de análisis, backup y eliminación por lotes"""
+        remover = DuplicateRemover(self.connector)
+        throttle = ThrottleController(self.connector, initial_batch_size=1, min_batch_size=1,
+                                      max_sleep=0)
+        result = remover.remove_duplicates_keep_newest('users', ['email'], dry_run=False,
+                                                       throttle=throttle,
+                                                       progress=self.events.append)
+        
+        finished = {event['phase']: event for event in self.events if event['event'] == 'finish'}
+        self.assertEqual(set(finished), {'analysis', 'backup', 'deletion'})
+        self.assertEqual((finished['analysis']['processed'], finished['analysis']['unit']),
+                         (2, 'groups'))
+        self.assertEqual(finished['backup']['processed'], 6)
+        self.assertEqual(finished['deletion']['total'], result['deleted_count'])
+        self.assertEqual(finished['deletion']['processed'], 3)
+    
+    def test_terminal_bar_render(self):
+        """Test la línea de la barra con y sin total"""
+        stream = io.StringIO()
+        bar = TerminalProgressBar(stream, width=10)
+        bar({"event": "progress", "phase": "backup", "table": "users", "unit": "rows",
+             "processed": 500, "total": 1000, "percent": 50.0, "rate": 100.0, "eta": 5.0,
+             "elapsed": 5.0})
+        bar({"event": "finish", "phase": "analysis", "table": "users", "unit": "groups",
+             "processed": 12, "total": None, "percent": None, "rate": 4.0, "eta": 0.0,
+             "elapsed": 3.0})
+        
+        first, second = stream.getvalue().splitlines()
+        self.assertIn("[#####-----]  50.0%", first)
+        self.assertIn("ETA 0:00:05", first)
+        self.assertIn("12 grupos", second)
+        self.assertIn("en 0:00:03", second)
+
+class TestTimeoutsAndCancellation(SQLiteTestCase):
+    """Tests para timeouts por fase, reintentos por bloqueo y cancelación"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_users_table([
+            ('a@test.com', 'Ana'), ('b@test.com', 'Beto'), ('a@test.com', 'Ana'),
+            ('b@test.com', 'Beto'), ('b@test.com', 'Beto'), ('c@test.com', 'Caro')
+        ])
+    
+    def busy_timeout(self, engine):
+        with engine.connect() as conn:
+            return conn.exec_driver_sql("PRAGMA busy_timeout").scalar()
+    
+    def test_phase_timeouts_applied_and_restored(self):
+        """Test busy_timeout de la fase dentro de database_phase y el original fuera"""
+        connector = DatabaseConnector(f"sqlite:///{self.db_path}", "sqlite",
+                                      timeouts={'deletion': {'lock_timeout': 2}})
+        engine = connector.get_engine()
+        original = self.busy_timeout(engine)
+        
+        with database_phase('deletion'):
+            self.assertEqual(self.busy_timeout(engine), 2000)
+        self.assertEqual(self.busy_timeout(engine), original)
+        engine.dispose()
+    
+    def test_statement_timeout_interrupts_sqlite(self):
+        """Test que el statement_timeout interrumpe una consulta larga en SQLite"""
+        connector = DatabaseConnector(f"sqlite:///{self.db_path}", "sqlite",
+                                      timeouts={'analysis': {'statement_timeout': 0.05}})
+        engine = connector.get_engine()
+        slow_query = ("WITH RECURSIVE n(x) AS (SELECT 1 UNION ALL SELECT x + 1 FROM n "
+                      "WHERE x < 100000000) SELECT COUNT(*) FROM n")
+        
+        with database_phase('analysis'):
+            with engine.connect() as conn:
+                with self.assertRaises(OperationalError):
+                    conn.exec_driver_sql(slow_query).scalar()
+        engine.dispose()
+    
+    def test_invalid_phase_and_timeouts(self):
+        """Test fases desconocidas"""
+        with self.assertRaises(ValueError):
+            with database_phase('vacuum'):
+                pass
+        with self.assertRaises(ValueError):
+            DatabaseConnector(f"sqlite:///{self.db_path}", "sqlite",
+                              timeouts={'vacuum': {'lock_timeout': 1}})
+    
+    def test_run_with_retry_on_lock_timeout(self):
+        """Test reintento con espera ante BD bloqueada y propagación de otros errores"""
+        locked = OperationalError("DELETE", {}, Exception("database is locked"))
+        operation = Mock(side_effect=[locked, locked, 7])
+        
+        with patch('database_repair.database_connector.time.sleep') as sleep:
+            self.assertEqual(self.connector.run_with_retry(operation), 7)
+        self.assertEqual(operation.call_count, 3)
+        self.assertEqual(sleep.call_count, 2)
+        
+        failing = Mock(side_effect=OperationalError("DELETE", {}, Exception("no such table: x")))
+        with self.assertRaises(OperationalError):
+            self.connector.run_with_retry(failing)
+        self.assertEqual(failing.call_count, 1)
+        
+        self.assertTrue(DatabaseConnector.is_lock_timeout(locked))
+        pg_error = Exception("canceling statement due to lock timeout")
+        pg_error.pgcode = '55P03'
+        self.assertTrue(DatabaseConnector.is_lock_timeout(OperationalError("DELETE", {}, pg_error)))
+    
+    def test_cancel_between_deletion_batches(self):
+        """Test que la cancelación detiene la eliminación al terminar un lote"""
+        token = CancellationToken()
+        controller = ThrottleController(self.connector, target_latency=60, initial_batch_size=1,
+                                        min_batch_size=1, max_batch_size=1)
+        remover = DuplicateRemover(self.connector)
+        delete_batch = remover._delete_locator_batch
+        
+        def delete_and_cancel(*args):
+            deleted = delete_batch(*args)
+            token.cancel("prueba")
+            return deleted
+        
+        with patch.object(remover, '_delete_locator_batch', side_effect=delete_and_cancel):
+            result = remover.remove_duplicates_keep_oldest('users', ['email'], dry_run=False,
+                                                           throttle=controller, cancel_token=token)
+        
+        self.assertEqual(result['status'], 'cancelled')
+        self.assertEqual(result['deleted_count'], 1)
+        self.assertEqual(result['message'], 'prueba')
+        self.assertEqual(len(self.fetch_ids()), 5)
+        self.assertEqual(self.fetch_ids(result['backup_table']), [1, 2, 3, 4, 5, 6])
+    
+    def test_cancel_during_backup_drops_partial_copy(self):
+        """Test que un backup por lotes cancelado se descarta sin tocar la tabla"""
+        token = CancellationToken()
+        controller = ThrottleController(self.connector, target_latency=60, initial_batch_size=2,
+                                        min_batch_size=2, max_batch_size=2)
+        record = controller.record
+        
+        def record_and_cancel(*args):
+            token.cancel()
+            return record(*args)
+        
+        with patch.object(controller, 'record', side_effect=record_and_cancel):
+            result = DuplicateRemover(self.connector).remove_duplicates_keep_oldest(
+                'users', ['email'], dry_run=False, throttle=controller, cancel_token=token
+            )
+        
+        self.assertEqual(result['status'], 'cancelled')
+        self.assertEqual(result['deleted_count'], 0)
+        self.assertIsNone(result['backup_table'])
+        self.assertEqual(self.fetch_ids(), [1, 2, 3, 4, 5, 6])
+        with self.engine.connect() as conn:
+            tables = [row[0] for row in conn.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'table'"
+            )]
+        self.assertEqual(tables, ['users'])
+
+class TestIdSet(unittest.TestCase):
+    """Tests para IdSet"""
+    
+    def test_sorted_unique_and_lookup(self):
+        """Test orden, repetidos, pertenencia e índices"""
+        ids = IdSet([7, 3, 3, 10, -2])
+        self.assertEqual(ids.tolist(), [-2, 3, 7, 10])
+        self.assertEqual(list(ids), [-2, 3, 7, 10])
+        self.assertEqual((len(ids), ids[0], ids[-1]), (4, -2, 10))
+        self.assertIn(7, ids)
+        self.assertNotIn(8, ids)
+        self.assertNotIn(11, ids)
+        self.assertNotIn('7', ids)
+        self.assertEqual(len(IdSet()), 0)
+        self.assertNotIn(1, IdSet())
+    
+    def test_set_operations_match_python_sets(self):
+        """Test unión, intersección y diferencia contra set()"""
+        first = set(range(0, 10_000, 3))
+        second = set(range(0, 10_000, 5)) | {2 ** 40}
+        a, b = IdSet(first), IdSet(iter(second))
+        
+        self.assertEqual((a | b).tolist(), sorted(first | second))
+        self.assertEqual((a & b).tolist(), sorted(first & second))
+        self.assertEqual((a - b).tolist(), sorted(first - second))
+        self.assertEqual(b - b, IdSet())
+    
+    def test_compact_storage(self):
+        """Test 4 bytes por id si el rango cabe en 32 bits y 8 si no"""
+        dense = IdSet(range(10 ** 9, 10 ** 9 + 100_000))
+        self.assertEqual(dense.nbytes, 4 * 100_000)
+        self.assertEqual(dense[0], 10 ** 9)
+        self.assertIn(10 ** 9 + 99_999, dense)
+        
+        sparse = IdSet([1, 2 ** 40])
+        self.assertEqual(sparse.nbytes, 16)
+        self.assertEqual(sparse.tolist(), [1, 2 ** 40])
+    
+    def test_batches_and_serialization(self):
+        """Test lotes contiguos y ida y vuelta por bytes"""
+        ids = IdSet(range(1_000_000, 1_200_000, 2))
+        batches = list(ids.batches(30_000))
+        self.assertEqual([len(batch) for batch in batches], [30_000] * 3 + [10_000])
+        self.assertEqual(batches[1][0], 1_060_000)
+        
+        with patch.object(DatabaseConfig, 'ID_SET_CHUNK_SIZE', 7_000):
+            blob = ids.to_bytes()
+        self.assertLess(len(blob), len(ids))
+        self.assertEqual(IdSet.from_bytes(blob), ids)
+        self.assertEqual(IdSet.from_bytes(IdSet([5, -3, 2 ** 40]).to_bytes()).tolist(),
+                         [-3, 5, 2 ** 40])
+        self.assertEqual(IdSet.from_bytes(IdSet().to_bytes()), IdSet())
+    
+    def test_duplicate_groups_victims_and_survivors(self):
+        """Test supervivientes y víctimas a partir de los arreglos CSR"""
+        groups = DuplicateGroups(['email'])
+        groups.append(('a',), [4, 2, 5])
+        groups.append(('b',), '1,3')
+        groups.append(('c',), [], count=2)
+        
+        self.assertEqual(groups.survivors('oldest').tolist(), [1, 2])
+        self.assertEqual(groups.survivors('newest').tolist(), [3, 5])
+        self.assertEqual(groups.victims('oldest').tolist(), [3, 4, 5])
+        self.assertEqual(groups.victims('newest').tolist(), [1, 2, 4])
+        
+        text_groups = DuplicateGroups(['email'])
+        text_groups.append(('a',), ['(0,1)', '(0,2)'])
+        with self.assertRaises(ValueError):
+            text_groups.victims()
+
+class TestDeletionPlan(SQLiteTestCase):
+    """Tests para el flujo plan/apply"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_users_table([
+            ('a@test.com', 'Ana'), ('a@test.com', 'Ana'), ('b@test.com', 'Beto'),
+            ('b@test.com', 'Beto'), ('b@test.com', 'Beto'), ('c@test.com', 'Caro')
+        ])
+        self.planner = DeletionPlanner(self.connector)
+        self.plan_path = os.path.join(self.tmp_dir.name, 'users.dedupplan')
+    
+    def test_plan_contents(self):
+        """Test víctimas, supervivientes y cabecera del plan"""
+        result = self.planner.plan('users', ['email'], 'oldest', self.plan_path)
+        self.assertEqual((result['victim_count'], result['kept_count']), (3, 2))
+        self.assertEqual(self.fetch_ids(), [1, 2, 3, 4, 5, 6])
+        
+        plan = DeletionPlan.load(self.plan_path)
+        self.assertEqual(plan.victims.tolist(), [2, 4, 5])
+        self.assertEqual(plan.kept.tolist(), [1, 3])
+        self.assertEqual((plan.header['key'], plan.header['rows_total']), ('id', 6))
+    
+    def test_apply_deletes_exactly_the_plan(self):
+        """Test que apply ignora duplicados nuevos y omite víctimas ya borradas"""
+        self.planner.plan('users', ['email'], 'newest', self.plan_path)
+        self.insert_users(['a@test.com', 'c@test.com'])
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("DELETE FROM users WHERE id = 3")
+            conn.commit()
+        
+        result = self.planner.apply(self.plan_path)
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual((result['planned'], result['deleted_count'], result['skipped_count']),
+                         (3, 2, 1))
+        self.assertEqual(self.fetch_ids(), [2, 5, 6, 7, 8])
+        self.assertEqual(self.fetch_ids(result['backup_table']), [1, 4])
+    
+    def test_apply_skips_victims_whose_key_changed(self):
+        """Test una víctima cuya clave un UPDATE dejó única tras plan() no se borra ni respalda"""
+        self.planner.plan('users', ['email'], 'oldest', self.plan_path)
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("UPDATE users SET email = 'd@test.com' WHERE id = 4")
+            conn.commit()
+        
+        result = self.planner.apply(self.plan_path)
+        self.assertEqual(result['read_from'], 'primary')
+        self.assertEqual((result['deleted_count'], result['skipped_count']), (2, 1))
+        self.assertEqual(self.fetch_ids(), [1, 3, 4, 6])
+        self.assertEqual(self.fetch_ids(result['backup_table']), [2, 5])
+    
+    def test_apply_with_throttle(self):
+        """Test aplicación en lotes decididos por el controlador de ritmo"""
+        self.planner.plan('users', ['email'], 'oldest', self.plan_path)
+        throttle = ThrottleController(self.connector, initial_batch_size=1, min_batch_size=1,
+                                      max_sleep=0)
+        
+        result = self.planner.apply(self.plan_path, backup=False, throttle=throttle)
+        self.assertEqual(result['deleted_count'], 3)
+        self.assertGreater(result['throttle']['batches'], 1)
+        self.assertEqual(self.fetch_ids(), [1, 3, 6])
+    
+    def test_apply_refuses_stale_plan(self):
+        """Test que un cambio de esquema o un superviviente borrado bloquean apply"""
+        self.planner.plan('users', ['email'], 'oldest', self.plan_path)
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("DELETE FROM users WHERE id = 1")
+            conn.commit()
+        with self.assertRaises(ValueError):
+            self.planner.apply(self.plan_path)
+        self.assertEqual(self.fetch_ids(), [2, 3, 4, 5, 6])
+        
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("ALTER TABLE users ADD COLUMN pais TEXT")
+            conn.commit()
+        with self.assertRaises(ValueError):
+            self.planner.apply(self.plan_path)
+        
+        # force no borra la última copia: sin el superviviente 1, la víctima 2 se queda
+        result = self.planner.apply(self.plan_path, backup=False, force=True)
+        self.assertEqual((result['deleted_count'], result['skipped_count']), (2, 1))
+        self.assertEqual(self.fetch_ids(), [2, 3, 6])
+    
+    def test_corrupted_plan_is_rejected(self):
+        """Test que un archivo alterado no pasa la verificación del checksum"""
+        self.planner.plan('users', ['email'], 'oldest', self.plan_path)
+        with open(self.plan_path, 'r+b') as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 0xFF]))
+        
+        with self.assertRaises(ValueError):
+            DeletionPlan.load(self.plan_path)
+        with self.assertRaises(ValueError):
+            self.planner.apply(self.plan_path)
+        self.assertEqual(len(self.fetch_ids()), 6)
+
+class TestDedupLoader(SQLiteTestCase):
+    """Tests para DedupLoader"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_users_table([('a@test.com', 'Ana'), ('b@test.com', 'Beto')])
+        self.loader = DedupLoader(self.connector)
+    
+    def fetch_users(self):
+        with self.engine.connect() as conn:
+            return [tuple(row) for row in
+                    conn.exec_driver_sql("SELECT email, nombre FROM users ORDER BY id")]
+    
+    def test_unique_index_uses_on_conflict(self):
+        """Test ON CONFLICT DO NOTHING con índice único; repetir la carga no inserta nada"""
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("CREATE UNIQUE INDEX ux_users_email ON users (email)")
+            conn.commit()
+        frame = pd.DataFrame({'email': ['b@test.com', 'c@test.com', 'c@test.com', 'd@test.com'],
+                              'nombre': ['B2', 'Caro', 'C2', None]})
+        
+        result = self.loader.load('users', frame, ['email'], batch_size=2)
+        self.assertEqual(result['mode'], 'conflict')
+        self.assertEqual((result['rows_read'], result['inserted_count'], result['skipped_count'],
+                          result['batches']), (4, 2, 2, 2))
+        self.assertEqual(self.fetch_users()[2:], [('c@test.com', 'Caro'), ('d@test.com', None)])
+        
+        again = self.loader.load('users', frame, ['email'])
+        self.assertEqual((again['inserted_count'], again['skipped_count']), (0, 4))
+    
+    def test_staging_anti_join_without_index(self):
+        """Test tabla temporal y NOT EXISTS sin índice único; claves NULL siempre se insertan"""
+        rows = [{'email': 'a@test.com', 'nombre': 'A2'}, {'email': 'e@test.com', 'nombre': 'Eva'},
+                {'email': 'e@test.com', 'nombre': 'E2'}, {'email': None, 'nombre': 'X'},
+                {'email': None, 'nombre': 'Y'}]
+        
+        result = self.loader.load('users', rows, ['email'])
+        self.assertEqual(result['mode'], 'staging')
+        self.assertEqual((result['inserted_count'], result['skipped_count']), (3, 2))
+        self.assertEqual(self.fetch_users()[2:],
+                         [('e@test.com', 'Eva'), (None, 'X'), (None, 'Y')])
+        
+        with self.assertRaises(ValueError):
+            self.loader.load('users', rows, ['email'], mode='conflict')
+        self.assertEqual(self.loader.load('users', rows, ['email'])['inserted_count'], 2)
+    
+    def test_csv_source(self):
+        """Test carga desde CSV con columnas en otro orden y vacío como NULL"""
+        path = os.path.join(self.tmp_dir.name, 'users.csv')
+        with open(path, 'w', encoding='utf-8', newline='') as f:
+            f.write("nombre,email\nBeto,b@test.com\nFede,f@test.com\n,g@test.com\n")
+        
+        result = self.loader.load('users', path, ['email'])
+        self.assertEqual((result['inserted_count'], result['skipped_count']), (2, 1))
+        self.assertEqual(self.fetch_users()[2:], [('f@test.com', 'Fede'), ('g@test.com', None)])
+        
+        with self.assertRaises(ValueError):
+            self.loader.load('users', path, ['pais'])
+    
+    def test_tuples_and_cancellation(self):
+        """Test filas como tuplas y cancelación antes del primer lote"""
+        with self.assertRaises(ValueError):
+            self.loader.load('users', [('h@test.com', 'H')], ['email'])
+        
+        token = CancellationToken()
+        token.cancel("prueba")
+        result = self.loader.load('users', [('h@test.com', 'H')], ['email'],
+                                  columns=['email', 'nombre'], cancel_token=token)
+        self.assertEqual((result['status'], result['inserted_count']), ('cancelled', 0))
+        
+        result = self.loader.load('users', [('h@test.com', 'H')], ['email'],
+                                  columns=['email', 'nombre'])
+        self.assertEqual((result['status'], result['inserted_count']), ('success', 1))
+
+class TestKeyFilter(SQLiteTestCase):
+    """Tests para KeyFilter"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_users_table([(f'u{i}@test.com', f'U{i}') for i in range(500)])
+        self.path = os.path.join(self.tmp_dir.name, 'users.bloom')
+        self.key_filter = KeyFilter(self.connector, 'users', ['email'], path=self.path)
+        self.key_filter.build()
+    
+    def test_no_false_negatives(self):
+        """Test toda clave existente da positivo y la tasa de falsos positivos es baja"""
+        self.assertTrue(all(self.key_filter.might_exist_many(
+            [{'email': f'u{i}@test.com'} for i in range(500)]
+        )))
+        self.assertTrue(self.key_filter.might_exist('u7@test.com'))
+        
+        absent = self.key_filter.might_exist_many([(f'x{i}@test.com',) for i in range(2000)])
+        self.assertLess(sum(absent), 100)
+        stats = self.key_filter.stats()
+        self.assertEqual((stats['count'], stats['watermark']), (500, 500))
+    
+    def test_exists_confirms_positives(self):
+        """Test exists_many es exacto aunque el filtro dé falsos positivos"""
+        rows = ['u1@test.com', 'nuevo@test.com', 'u499@test.com']
+        self.assertEqual(self.key_filter.exists_many(rows), [True, False, True])
+        
+        with patch.object(self.key_filter.bloom, 'contains_many',
+                          side_effect=lambda keys: np.ones(len(keys), dtype=bool)):
+            self.assertEqual(self.key_filter.exists_many(rows), [True, False, True])
+        self.assertEqual(self.key_filter.stats()['lookups'], 5)
+    
+    def test_numeric_and_temporal_keys_are_canonical(self):
+        """Test una clave NUMERIC o de fecha da la misma huella como Decimal, float, texto o datetime"""
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("CREATE TABLE precios (id INTEGER PRIMARY KEY, "
+                                 "monto NUMERIC(10, 2), vigente TIMESTAMP)")
+            conn.exec_driver_sql("INSERT INTO precios (monto, vigente) VALUES "
+                                 "('10.50', '2024-03-01 08:30:00'), ('7', '2024-03-02 00:00:00')")
+            conn.commit()
+        key_filter = KeyFilter(self.connector, 'precios', ['monto', 'vigente'],
+                               path=os.path.join(self.tmp_dir.name, 'precios.bloom'))
+        key_filter.build()
+        
+        self.assertEqual(key_filter.might_exist_many([
+            (Decimal('10.50'), datetime(2024, 3, 1, 8, 30)),
+            ('10.5', '2024-03-01T08:30:00'),
+            ('7.00', '2024-03-02 00:00:00')
+        ]), [True, True, True])
+        # La consulta de confirmación recibe los valores tal cual (sqlite3 no enlaza Decimal)
+        self.assertEqual(key_filter.exists_many([(10.5, datetime(2024, 3, 1, 8, 30)),
+                                                 (7, datetime(2024, 3, 2)),
+                                                 (10.51, datetime(2024, 3, 1, 8, 30))]),
+                         [True, True, False])
+    
+    @unittest.skipUnless(os.getenv('TEST_POSTGRESQL_URL'), "PostgreSQL no disponible")
+    def test_numeric_key_postgresql(self):
+        """Test exists con un float sobre un NUMERIC que el driver devuelve como Decimal('10.50')"""
+        connector = DatabaseConnector(os.getenv('TEST_POSTGRESQL_URL'), 'postgresql')
+        engine = connector.get_engine()
+        with engine.connect() as conn:
+            conn.exec_driver_sql("DROP TABLE IF EXISTS keyfilter_precios")
+            conn.exec_driver_sql("CREATE TABLE keyfilter_precios (id SERIAL PRIMARY KEY, "
+                                 "monto NUMERIC(10, 2))")
+            conn.exec_driver_sql("INSERT INTO keyfilter_precios (monto) VALUES (10.50), (7)")
+            conn.commit()
+        try:
+            key_filter = KeyFilter(connector, 'keyfilter_precios', ['monto'],
+                                   path=os.path.join(self.tmp_dir.name, 'pg.bloom'))
+            key_filter.build()
+            self.assertEqual(key_filter.exists_many([10.5, Decimal('7.00'), 7, 10.51]),
+                             [True, True, True, False])
+        finally:
+            with engine.connect() as conn:
+                conn.exec_driver_sql("DROP TABLE IF EXISTS keyfilter_precios")
+                conn.commit()
+    
+    def test_refresh_and_reload(self):
+        """Test refresh agrega solo las filas nuevas y el filtro se recarga desde disco"""
+        self.insert_users(['nuevo@test.com'])
+        self.assertEqual(self.key_filter.refresh()['added'], 1)
+        
+        reloaded = KeyFilter(self.connector, 'users', ['email'], path=self.path)
+        self.assertEqual(reloaded.stats()['watermark'], 501)
+        self.assertTrue(reloaded.exists({'email': 'nuevo@test.com'}))
+        
+        with self.assertRaises(ValueError):
+            KeyFilter(self.connector, 'users', ['nombre'], path=self.path)
+    
+    def test_updated_key_needs_rebuild(self):
+        """Test una clave cambiada por UPDATE no entra con refresh() salvo con force o max_age"""
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("UPDATE users SET email = 'cambiado@test.com' WHERE id = 1")
+            conn.commit()
+        
+        self.key_filter.refresh()
+        self.assertFalse(self.key_filter.exists('cambiado@test.com'))
+        self.key_filter.refresh(force=True)
+        self.assertTrue(self.key_filter.exists('cambiado@test.com'))
+        
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("UPDATE users SET email = 'otro@test.com' WHERE id = 2")
+            conn.commit()
+        expired = KeyFilter(self.connector, 'users', ['email'], path=self.path, max_age=0)
+        expired.header['built_at'] = '2000-01-01T00:00:00'
+        expired.refresh()
+        self.assertTrue(expired.exists('otro@test.com'))
+
+
+class TestKeyNormalization(SQLiteTestCase):
+    """Tests para columnas clave normalizadas e índices de expresión"""
+    
+    COLUMNS = ['lower(trim(email))', 'collapse(trim(nombre))']
+    
+    def setUp(self):
+        super().setUp()
+        QueryBuilder.clear_cache()
+        self.create_users_table([
+            ('Ana@Test.com', 'Ana  María'), (' ana@test.com', 'Ana María '),
+            ('ANA@test.com ', 'Ana\tMaría'), ('b@test.com', 'Beto'), ('B@TEST.COM', 'beto')
+        ])
+    
+    def test_parse_key_column(self):
+        """Test especificaciones: normalizaciones de adentro hacia afuera y errores"""
+        self.assertEqual(parse_key_column('email'), ('email', ()))
+        self.assertEqual(parse_key_column('Lower( trim(email) )'), ('email', ('trim', 'lower')))
+        with self.assertRaises(ValueError):
+            parse_key_column('upper(email)')
+        with self.assertRaises(ValueError):
+            parse_key_column('lower(email, nombre)')
+    
+    def test_normalized_groups_and_delete(self):
+        """Test agrupar y eliminar por la clave normalizada sin modificar los valores"""
+        analyzer = DuplicateAnalyzer(self.connector)
+        groups = analyzer.analyze_duplicates('users', self.COLUMNS, as_frame=False)
+        self.assertEqual([groups.key(0), list(groups.group_ids(0))],
+                         [('ana@test.com', 'Ana María'), [1, 2, 3]])
+        self.assertEqual(analyzer.count_total_duplicates('users', self.COLUMNS), 2)
+        self.assertEqual(list(analyzer.iter_group_ids('users', self.COLUMNS, groups.key(0),
+                                                      page_size=2)), [[1, 2], [3]])
+        
+        remover = DuplicateRemover(self.connector)
+        with patch.object(remover.backup_manager, 'create_backup', return_value='users_backup'):
+            result = remover.remove_duplicates_keep_oldest('users', self.COLUMNS, dry_run=False)
+        self.assertEqual(result['deleted_count'], 2)
+        self.assertEqual(self.fetch_ids(), [1, 4, 5])
+    
+    def test_dialect_expressions(self):
+        """Test expresiones por dialecto con constantes literales (coinciden con el índice)"""
+        builder = QueryBuilder(Mock(db_type='postgresql'))
+        self.assertEqual(builder.index_elements(['collapse(lower(email))', 'id']),
+                         ["(regexp_replace(lower(email), '\\s+', ' ', 'g'))", 'id'])
+        mysql_builder = QueryBuilder(Mock(db_type='mysql'))
+        self.assertIn("COLLATE utf8mb4_0900_ai_ci",
+                      mysql_builder.index_elements(['unaccent(nombre)'])[0])
+        with self.assertRaises(ValueError):
+            QueryBuilder(self.connector).index_elements(['unaccent(nombre)'])
+    
+    def test_key_index_is_used(self):
+        """Test el índice de expresión se crea una vez, se reconoce y lo usa el GROUP BY"""
+        advisor = IndexAdvisor(self.connector)
+        created = advisor.create_key_index('users', self.COLUMNS)
+        self.assertTrue(created['created'])
+        self.assertFalse(advisor.create_key_index('users', self.COLUMNS)['created'])
+        self.assertEqual(advisor.find_supporting_index('users', self.COLUMNS)['name'], created['name'])
+        
+        builder = QueryBuilder(self.connector)
+        query = builder.duplicate_summary('users', self.COLUMNS,
+                                          SchemaReflector(self.connector).get_row_locator('users'))
+        with self.engine.connect() as conn:
+            plan = ' '.join(str(row[-1]) for row in conn.exec_driver_sql(
+                f"EXPLAIN QUERY PLAN {builder.sql(query)}", (1,)
+            ))
+        self.assertIn(created['name'], plan)
+    
+    def test_unique_expression_index(self):
+        """Test enforce_unique instala un índice único sobre la expresión normalizada"""
+        remover = DuplicateRemover(self.connector)
+        with patch.object(remover.backup_manager, 'create_backup', return_value='users_backup'):
+            result = remover.remove_duplicates_keep_oldest('users', ['lower(trim(email))'],
+                                                           dry_run=False, enforce_unique=True)
+        self.assertTrue(result['unique_constraint']['installed'])
+        
+        with self.assertRaises(IntegrityError):
+            self.insert_users([' B@test.COM'])
+
+
+class TestForeignKeyRemap(SQLiteTestCase):
+    """Tests para la reasignación de filas hijas antes de eliminar duplicados"""
+    
+    def setUp(self):
+        super().setUp()
+        event.listen(self.engine, 'connect',
+                     lambda dbapi_connection, record: dbapi_connection.execute("PRAGMA foreign_keys=ON"))
+        self.engine.dispose()
+        self.create_users_table([('a@test.com', 'Ana'), ('a@test.com', 'Ana'),
+                                 ('b@test.com', 'Beto'), ('a@test.com', 'Ana')])
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("CREATE TABLE pedidos (id INTEGER PRIMARY KEY, "
+                                 "user_id INTEGER REFERENCES users(id))")
+            conn.exec_driver_sql("INSERT INTO pedidos (user_id) VALUES (1), (2), (2), (3), (4)")
+            conn.commit()
+        self.remover = DuplicateRemover(self.connector)
+        patcher = patch.object(self.remover.backup_manager, 'create_backup', return_value='users_backup')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def fetch_orders(self):
+        with self.engine.connect() as conn:
+            return [row[0] for row in conn.exec_driver_sql("SELECT user_id FROM pedidos ORDER BY id")]
+    
+    def test_remap_then_delete(self):
+        """Test simulacro con conteo, reasignación al superviviente y sin tablas de mapeo al final"""
+        dry = self.remover.remove_duplicates_keep_oldest('users', ['email'], dry_run=True,
+                                                         remap_foreign_keys=True)
+        self.assertEqual([(fk['table'], fk['column'], fk['remapped']) for fk in dry['foreign_keys']],
+                         [('pedidos', 'user_id', 3)])
+        
+        result = self.remover.remove_duplicates_keep_newest('users', ['email'], dry_run=False,
+                                                            remap_foreign_keys=True)
+        self.assertEqual(result['deleted_count'], 2)
+        self.assertEqual(result['foreign_keys'][0]['remapped'], 3)
+        self.assertEqual(self.fetch_orders(), [4, 4, 4, 3, 4])
+        self.assertEqual([name for name in inspect(self.engine).get_table_names()
+                          if name.startswith(DatabaseConfig.FK_MAPPING_PREFIX)], [])
+    
+    def test_remap_per_batch(self):
+        """Test con throttle cada lote reasigna solo las hijas de sus víctimas"""
+        throttle = ThrottleController(self.connector, initial_batch_size=1, min_batch_size=1,
+                                      max_sleep=0)
+        result = self.remover.remove_duplicates_keep_oldest('users', ['email'], dry_run=False,
+                                                            throttle=throttle,
+                                                            remap_foreign_keys=True)
+        self.assertEqual(result['deleted_count'], 2)
+        self.assertEqual(result['foreign_keys'][0]['remapped'], 3)
+        self.assertEqual(self.fetch_orders(), [1, 1, 1, 3, 1])
+    
+    def test_rows_after_mapping_are_kept(self):
+        """Test que se borran solo las víctimas del mapeo aunque lleguen filas después"""
+        # La 2ª pasada parte de lo que dejó la 1ª: a@test.com en 4 y 5
+        for keep, deleted, survivors in (('keep_newest', 2, [3, 4, 5]),
+                                         ('keep_oldest', 1, [3, 4, 6])):
+            execute_deletion = self.remover._execute_deletion
+            
+            def insert_then_delete(*args, **kwargs):
+                # Llega otra copia de a@test.com (con un pedido) ya construido el mapeo
+                self.insert_users(['a@test.com'])
+                with self.engine.connect() as conn:
+                    conn.exec_driver_sql("INSERT INTO pedidos (user_id) "
+                                         "SELECT MAX(id) FROM users")
+                    conn.commit()
+                return execute_deletion(*args, **kwargs)
+            
+            with patch.object(self.remover, '_execute_deletion', side_effect=insert_then_delete):
+                result = getattr(self.remover, f"remove_duplicates_{keep}")(
+                    'users', ['email'], dry_run=False, remap_foreign_keys=True
+                )
+            self.assertEqual(result['status'], 'success')
+            self.assertEqual(result['deleted_count'], deleted)
+            self.assertEqual(self.fetch_ids(), survivors)
+        
+        # Ningún pedido quedó apuntando a un usuario eliminado
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql("PRAGMA foreign_key_check").fetchall(), [])
+    
+    def test_mapping_names_are_per_run(self):
+        """Test dos ejecuciones sobre la misma tabla no comparten tabla de mapeo"""
+        remapper = self.remover.fk_remapper
+        self.assertNotEqual(remapper._mapping_name('users', 'id', 'aaaa'),
+                            remapper._mapping_name('users', 'id', 'bbbb'))
+        references = remapper.find_references('users')
+        locator = self.remover.schema_reflector.get_row_locator('users')
+        with remapper.mapping('users', ['email'], 'oldest', locator, references) as first, \
+                remapper.mapping('users', ['email'], 'oldest', locator, references) as second:
+            self.assertNotEqual(first.mappings, second.mappings)
+            with self.engine.connect() as conn:
+                self.assertEqual(conn.execute(first.victims_query()).fetchall(),
+                                 conn.execute(second.victims_query()).fetchall())
+    
+    def test_child_rows_backed_up_before_remap(self):
+        """Test las filas hijas afectadas se copian con su FK original antes de reasignarlas"""
+        remover = DuplicateRemover(self.connector)
+        result = remover.remove_duplicates_keep_oldest('users', ['email'], dry_run=False,
+                                                       remap_foreign_keys=True)
+        backup_table = result['foreign_keys'][0]['backup_table']
+        self.assertTrue(backup_table.startswith('pedidos_backup_fk_'))
+        with self.engine.connect() as conn:
+            self.assertEqual(conn.exec_driver_sql(f"SELECT id, user_id FROM {backup_table} "
+                                                  "ORDER BY id").fetchall(),
+                             [(2, 2), (3, 2), (5, 4)])
+        self.assertEqual(self.fetch_orders(), [1, 1, 1, 3, 1])
+    
+    def test_without_remap_fk_blocks_delete(self):
+        """Test sin reasignación (por defecto) la FK actúa y las compuestas no molestan"""
+        with self.assertRaises(IntegrityError):
+            self.remover.remove_duplicates_keep_oldest('users', ['email'], dry_run=False)
+        
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("CREATE TABLE envios (id INTEGER PRIMARY KEY, user_id INTEGER, "
+                                 "email TEXT, FOREIGN KEY (user_id, email) "
+                                 "REFERENCES users (id, email))")
+            conn.commit()
+        dry = self.remover.remove_duplicates_keep_oldest('users', ['email'], dry_run=True)
+        self.assertEqual(dry['deleted_count'], 2)
+        self.assertIsNone(dry['foreign_keys'])
+        
+        # Las compuestas solo se rechazan si se pide reasignar, antes de escribir nada
+        with self.assertRaises(ValueError):
+            self.remover.remove_duplicates_keep_oldest('users', ['email'], dry_run=False,
+                                                       remap_foreign_keys=True)
+        self.assertEqual(self.fetch_ids(), [1, 2, 3, 4])
+
+
+class TestSurvivorOrder(SQLiteTestCase):
+    """Tests para el orden de supervivencia y la fusión en el superviviente"""
+    
+    def setUp(self):
+        super().setUp()
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("CREATE TABLE contactos (id INTEGER PRIMARY KEY, email TEXT, "
+                                 "telefono TEXT, ciudad TEXT, updated_at TEXT)")
+            conn.exec_driver_sql(
+                "INSERT INTO contactos (email, telefono, ciudad, updated_at) VALUES (?, ?, ?, ?)",
+                [('a@test.com', None, None, '2024-01-01'),
+                 ('a@test.com', '555', None, '2024-03-01'),
+                 ('a@test.com', '777', 'Quito', None),
+                 ('b@test.com', None, None, '2024-02-01'),
+                 ('b@test.com', '999', None, '2024-01-01')]
+            )
+            conn.commit()
+        self.remover = DuplicateRemover(self.connector)
+        patcher = patch.object(self.remover.backup_manager, 'create_backup', return_value='backup')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def fetch_rows(self):
+        with self.engine.connect() as conn:
+            return [tuple(row) for row in conn.exec_driver_sql(
+                "SELECT id, telefono, ciudad FROM contactos ORDER BY id"
+            )]
+    
+    def test_parse_survivor_order(self):
+        """Test términos, comas dentro de non_null y expansión de non_null(*)"""
+        self.assertEqual(parse_survivor_order('updated_at DESC, non_null(a, b)'),
+                         (('column', ('updated_at',), True), ('non_null', ('a', 'b'), False)))
+        self.assertEqual(parse_survivor_order(['non_null(*) desc'], ['id', 'a']),
+                         (('non_null', ('id', 'a'), True),))
+        for invalid in ('', 'updated_at; DROP TABLE x', 'non_null(*)'):
+            with self.assertRaises(ValueError):
+                parse_survivor_order(invalid)
+    
+    def test_keep_by_order(self):
+        """Test NULL al final, empates por antigüedad y la fila más completa"""
+        dry = self.remover.remove_duplicates_keep_by('contactos', ['email'], 'updated_at DESC')
+        self.assertEqual(dry['deleted_count'], 3)
+        self.assertEqual(dry['strategy'], 'updated_at DESC')
+        
+        result = self.remover.remove_duplicates_keep_by(
+            'contactos', ['email'], ['non_null(*) DESC', 'updated_at DESC'], dry_run=False
+        )
+        self.assertEqual(result['deleted_count'], 3)
+        self.assertEqual([row[0] for row in self.fetch_rows()], [2, 5])
+    
+    def test_merge_into_survivor(self):
+        """Test la fusión llena solo los NULL del superviviente con la mejor víctima"""
+        dry = self.remover.remove_duplicates_keep_by('contactos', ['email'], 'updated_at DESC',
+                                                     merge=True)
+        self.assertEqual(dry['merged_count'], 2)
+        self.assertEqual(len(self.fetch_rows()), 5)
+        with self.assertRaises(ValueError):
+            self.remover.remove_duplicates_keep_oldest('contactos', ['email'], merge=['fax'])
+        
+        result = self.remover.remove_duplicates_keep_by('contactos', ['email'], 'updated_at DESC',
+                                                        dry_run=False, merge=['telefono', 'ciudad'])
+        self.assertEqual(result['merged_count'], 2)
+        self.assertEqual(self.fetch_rows(), [(2, '555', 'Quito'), (4, '999', None)])
+
+
+class TestReadReplicas(SQLiteTestCase):
+    """Tests para el enrutamiento de lecturas a réplicas"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_users_table([
+            ('a@test.com', 'Ana'), ('a@test.com', 'Ana'), ('b@test.com', 'Beto'),
+            ('b@test.com', 'Beto'), ('b@test.com', 'Beto'), ('c@test.com', 'Caro')
+        ])
+        # La réplica es una copia; después el primario avanza sin ella
+        replica_path = os.path.join(self.tmp_dir.name, 'replica.db')
+        shutil.copy(self.db_path, replica_path)
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql("UPDATE users SET email = 'd@test.com' WHERE id = 4")
+            conn.commit()
+        self.insert_users(['e@test.com'])
+        
+        self.replica_connector = DatabaseConnector(f"sqlite:///{self.db_path}", "sqlite",
+                                                   replicas=f"sqlite:///{replica_path}")
+        for engine in [self.replica_connector.engine, *self.replica_connector.replica_engines]:
+            self.addCleanup(engine.dispose)
+        patcher = patch.object(DatabaseConfig, 'REPLICA_LAG_CHECK_INTERVAL', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_reads_follow_replica_lag(self):
+        """Test lecturas en la réplica al día y en el primario si va atrasada"""
+        analyzer = DuplicateAnalyzer(self.replica_connector)
+        stats = StatsCollector(self.replica_connector)
+        with patch.object(self.replica_connector, 'replica_lag', return_value=0.0):
+            self.assertTrue(self.replica_connector.is_replica(
+                self.replica_connector.get_read_engine()
+            ))
+            self.assertEqual(analyzer.count_total_duplicates('users', ['email']), 3)
+            self.assertEqual(stats.get_table_stats('users')['total_records'], 6)
+            self.assertEqual(ThrottleController(self.replica_connector)._probe_replica_lag(), 0.0)
+        
+        with patch.object(self.replica_connector, 'replica_lag',
+                          return_value=DatabaseConfig.REPLICA_MAX_LAG + 1):
+            self.assertIs(self.replica_connector.get_read_engine(), self.replica_connector.engine)
+            self.assertEqual(analyzer.count_total_duplicates('users', ['email']), 2)
+            self.assertEqual(stats.get_table_stats('users')['total_records'], 7)
+    
+    def test_plan_from_replica_is_revalidated(self):
+        """Test que apply no borra una víctima de la réplica que ya no está repetida"""
+        planner = DeletionPlanner(self.replica_connector)
+        plan_path = os.path.join(self.tmp_dir.name, 'users.dedupplan')
+        with patch.object(self.replica_connector, 'replica_lag', return_value=0.0):
+            result = planner.plan('users', ['email'], 'oldest', plan_path)
+        self.assertEqual((result['victim_count'], result['read_from']), (3, 'replica'))
+        
+        result = planner.apply(plan_path, backup=False)
+        self.assertEqual(result['read_from'], 'replica')
+        self.assertEqual((result['deleted_count'], result['skipped_count']), (2, 1))
+        self.assertEqual(self.fetch_ids(), [1, 3, 4, 6, 7])
+
+
+class TestAtomicWrite(unittest.TestCase):
+    """Tests para la escritura atómica de archivos compartidos"""
+    
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp_dir.cleanup)
+        self.path = os.path.join(self.tmp_dir.name, 'cache.json')
+    
+    def test_concurrent_writers_use_own_temp_files(self):
+        """Test dos escrituras simultáneas no comparten temporal y gana una completa"""
+        with atomic_write(self.path) as first, atomic_write(self.path) as second:
+            self.assertNotEqual(first.name, second.name)
+            first.write('{"writer": 1}')
+            second.write('{"writer": 2}')
+        
+        with open(self.path, 'r', encoding='utf-8') as f:
+            self.assertIn(json.load(f)['writer'], (1, 2))
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['cache.json'])
+    
+    def test_failed_write_keeps_previous_file(self):
+        """Test un error a mitad de escritura no toca el archivo ni deja temporales"""
+        with atomic_write(self.path, binary=True) as f:
+            f.write(b'original')
+        with self.assertRaises(RuntimeError):
+            with atomic_write(self.path, binary=True) as f:
+                f.write(b'parcial')
+                raise RuntimeError("fallo")
+        
+        with open(self.path, 'rb') as f:
+            self.assertEqual(f.read(), b'original')
+        self.assertEqual(os.listdir(self.tmp_dir.name), ['cache.json'])
+    
+    def test_watermarks_from_several_processes_are_merged(self):
+        """Test procesos que actualizan tablas distintas no pierden las entradas del otro"""
+        script = ("import sys\n"
+                  "from database_repair.watermark_store import WatermarkStore\n"
+                  "store = WatermarkStore(sys.argv[1])\n"
+                  "for i in range(30):\n"
+                  "    store.set(f'db|t{sys.argv[2]}_{i}|id', i)\n")
+        root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+        env = {**os.environ, 'PYTHONPATH': root}
+        processes = [subprocess.Popen([sys.executable, '-c', script, self.path, str(worker)],
+                                      cwd=self.tmp_dir.name, env=env)
+                     for worker in range(4)]
+        self.assertEqual([process.wait() for process in processes], [0] * 4)
+        
+        with open(self.path, 'r', encoding='utf-8') as f:
+            self.assertEqual(len(json.load(f)), 4 * 30)
+
+
+class TestDuplicateWatcher(SQLiteTestCase):
+    """Tests para el modo vigilancia"""
+    
+    def setUp(self):
+        super().setUp()
+        self.create_users_table([
+            ('a@test.com', 'Ana'), ('a@test.com', 'Ana'), ('b@test.com', 'Beto')
+        ])
+        self.status_file = os.path.join(self.tmp_dir.name, 'status.json')
+        self.watcher = DuplicateWatcher(
+            self.connector, [{'table': 'users', 'columns': ['email'], 'strategy': 'oldest'}],
+            min_interval=0, max_interval=1, busy_latency=5, status_file=self.status_file
+        )
+        self.watcher.remover.watermark_store = WatermarkStore(
+            os.path.join(self.tmp_dir.name, 'wm.json')
+        )
+    
+    def test_cycles_remove_new_duplicates_and_report_health(self):
+        """Test que cada ciclo depura el delta y publica métricas"""
+        first = self.watcher.run_cycle()
+        self.assertEqual(first['tables']['users']['deleted_total'], 1)
+        self.assertEqual(first['tables']['users']['lag_rows'], 0)
+        self.assertEqual(first['interval'], 0)
+        
+        self.insert_users(['b@test.com', 'c@test.com'])
+        self.watcher.run(max_cycles=3)
+        
+        health = self.watcher.get_health()
+        self.assertEqual(health['status'], "stopped")
+        self.assertEqual(health['cycles'], 3)
+        self.assertEqual(health['consecutive_errors'], 0)
+        self.assertEqual(health['tables']['users']['deleted_total'], 2)
+        self.assertEqual(health['tables']['users']['watermark'], 5)
+        self.assertEqual(self.fetch_ids(), [1, 3, 5])
+        
+        with open(self.status_file, 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['cycles'], 3)
+    
+    def test_idle_cycles_back_off(self):
+        """Test que el intervalo crece sin trabajo y al detectar la BD ocupada"""
+        self.watcher.run_cycle()
+        self.watcher.run_cycle()
+        idle_interval = self.watcher.interval
+        self.assertGreater(idle_interval, 0)
+        
+        self.watcher.busy_latency = -1
+        health = self.watcher.run_cycle()
+        self.assertEqual(health['status'], "backoff")
+        self.assertEqual(self.watcher.interval, min(1, idle_interval * 2))
+    
+    def test_stop_ends_run_loop(self):
+        """Test que stop() termina el bucle antes del siguiente ciclo"""
+        self.watcher.stop()
+        self.watcher.run()
+        
+        health = self.watcher.get_health()
+        self.assertEqual(health['status'], "stopped")
+        self.assertEqual(health['cycles'], 0)
+    
+    def test_pending_rows_on_reserved_table_name(self):
+        """Test conteo del delta en una tabla con nombre reservado ("order")"""
+        with self.engine.connect() as conn:
+            conn.exec_driver_sql('CREATE TABLE "order" (id INTEGER PRIMARY KEY, ref TEXT)')
+            conn.exec_driver_sql('INSERT INTO "order" (ref) VALUES (\'r1\'), (\'r1\'), (\'r2\')')
+            conn.commit()
+        
+        self.assertEqual(self.watcher._count_pending_rows('order', None), 3)
+        self.assertEqual(self.watcher._count_pending_rows('order', 1), 2)
+
+class TestStartupImports(unittest.TestCase):
+    """Guarda del tiempo de arranque (python -X importtime)"""
+    
+    HEAVY_MODULES = ('pandas', 'numpy', 'sqlalchemy', 'psycopg2', 'pymysql')
+    # Margen amplio: sin dependencias pesadas el arranque ronda decenas de ms
+    STARTUP_BUDGET_US = 300000
+    
+    def assert_light_startup(self, args):
+        result = measure_imports(args)
+        
+        self.assertEqual(result['returncode'], 0)
+        loaded = set(result['modules'])
+        for module in self.HEAVY_MODULES:
+            self.assertNotIn(module, loaded)
+        self.assertLess(result['total_us'], self.STARTUP_BUDGET_US)
+    
+    def test_package_import_is_light(self):
+        """Test que importar el paquete no carga SQLAlchemy ni pandas"""
+        self.assert_light_startup(['-c', 'import database_repair'])
+    
+    def test_cli_help_is_light(self):
+        """Test que --help de las CLIs no carga dependencias pesadas"""
+        self.assert_light_startup(['run_cli.py', '--help'])
+        self.assert_light_startup(['run_watch.py', '--help'])
+    
+    def test_pandas_deferred_until_first_analysis(self):
+        """Test que el analizador no importa pandas al cargarse"""
+        result = measure_imports(['-c', 'from database_repair import DuplicateAnalyzer'])
+        
+        self.assertIn('sqlalchemy', result['modules'])
+        self.assertNotIn('pandas', result['modules'])
+
 class TestIntegration(unittest.TestCase):
     """Tests de integración"""
     
@@ -321,6 +2464,32 @@ def run_tests():
         TestDuplicateRemover,
         TestBackupManager,
         TestStatsCollector,
+        TestTableCompressor,
+        TestOnlineRebuild,
+        TestIndexAdvisor,
+        TestUniqueConstraintInstaller,
+        TestIncrementalRemoval,
+        TestSchemaReflector,
+        TestDuplicateGroups,
+        TestPaginatedIds,
+        TestKeyProfiler,
+        TestCrossShardDetector,
+        TestThrottleController,
+        TestQueryBuilder,
+        TestProgressReporting,
+        TestTimeoutsAndCancellation,
+        TestJobRunner,
+        TestDeletionPlan,
+        TestIdSet,
+        TestDedupLoader,
+        TestKeyFilter,
+        TestKeyNormalization,
+        TestForeignKeyRemap,
+        TestSurvivorOrder,
+        TestReadReplicas,
+        TestAtomicWrite,
+        TestDuplicateWatcher,
+        TestStartupImports,
         TestIntegration
     ]
     
@@ -0,0 +1,149 @@
+﻿"""
+Interfaz de línea de comandos del modo vigilancia
+"""
+import argparse
+import signal
+import sys
+import os
+
+# Agregar el directorio padre al path para importar database_repair
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from database_repair.config import DatabaseConfig
+
+def parse_watch_spec(spec):
+    """Convierte 'tabla:col1,col2[:oldest|newest]' en configuración de tabla"""
+    parts = spec.split(':')
+    if len(parts) not in (2, 3) or not parts[0] or not parts[1]:
+        raise argparse.ArgumentTypeError(
+            f"Formato inválido '{spec}'; use TABLA:col1,col2[:oldest|newest]"
+        )
+    
+    strategy = parts[2] if len(parts) == 3 else 'oldest'
+    if strategy not in ('oldest', 'newest'):
+        raise argparse.ArgumentTypeError(f"Estrategia inválida: {strategy}")
+    
+    return {
+        'table': parts[0],
+        'columns': [column.strip() for column in parts[1].split(',') if column.strip()],
+        'strategy': strategy
+    }
+
+def create_watch_parser():
+    """Crear parser de argumentos"""
+    parser = argparse.ArgumentParser(
+        description="Vigilancia continua: elimina duplicados de las filas nuevas"
+    )
+    
+    parser.add_argument(
+        '--db-type',
+        choices=['postgresql', 'mysql', 'sqlite'],
+        required=True,
+        help='Tipo de base de datos'
+    )
+    
+    parser.add_argument(
+        '--connection-string',
+        required=True,
+        help='String de conexión a la BD'
+    )
+    
+    parser.add_argument(
+        '--watch',
+        required=True,
+        action='append',
+        type=parse_watch_spec,
+        metavar='TABLA:COLS[:ESTRATEGIA]',
+        help='Tabla a vigilar (repetible), p. ej. users:email:oldest'
+    )
+    
+    parser.add_argument(
+        '--min-interval',
+        type=float,
+        default=DatabaseConfig.WATCH_MIN_INTERVAL,
+        help='Intervalo mínimo entre ciclos (segundos)'
+    )
+    
+    parser.add_argument(
+        '--max-interval',
+        type=float,
+        default=DatabaseConfig.WATCH_MAX_INTERVAL,
+        help='Intervalo máximo entre ciclos (segundos)'
+    )
+    
+    parser.add_argument(
+        '--busy-latency',
+        type=float,
+        default=DatabaseConfig.WATCH_BUSY_LATENCY,
+        help='Latencia (segundos) a partir de la cual se considera la BD ocupada'
+    )
+    
+    parser.add_argument(
+        '--max-delta-rows',
+        type=int,
+        default=DatabaseConfig.WATCH_MAX_DELTA_ROWS,
+        help='Filas nuevas máximas a depurar por tabla y ciclo'
+    )
+    
+    parser.add_argument(
+        '--status-file',
+        help='Archivo JSON donde publicar salud y retraso en cada ciclo'
+    )
+    
+    parser.add_argument(
+        '--max-cycles',
+        type=int,
+        help='Terminar tras N ciclos (por defecto, sin límite)'
+    )
+    
+    parser.add_argument(
+        '--no-backup',
+        action='store_true',
+        help='No respaldar las filas eliminadas en cada ciclo'
+    )
+    
+    return parser
+
+def main_watch():
+    """Función principal del modo vigilancia"""
+    parser = create_watch_parser()
+    args = parser.parse_args()
+    
+    # Import diferido: --help y los errores de argumentos no cargan SQLAlchemy/pandas
+    from database_repair import DatabaseConnector, DuplicateWatcher
+    
+    try:
+        connector = DatabaseConnector(args.connection_string, args.db_type)
+        
+        if not connector.test_connection():
+            print("❌ Error: No se pudo conectar a la base de datos")
+            sys.exit(1)
+        
+        watcher = DuplicateWatcher(
+            connector, args.watch,
+            min_interval=args.min_interval,
+            max_interval=args.max_interval,
+            busy_latency=args.busy_latency,
+            max_delta_rows=args.max_delta_rows,
+            backup=not args.no_backup,
+            status_file=args.status_file
+        )
+        
+        # Detener limpiamente al terminar el ciclo en curso
+        signal.signal(signal.SIGINT, lambda signum, frame: watcher.stop())
+        signal.signal(signal.SIGTERM, lambda signum, frame: watcher.stop())
+        
+        tables = ', '.join(config['table'] for config in args.watch)
+        print(f"👀 Vigilando {tables} (Ctrl+C para detener)")
+        watcher.run(max_cycles=args.max_cycles)
+        
+        health = watcher.get_health()
+        for table_name, metrics in health['tables'].items():
+            print(f"✅ {table_name}: {metrics['deleted_total']} duplicados eliminados")
+    
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main_watch()